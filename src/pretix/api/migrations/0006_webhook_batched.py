@@ -0,0 +1,32 @@
+# Generated by Django 3.0.14 on 2026-10-16 21:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0155_quota_release_after_exit'),
+        ('pretixapi', '0005_auto_20191028_1541'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhook',
+            name='batched',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='WebHookBatchEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('action_type', models.CharField(max_length=255)),
+                ('logentry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.LogEntry')),
+                ('webhook', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batch_entries', to='pretixapi.WebHook')),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+        ),
+    ]
@@ -77,6 +77,12 @@ class WebHook(models.Model):
     target_url = models.URLField(verbose_name=_("Target URL"))
     all_events = models.BooleanField(default=True, verbose_name=_("All events (including newly created ones)"))
     limit_events = models.ManyToManyField('pretixbase.Event', verbose_name=_("Limit to events"), blank=True)
+    batched = models.BooleanField(
+        default=False, verbose_name=_("Send notifications in batches"),
+        help_text=_("Notifications that occur within a few seconds of each other will be sent together as a list in "
+                    "a single request. This is recommended if you expect large numbers of notifications, e.g. from "
+                    "bulk operations.")
+    )
 
     class Meta:
         ordering = ('id',)
@@ -112,6 +118,18 @@ class WebHookCall(models.Model):
         ordering = ("-datetime",)
 
 
+class WebHookBatchEntry(models.Model):
+    """
+    A notification that is waiting to be sent to a batched webhook together with other notifications.
+    """
+    webhook = models.ForeignKey('WebHook', on_delete=models.CASCADE, related_name='batch_entries')
+    logentry = models.ForeignKey('pretixbase.LogEntry', on_delete=models.CASCADE, related_name='+')
+    action_type = models.CharField(max_length=255)
+
+    class Meta:
+        ordering = ("id",)
+
+
 class ApiCall(models.Model):
     idempotency_key = models.CharField(max_length=190, db_index=True)
     auth_hash = models.CharField(max_length=190, db_index=True)
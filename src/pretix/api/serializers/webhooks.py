@@ -34,7 +34,7 @@ class WebHookSerializer(I18nAwareModelSerializer):
 
     class Meta:
         model = WebHook
-        fields = ('id', 'enabled', 'target_url', 'all_events', 'limit_events', 'action_types')
+        fields = ('id', 'enabled', 'target_url', 'all_events', 'limit_events', 'action_types', 'batched')
 
     def validate(self, data):
         data = super().validate(data)
@@ -1,13 +1,22 @@
+import json
+import zlib
+from datetime import timedelta
+
 from django.core.exceptions import ValidationError
-from django.db.models import Count, F, Max, OuterRef, Prefetch, Q, Subquery
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import (
+    Count, F, Max, OuterRef, Prefetch, Q, Subquery, prefetch_related_objects,
+)
 from django.db.models.functions import Coalesce
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
 from django.utils.functional import cached_property
 from django.utils.timezone import now
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet
-from django_scopes import scopes_disabled
-from rest_framework import viewsets
+from django_scopes import scope, scopes_disabled
+from rest_framework import exceptions, viewsets
 from rest_framework.decorators import action
 from rest_framework.fields import DateTimeField
 from rest_framework.response import Response
@@ -18,12 +27,16 @@ from pretix.api.serializers.order import CheckinListOrderPositionSerializer
 from pretix.api.views import RichOrderingFilter
 from pretix.api.views.order import OrderPositionFilter
 from pretix.base.models import (
-    Checkin, CheckinList, Event, Order, OrderPosition,
+    Checkin, CheckinList, Event, LogEntry, Order, OrderPosition,
 )
 from pretix.base.services.checkin import (
     CheckInError, RequiredQuestionsError, perform_checkin,
 )
-from pretix.helpers.database import FixedOrderBy
+from pretix.helpers.database import FixedOrderBy, iterate_in_chunks
+
+CHANGES_OVERLAP = timedelta(seconds=10)
+BULK_REDEEM_MAX_SCANS = 1000
+BULK_REDEEM_CHUNK_SIZE = 100
 
 with scopes_disabled():
     class CheckinListFilter(FilterSet):
@@ -252,6 +265,109 @@ class CheckinListPositionViewSet(viewsets.ReadOnlyModelViewSet):
 
         return qs
 
+    @action(detail=False, methods=['GET'])
+    def changes(self, *args, **kwargs):
+        """
+        Returns all positions that changed since the given cursor, as well as the secrets of all
+        positions that are no longer valid for this list. Orders are touched whenever one of their
+        positions is changed or checked in, so ``Order.last_modified`` serves as the cursor. Since
+        it is set before the transaction commits, we include changes of the last
+        ``CHANGES_OVERLAP`` before the cursor again.
+        """
+        cursor = now()
+        since = self.request.query_params.get('cursor')
+        qs = self.get_queryset()
+        removed = OrderPosition.all.none()
+        if since:
+            try:
+                since = DateTimeField().to_internal_value(since) - CHANGES_OVERLAP
+            except exceptions.ValidationError:
+                raise exceptions.ValidationError('Invalid cursor.')
+            qs = qs.filter(order__last_modified__gte=since)
+            removed = self._removed_positions(qs, since).values_list('secret', flat=True)
+        qs = self.filter_queryset(qs).order_by('pk')
+
+        if self.request.query_params.get('ndjson', 'false') == 'true':
+            return self._ndjson_changes(cursor, qs, removed)
+
+        return Response({
+            'cursor': DateTimeField().to_representation(cursor),
+            'results': self.get_serializer(qs, many=True).data,
+            'removed': list(removed),
+        })
+
+    def _removed_positions(self, qs, since):
+        """
+        Returns the positions changed since ``since`` that have been valid for this list, but are no
+        longer part of ``qs``. These are positions of the list's products and date that have been
+        canceled or whose order is no longer paid, as well as positions whose product or date has been
+        changed away from the list's. Positions that never matched this list are not included, since
+        devices should not learn about them.
+        """
+        clist = self.checkinlist
+        product_ids = None if clist.all_products else set(clist.limit_products.values_list('id', flat=True))
+
+        matches_products = Q() if product_ids is None else Q(item__in=product_ids)
+        matches_subevent = Q(subevent=clist.subevent) if clist.subevent else Q()
+        candidates = Q(matches_products & matches_subevent)
+
+        moved_products = set()
+        moved_subevent = set()
+        changes = LogEntry.objects.filter(
+            event=self.request.event, datetime__gte=since,
+            action_type__in=('pretix.event.order.changed.item', 'pretix.event.order.changed.subevent'),
+        )
+        for le in changes:
+            data = le.parsed_data
+            if le.action_type == 'pretix.event.order.changed.item':
+                if product_ids is not None and data.get('old_item') in product_ids:
+                    moved_products.add(data['position'])
+            elif clist.subevent_id and data.get('old_subevent') == clist.subevent_id:
+                moved_subevent.add(data['position'])
+        if moved_products:
+            candidates |= Q(pk__in=moved_products) & matches_subevent
+        if moved_subevent:
+            candidates |= Q(pk__in=moved_subevent) & matches_products
+
+        return OrderPosition.all.filter(
+            candidates,
+            order__event=self.request.event,
+            order__last_modified__gte=since,
+        ).exclude(
+            pk__in=qs.values('pk')
+        )
+
+    def _ndjson_changes(self, cursor, qs, removed):
+        def lines():
+            # The response is streamed after the API middleware has left the organizer scope. Both
+            # querysets are limited to this event already, so we only need to enter the scope again.
+            with scope(organizer=self.request.organizer):
+                yield {'cursor': DateTimeField().to_representation(cursor)}
+                for op in iterate_in_chunks(qs, chunk_size=500):
+                    yield {'position': self.get_serializer(op).data}
+                for secret in removed.iterator():
+                    yield {'removed': secret}
+
+        def encoded():
+            for line in lines():
+                yield json.dumps(line, cls=DjangoJSONEncoder).encode() + b'\n'
+
+        if 'gzip' in self.request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            def compressed():
+                z = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+                for chunk in encoded():
+                    c = z.compress(chunk)
+                    if c:
+                        yield c
+                yield z.flush()
+
+            resp = StreamingHttpResponse(compressed(), content_type='application/x-ndjson')
+            resp['Content-Encoding'] = 'gzip'
+        else:
+            resp = StreamingHttpResponse(encoded(), content_type='application/x-ndjson')
+        patch_vary_headers(resp, ('Accept-Encoding',))
+        return resp
+
     @action(detail=True, methods=['POST'])
     def redeem(self, *args, **kwargs):
         force = bool(self.request.data.get('force', False))
@@ -315,6 +431,86 @@ class CheckinListPositionViewSet(viewsets.ReadOnlyModelViewSet):
                 'position': CheckinListOrderPositionSerializer(op, context=self.get_serializer_context()).data
             }, status=201)
 
+    @action(detail=False, methods=['POST'])
+    def bulk_redeem(self, *args, **kwargs):
+        """
+        Redeems a list of scans, e.g. uploaded by a scanner that has been offline for a while. Positions
+        are looked up with one query per chunk and every chunk is processed in a single transaction, with
+        a savepoint per scan so that failing scans do not affect the others.
+        """
+        scans = self.request.data
+        if not isinstance(scans, list):
+            raise exceptions.ValidationError("Expected a list of scans.")
+        if len(scans) > BULK_REDEEM_MAX_SCANS:
+            raise exceptions.ValidationError("You can submit at most {} scans at once.".format(BULK_REDEEM_MAX_SCANS))
+
+        parsed = []
+        for scan in scans:
+            if not isinstance(scan, dict) or not isinstance(scan.get('secret'), str):
+                raise exceptions.ValidationError("Every scan needs to contain a secret.")
+            type = scan.get('type', None) or Checkin.TYPE_ENTRY
+            if type not in dict(Checkin.CHECKIN_TYPES):
+                raise exceptions.ValidationError("Invalid check-in type.")
+            if scan.get('datetime'):
+                dt = DateTimeField().to_internal_value(scan.get('datetime'))
+            else:
+                dt = now()
+            parsed.append((scan, type, dt))
+
+        prefetch_related_objects([self.checkinlist], 'limit_products')
+        results = []
+        for i in range(0, len(parsed), BULK_REDEEM_CHUNK_SIZE):
+            chunk = parsed[i:i + BULK_REDEEM_CHUNK_SIZE]
+            positions = {
+                op.secret: op for op in self.get_queryset(ignore_status=True).filter(
+                    secret__in=[scan['secret'] for scan, type, dt in chunk]
+                )
+            }
+            with transaction.atomic():
+                for scan, type, dt in chunk:
+                    results.append(self._redeem_scan(positions.get(scan['secret']), scan, type, dt))
+
+        return Response({'results': results})
+
+    def _redeem_scan(self, op, scan, type, dt):
+        if op is None:
+            return {
+                'secret': scan['secret'],
+                'status': 'error',
+                'reason': 'invalid',
+                'require_attention': False,
+                'position': None,
+            }
+
+        result = {
+            'secret': scan['secret'],
+            'status': 'ok',
+            'require_attention': op.item.checkin_attention or op.order.checkin_attention,
+            'position': op.pk,
+        }
+        try:
+            perform_checkin(
+                op=op,
+                clist=self.checkinlist,
+                given_answers={},
+                force=bool(scan.get('force', False)),
+                ignore_unpaid=bool(scan.get('ignore_unpaid', False)),
+                nonce=scan.get('nonce'),
+                datetime=dt,
+                questions_supported=scan.get('questions_supported', True),
+                canceled_supported=scan.get('canceled_supported', False),
+                user=self.request.user,
+                auth=self.request.auth,
+                type=type,
+            )
+        except RequiredQuestionsError as e:
+            result['status'] = 'incomplete'
+            result['questions'] = [q.pk for q in e.questions]
+        except CheckInError as e:
+            result['status'] = 'error'
+            result['reason'] = e.code
+        return result
+
     def get_object(self, ignore_status=False):
         queryset = self.filter_queryset(self.get_queryset(ignore_status=ignore_status))
         if self.kwargs['pk'].isnumeric():
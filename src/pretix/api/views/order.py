@@ -47,6 +47,9 @@ from pretix.base.services.orders import (
     extend_order, mark_order_expired, mark_order_refunded, reactivate_order,
 )
 from pretix.base.services.pricing import get_price
+from pretix.base.services.search import (
+    search_orders_q, search_positions_q,
+)
 from pretix.base.services.tickets import generate
 from pretix.base.signals import (
     order_modified, order_paid, order_placed, register_ticket_outputs,
@@ -81,27 +84,30 @@ with scopes_disabled():
                 | Q(full_invoice_no__iexact=u)
             ).values_list('order_id', flat=True)
 
-            matching_positions = OrderPosition.objects.filter(
-                Q(order=OuterRef('pk')) & Q(
-                    Q(attendee_name_cached__icontains=u) | Q(attendee_email__icontains=u)
-                    | Q(secret__istartswith=u) | Q(voucher__code__icontains=u)
+            search_q = search_orders_q(u)
+            if search_q is not None:
+                mainq = code | Q(pk__in=matching_invoices) | search_q
+            else:
+                matching_positions = OrderPosition.objects.filter(
+                    Q(order=OuterRef('pk')) & Q(
+                        Q(attendee_name_cached__icontains=u) | Q(attendee_email__icontains=u)
+                        | Q(secret__istartswith=u) | Q(voucher__code__icontains=u)
+                    )
+                ).values('id')
+                qs = qs.annotate(has_pos=Exists(matching_positions))
+
+                mainq = (
+                    code
+                    | Q(email__icontains=u)
+                    | Q(invoice_address__name_cached__icontains=u)
+                    | Q(invoice_address__company__icontains=u)
+                    | Q(pk__in=matching_invoices)
+                    | Q(comment__icontains=u)
+                    | Q(has_pos=True)
                 )
-            ).values('id')
-
-            mainq = (
-                code
-                | Q(email__icontains=u)
-                | Q(invoice_address__name_cached__icontains=u)
-                | Q(invoice_address__company__icontains=u)
-                | Q(pk__in=matching_invoices)
-                | Q(comment__icontains=u)
-                | Q(has_pos=True)
-            )
             for recv, q in order_search_filter_q.send(sender=getattr(self, 'event', None), query=u):
                 mainq = mainq | q
-            return qs.annotate(has_pos=Exists(matching_positions)).filter(
-                mainq
-            )
+            return qs.filter(mainq)
 
 
 class OrderViewSet(viewsets.ModelViewSet):
@@ -677,6 +683,9 @@ with scopes_disabled():
         search = django_filters.CharFilter(method='search_qs')
 
         def search_qs(self, queryset, name, value):
+            search_q = search_positions_q(value, include_addon_to=True)
+            if search_q is not None:
+                return queryset.filter(search_q)
             return queryset.filter(
                 Q(secret__istartswith=value)
                 | Q(attendee_name_cached__icontains=value)
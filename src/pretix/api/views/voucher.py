@@ -14,7 +14,7 @@ from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
 
 from pretix.api.serializers.voucher import VoucherSerializer
-from pretix.base.models import Voucher
+from pretix.base.models import Voucher, log_batch
 
 with scopes_disabled():
     class VoucherFilter(FilterSet):
@@ -126,7 +126,7 @@ class VoucherViewSet(viewsets.ModelViewSet):
         with lockfn():
             serializer = self.get_serializer(data=request.data, many=True)
             serializer.is_valid(raise_exception=True)
-            with transaction.atomic():
+            with transaction.atomic(), log_batch():
                 serializer.save(event=self.request.event)
                 for i, v in enumerate(serializer.instance):
                     v.log_action(
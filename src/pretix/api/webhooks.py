@@ -2,16 +2,22 @@ import json
 import logging
 import time
 from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
 
 import requests
 from celery.exceptions import MaxRetriesExceededError
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
 from django.db.models import Exists, OuterRef, Q
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from django_scopes import scope, scopes_disabled
 from requests import RequestException
 
-from pretix.api.models import WebHook, WebHookCall, WebHookEventListener
+from pretix.api.models import (
+    WebHook, WebHookBatchEntry, WebHookCall, WebHookEventListener,
+)
 from pretix.api.signals import register_webhook_events
 from pretix.base.models import LogEntry
 from pretix.base.services.tasks import ProfiledTask, TransactionAwareTask
@@ -19,6 +25,8 @@ from pretix.celery_app import app
 
 logger = logging.getLogger(__name__)
 _ALL_EVENTS = None
+_SESSION = None
+BATCH_SIZE = 500
 
 
 class WebhookEvent:
@@ -52,6 +60,28 @@ class WebhookEvent:
         raise NotImplementedError()  # NOQA
 
 
+class _RejectCookiesPolicy(DefaultCookiePolicy):
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+
+def get_session():
+    """
+    Returns a HTTP session shared by all webhook calls of this process, so connections to
+    the same receiver are kept alive and reused instead of being set up for every call.
+    Webhooks of different organizers share the session, so it never stores or sends cookies.
+    """
+    global _SESSION
+
+    if _SESSION is None:
+        _SESSION = requests.Session()
+        _SESSION.cookies.set_policy(_RejectCookiesPolicy())
+    return _SESSION
+
+
 def get_all_webhook_events():
     global _ALL_EVENTS
 
@@ -168,10 +198,26 @@ def register_default_webhook_events(sender, **kwargs):
     )
 
 
-@app.task(base=TransactionAwareTask, acks_late=True)
-def notify_webhooks(logentry_id: int):
-    logentry = LogEntry.all.select_related('event', 'event__organizer').get(id=logentry_id)
+def _get_webhooks(organizer, event_id, action_type):
+    # All webhooks that registered for this notification
+    event_listener = WebHookEventListener.objects.filter(
+        webhook=OuterRef('pk'),
+        action_type=action_type
+    )
 
+    webhooks = WebHook.objects.annotate(has_el=Exists(event_listener)).filter(
+        organizer=organizer,
+        has_el=True,
+        enabled=True
+    )
+    if event_id:
+        webhooks = webhooks.filter(
+            Q(all_events=True) | Q(limit_events__pk=event_id)
+        )
+    return list(webhooks)
+
+
+def _notify_webhooks(logentry, webhook_cache):
     if not logentry.organizer:
         return  # We need to know the organizer
 
@@ -185,24 +231,37 @@ def notify_webhooks(logentry_id: int):
     if not notification_type:
         return  # Ignore, no webhooks for this event type
 
-    # All webhooks that registered for this notification
-    event_listener = WebHookEventListener.objects.filter(
-        webhook=OuterRef('pk'),
-        action_type=notification_type.action_type
-    )
+    key = (logentry.organizer.pk, logentry.event_id, notification_type.action_type)
+    if key not in webhook_cache:
+        webhook_cache[key] = _get_webhooks(logentry.organizer, logentry.event_id, notification_type.action_type)
+
+    for wh in webhook_cache[key]:
+        if wh.batched:
+            WebHookBatchEntry.objects.create(webhook=wh, logentry=logentry, action_type=notification_type.action_type)
+            # Only the first notification within the batch window schedules a delivery, all later ones are picked
+            # up by it. The task removes the cache key before it collects the queued notifications.
+            if cache.add('pretix_webhook_batch_{}'.format(wh.pk), True, settings.PRETIX_WEBHOOK_BATCH_WINDOW):
+                send_webhook_batch.apply_async(args=(wh.pk,), countdown=settings.PRETIX_WEBHOOK_BATCH_WINDOW)
+        else:
+            send_webhook.apply_async(args=(logentry.pk, notification_type.action_type, wh.pk))
 
-    webhooks = WebHook.objects.annotate(has_el=Exists(event_listener)).filter(
-        organizer=logentry.organizer,
-        has_el=True,
-        enabled=True
-    )
-    if logentry.event_id:
-        webhooks = webhooks.filter(
-            Q(all_events=True) | Q(limit_events__pk=logentry.event_id)
-        )
 
-    for wh in webhooks:
-        send_webhook.apply_async(args=(logentry_id, notification_type.action_type, wh.pk))
+@app.task(base=TransactionAwareTask, acks_late=True)
+def notify_webhooks(logentry_id: int):
+    logentry = LogEntry.all.select_related('event', 'event__organizer').get(id=logentry_id)
+    _notify_webhooks(logentry, {})
+
+
+@app.task(base=TransactionAwareTask, acks_late=True)
+def notify_webhooks_batch(logentry_ids: list):
+    """
+    Like ``notify_webhooks``, but for many log entries at once, e.g. all entries written by a
+    ``log_batch``. The matching webhooks are only looked up once per event and action type.
+    """
+    webhook_cache = {}
+    logentries = LogEntry.all.select_related('event', 'event__organizer').filter(id__in=logentry_ids).order_by('pk')
+    for logentry in logentries:
+        _notify_webhooks(logentry, webhook_cache)
 
 
 @app.task(base=ProfiledTask, bind=True, max_retries=9, acks_late=True)
@@ -222,7 +281,7 @@ def send_webhook(self, logentry_id: int, action_type: str, webhook_id: int):
 
         try:
             try:
-                resp = requests.post(
+                resp = get_session().post(
                     webhook.target_url,
                     json=payload,
                     allow_redirects=False
@@ -257,3 +316,94 @@ def send_webhook(self, logentry_id: int, action_type: str, webhook_id: int):
                 raise self.retry(countdown=2 ** (self.request.retries * 2))
         except MaxRetriesExceededError:
             pass
+
+
+@app.task(base=ProfiledTask, bind=True, max_retries=9, acks_late=True)
+def send_webhook_batch(self, webhook_id: int, notifications: list = None):
+    """
+    Sends all queued notifications of a batched webhook as a list in one request. On the first
+    run, the queued notifications are locked and only removed from the queue once they have been
+    delivered or a retry of this task has been scheduled, which receives them as
+    ``(logentry_id, action_type)`` pairs. If the worker crashes in between, the notifications are
+    still queued and sent by the next run.
+    """
+    with scopes_disabled():
+        webhook = WebHook.objects.get(id=webhook_id)
+
+    if notifications is not None:
+        retry = _deliver_batch(self, webhook, notifications)
+    else:
+        cache.delete('pretix_webhook_batch_{}'.format(webhook.pk))
+        with transaction.atomic():
+            entries = list(
+                webhook.batch_entries.select_for_update(
+                    skip_locked=connection.features.has_select_for_update_skip_locked
+                ).values_list('pk', 'logentry_id', 'action_type')[:BATCH_SIZE]
+            )
+            if len(entries) == BATCH_SIZE:
+                transaction.on_commit(lambda: send_webhook_batch.apply_async(args=(webhook.pk,)))
+            retry = _deliver_batch(self, webhook, [
+                (logentry_id, action_type) for pk, logentry_id, action_type in entries
+            ])
+            WebHookBatchEntry.objects.filter(pk__in=[e[0] for e in entries]).delete()
+
+    if retry:
+        raise retry
+
+
+def _deliver_batch(task, webhook, notifications):
+    """
+    Sends the given notifications in one request. If the delivery failed, a retry of ``task`` is
+    scheduled and its exception is returned, so the caller can raise it once it is done.
+    """
+    if not notifications or not webhook.enabled:
+        return
+
+    with scope(organizer=webhook.organizer):
+        types = get_all_webhook_events()
+        logentries = LogEntry.all.in_bulk([logentry_id for logentry_id, action_type in notifications])
+        payload = [
+            types[action_type].build_payload(logentries[logentry_id])
+            for logentry_id, action_type in notifications
+            if action_type in types and logentry_id in logentries  # Ignore, e.g. plugin not installed
+        ]
+        if not payload:
+            return
+
+        call = WebHookCall(
+            webhook=webhook,
+            action_type=', '.join(sorted({p['action'] for p in payload if 'action' in p}))[:255],
+            target_url=webhook.target_url,
+            is_retry=task.request.retries > 0,
+            payload=json.dumps(payload),
+        )
+        t = time.time()
+
+        try:
+            resp = get_session().post(
+                webhook.target_url,
+                json=payload,
+                allow_redirects=False
+            )
+            call.execution_time = time.time() - t
+            call.return_code = resp.status_code
+            call.response_body = resp.text[:1024 * 1024]
+            call.success = 200 <= resp.status_code <= 299
+            call.save()
+            if resp.status_code == 410:
+                webhook.enabled = False
+                webhook.save()
+                return
+            elif resp.status_code <= 299:
+                return
+        except RequestException as e:
+            call.execution_time = time.time() - t
+            call.response_body = str(e)[:1024 * 1024]
+            call.save()
+
+        try:
+            return task.retry(
+                args=(webhook.pk, notifications), countdown=2 ** (task.request.retries * 2), throw=False
+            )
+        except MaxRetriesExceededError:
+            return
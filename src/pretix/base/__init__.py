@@ -12,7 +12,7 @@ class PretixBaseConfig(AppConfig):
         from . import invoice  # NOQA
         from . import notifications  # NOQA
         from . import email  # NOQA
-        from .services import auth, checkin, export, mail, tickets, cart, orderimport, orders, invoices, cleanup, update_check, quotas, notifications, vouchers  # NOQA
+        from .services import auth, checkin, export, mail, tickets, cart, orderimport, ordercodes, orders, invoices, cleanup, update_check, quotas, quotacounters, rollups, search, notifications, vouchers, thumbnails  # NOQA
         from django.conf import settings
 
         try:
@@ -41,6 +41,13 @@ class NamespacedCache:
             prefix = int(time.time())
             self.cache.set(self.prefixkey, prefix)
 
+    def current_prefix(self) -> int:
+        """
+        Returns the prefix that is currently used for all keys. It changes every time the cache is cleared.
+        """
+        self._prefix_key('')
+        return self._last_prefix
+
     def set(self, key: str, value: str, timeout: int=300):
         return self.cache.set(self._prefix_key(key), value, timeout)
 
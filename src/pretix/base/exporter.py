@@ -82,8 +82,9 @@ class BaseExporter:
 
         :type form_data: dict
         :param form_data: The form data of the export details form
-        :param output_file: You can optionally accept a parameter that will be given a file handle to write the
-                            output to. In this case, you can return None instead of the file content.
+        :param output_file: You can optionally accept a parameter that will be given a binary file handle to write
+                            the output to. In this case, you can return None instead of the file content. This
+                            allows large exports to be created without keeping the whole file in memory.
 
         Note: If you use a ``ModelChoiceField`` (or a ``ModelMultipleChoiceField``), the
         ``form_data`` will not contain the model instance but only it's primary key (or
@@ -94,6 +95,26 @@ class BaseExporter:
 
 
 class ListExporter(BaseExporter):
+    #: Set this to ``True`` to split a multi-event export up into one export per event, which can run
+    #: in parallel and are merged afterwards. If the columns returned by ``iterate_list`` depend on the
+    #: exported events, they need to be computed from ``shard_events`` while ``sharded`` is ``True``.
+    shardable = False
+
+    #: If the export is split up by event, the rows are grouped by event unless you set this to a
+    #: function returning a sort key for a row. The rows yielded by ``iterate_list`` must already be
+    #: sorted by this key.
+    shard_sort_key = None
+
+    #: Number of columns that ``iterate_list`` appends to every row except the header if ``sharded``
+    #: is ``True``. They are only used by ``shard_sort_key`` and removed before the rows are rendered,
+    #: e.g. to sort by a full timestamp while only a local date is shown.
+    shard_extra_columns = 0
+
+    #: Set to ``True`` while ``iterate_list`` runs for a single event of a split-up export.
+    sharded = False
+
+    #: All events of a split-up export while ``iterate_list`` runs for a single one of them.
+    shard_events = None
 
     @property
     def export_form_fields(self) -> dict:
@@ -124,37 +145,40 @@ class ListExporter(BaseExporter):
     def get_filename(self):
         return 'export'
 
-    def _render_csv(self, form_data, output_file=None, **kwargs):
+    def _write_csv(self, lines, output_file=None, **kwargs):
         if output_file:
-            writer = csv.writer(output_file, **kwargs)
-            for line in self.iterate_list(form_data):
-                line = [
-                    localize(f) if isinstance(f, Decimal) else f
-                    for f in line
-                ]
-                writer.writerow(line)
-            return self.get_filename() + '.csv', 'text/csv', None
+            output = io.TextIOWrapper(output_file, encoding='utf-8', newline='')
         else:
             output = io.StringIO()
-            writer = csv.writer(output, **kwargs)
-            for line in self.iterate_list(form_data):
-                line = [
-                    localize(f) if isinstance(f, Decimal) else f
-                    for f in line
-                ]
-                writer.writerow(line)
+        writer = csv.writer(output, **kwargs)
+        for line in lines:
+            line = [
+                localize(f) if isinstance(f, Decimal) else f
+                for f in line
+            ]
+            writer.writerow(line)
+
+        if output_file:
+            output.flush()
+            output.detach()  # do not close output_file when the wrapper is garbage collected
+            return self.get_filename() + '.csv', 'text/csv', None
+        else:
             return self.get_filename() + '.csv', 'text/csv', output.getvalue().encode("utf-8")
 
-    def _render_xlsx(self, form_data, output_file=None):
-        wb = Workbook()
-        ws = wb.active
-        try:
-            ws.title = str(self.verbose_name)
-        except:
-            pass
-        for i, line in enumerate(self.iterate_list(form_data)):
-            for j, val in enumerate(line):
-                ws.cell(row=i + 1, column=j + 1).value = str(val) if not isinstance(val, KNOWN_TYPES) else val
+    def _write_xlsx(self, sheets, output_file=None):
+        """
+        Writes an iterable of ``(title, lines)`` tuples to a workbook in write-only mode, which
+        flushes every row to disk right away instead of keeping all cells in memory.
+        """
+        wb = Workbook(write_only=True)
+        for title, lines in sheets:
+            ws = wb.create_sheet()
+            try:
+                ws.title = title
+            except:
+                pass
+            for line in lines:
+                ws.append([str(val) if not isinstance(val, KNOWN_TYPES) else val for val in line])
 
         if output_file:
             wb.save(output_file)
@@ -165,15 +189,22 @@ class ListExporter(BaseExporter):
                 f.seek(0)
                 return self.get_filename() + '.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', f.read()
 
-    def render(self, form_data: dict, output_file=None) -> Tuple[str, str, bytes]:
+    def render_lines(self, form_data: dict, lines, output_file=None) -> Tuple[str, str, bytes]:
+        """
+        Renders the given lines in the format selected in ``form_data``. :py:meth:`render` calls this
+        with the result of :py:meth:`iterate_list`.
+        """
         if form_data.get('_format') == 'xlsx':
-            return self._render_xlsx(form_data, output_file=output_file)
+            return self._write_xlsx([(str(self.verbose_name), lines)], output_file=output_file)
         elif form_data.get('_format') == 'default':
-            return self._render_csv(form_data, quoting=csv.QUOTE_NONNUMERIC, delimiter=',', output_file=output_file)
+            return self._write_csv(lines, quoting=csv.QUOTE_NONNUMERIC, delimiter=',', output_file=output_file)
         elif form_data.get('_format') == 'csv-excel':
-            return self._render_csv(form_data, dialect='excel', output_file=output_file)
+            return self._write_csv(lines, dialect='excel', output_file=output_file)
         elif form_data.get('_format') == 'semicolon':
-            return self._render_csv(form_data, dialect='excel', delimiter=';', output_file=output_file)
+            return self._write_csv(lines, dialect='excel', delimiter=';', output_file=output_file)
+
+    def render(self, form_data: dict, output_file=None) -> Tuple[str, str, bytes]:
+        return self.render_lines(form_data, self.iterate_list(form_data), output_file=output_file)
 
 
 class MultiSheetListExporter(ListExporter):
@@ -211,55 +242,36 @@ class MultiSheetListExporter(ListExporter):
     def iterate_sheet(self, form_data, sheet):
         raise NotImplementedError()  # noqa
 
-    def _render_sheet_csv(self, form_data, sheet, output_file=None, **kwargs):
-        if output_file:
-            writer = csv.writer(output_file, **kwargs)
-            for line in self.iterate_sheet(form_data, sheet):
-                line = [
-                    localize(f) if isinstance(f, Decimal) else f
-                    for f in line
-                ]
-                writer.writerow(line)
-            return self.get_filename() + '.csv', 'text/csv', None
-        else:
-            output = io.StringIO()
-            writer = csv.writer(output, **kwargs)
-            for line in self.iterate_sheet(form_data, sheet):
-                line = [
-                    localize(f) if isinstance(f, Decimal) else f
-                    for f in line
-                ]
-                writer.writerow(line)
-            return self.get_filename() + '.csv', 'text/csv', output.getvalue().encode("utf-8")
-
-    def _render_xlsx(self, form_data, output_file=None):
-        wb = Workbook()
-        ws = wb.active
-        wb.remove(ws)
-        for s, l in self.sheets:
-            ws = wb.create_sheet(str(l))
-            for i, line in enumerate(self.iterate_sheet(form_data, sheet=s)):
-                for j, val in enumerate(line):
-                    ws.cell(row=i + 1, column=j + 1).value = str(val) if not isinstance(val, KNOWN_TYPES) else val
-
-        if output_file:
-            wb.save(output_file)
-            return self.get_filename() + '.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', None
-        else:
-            with tempfile.NamedTemporaryFile(suffix='.xlsx') as f:
-                wb.save(f.name)
-                f.seek(0)
-                return self.get_filename() + '.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', f.read()
+    def rendered_sheets(self, form_data: dict):
+        """
+        Returns the identifiers of the sheets that are part of the format selected in ``form_data``.
+        """
+        if form_data.get('_format') == 'xlsx':
+            return [s for s, l in self.sheets]
+        elif ':' in form_data.get('_format'):
+            return [form_data.get('_format').split(':')[0]]
+        return []
 
-    def render(self, form_data: dict, output_file=None) -> Tuple[str, str, bytes]:
+    def render_sheets(self, form_data: dict, sheet_lines, output_file=None) -> Tuple[str, str, bytes]:
+        """
+        Renders the sheets in the format selected in ``form_data``. ``sheet_lines`` is called with the
+        identifier of every sheet and returns its lines. :py:meth:`render` calls this with
+        :py:meth:`iterate_sheet`.
+        """
         if form_data.get('_format') == 'xlsx':
-            return self._render_xlsx(form_data, output_file=output_file)
+            return self._write_xlsx(
+                ((str(l), sheet_lines(s)) for s, l in self.sheets),
+                output_file=output_file
+            )
         elif ':' in form_data.get('_format'):
             sheet, f = form_data.get('_format').split(':')
             if f == 'default':
-                return self._render_sheet_csv(form_data, sheet, quoting=csv.QUOTE_NONNUMERIC, delimiter=',',
-                                              output_file=output_file)
+                return self._write_csv(sheet_lines(sheet), quoting=csv.QUOTE_NONNUMERIC, delimiter=',',
+                                       output_file=output_file)
             elif f == 'excel':
-                return self._render_sheet_csv(form_data, sheet, dialect='excel', output_file=output_file)
+                return self._write_csv(sheet_lines(sheet), dialect='excel', output_file=output_file)
             elif f == 'semicolon':
-                return self._render_sheet_csv(form_data, sheet, dialect='excel', delimiter=';', output_file=output_file)
+                return self._write_csv(sheet_lines(sheet), dialect='excel', delimiter=';', output_file=output_file)
+
+    def render(self, form_data: dict, output_file=None) -> Tuple[str, str, bytes]:
+        return self.render_sheets(form_data, lambda sheet: self.iterate_sheet(form_data, sheet), output_file=output_file)
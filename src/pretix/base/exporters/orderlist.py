@@ -17,6 +17,7 @@ from pretix.base.models import (
 from pretix.base.models.orders import OrderFee, OrderPayment, OrderRefund
 from pretix.base.services.quotas import QuotaAvailability
 from pretix.base.settings import PERSON_NAME_SCHEMES
+from pretix.helpers.database import iterate_in_chunks
 
 from ...control.forms.filter import get_all_payment_providers
 from ..exporter import ListExporter, MultiSheetListExporter
@@ -28,6 +29,18 @@ from ..signals import (
 class OrderListExporter(MultiSheetListExporter):
     identifier = 'orderlist'
     verbose_name = gettext_lazy('Order data')
+    shardable = True
+    shard_extra_columns = 1
+
+    def shard_sort_key(self, line):
+        # The order date column is a local date, sort by the order time in UTC instead
+        return line[-1]
+
+    @property
+    def column_events(self):
+        # The tax rates, questions and date columns depend on the exported events. If the export is split up,
+        # all parts need the columns of all events.
+        return self.shard_events if self.sharded else self.events
 
     @property
     def sheets(self):
@@ -54,13 +67,13 @@ class OrderListExporter(MultiSheetListExporter):
         tax_rates = set(
             a for a
             in OrderFee.objects.filter(
-                order__event__in=self.events
+                order__event__in=self.column_events
             ).values_list('tax_rate', flat=True).distinct().order_by()
         )
         tax_rates |= set(
             a for a
             in OrderPosition.objects.filter(
-                order__event__in=self.events
+                order__event__in=self.column_events
             ).values_list('tax_rate', flat=True).distinct().order_by()
         )
         tax_rates = sorted(tax_rates)
@@ -126,22 +139,24 @@ class OrderListExporter(MultiSheetListExporter):
 
         full_fee_sum_cache = {
             o['order__id']: o['grosssum'] for o in
-            OrderFee.objects.values('tax_rate', 'order__id').order_by().annotate(grosssum=Sum('value'))
+            OrderFee.objects.filter(order__event__in=self.events).values('tax_rate', 'order__id').order_by().annotate(
+                grosssum=Sum('value')
+            )
         }
         fee_sum_cache = {
             (o['order__id'], o['tax_rate']): o for o in
-            OrderFee.objects.values('tax_rate', 'order__id').order_by().annotate(
+            OrderFee.objects.filter(order__event__in=self.events).values('tax_rate', 'order__id').order_by().annotate(
                 taxsum=Sum('tax_value'), grosssum=Sum('value')
             )
         }
         sum_cache = {
             (o['order__id'], o['tax_rate']): o for o in
-            OrderPosition.objects.values('tax_rate', 'order__id').order_by().annotate(
+            OrderPosition.objects.filter(order__event__in=self.events).values('tax_rate', 'order__id').order_by().annotate(
                 taxsum=Sum('tax_value'), grosssum=Sum('price')
             )
         }
 
-        for order in qs.order_by('datetime'):
+        for order in iterate_in_chunks(qs.order_by('datetime')):
             tz = pytz.timezone(order.event.settings.timezone)
 
             row = [
@@ -199,6 +214,8 @@ class OrderListExporter(MultiSheetListExporter):
             row.append(_('Yes') if order.checkin_attention else _('No'))
             row.append(order.comment or "")
             row.append(order.pcnt)
+            if self.sharded:
+                row.append(order.datetime)
             yield row
 
     def iterate_fees(self, form_data: dict):
@@ -233,7 +250,7 @@ class OrderListExporter(MultiSheetListExporter):
 
         yield headers
 
-        for op in qs.order_by('order__datetime'):
+        for op in iterate_in_chunks(qs.order_by('order__datetime')):
             order = op.order
             tz = pytz.timezone(order.event.settings.timezone)
             row = [
@@ -270,6 +287,8 @@ class OrderListExporter(MultiSheetListExporter):
                 ]
             except InvoiceAddress.DoesNotExist:
                 row += [''] * (8 + (len(name_scheme['fields']) if name_scheme and len(name_scheme['fields']) > 1 else 0))
+            if self.sharded:
+                row.append(order.datetime)
             yield row
 
     def iterate_positions(self, form_data: dict):
@@ -292,7 +311,7 @@ class OrderListExporter(MultiSheetListExporter):
             _('Email'),
             _('Order date'),
         ]
-        if self.events.filter(has_subevents=True).exists():
+        if self.column_events.filter(has_subevents=True).exists():
             headers.append(pgettext('subevent', 'Date'))
             headers.append(_('Start date'))
             headers.append(_('End date'))
@@ -321,7 +340,7 @@ class OrderListExporter(MultiSheetListExporter):
             _('Pseudonymization ID'),
         ]
 
-        questions = list(Question.objects.filter(event__in=self.events))
+        questions = list(Question.objects.filter(event__in=self.column_events))
         options = {}
         for q in questions:
             if q.type == Question.TYPE_CHOICE_MULTIPLE:
@@ -347,7 +366,7 @@ class OrderListExporter(MultiSheetListExporter):
 
         yield headers
 
-        for op in qs.order_by('order__datetime', 'positionid'):
+        for op in iterate_in_chunks(qs.order_by('order__datetime', 'positionid')):
             order = op.order
             tz = pytz.timezone(order.event.settings.timezone)
             row = [
@@ -432,6 +451,8 @@ class OrderListExporter(MultiSheetListExporter):
                 order.sales_channel,
                 order.locale
             ]
+            if self.sharded:
+                row.append([order.datetime, op.positionid])
             yield row
 
     def get_filename(self):
@@ -444,6 +465,12 @@ class OrderListExporter(MultiSheetListExporter):
 class PaymentListExporter(ListExporter):
     identifier = 'paymentlist'
     verbose_name = gettext_lazy('Order payments and refunds')
+    shardable = True
+    shard_extra_columns = 1
+
+    def shard_sort_key(self, line):
+        # The creation date column is a local date, sort by the creation time in UTC instead
+        return line[-1]
 
     @property
     def additional_form_fields(self):
@@ -508,6 +535,8 @@ class PaymentListExporter(ListExporter):
                 obj.amount * (-1 if isinstance(obj, OrderRefund) else 1),
                 provider_names.get(obj.provider, obj.provider)
             ]
+            if self.sharded:
+                row.append(obj.created)
             yield row
 
     def get_filename(self):
@@ -615,7 +644,7 @@ class InvoiceDataExporter(MultiSheetListExporter):
                     ).values('s')
                 )
             )
-            for i in qs:
+            for i in iterate_in_chunks(qs):
                 pmis = []
                 for p in i.order.payments.all():
                     if p.state in (OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_CREATED,
@@ -698,7 +727,7 @@ class InvoiceDataExporter(MultiSheetListExporter):
             ).order_by('invoice__full_invoice_no', 'position').select_related(
                 'invoice', 'invoice__order', 'invoice__refers'
             )
-            for l in qs:
+            for l in iterate_in_chunks(qs):
                 i = l.invoice
                 yield [
                     i.full_invoice_no,
@@ -744,6 +773,10 @@ class InvoiceDataExporter(MultiSheetListExporter):
 class GiftcardRedemptionListExporter(ListExporter):
     identifier = 'giftcardredemptionlist'
     verbose_name = gettext_lazy('Gift card redemptions')
+    shardable = True
+
+    def shard_sort_key(self, line):
+        return line[1], line[3]
 
     def iterate_list(self, form_data):
         payments = OrderPayment.objects.filter(
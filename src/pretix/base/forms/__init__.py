@@ -82,7 +82,13 @@ class SettingsForm(i18nfield.forms.I18nFormMixin, HierarkeyForm):
         for k, v in self.cleaned_data.items():
             if isinstance(self.fields.get(k), SecretKeySettingsField) and self.cleaned_data.get(k) == SECRET_REDACTED:
                 self.cleaned_data[k] = self.initial[k]
-        return super().save()
+        ret = super().save()
+
+        from pretix.base.services.thumbnails import (
+            pregenerate_settings_thumbnails,
+        )
+        pregenerate_settings_thumbnails(self.obj, self.changed_data)
+        return ret
 
     def get_new_filename(self, name: str) -> str:
         from pretix.base.models import Event
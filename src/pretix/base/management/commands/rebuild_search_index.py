@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+
+from pretix.base.models import Event
+from pretix.base.services.search import reindex_event
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search index of the orders of all or some events"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, action='append', dest='events',
+                            help='ID of an event to rebuild, can be given multiple times. Defaults to all events.')
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        events = Event.objects.all()
+        if options.get('events'):
+            events = events.filter(pk__in=options['events'])
+        for event in events.order_by('pk').iterator():
+            reindex_event(event)
+            if options.get('verbosity', 1) > 1:
+                self.stdout.write('Rebuilt search index of event {}'.format(event.pk))
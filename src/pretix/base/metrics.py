@@ -238,3 +238,12 @@ pretix_task_runs_total = Counter("pretix_task_runs_total", "Total calls to a cel
                                  ["task_name", "status"])
 pretix_task_duration_seconds = Histogram("pretix_task_duration_seconds", "Call time of a celery task",
                                          ["task_name"])
+pretix_lock_wait_seconds = Histogram("pretix_lock_wait_seconds", "Time spent waiting for an event lock",
+                                     ["scope", "result"])
+pretix_lock_hold_seconds = Histogram("pretix_lock_hold_seconds", "Time an event lock was held",
+                                     ["scope"])
+pretix_mail_sent_total = Counter("pretix_mail_sent_total", "Emails handed to an email server",
+                                 ["mode", "status"])
+pretix_mail_batch_duration_seconds = Histogram("pretix_mail_batch_duration_seconds",
+                                               "Time to send a chunk of emails to many recipients", [],
+                                               buckets=(1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, _INF))
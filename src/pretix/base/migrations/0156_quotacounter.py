@@ -0,0 +1,29 @@
+# Generated by Django 3.0.14 on 2026-10-16 21:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0155_quota_release_after_exit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('subevent_id', models.PositiveIntegerField(default=0)),
+                ('item_id', models.PositiveIntegerField(default=0)),
+                ('variation_id', models.PositiveIntegerField(default=0)),
+                ('kind', models.CharField(max_length=1)),
+                ('count', models.IntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quota_counters', to='pretixbase.Event')),
+            ],
+            options={
+                'unique_together': {('event', 'subevent_id', 'item_id', 'variation_id', 'kind')},
+            },
+        ),
+    ]
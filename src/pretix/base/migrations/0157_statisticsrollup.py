@@ -0,0 +1,49 @@
+# Generated by Django 3.0.14 on 2026-10-16 22:00
+
+import datetime
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0156_quotacounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticsRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('subevent_id', models.PositiveIntegerField(default=0)),
+                ('day', models.DateField(default=datetime.date(1970, 1, 1))),
+                ('item_id', models.PositiveIntegerField(default=0)),
+                ('variation_id', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(max_length=3)),
+                ('canceled', models.BooleanField(default=False)),
+                ('count', models.IntegerField(default=0)),
+                ('price', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=13)),
+                ('tax_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=13)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistics_rollups', to='pretixbase.Event')),
+            ],
+            options={
+                'unique_together': {('event', 'subevent_id', 'day', 'item_id', 'variation_id', 'status', 'canceled')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StatisticsOrderRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('paid_day', models.DateField(default=datetime.date(1970, 1, 1))),
+                ('count', models.IntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistics_order_rollups', to='pretixbase.Event')),
+            ],
+            options={
+                'unique_together': {('event', 'day', 'paid_day')},
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.0.14 on 2026-10-16 23:00
+
+from django.db import DatabaseError, migrations, models, transaction
+import django.db.models.deletion
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Trigram indexes allow PostgreSQL to use an index for LIKE '%…%' queries. The extension might not be available
+    # or the database user might not be allowed to install it, in which case searches still work without the index.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            with transaction.atomic():
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except DatabaseError:
+            return
+        cursor.execute(
+            'CREATE INDEX pretixbase_ordersearchdocument_text_trgm '
+            'ON pretixbase_ordersearchdocument USING gin (text gin_trgm_ops)'
+        )
+        cursor.execute(
+            'CREATE INDEX pretixbase_ordersearchdocument_prefixes_trgm '
+            'ON pretixbase_ordersearchdocument USING gin (prefixes gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP INDEX IF EXISTS pretixbase_ordersearchdocument_text_trgm')
+        cursor.execute('DROP INDEX IF EXISTS pretixbase_ordersearchdocument_prefixes_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0157_statisticsrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('text', models.TextField()),
+                ('prefixes', models.TextField()),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to='pretixbase.Order')),
+                ('position', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to='pretixbase.OrderPosition')),
+            ],
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
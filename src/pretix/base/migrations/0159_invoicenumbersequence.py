@@ -0,0 +1,26 @@
+# Generated by Django 3.0.14 on 2026-10-16 23:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0158_ordersearchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceNumberSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('prefix', models.CharField(max_length=160)),
+                ('last', models.PositiveIntegerField(default=0)),
+                ('organizer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_number_sequences', to='pretixbase.Organizer')),
+            ],
+            options={
+                'unique_together': {('organizer', 'prefix')},
+            },
+        ),
+    ]
@@ -1,6 +1,6 @@
 from ..settings import GlobalSettingsObject_SettingsStore
 from .auth import U2FDevice, User, WebAuthnDevice
-from .base import CachedFile, LoggedModel, cachedfile_name
+from .base import CachedFile, LoggedModel, cachedfile_name, log_batch
 from .checkin import Checkin, CheckinList
 from .devices import Device
 from .event import (
@@ -8,10 +8,12 @@ from .event import (
     RequiredAction, SubEvent, SubEventMetaValue, generate_invite_token,
 )
 from .giftcards import GiftCard, GiftCardAcceptance, GiftCardTransaction
-from .invoices import Invoice, InvoiceLine, invoice_filename
+from .invoices import (
+    Invoice, InvoiceLine, InvoiceNumberSequence, invoice_filename,
+)
 from .items import (
     Item, ItemAddOn, ItemBundle, ItemCategory, ItemMetaProperty, ItemMetaValue,
-    ItemVariation, Question, QuestionOption, Quota, SubEventItem,
+    ItemVariation, Question, QuestionOption, Quota, QuotaCounter, SubEventItem,
     SubEventItemVariation, itempicture_upload_to,
 )
 from .log import LogEntry
@@ -19,7 +21,8 @@ from .notifications import NotificationSetting
 from .orders import (
     AbstractPosition, CachedCombinedTicket, CachedTicket, CartPosition,
     InvoiceAddress, Order, OrderFee, OrderPayment, OrderPosition, OrderRefund,
-    QuestionAnswer, cachedcombinedticket_name, cachedticket_name,
+    OrderSearchDocument, QuestionAnswer, StatisticsOrderRollup,
+    StatisticsRollup, cachedcombinedticket_name, cachedticket_name,
     generate_position_secret, generate_secret,
 )
 from .organizer import (
@@ -1,8 +1,11 @@
 import json
+import threading
 import uuid
+from contextlib import contextmanager
+from functools import lru_cache
 
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import connection, models
 from django.db.models.constants import LOOKUP_SEP
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
@@ -37,6 +40,110 @@ def cached_file_delete(sender, instance, **kwargs):
         instance.file.delete(False)
 
 
+_log_batch = threading.local()
+
+
+@lru_cache(maxsize=None)
+def _dispatch_targets(action_type):
+    """
+    Returns a tuple of two booleans that tell whether log entries with the given action type can trigger
+    notifications and webhooks, respectively.
+    """
+    from ..notifications import get_all_notification_types
+    from pretix.api.webhooks import get_all_webhook_events
+
+    no_types = get_all_notification_types()
+    wh_types = get_all_webhook_events()
+
+    no_type = None
+    wh_type = None
+    typepath = action_type
+    while (not no_type or not wh_type) and '.' in typepath:
+        wh_type = wh_type or wh_types.get(typepath + ('.*' if typepath != action_type else ''))
+        no_type = no_type or no_types.get(typepath + ('.*' if typepath != action_type else ''))
+        typepath = typepath.rsplit('.', 1)[0]
+    return bool(no_type), bool(wh_type)
+
+
+def dispatch_logentry(logentry):
+    """
+    Triggers the notifications and webhooks for a log entry that has been saved to the database. This is called by
+    ``log_action`` automatically and only needs to be called manually for log entries that have been created in bulk.
+    """
+    from ..services.notifications import notify
+    from pretix.api.webhooks import notify_webhooks
+
+    has_notifications, has_webhooks = _dispatch_targets(logentry.action_type)
+    if has_notifications:
+        notify.apply_async(args=(logentry.pk,))
+    if has_webhooks:
+        notify_webhooks.apply_async(args=(logentry.pk,))
+
+
+def dispatch_logentries(logentries):
+    """
+    Like ``dispatch_logentry``, but for many log entries at once. Schedules at most one task for all notifications
+    and one task for all webhooks.
+    """
+    from ..services.notifications import notify_batch
+    from pretix.api.webhooks import notify_webhooks_batch
+
+    notification_ids = []
+    webhook_ids = []
+    for logentry in logentries:
+        has_notifications, has_webhooks = _dispatch_targets(logentry.action_type)
+        if has_notifications:
+            notification_ids.append(logentry.pk)
+        if has_webhooks:
+            webhook_ids.append(logentry.pk)
+
+    if notification_ids:
+        notify_batch.apply_async(args=(notification_ids,))
+    if webhook_ids:
+        notify_webhooks_batch.apply_async(args=(webhook_ids,))
+
+
+def _save_logentries(logentries):
+    from .log import LogEntry
+
+    if connection.features.can_return_rows_from_bulk_insert:
+        LogEntry.objects.bulk_create(logentries)
+    else:
+        # We need to know the primary key of every log entry that triggers notifications or webhooks, and only
+        # some databases return them from a bulk insert.
+        dispatched = [le for le in logentries if any(_dispatch_targets(le.action_type))]
+        LogEntry.objects.bulk_create([le for le in logentries if not any(_dispatch_targets(le.action_type))])
+        for le in dispatched:
+            le.save()
+    dispatch_logentries(logentries)
+
+
+@contextmanager
+def log_batch():
+    """
+    Within this context manager, ``log_action`` does not write log entries to the database immediately. Instead,
+    they are collected and written with a single query when the context manager is left, and all their
+    notifications and webhooks are triggered by one task. This should be used whenever many actions are logged at
+    once, e.g. when many orders or vouchers are created or changed in one request or task.
+
+    Log entries returned by ``log_action`` within this context manager do not have a primary key yet. The context
+    manager should be used within the same database transaction as the logged changes. If an exception occurs,
+    the collected log entries are discarded. Nested calls join the outermost batch.
+    """
+    if getattr(_log_batch, 'entries', None) is not None:
+        yield
+        return
+
+    _log_batch.entries = []
+    try:
+        yield
+        logentries = _log_batch.entries
+    finally:
+        _log_batch.entries = None
+    if logentries:
+        _save_logentries(logentries)
+
+
 class LoggingMixin:
 
     def log_action(self, action, data=None, user=None, api_token=None, auth=None, save=True):
@@ -53,9 +160,6 @@ class LoggingMixin:
         from .devices import Device
         from pretix.api.models import OAuthAccessToken, OAuthApplication
         from .organizer import TeamAPIToken
-        from ..notifications import get_all_notification_types
-        from ..services.notifications import notify
-        from pretix.api.webhooks import get_all_webhook_events, notify_webhooks
 
         event = None
         if isinstance(self, Event):
@@ -90,23 +194,11 @@ class LoggingMixin:
         elif data:
             raise TypeError("You should only supply dictionaries as log data.")
         if save:
-            logentry.save()
-
-            no_types = get_all_notification_types()
-            wh_types = get_all_webhook_events()
-
-            no_type = None
-            wh_type = None
-            typepath = logentry.action_type
-            while (not no_type or not wh_types) and '.' in typepath:
-                wh_type = wh_type or wh_types.get(typepath + ('.*' if typepath != logentry.action_type else ''))
-                no_type = no_type or no_types.get(typepath + ('.*' if typepath != logentry.action_type else ''))
-                typepath = typepath.rsplit('.', 1)[0]
-
-            if no_type:
-                notify.apply_async(args=(logentry.pk,))
-            if wh_type:
-                notify_webhooks.apply_async(args=(logentry.pk,))
+            if getattr(_log_batch, 'entries', None) is not None:
+                _log_batch.entries.append(logentry)
+            else:
+                logentry.save()
+                dispatch_logentry(logentry)
         return logentry
 
 
@@ -392,20 +392,32 @@ class Event(EventMixin, LoggedModel):
             return urljoin(build_absolute_uri(self, 'presale:event.index'), img)
 
     def free_seats(self, ignore_voucher=None, sales_channel='web', include_blocked=False):
+        """
+        Returns a list of all seats that can currently be booked, taking the minimal distance between
+        seats into account if one is configured.
+
+        .. versionchanged:: 3.10.0
+
+           This used to return a queryset. If a minimal distance is configured, the seats are checked
+           against their neighbours in Python and can not be turned back into a queryset efficiently,
+           so a list is returned in all cases.
+        """
         from .seating import Seat
 
         qs_annotated = Seat.annotated(self.seats, self.pk, None,
-                                      ignore_voucher_id=ignore_voucher.pk if ignore_voucher else None,
-                                      minimal_distance=self.settings.seating_minimal_distance,
-                                      distance_only_within_row=self.settings.seating_distance_within_row)
-
-        qs = qs_annotated.filter(has_order=False, has_cart=False, has_voucher=False)
+                                      ignore_voucher_id=ignore_voucher.pk if ignore_voucher else None)
         if self.settings.seating_minimal_distance > 0:
-            qs = qs.filter(has_closeby_taken=False)
+            seats = [
+                s for s in Seat.without_closeby_taken(qs_annotated, self.settings.seating_minimal_distance,
+                                                      self.settings.seating_distance_within_row)
+                if not (s.has_order or s.has_cart or s.has_voucher)
+            ]
+        else:
+            seats = qs_annotated.filter(has_order=False, has_cart=False, has_voucher=False)
 
         if not (sales_channel in self.settings.seating_allow_blocked_seats_for_channel or include_blocked):
-            qs = qs.filter(blocked=False)
-        return qs
+            seats = [s for s in seats if not s.blocked]
+        return list(seats)
 
     @property
     def presale_has_ended(self):
@@ -432,6 +444,13 @@ class Event(EventMixin, LoggedModel):
         self.cache.clear()
         return obj
 
+    def delete(self, *args, **kwargs):
+        # The cache is keyed by the primary key, which is no longer set after the deletion
+        cache = self.cache
+        obj = super().delete(*args, **kwargs)
+        cache.clear()
+        return obj
+
     def get_plugins(self):
         """
         Returns the names of the plugins activated for this event as a list.
@@ -464,13 +483,15 @@ class Event(EventMixin, LoggedModel):
 
         return ObjectRelatedCache(self)
 
-    def lock(self):
+    def lock(self, quotas=None, vouchers=None, seats=None):
         """
-        Returns a contextmanager that can be used to lock an event for bookings.
+        Returns a contextmanager that can be used to lock an event for bookings. If ``quotas``,
+        ``vouchers`` or ``seats`` are given, only bookings affecting these objects are blocked,
+        as far as the configuration allows it.
         """
         from pretix.base.services import locking
 
-        return locking.LockManager(self)
+        return locking.LockManager(self, quotas=quotas, vouchers=vouchers, seats=seats)
 
     def get_mail_backend(self, force_custom=False):
         """
@@ -1043,18 +1064,31 @@ class SubEvent(EventMixin, LoggedModel):
         ).strip()
 
     def free_seats(self, ignore_voucher=None, sales_channel='web', include_blocked=False):
+        """
+        Returns a list of all seats that can currently be booked, taking the minimal distance between
+        seats into account if one is configured.
+
+        .. versionchanged:: 3.10.0
+
+           This used to return a queryset. If a minimal distance is configured, the seats are checked
+           against their neighbours in Python and can not be turned back into a queryset efficiently,
+           so a list is returned in all cases.
+        """
         from .seating import Seat
         qs_annotated = Seat.annotated(self.seats, self.event_id, self,
-                                      ignore_voucher_id=ignore_voucher.pk if ignore_voucher else None,
-                                      minimal_distance=self.settings.seating_minimal_distance,
-                                      distance_only_within_row=self.settings.seating_distance_within_row)
-        qs = qs_annotated.filter(has_order=False, has_cart=False, has_voucher=False)
+                                      ignore_voucher_id=ignore_voucher.pk if ignore_voucher else None)
         if self.settings.seating_minimal_distance > 0:
-            qs = qs.filter(has_closeby_taken=False)
+            seats = [
+                s for s in Seat.without_closeby_taken(qs_annotated, self.settings.seating_minimal_distance,
+                                                      self.settings.seating_distance_within_row)
+                if not (s.has_order or s.has_cart or s.has_voucher)
+            ]
+        else:
+            seats = qs_annotated.filter(has_order=False, has_cart=False, has_voucher=False)
 
         if not (sales_channel in self.settings.seating_allow_blocked_seats_for_channel or include_blocked):
-            qs = qs.filter(blocked=False)
-        return qs
+            seats = [s for s in seats if not s.blocked]
+        return list(seats)
 
     @cached_property
     def settings(self):
@@ -1,8 +1,9 @@
 import string
 from decimal import Decimal
+from typing import List
 
 import pycountry
-from django.db import DatabaseError, models, transaction
+from django.db import DatabaseError, IntegrityError, models, transaction
 from django.db.models import Max
 from django.db.models.functions import Cast
 from django.utils import timezone
@@ -173,16 +174,27 @@ class Invoice(models.Model):
         ]
         return '\n'.join([p.strip() for p in parts if p and p.strip()])
 
-    def _get_numeric_invoice_number(self):
-        numeric_invoices = Invoice.objects.filter(
-            event__organizer=self.event.organizer,
-            prefix=self.prefix,
+    @staticmethod
+    def _get_max_numeric_invoice_number(organizer, prefix):
+        return Invoice.objects.filter(
+            event__organizer=organizer,
+            prefix=prefix,
         ).exclude(invoice_no__contains='-').annotate(
             numeric_number=Cast('invoice_no', models.IntegerField())
         ).aggregate(
             max=Max('numeric_number')
         )['max'] or 0
-        return self._to_numeric_invoice_number(numeric_invoices + 1)
+
+    def _get_numeric_invoice_number(self, resync=False):
+        return InvoiceNumberSequence.allocate(self.organizer, self.prefix, resync=resync)[0]
+
+    def _get_prefix(self):
+        prefix = self.event.settings.invoice_numbers_prefix or (self.event.slug.upper() + '-')
+        if self.is_cancellation:
+            prefix = self.event.settings.invoice_numbers_prefix_cancellations or prefix
+        if '%' in prefix:
+            prefix = self.date.strftime(prefix)
+        return prefix
 
     def _get_invoice_number_from_order(self):
         return '{order}-{count}'.format(
@@ -198,20 +210,18 @@ class Invoice(models.Model):
         if not self.organizer:
             self.organizer = self.order.event.organizer
         if not self.prefix:
-            self.prefix = self.event.settings.invoice_numbers_prefix or (self.event.slug.upper() + '-')
-            if self.is_cancellation:
-                self.prefix = self.event.settings.invoice_numbers_prefix_cancellations or self.prefix
-            if '%' in self.prefix:
-                self.prefix = self.date.strftime(self.prefix)
+            self.prefix = self._get_prefix()
 
         if not self.invoice_no:
             if self.order.testmode:
                 self.prefix += 'TEST-'
             for i in range(10):
                 if self.event.settings.get('invoice_numbers_consecutive'):
-                    self.invoice_no = self._get_numeric_invoice_number()
+                    # If the number is already taken, the sequence is behind the existing invoices
+                    self.invoice_no = self._get_numeric_invoice_number(resync=i > 0)
                 else:
                     self.invoice_no = self._get_invoice_number_from_order()
+                self.full_invoice_no = self.prefix + self.invoice_no
                 try:
                     with transaction.atomic():
                         return super().save(*args, **kwargs)
@@ -293,3 +303,54 @@ class InvoiceLine(models.Model):
 
     def __str__(self):
         return 'Line {} of invoice {}'.format(self.position, self.invoice)
+
+
+class InvoiceNumberSequence(models.Model):
+    """
+    Keeps track of the last consecutive invoice number that has been given out for an invoice number prefix of an
+    organizer, so new numbers can be allocated without looking for the highest existing number every time.
+
+    :param organizer: The organizer this sequence belongs to
+    :type organizer: Organizer
+    :param prefix: The invoice number prefix
+    :type prefix: str
+    :param last: The last number that has been allocated
+    :type last: int
+    """
+    organizer = models.ForeignKey('Organizer', related_name='invoice_number_sequences', on_delete=models.CASCADE)
+    prefix = models.CharField(max_length=160)
+    last = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('organizer', 'prefix')
+
+    @classmethod
+    def allocate(cls, organizer, prefix: str, count=1, resync=False) -> List[str]:
+        """
+        Allocates ``count`` consecutive invoice numbers for the given prefix and returns them. The sequence stays
+        locked until the surrounding transaction ends, so numbers are never given out twice and numbers allocated by
+        a transaction that is rolled back are used again. Unlike the event lock, this only blocks other invoices with
+        the same prefix.
+
+        The sequence is initialized from the existing invoices when it is first used. Pass ``resync=True`` to
+        skip numbers that have been used without the sequence.
+        """
+        with transaction.atomic():
+            seq = cls.objects.select_for_update().filter(organizer=organizer, prefix=prefix).first()
+            if not seq:
+                try:
+                    with transaction.atomic():
+                        seq = cls.objects.create(
+                            organizer=organizer, prefix=prefix,
+                            last=Invoice._get_max_numeric_invoice_number(organizer, prefix)
+                        )
+                except IntegrityError:
+                    # Created concurrently by another transaction, which we waited for
+                    seq = cls.objects.select_for_update().get(organizer=organizer, prefix=prefix)
+            elif resync:
+                seq.last = max(seq.last, Invoice._get_max_numeric_invoice_number(organizer, prefix))
+
+            first = seq.last + 1
+            seq.last += count
+            seq.save(update_fields=['last'])
+        return [Invoice._to_numeric_invoice_number(n) for n in range(first, first + count)]
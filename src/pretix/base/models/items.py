@@ -1447,6 +1447,39 @@ class Quota(LoggedModel):
                 raise ValidationError(_('The subevent does not belong to this event.'))
 
 
+class QuotaCounter(models.Model):
+    """
+    Incrementally maintained number of order positions (by order status) or waiting list entries for
+    one product, used by the counter-based quota availability engine in
+    :py:mod:`pretix.base.services.quotacounters`. The rows are keyed by product instead of by quota, so
+    they stay valid if products are added to or removed from a quota.
+
+    An additional row of kind ``KIND_RECONCILED`` marks events whose counters have been fully
+    reconciled at least once and can therefore be trusted.
+
+    ``subevent_id`` and ``variation_id`` are plain integers that are ``0`` instead of ``NULL`` if
+    not set, since a unique constraint does not prevent duplicate ``NULL`` values on all databases.
+    """
+    KIND_PAID = 'p'
+    KIND_PENDING = 'n'
+    KIND_WAITINGLIST = 'w'
+    KIND_RECONCILED = 'r'
+
+    event = models.ForeignKey(
+        Event,
+        on_delete=models.CASCADE,
+        related_name="quota_counters",
+    )
+    subevent_id = models.PositiveIntegerField(default=0)
+    item_id = models.PositiveIntegerField(default=0)
+    variation_id = models.PositiveIntegerField(default=0)
+    kind = models.CharField(max_length=1)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('event', 'subevent_id', 'item_id', 'variation_id', 'kind'),)
+
+
 class ItemMetaProperty(LoggedModel):
     """
     An event can have ItemMetaProperty objects attached to define meta information fields
@@ -5,7 +5,7 @@ import logging
 import os
 import string
 from collections import Counter
-from datetime import datetime, time, timedelta
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 from typing import Any, Dict, List, Union
 
@@ -562,27 +562,44 @@ class Order(LockModel, LoggedModel):
         })
         return code.upper().translate(tr)
 
-    def assign_code(self):
+    @staticmethod
+    def generate_code(length):
+        """
+        Returns a random order code of the given length that does not contain any banned words. This does not check
+        whether the code is already in use.
+        """
         # This omits some character pairs completely because they are hard to read even on screens (1/I and O/0)
         # and includes only one of two characters for some pairs because they are sometimes hard to distinguish in
         # handwriting (2/Z, 4/A, 5/S, 6/G). This allows for better detection e.g. in incoming wire transfers that
         # might include OCR'd handwritten text
         charset = list('ABCDEFGHJKLMNPQRSTUVWXYZ3789')
+        while True:
+            code = get_random_string(length=length, allowed_chars=charset)
+            if not banned(code):
+                return code
+
+    def assign_code(self):
+        from pretix.base.services.ordercodes import claim_code, pop_code
+
+        if not self.testmode:
+            code = pop_code(self.event.organizer)
+            if code:
+                self.code = code
+                return
+
         iteration = 0
         length = settings.ENTROPY['order_code']
         while True:
-            code = get_random_string(length=length, allowed_chars=charset)
+            code = self.generate_code(length)
             iteration += 1
 
-            if banned(code):
-                continue
-
             if self.testmode:
                 # Subtle way to recognize test orders while debugging: They all contain a 0 at the second place,
                 # even though zeros are not used outside test mode.
                 code = code[0] + "0" + code[2:]
 
-            if not Order.objects.filter(event__organizer=self.event.organizer, code=code).exists():
+            if (not Order.objects.filter(event__organizer=self.event.organizer, code=code).exists()
+                    and claim_code(self.event.organizer, code)):
                 self.code = code
                 return
 
@@ -2265,6 +2282,90 @@ class CancellationRequest(models.Model):
     refund_as_giftcard = models.BooleanField(default=False)
 
 
+class StatisticsRollup(models.Model):
+    """
+    Incrementally maintained number, revenue and tax of the order positions of an event that share
+    a subevent, product, variation, order status, cancellation state and order day. These rows are
+    kept up to date by :py:mod:`pretix.base.services.rollups` and allow the order overview and the
+    statistics to be computed without aggregating over all order positions.
+
+    ``day`` is the date of the order in the timezone of the event. An additional row with status
+    ``STATUS_REBUILT`` and day ``NO_DAY`` marks events whose rollups have been fully rebuilt at least
+    once and can therefore be trusted.
+
+    ``subevent_id`` and ``variation_id`` are plain integers that are ``0`` instead of ``NULL`` if
+    not set and ``day`` is ``NO_DAY`` instead of ``NULL``, since a unique constraint does not prevent
+    duplicate ``NULL`` values on all databases.
+    """
+    STATUS_REBUILT = 'r'
+    NO_DAY = date(1970, 1, 1)
+
+    event = models.ForeignKey(
+        'Event',
+        on_delete=models.CASCADE,
+        related_name="statistics_rollups",
+    )
+    subevent_id = models.PositiveIntegerField(default=0)
+    day = models.DateField(default=NO_DAY)
+    item_id = models.PositiveIntegerField(default=0)
+    variation_id = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=3)
+    canceled = models.BooleanField(default=False)
+    count = models.IntegerField(default=0)
+    price = models.DecimalField(decimal_places=2, max_digits=13, default=Decimal('0.00'))
+    tax_value = models.DecimalField(decimal_places=2, max_digits=13, default=Decimal('0.00'))
+
+    class Meta:
+        unique_together = (('event', 'subevent_id', 'day', 'item_id', 'variation_id', 'status', 'canceled'),)
+
+
+class StatisticsOrderRollup(models.Model):
+    """
+    Incrementally maintained number of orders of an event that have been placed on the same day and
+    paid on the same day. These rows are kept up to date by :py:mod:`pretix.base.services.rollups`
+    together with :py:class:`StatisticsRollup` and allow the orders by day to be computed without
+    aggregating over all orders and their payments.
+
+    ``day`` is the date of the order and ``paid_day`` the date of its latest confirmed or refunded
+    payment in the timezone of the event, or ``StatisticsRollup.NO_DAY`` if there is none.
+    """
+    event = models.ForeignKey(
+        'Event',
+        on_delete=models.CASCADE,
+        related_name="statistics_order_rollups",
+    )
+    day = models.DateField()
+    paid_day = models.DateField(default=StatisticsRollup.NO_DAY)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('event', 'day', 'paid_day'),)
+
+
+class OrderSearchDocument(models.Model):
+    """
+    Denormalized, lowercased copy of the searchable fields of an order or an order position, maintained by
+    :py:mod:`pretix.base.services.search`. Every order has one document without a position, containing only the
+    fields of the order, and one document per position, containing the fields of the order and of the position.
+
+    ``text`` contains all values that can be matched anywhere, separated by line breaks. ``prefixes`` contains all
+    values that can only be matched at their beginning, each preceded by a line break.
+    """
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name="search_documents",
+    )
+    position = models.ForeignKey(
+        'OrderPosition',
+        null=True,
+        on_delete=models.CASCADE,
+        related_name="search_documents",
+    )
+    text = models.TextField()
+    prefixes = models.TextField()
+
+
 @receiver(post_delete, sender=CachedTicket)
 def cachedticket_delete(sender, instance, **kwargs):
     if instance.file:
@@ -61,6 +61,13 @@ class Organizer(LoggedModel):
         self.get_cache().clear()
         return obj
 
+    def delete(self, *args, **kwargs):
+        # The cache is keyed by the primary key, which is no longer set after the deletion
+        cache = self.cache
+        obj = super().delete(*args, **kwargs)
+        cache.clear()
+        return obj
+
     def get_cache(self):
         """
         Returns an :py:class:`ObjectRelatedCache` object. This behaves equivalent to
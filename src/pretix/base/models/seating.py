@@ -1,5 +1,6 @@
 import json
-from collections import namedtuple
+import math
+from collections import defaultdict, namedtuple
 
 import jsonschema
 from django.contrib.staticfiles import finders
@@ -118,6 +119,42 @@ class SeatCategoryMapping(models.Model):
     product = models.ForeignKey(Item, related_name='seat_category_mappings', on_delete=models.CASCADE)
 
 
+class SeatGrid:
+    """
+    A uniform grid of seat positions that allows to check whether any seat is closer than ``distance`` to a given point
+    by looking at the nine grid cells around it, instead of comparing the point with every seat.
+    """
+
+    def __init__(self, distance, only_within_row=False):
+        self.distance = distance
+        self.only_within_row = only_within_row
+        self.cells = defaultdict(list)
+
+    def _cell(self, x, y, row_name):
+        return (
+            row_name if self.only_within_row else None,
+            math.floor(x / self.distance),
+            math.floor(y / self.distance),
+        )
+
+    def add(self, x, y, row_name=None):
+        if x is None or y is None:
+            return
+        self.cells[self._cell(x, y, row_name)].append((x, y))
+
+    def any_within(self, x, y, row_name=None):
+        if x is None or y is None:
+            return False
+        row, cx, cy = self._cell(x, y, row_name)
+        limit = self.distance ** 2
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for ox, oy in self.cells.get((row, cx + dx, cy + dy), ()):
+                    if (ox - x) ** 2 + (oy - y) ** 2 < limit:
+                        return True
+        return False
+
+
 class Seat(models.Model):
     """
     This model is used to represent every single specific seat within an (sub)event that can be selected. It's mainly
@@ -161,8 +198,7 @@ class Seat(models.Model):
         return ', '.join(parts)
 
     @classmethod
-    def annotated(cls, qs, event_id, subevent, ignore_voucher_id=None, minimal_distance=0,
-                  ignore_order_id=None, ignore_cart_id=None, distance_only_within_row=False):
+    def annotated(cls, qs, event_id, subevent, ignore_voucher_id=None, ignore_order_id=None, ignore_cart_id=None):
         from . import Order, OrderPosition, Voucher, CartPosition
 
         vqs = Voucher.objects.filter(
@@ -203,23 +239,24 @@ class Seat(models.Model):
             )
         )
 
-        if minimal_distance > 0:
-            # TODO: Is there a more performant implementation on PostgreSQL using
-            # https://www.postgresql.org/docs/8.2/functions-geometry.html ?
-            sq_closeby = qs_annotated.annotate(
-                distance=(
-                    Power(F('x') - OuterRef('x'), Value(2), output_field=models.FloatField()) +
-                    Power(F('y') - OuterRef('y'), Value(2), output_field=models.FloatField())
-                )
-            ).filter(
-                Q(has_order=True) | Q(has_cart=True) | Q(has_voucher=True),
-                distance__lt=minimal_distance ** 2
-            )
-            if distance_only_within_row:
-                sq_closeby = sq_closeby.filter(row_name=OuterRef('row_name'))
-            qs_annotated = qs_annotated.annotate(has_closeby_taken=Exists(sq_closeby))
         return qs_annotated
 
+    @classmethod
+    def without_closeby_taken(cls, qs_annotated, minimal_distance, distance_only_within_row=False):
+        """
+        Returns the seats of a queryset returned by ``annotated`` that do not have a taken seat closer than
+        ``minimal_distance`` as a list.
+        """
+        # Comparing every seat with every taken seat in SQL is quadratic in the size of the seating plan, so we
+        # fetch all seats once and look up the taken seats around every seat in a grid instead. The result is not
+        # turned back into a queryset, since that would need one query parameter per seat.
+        grid = SeatGrid(minimal_distance, distance_only_within_row)
+        seats = list(qs_annotated)
+        for seat in seats:
+            if seat.has_order or seat.has_cart or seat.has_voucher:
+                grid.add(seat.x, seat.y, seat.row_name)
+        return [seat for seat in seats if not grid.any_within(seat.x, seat.y, seat.row_name)]
+
     def is_available(self, ignore_cart=None, ignore_orderpos=None, ignore_voucher_id=None, sales_channel='web',
                      ignore_distancing=False, distance_ignore_cart_id=None):
         from .orders import Order
@@ -245,24 +282,28 @@ class Seat(models.Model):
         if opqs.exists() or (ignore_cart is not True and cpqs.exists()) or vqs.exists():
             return False
 
-        if self.event.settings.seating_minimal_distance > 0 and not ignore_distancing:
+        if self.event.settings.seating_minimal_distance > 0 and not ignore_distancing and self.x is not None and self.y is not None:
             ev = (self.subevent or self.event)
             qs_annotated = Seat.annotated(ev.seats, self.event_id, self.subevent,
                                           ignore_voucher_id=ignore_voucher_id,
-                                          minimal_distance=0,
                                           ignore_order_id=ignore_orderpos.order_id if ignore_orderpos else None,
                                           ignore_cart_id=(
                                               distance_ignore_cart_id or
                                               (ignore_cart.cart_id if ignore_cart else None)
                                           ))
-            qs_closeby_taken = qs_annotated.annotate(
+            distance = self.event.settings.seating_minimal_distance
+            qs_closeby_taken = qs_annotated.filter(
+                # Narrow the candidates down to the bounding box first, so the distance is only computed for few seats
+                x__gt=self.x - distance, x__lt=self.x + distance,
+                y__gt=self.y - distance, y__lt=self.y + distance,
+            ).annotate(
                 distance=(
                     Power(F('x') - Value(self.x), Value(2), output_field=models.FloatField()) +
                     Power(F('y') - Value(self.y), Value(2), output_field=models.FloatField())
                 )
             ).exclude(pk=self.pk).filter(
                 Q(has_order=True) | Q(has_cart=True) | Q(has_voucher=True),
-                distance__lt=self.event.settings.seating_minimal_distance ** 2
+                distance__lt=distance ** 2
             )
             if self.event.settings.seating_distance_within_row:
                 qs_closeby_taken = qs_closeby_taken.filter(row_name=self.row_name)
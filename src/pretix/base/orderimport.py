@@ -117,6 +117,15 @@ class ImportColumn:
         """
         pass
 
+    def save_many(self, orders):
+        """
+        This will be called with chunks of orders that have already been saved to the database inside the actual
+        database transaction. The default implementation calls ``save`` for every order, you can override it to
+        persist your related objects in bulk.
+        """
+        for order in orders:
+            self.save(order)
+
 
 class EmailColumn(ImportColumn):
     identifier = 'email'
@@ -662,6 +671,25 @@ class QuestionColumn(ImportColumn):
             if hasattr(a, '_options'):
                 a.options.add(*a._options)
 
+    def save_many(self, orders):
+        # All question columns share the list of answers of an order, so we only persist the answers to our question
+        answers = [a for o in orders for a in getattr(o, '_answers', []) if a.question_id == self.q.pk]
+        for a in answers:
+            a.orderposition = a.orderposition  # Picks up the primary key of the position saved in the meantime
+        QuestionAnswer.objects.bulk_create(answers)
+
+        with_options = [a for a in answers if getattr(a, '_options', None)]
+        if any(a.pk is None for a in with_options):
+            pks = dict(QuestionAnswer.objects.filter(
+                question=self.q, orderposition_id__in=[a.orderposition_id for a in with_options]
+            ).values_list('orderposition_id', 'pk'))
+            for a in with_options:
+                a.pk = pks[a.orderposition_id]
+        through = QuestionAnswer.options.through
+        through.objects.bulk_create([
+            through(questionanswer_id=a.pk, questionoption_id=o.pk) for a in with_options for o in a._options
+        ])
+
 
 def get_all_columns(event):
     default = []
@@ -2,6 +2,7 @@ import copy
 import itertools
 import logging
 import os
+import re
 import subprocess
 import tempfile
 import uuid
@@ -373,12 +374,25 @@ def get_variables(event):
     return v
 
 
+_fonts_registered = False
+_form_counter = itertools.count()
+# Texts without any characters from right-to-left or Arabic scripts do not need to be reshaped or reordered
+_rtl_or_arabic = re.compile('[\u0590-\u08FF\uFB1D-\uFDFF\uFE70-\uFEFF]')
+_reshaper = ArabicReshaper(configuration={
+    'delete_harakat': True,
+    'support_ligatures': False,
+})
+
+
 class Renderer:
 
     def __init__(self, event, layout, background_file):
         self.layout = layout
         self.background_file = background_file
         self.variables = get_variables(event)
+        self._styles = {}
+        self._form_prefix = 'pretixlayout{}x'.format(next(_form_counter))
+        self._plan = self._compile_layout(layout)
         if self.background_file:
             self.bg_bytes = self.background_file.read()
             self.bg_pdf = PdfFileReader(BytesIO(self.bg_bytes), strict=False)
@@ -388,6 +402,10 @@ class Renderer:
 
     @classmethod
     def _register_fonts(cls):
+        global _fonts_registered
+        if _fonts_registered:
+            return
+
         pdfmetrics.registerFont(TTFont('Open Sans', finders.find('fonts/OpenSans-Regular.ttf')))
         pdfmetrics.registerFont(TTFont('Open Sans I', finders.find('fonts/OpenSans-Italic.ttf')))
         pdfmetrics.registerFont(TTFont('Open Sans B', finders.find('fonts/OpenSans-Bold.ttf')))
@@ -401,6 +419,7 @@ class Renderer:
                 pdfmetrics.registerFont(TTFont(family + ' B', finders.find(styles['bold']['truetype'])))
             if 'bolditalic' in styles:
                 pdfmetrics.registerFont(TTFont(family + ' B I', finders.find(styles['bolditalic']['truetype'])))
+        _fonts_registered = True
 
     def _draw_poweredby(self, canvas: Canvas, op: OrderPosition, o: dict):
         content = o.get('content', 'dark')
@@ -467,32 +486,15 @@ class Renderer:
         if o['italic']:
             font += ' I'
 
-        align_map = {
-            'left': TA_LEFT,
-            'center': TA_CENTER,
-            'right': TA_RIGHT
-        }
-        style = ParagraphStyle(
-            name=uuid.uuid4().hex,
-            fontName=font,
-            fontSize=float(o['fontsize']),
-            leading=float(o['fontsize']),
-            autoLeading="max",
-            textColor=Color(o['color'][0] / 255, o['color'][1] / 255, o['color'][2] / 255),
-            alignment=align_map[o['align']]
-        )
+        style = self._get_paragraph_style(font, o)
         text = conditional_escape(
             self._get_text_content(op, order, o) or "",
         ).replace("\n", "<br/>\n")
 
         # reportlab does not support RTL, ligature-heavy scripts like Arabic. Therefore, we use ArabicReshaper
         # to resolve all ligatures and python-bidi to switch RTL texts.
-        configuration = {
-            'delete_harakat': True,
-            'support_ligatures': False,
-        }
-        reshaper = ArabicReshaper(configuration=configuration)
-        text = "<br/>".join(get_display(reshaper.reshape(l)) for l in text.split("<br/>"))
+        if _rtl_or_arabic.search(text):
+            text = "<br/>".join(get_display(_reshaper.reshape(l)) for l in text.split("<br/>"))
 
         p = Paragraph(text, style=style)
         w, h = p.wrapOn(canvas, float(o['width']) * mm, 1000 * mm)
@@ -511,16 +513,78 @@ class Renderer:
             p.drawOn(canvas, 0, -h - ad[1])
         canvas.restoreState()
 
-    def draw_page(self, canvas: Canvas, order: Order, op: OrderPosition, show_page=True):
-        for o in self.layout:
-            if o['type'] == "barcodearea":
-                self._draw_barcodearea(canvas, op, o)
-            elif o['type'] == "textarea":
-                self._draw_textarea(canvas, op, order, o)
-            elif o['type'] == "poweredby":
-                self._draw_poweredby(canvas, op, o)
+    def _get_paragraph_style(self, font, o: dict):
+        key = (font, o['fontsize'], tuple(o['color'][:3]), o['align'])
+        if key not in self._styles:
+            align_map = {
+                'left': TA_LEFT,
+                'center': TA_CENTER,
+                'right': TA_RIGHT
+            }
+            self._styles[key] = ParagraphStyle(
+                name=uuid.uuid4().hex,
+                fontName=font,
+                fontSize=float(o['fontsize']),
+                leading=float(o['fontsize']),
+                autoLeading="max",
+                textColor=Color(o['color'][0] / 255, o['color'][1] / 255, o['color'][2] / 255),
+                alignment=align_map[o['align']]
+            )
+        return self._styles[key]
+
+    @staticmethod
+    def _is_static(o: dict):
+        return o['type'] == 'poweredby' or (o['type'] == 'textarea' and o.get('content') == 'other')
+
+    def _compile_layout(self, layout):
+        """
+        Groups consecutive elements that look the same on every page, e.g. fixed texts, so they can be
+        drawn once per document as a form and then be reused on every page, keeping the stacking order.
+        """
+        plan = []
+        for o in layout:
+            if self._is_static(o):
+                if plan and plan[-1][0] == 'static':
+                    plan[-1][1].append(o)
+                else:
+                    plan.append(('static', [o]))
+            else:
+                plan.append(('dynamic', o))
+        return [
+            (kind, ('{}{}'.format(self._form_prefix, i), o) if kind == 'static' else o)
+            for i, (kind, o) in enumerate(plan)
+        ]
+
+    def _draw_object(self, canvas: Canvas, op: OrderPosition, order: Order, o: dict):
+        if o['type'] == "barcodearea":
+            self._draw_barcodearea(canvas, op, o)
+        elif o['type'] == "textarea":
+            self._draw_textarea(canvas, op, order, o)
+        elif o['type'] == "poweredby":
+            self._draw_poweredby(canvas, op, o)
+
+    def _draw_static(self, canvas: Canvas, op: OrderPosition, order: Order, name: str, objs: list):
+        forms = canvas.__dict__.setdefault('_pretix_forms', set())
+        if name not in forms:
             if self.bg_pdf:
-                canvas.setPageSize((self.bg_pdf.getPage(0).mediaBox[2], self.bg_pdf.getPage(0).mediaBox[3]))
+                width, height = self.bg_pdf.getPage(0).mediaBox[2], self.bg_pdf.getPage(0).mediaBox[3]
+            else:
+                width, height = canvas._pagesize
+            canvas.beginForm(name, upperx=float(width), uppery=float(height))
+            for o in objs:
+                self._draw_object(canvas, op, order, o)
+            canvas.endForm()
+            forms.add(name)
+        canvas.doForm(name)
+
+    def draw_page(self, canvas: Canvas, order: Order, op: OrderPosition, show_page=True):
+        for kind, o in self._plan:
+            if kind == 'static':
+                self._draw_static(canvas, op, order, *o)
+            else:
+                self._draw_object(canvas, op, order, o)
+        if self.bg_pdf and self.layout:
+            canvas.setPageSize((self.bg_pdf.getPage(0).mediaBox[2], self.bg_pdf.getPage(0).mediaBox[3]))
         if show_page:
             canvas.showPage()
 
@@ -10,7 +10,7 @@ from pretix.base.email import get_email_context
 from pretix.base.i18n import language
 from pretix.base.models import (
     Event, InvoiceAddress, Order, OrderFee, OrderPosition, OrderRefund,
-    SubEvent, User, WaitingListEntry,
+    SubEvent, User, WaitingListEntry, log_batch,
 )
 from pretix.base.services.locking import LockTimeoutException
 from pretix.base.services.mail import SendMailException, TolerantDict, mail
@@ -135,16 +135,17 @@ def cancel_event(self, event: Event, subevent: int, auto_refund: bool, keep_fee_
         )
     else:
         orders_to_change = event.orders.none()
-        event.log_action(
-            'pretix.event.canceled', user=user,
-        )
-
-        for i in event.items.filter(active=True):
-            i.active = False
-            i.save(update_fields=['active'])
-            i.log_action(
-                'pretix.event.item.changed', user=user, data={'active': False, '_source': 'cancel_event'}
+        with transaction.atomic(), log_batch():
+            event.log_action(
+                'pretix.event.canceled', user=user,
             )
+
+            for i in event.items.filter(active=True):
+                i.active = False
+                i.save(update_fields=['active'])
+                i.log_action(
+                    'pretix.event.item.changed', user=user, data={'active': False, '_source': 'cancel_event'}
+                )
     failed = 0
 
     for o in orders_to_cancel.only('id', 'total'):
@@ -1,6 +1,7 @@
 from collections import Counter, defaultdict, namedtuple
 from datetime import datetime, time, timedelta
 from decimal import Decimal
+from functools import partial
 from typing import List, Optional
 
 from celery.exceptions import MaxRetriesExceededError
@@ -8,6 +9,7 @@ from django.core.exceptions import ValidationError
 from django.db import DatabaseError, transaction
 from django.db.models import Count, Exists, OuterRef, Q
 from django.dispatch import receiver
+from django.utils.functional import cached_property
 from django.utils.timezone import make_aware, now
 from django.utils.translation import gettext as _, pgettext_lazy
 from django_scopes import scopes_disabled
@@ -24,7 +26,7 @@ from pretix.base.models.tax import TAXED_ZERO, TaxedPrice, TaxRule
 from pretix.base.reldate import RelativeDateWrapper
 from pretix.base.services.checkin import _save_answers
 from pretix.base.services.locking import LockTimeoutException, NoLockManager
-from pretix.base.services.pricing import get_price
+from pretix.base.services.pricing import PriceSpec, PricingContext, get_prices
 from pretix.base.services.quotas import QuotaAvailability
 from pretix.base.services.tasks import ProfiledEventTask
 from pretix.base.settings import PERSON_NAME_SCHEMES
@@ -138,6 +140,11 @@ class CartManager:
         self.invoice_address = invoice_address
         self._widget_data = widget_data or {}
         self._sales_channel = sales_channel
+        self._pricing = PricingContext(event, invoice_address)
+
+    @cached_property
+    def _display_net_prices(self):
+        return self.event.settings.display_net_prices
 
     @property
     def positions(self):
@@ -310,22 +317,28 @@ class CartManager:
             if op.item.require_bundling and not op.addon_to == 'FAKE':
                 raise CartError(error_messages['bundled_only'])
 
-    def _get_price(self, item: Item, variation: Optional[ItemVariation],
-                   voucher: Optional[Voucher], custom_price: Optional[Decimal],
-                   subevent: Optional[SubEvent], cp_is_net: bool=None, force_custom_price=False,
-                   bundled_sum=Decimal('0.00')):
+    def _price_spec(self, item: Item, variation: Optional[ItemVariation],
+                    voucher: Optional[Voucher], custom_price: Optional[Decimal],
+                    subevent: Optional[SubEvent], cp_is_net: bool=None, force_custom_price=False,
+                    bundled_sum=Decimal('0.00')):
+        return PriceSpec(
+            item, variation, voucher, custom_price, subevent,
+            custom_price_is_net=cp_is_net if cp_is_net is not None else self._display_net_prices,
+            force_custom_price=force_custom_price, bundled_sum=bundled_sum
+        )
+
+    def _get_prices(self, specs: List[PriceSpec]):
         try:
-            return get_price(
-                item, variation, voucher, custom_price, subevent,
-                custom_price_is_net=cp_is_net if cp_is_net is not None else self.event.settings.display_net_prices,
-                invoice_address=self.invoice_address, force_custom_price=force_custom_price, bundled_sum=bundled_sum
-            )
+            return get_prices(specs, self._pricing)
         except ValueError as e:
             if str(e) == 'price_too_high':
                 raise CartError(error_messages['price_too_high'])
             else:
                 raise e
 
+    def _get_price(self, *args, **kwargs):
+        return self._get_prices([self._price_spec(*args, **kwargs)])[0]
+
     def extend_expired_positions(self):
         expired = self.positions.filter(expires__lte=self.now_dt).select_related(
             'item', 'variation', 'voucher', 'addon_to', 'addon_to__item'
@@ -341,6 +354,7 @@ class CartManager:
             'variation__quotas',
             'addons'
         ).order_by('-is_bundled')
+        self._pricing.load([self._price_spec(cp.item, cp.variation, cp.voucher, None, cp.subevent) for cp in expired])
         err = None
         changed_prices = {}
         for cp in expired:
@@ -425,6 +439,8 @@ class CartManager:
         if not voucher.is_active():
             raise CartError(error_messages['voucher_expired'])
 
+        candidates = []
+        specs = []
         for p in self.positions:
             if p.voucher_id:
                 continue
@@ -448,7 +464,10 @@ class CartManager:
                         bundledprice = bundledp.price
                         bundled_sum += bundledprice
 
-            price = self._get_price(p.item, p.variation, voucher, None, p.subevent, bundled_sum=bundled_sum)
+            candidates.append(p)
+            specs.append(self._price_spec(p.item, p.variation, voucher, None, p.subevent, bundled_sum=bundled_sum))
+
+        for p, price in zip(candidates, self._get_prices(specs)):
             """
             if price.gross > p.price:
                 continue
@@ -1013,7 +1032,12 @@ class CartManager:
 
         lockfn = NoLockManager
         if self._require_locking():
-            lockfn = self.event.lock
+            lockfn = partial(
+                self.event.lock,
+                quotas=[q for q in self._quota_diff if q.size is not None],
+                vouchers=list(self._voucher_use_diff),
+                seats=[o.seat for o in self._operations if getattr(o, 'seat', None)],
+            )
 
         with lockfn() as now_dt:
             with transaction.atomic():
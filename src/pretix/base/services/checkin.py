@@ -1,7 +1,10 @@
+import json
 from datetime import timedelta
+from functools import lru_cache
 
 import dateutil
 from django.db import transaction
+from django.db.models import Count, Q
 from django.db.models.functions import TruncDate
 from django.dispatch import receiver
 from django.utils.functional import cached_property
@@ -42,6 +45,23 @@ def get_logic_environment(ev):
     return logic
 
 
+@lru_cache(maxsize=512)
+def _compile_rules(rules, ev, date_from, date_to, date_admission):
+    # The dates are part of the cache key so that changing the event invalidates the compiled rules
+    return get_logic_environment(ev).compile(json.loads(rules))
+
+
+def get_compiled_rules(clist, ev):
+    """
+    Returns the rules of the given check-in list as a callable, compiled in the logic environment of
+    the given event or subevent. Compiled rules are cached per process, keyed by the rule content,
+    so any change to the check-in list's rules results in a new compilation.
+    """
+    return _compile_rules(
+        json.dumps(clist.rules, sort_keys=True), ev, ev.date_from, ev.date_to, ev.date_admission
+    )
+
+
 class LazyRuleVars:
     def __init__(self, position, clist, dt):
         self._position = position
@@ -66,22 +86,28 @@ class LazyRuleVars:
         return self._position.variation_id
 
     @cached_property
+    def _entry_counts(self):
+        # All entry counters are computed in one query, since rules using one of them usually use the others as well
+        tz = self._clist.event.timezone
+        midnight = now().astimezone(tz).replace(hour=0, minute=0, second=0, microsecond=0)
+        with override(tz):
+            return self._position.checkins.filter(list=self._clist, type=Checkin.TYPE_ENTRY).aggregate(
+                number=Count('pk'),
+                today=Count('pk', filter=Q(datetime__gte=midnight)),
+                days=Count(TruncDate('datetime'), distinct=True),
+            )
+
+    @property
     def entries_number(self):
-        return self._position.checkins.filter(type=Checkin.TYPE_ENTRY, list=self._clist).count()
+        return self._entry_counts['number']
 
-    @cached_property
+    @property
     def entries_today(self):
-        tz = self._clist.event.timezone
-        midnight = now().astimezone(tz).replace(hour=0, minute=0, second=0, microsecond=0)
-        return self._position.checkins.filter(type=Checkin.TYPE_ENTRY, list=self._clist, datetime__gte=midnight).count()
+        return self._entry_counts['today']
 
-    @cached_property
+    @property
     def entries_days(self):
-        tz = self._clist.event.timezone
-        with override(tz):
-            return self._position.checkins.filter(list=self._clist, type=Checkin.TYPE_ENTRY).annotate(
-                day=TruncDate('datetime')
-            ).values('day').distinct().count()
+        return self._entry_counts['days']
 
 
 class CheckInError(Exception):
@@ -200,8 +226,8 @@ def perform_checkin(op: OrderPosition, clist: CheckinList, given_answers: dict,
 
     if type == Checkin.TYPE_ENTRY and clist.rules and not force:
         rule_data = LazyRuleVars(op, clist, dt)
-        logic = get_logic_environment(op.subevent or clist.event)
-        if not logic.apply(clist.rules, rule_data):
+        rules = get_compiled_rules(clist, op.subevent or clist.event)
+        if not rules(rule_data):
             raise CheckInError(
                 _('This entry is not permitted due to custom rules.'),
                 'rules'
@@ -1,9 +1,23 @@
+import heapq
+import inspect
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import chain
 from typing import Any, Dict
 
-from django.core.files.base import ContentFile
+from dateutil.parser import isoparse
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.db import connections
 from django.utils.timezone import override
 from django.utils.translation import gettext
+from django_scopes import scope
 
+from pretix.base.exporter import MultiSheetListExporter
 from pretix.base.i18n import LazyLocaleException, language
 from pretix.base.models import (
     CachedFile, Event, Organizer, User, cachedfile_name,
@@ -21,6 +35,137 @@ class ExportError(LazyLocaleException):
     pass
 
 
+def _render_to_cachedfile(file, render):
+    """
+    Stores the result of an exporter in a ``CachedFile``. ``render`` is called with a temporary
+    file that the exporter can write to. If it does, the file is copied to the storage backend in
+    chunks, so large exports never need to fit into memory.
+    """
+    with tempfile.TemporaryFile() as f:
+        d = render(f)
+        if d is None:
+            raise ExportError(
+                gettext('Your export did not contain any data.')
+            )
+        file.filename, file.type, data = d
+        if data is None:
+            f.seek(0)
+            file.file.save(cachedfile_name(file, file.filename), File(f))
+        else:
+            file.file.save(cachedfile_name(file, file.filename), ContentFile(data))
+        file.save()
+
+
+def _render(ex, form_data, output_file):
+    if 'output_file' in inspect.signature(ex.render).parameters:
+        return ex.render(form_data, output_file=output_file)
+    return ex.render(form_data)
+
+
+class ShardEncoder(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return {'__decimal__': str(o)}
+        elif isinstance(o, datetime):
+            return {'__datetime__': o.isoformat()}
+        elif isinstance(o, date):
+            return {'__date__': o.isoformat()}
+        return str(o)
+
+
+def _decode_shard_value(d):
+    if '__decimal__' in d:
+        return Decimal(d['__decimal__'])
+    elif '__datetime__' in d:
+        return isoparse(d['__datetime__'])
+    elif '__date__' in d:
+        return isoparse(d['__date__']).date()
+    return d
+
+
+def _export_shard(response, organizer, user, event_id, event_ids, form_data, filenames, threaded=False):
+    """
+    Runs a shardable exporter for a single event and writes the header and all rows of every sheet to
+    a file with one JSON-encoded row per line.
+    """
+    try:
+        with scope(organizer=organizer), language(user.locale), override(user.timezone):
+            ex = response(Event.objects.filter(pk=event_id))
+            ex.sharded = True
+            ex.shard_events = Event.objects.filter(pk__in=event_ids)
+            for sheet, filename in filenames.items():
+                lines = ex.iterate_list(form_data) if sheet is None else ex.iterate_sheet(form_data, sheet)
+                with open(filename, 'w', encoding='utf-8') as f:
+                    for line in lines:
+                        f.write(json.dumps(line, cls=ShardEncoder) + '\n')
+    finally:
+        if threaded:
+            connections.close_all()
+
+
+def _read_shard(filename, skip_header):
+    with open(filename, 'r', encoding='utf-8') as f:
+        for i, line in enumerate(f):
+            if i > 0 or not skip_header:
+                yield json.loads(line, object_hook=_decode_shard_value)
+
+
+def _merge_shards(ex, filenames):
+    header = next(_read_shard(filenames[0], skip_header=False), None)
+    shards = [_read_shard(fname, skip_header=True) for fname in filenames]
+    if ex.shard_sort_key:
+        rows = heapq.merge(*shards, key=ex.shard_sort_key)
+    else:
+        rows = chain(*shards)
+    if ex.shard_extra_columns:
+        rows = (row[:-ex.shard_extra_columns] for row in rows)
+    return chain([header] if header else [], rows)
+
+
+def _render_sharded(task, ex, response, organizer, user, events, form_data, output_file):
+    """
+    Splits a multi-event export into one export per event. With ``export_workers`` set to more than
+    one, these run in a thread pool. The partial results are merged into one file afterwards, in
+    the order of ``ex.shard_sort_key`` if given and grouped by event otherwise. Exporters with
+    multiple sheets are merged sheet by sheet.
+    """
+    event_ids = list(events.order_by('date_from', 'pk').values_list('pk', flat=True))
+    sheets = ex.rendered_sheets(form_data) if isinstance(ex, MultiSheetListExporter) else [None]
+    workers = min(settings.PRETIX_EXPORT_WORKERS, len(event_ids))
+    with tempfile.TemporaryDirectory() as d:
+        filenames = [
+            {sheet: os.path.join(d, '{}_{}.jsonl'.format(i, sheet or '')) for sheet in sheets}
+            for i in range(len(event_ids))
+        ]
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(_export_shard, response, organizer, user, event_id, event_ids, form_data, fnames,
+                                    threaded=True)
+                    for event_id, fnames in zip(event_ids, filenames)
+                ]
+                for i, future in enumerate(as_completed(futures)):
+                    future.result()
+                    _report_progress(task, (i + 1) / (len(event_ids) + 1) * 100)
+        else:
+            for i, (event_id, fnames) in enumerate(zip(event_ids, filenames)):
+                _export_shard(response, organizer, user, event_id, event_ids, form_data, fnames)
+                _report_progress(task, (i + 1) / (len(event_ids) + 1) * 100)
+
+        if isinstance(ex, MultiSheetListExporter):
+            return ex.render_sheets(
+                form_data, lambda sheet: _merge_shards(ex, [fnames[sheet] for fnames in filenames]),
+                output_file=output_file
+            )
+        return ex.render_lines(form_data, _merge_shards(ex, [fnames[None] for fnames in filenames]),
+                               output_file=output_file)
+
+
+def _report_progress(task, percentage):
+    if settings.HAS_CELERY and not task.request.called_directly:
+        task.update_state(state='PROGRESS', meta={'value': round(percentage)})
+
+
 @app.task(base=ProfiledEventTask, throws=(ExportError,))
 def export(event: Event, fileid: str, provider: str, form_data: Dict[str, Any]) -> None:
     file = CachedFile.objects.get(id=fileid)
@@ -29,19 +174,12 @@ def export(event: Event, fileid: str, provider: str, form_data: Dict[str, Any])
         for receiver, response in responses:
             ex = response(event)
             if ex.identifier == provider:
-                d = ex.render(form_data)
-                if d is None:
-                    raise ExportError(
-                        gettext('Your export did not contain any data.')
-                    )
-                file.filename, file.type, data = d
-                file.file.save(cachedfile_name(file, file.filename), ContentFile(data))
-                file.save()
+                _render_to_cachedfile(file, lambda f: _render(ex, form_data, f))
     return file.pk
 
 
-@app.task(base=ProfiledOrganizerUserTask, throws=(ExportError,))
-def multiexport(organizer: Organizer, user: User, fileid: str, provider: str, form_data: Dict[str, Any]) -> None:
+@app.task(base=ProfiledOrganizerUserTask, bind=True, throws=(ExportError,))
+def multiexport(self, organizer: Organizer, user: User, fileid: str, provider: str, form_data: Dict[str, Any]) -> None:
     file = CachedFile.objects.get(id=fileid)
     with language(user.locale), override(user.timezone):
         allowed_events = user.get_events_with_permission('can_view_orders')
@@ -52,12 +190,10 @@ def multiexport(organizer: Organizer, user: User, fileid: str, provider: str, fo
         for receiver, response in responses:
             ex = response(events)
             if ex.identifier == provider:
-                d = ex.render(form_data)
-                if d is None:
-                    raise ExportError(
-                        gettext('Your export did not contain any data.')
-                    )
-                file.filename, file.type, data = d
-                file.file.save(cachedfile_name(file, file.filename), ContentFile(data))
-                file.save()
+                if getattr(ex, 'shardable', False) and events.count() > 1:
+                    _render_to_cachedfile(file, lambda f: _render_sharded(
+                        self, ex, response, organizer, user, events, form_data, f
+                    ))
+                else:
+                    _render_to_cachedfile(file, lambda f: _render(ex, form_data, f))
     return file.pk
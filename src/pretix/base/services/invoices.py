@@ -2,8 +2,11 @@ import inspect
 import json
 import logging
 import urllib.error
+import uuid
+from collections import defaultdict
 from datetime import date, timedelta
 from decimal import ROUND_HALF_UP, Decimal
+from typing import List
 
 import vat_moss.exchange_rates
 from django.conf import settings
@@ -14,6 +17,7 @@ from django.db.models import Count
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.formats import date_format
+from django.utils.functional import cached_property
 from django.utils.timezone import now
 from django.utils.translation import gettext as _, pgettext
 from django_countries.fields import Country
@@ -22,7 +26,8 @@ from i18nfield.strings import LazyI18nString
 
 from pretix.base.i18n import language
 from pretix.base.models import (
-    Invoice, InvoiceAddress, InvoiceLine, Order, OrderFee,
+    Invoice, InvoiceAddress, InvoiceLine, InvoiceNumberSequence, Order,
+    OrderFee,
 )
 from pretix.base.models.tax import EU_CURRENCIES
 from pretix.base.services.tasks import TransactionAwareTask
@@ -34,44 +39,79 @@ from pretix.helpers.models import modelcopy
 
 logger = logging.getLogger(__name__)
 
+PDF_CHUNK_SIZE = 50
+
+
+class InvoiceSettings:
+    """
+    The settings of an event that are needed to build its invoices. ``build_invoice`` looks them up for every
+    invoice unless an instance is passed in, which allows building many invoices of the same event without
+    resolving the same settings, payment providers and exchange rates over and over again.
+    """
+
+    def __init__(self, event):
+        self.event = event
+        s = event.settings
+        self.locale = s.locale
+        self.language = s.get('invoice_language', s.locale)
+        self.address_from = {
+            'invoice_from': s.get('invoice_address_from'),
+            'invoice_from_name': s.get('invoice_address_from_name'),
+            'invoice_from_zipcode': s.get('invoice_address_from_zipcode'),
+            'invoice_from_city': s.get('invoice_address_from_city'),
+            'invoice_from_country': s.get('invoice_address_from_country'),
+            'invoice_from_tax_id': s.get('invoice_address_from_tax_id'),
+            'invoice_from_vat_id': s.get('invoice_address_from_vat_id'),
+        }
+        self.introductory_text = s.get('invoice_introductory_text', as_type=LazyI18nString)
+        self.additional_text = s.get('invoice_additional_text', as_type=LazyI18nString)
+        self.footer_text = s.get('invoice_footer_text', as_type=LazyI18nString)
+        self.include_expire_date = s.invoice_include_expire_date
+        self.include_free = s.invoice_include_free
+        self.attendee_name = s.invoice_attendee_name
+        self.numbers_consecutive = s.invoice_numbers_consecutive
+
+    @cached_property
+    def payment_providers(self):
+        return self.event.get_payment_providers(cached=True)
+
+    @cached_property
+    def ecb_rates(self):
+        gs = GlobalSettingsObject()
+        return gs.settings.get('ecb_rates_date', as_type=date), gs.settings.get('ecb_rates_dict', as_type=dict)
+
 
 @transaction.atomic
-def build_invoice(invoice: Invoice) -> Invoice:
-    invoice.locale = invoice.event.settings.get('invoice_language', invoice.event.settings.locale)
+def build_invoice(invoice: Invoice, invoice_settings: InvoiceSettings=None) -> Invoice:
+    invoice_settings = invoice_settings or InvoiceSettings(invoice.event)
+    invoice.locale = invoice_settings.language
     if invoice.locale == '__user__':
-        invoice.locale = invoice.order.locale or invoice.event.settings.locale
+        invoice.locale = invoice.order.locale or invoice_settings.locale
 
     lp = invoice.order.payments.last()
+    provider = invoice_settings.payment_providers.get(lp.provider) if lp else None
 
     with language(invoice.locale):
-        invoice.invoice_from = invoice.event.settings.get('invoice_address_from')
-        invoice.invoice_from_name = invoice.event.settings.get('invoice_address_from_name')
-        invoice.invoice_from_zipcode = invoice.event.settings.get('invoice_address_from_zipcode')
-        invoice.invoice_from_city = invoice.event.settings.get('invoice_address_from_city')
-        invoice.invoice_from_country = invoice.event.settings.get('invoice_address_from_country')
-        invoice.invoice_from_tax_id = invoice.event.settings.get('invoice_address_from_tax_id')
-        invoice.invoice_from_vat_id = invoice.event.settings.get('invoice_address_from_vat_id')
+        for k, v in invoice_settings.address_from.items():
+            setattr(invoice, k, v)
 
-        introductory = invoice.event.settings.get('invoice_introductory_text', as_type=LazyI18nString)
-        additional = invoice.event.settings.get('invoice_additional_text', as_type=LazyI18nString)
-        footer = invoice.event.settings.get('invoice_footer_text', as_type=LazyI18nString)
-        if lp and lp.payment_provider:
-            if 'payment' in inspect.signature(lp.payment_provider.render_invoice_text).parameters:
-                payment = str(lp.payment_provider.render_invoice_text(invoice.order, lp))
+        if provider:
+            if 'payment' in inspect.signature(provider.render_invoice_text).parameters:
+                payment = str(provider.render_invoice_text(invoice.order, lp))
             else:
-                payment = str(lp.payment_provider.render_invoice_text(invoice.order))
+                payment = str(provider.render_invoice_text(invoice.order))
         else:
             payment = ""
-        if invoice.event.settings.invoice_include_expire_date and invoice.order.status == Order.STATUS_PENDING:
+        if invoice_settings.include_expire_date and invoice.order.status == Order.STATUS_PENDING:
             if payment:
                 payment += "<br />"
             payment += pgettext("invoice", "Please complete your payment before {expire_date}.").format(
                 expire_date=date_format(invoice.order.expires, "SHORT_DATE_FORMAT")
             )
 
-        invoice.introductory_text = str(introductory).replace('\n', '<br />')
-        invoice.additional_text = str(additional).replace('\n', '<br />')
-        invoice.footer_text = str(footer)
+        invoice.introductory_text = str(invoice_settings.introductory_text).replace('\n', '<br />')
+        invoice.additional_text = str(invoice_settings.additional_text).replace('\n', '<br />')
+        invoice.footer_text = str(invoice_settings.footer_text)
         invoice.payment_provider_text = str(payment).replace('\n', '<br />')
 
         try:
@@ -109,9 +149,7 @@ def build_invoice(invoice: Invoice) -> Invoice:
                 invoice.foreign_currency_display = EU_CURRENCIES[cc]
 
                 if settings.FETCH_ECB_RATES:
-                    gs = GlobalSettingsObject()
-                    rates_date = gs.settings.get('ecb_rates_date', as_type=date)
-                    rates_dict = gs.settings.get('ecb_rates_dict', as_type=dict)
+                    rates_date, rates_dict = invoice_settings.ecb_rates
                     convert = (
                         rates_date and rates_dict and
                         rates_date > (now() - timedelta(days=7)).date() and
@@ -140,10 +178,11 @@ def build_invoice(invoice: Invoice) -> Invoice:
         )
 
         reverse_charge = False
+        lines = []
 
         positions.sort(key=lambda p: p.sort_key)
         for i, p in enumerate(positions):
-            if not invoice.event.settings.invoice_include_free and p.price == Decimal('0.00') and not p.addon_c:
+            if not invoice_settings.include_free and p.price == Decimal('0.00') and not p.addon_c:
                 continue
 
             desc = str(p.item.name)
@@ -151,7 +190,7 @@ def build_invoice(invoice: Invoice) -> Invoice:
                 desc += " - " + str(p.variation.value)
             if p.addon_to_id:
                 desc = "  + " + desc
-            if invoice.event.settings.invoice_attendee_name and p.attendee_name:
+            if invoice_settings.attendee_name and p.attendee_name:
                 desc += "<br />" + pgettext("invoice", "Attendee: {name}").format(name=p.attendee_name)
             for recv, resp in invoice_line_text.send(sender=invoice.event, position=p):
                 if resp:
@@ -168,12 +207,12 @@ def build_invoice(invoice: Invoice) -> Invoice:
 
             if invoice.event.has_subevents:
                 desc += "<br />" + pgettext("subevent", "Date: {}").format(p.subevent)
-            InvoiceLine.objects.create(
+            lines.append(InvoiceLine(
                 position=i, invoice=invoice, description=desc,
                 gross_value=p.price, tax_value=p.tax_value,
                 subevent=p.subevent, event_date_from=(p.subevent.date_from if p.subevent else invoice.event.date_from),
                 tax_rate=p.tax_rate, tax_name=p.tax_rule.name if p.tax_rule else ''
-            )
+            ))
 
             if p.tax_rule and p.tax_rule.is_reverse_charge(ia) and p.price and not p.tax_value:
                 reverse_charge = True
@@ -197,7 +236,7 @@ def build_invoice(invoice: Invoice) -> Invoice:
                 fee_title = _(fee.get_fee_type_display())
                 if fee.description:
                     fee_title += " - " + fee.description
-            InvoiceLine.objects.create(
+            lines.append(InvoiceLine(
                 position=i + offset,
                 invoice=invoice,
                 description=fee_title,
@@ -205,7 +244,8 @@ def build_invoice(invoice: Invoice) -> Invoice:
                 tax_value=fee.tax_value,
                 tax_rate=fee.tax_rate,
                 tax_name=fee.tax_rule.name if fee.tax_rule else ''
-            )
+            ))
+        InvoiceLine.objects.bulk_create(lines)
 
         return invoice
 
@@ -222,7 +262,7 @@ def build_cancellation(invoice: Invoice):
     return invoice
 
 
-def generate_cancellation(invoice: Invoice, trigger_pdf=True):
+def _copy_cancellation(invoice: Invoice) -> Invoice:
     if invoice.canceled:
         raise ValueError("Invoice should not be canceled twice.")
     cancellation = modelcopy(invoice)
@@ -234,6 +274,11 @@ def generate_cancellation(invoice: Invoice, trigger_pdf=True):
     cancellation.date = timezone.now().date()
     cancellation.payment_provider_text = ''
     cancellation.file = None
+    return cancellation
+
+
+def generate_cancellation(invoice: Invoice, trigger_pdf=True):
+    cancellation = _copy_cancellation(invoice)
     cancellation.save()
 
     cancellation = build_cancellation(cancellation)
@@ -270,6 +315,71 @@ def generate_invoice(order: Order, trigger_pdf=True):
     return invoice
 
 
+def _reserve_invoice_number(invoice: Invoice):
+    # Placeholders contain a dash, so they are never taken for numbers allocated by a sequence
+    invoice.prefix = invoice._get_prefix()
+    if invoice.order.testmode:
+        invoice.prefix += 'TEST-'
+    invoice.invoice_no = 'TMP-' + uuid.uuid4().hex[:15]
+
+
+def generate_invoices(event, orders: List[Order], trigger_pdf=True) -> List[Invoice]:
+    """
+    Generates an invoice for every one of the given orders of ``event``, just like calling ``generate_invoice`` for
+    every order, but faster. The invoice settings of the event are only resolved once and consecutive invoice numbers
+    are allocated in one step for all invoices with the same prefix. If ``trigger_pdf`` is set, the PDF files are
+    rendered in chunks of ``PDF_CHUNK_SIZE`` invoices that multiple workers can process in parallel.
+
+    With consecutive invoice numbers, all invoices are first saved with a placeholder number. The numbers are only
+    allocated once all invoices have been built, so the invoice number sequence is locked only for a short moment at
+    the end of the transaction instead of the whole time the invoices are built.
+    """
+    invoice_settings = InvoiceSettings(event)
+    invoices = []
+    with transaction.atomic():
+        for o in orders:
+            o.event = event
+            invoice = Invoice(order=o, event=event, organizer=event.organizer, date=timezone.now().date())
+            if invoice_settings.numbers_consecutive:
+                _reserve_invoice_number(invoice)
+            build_invoice(invoice, invoice_settings)
+            invoices.append(invoice)
+
+        cancellations = []
+        for invoice in invoices:
+            if invoice.order.status == Order.STATUS_CANCELED:
+                cancellation = _copy_cancellation(invoice)
+                if invoice_settings.numbers_consecutive:
+                    _reserve_invoice_number(cancellation)
+                cancellation.save()
+                cancellations.append(build_cancellation(cancellation))
+
+        if invoice_settings.numbers_consecutive:
+            by_prefix = defaultdict(list)
+            for invoice in invoices + cancellations:
+                by_prefix[invoice.prefix].append(invoice)
+            for prefix, group in by_prefix.items():
+                numbers = InvoiceNumberSequence.allocate(event.organizer, prefix, len(group))
+                for invoice, number in zip(group, numbers):
+                    invoice.invoice_no = number
+                    invoice.full_invoice_no = invoice.prefix + number
+            Invoice.objects.bulk_update(invoices + cancellations, ['invoice_no', 'full_invoice_no'], batch_size=500)
+
+    if trigger_pdf:
+        invoice_pdfs([i.pk for i in invoices + cancellations])
+    return invoices
+
+
+def _render_pdf(invoice: Invoice, renderer):
+    if invoice.file:
+        invoice.file.delete()
+    with language(invoice.locale):
+        fname, ftype, fcontent = renderer.generate(invoice)
+        invoice.file.save(fname, ContentFile(fcontent))
+        invoice.save()
+        return invoice.file.name
+
+
 @app.task(base=TransactionAwareTask)
 def invoice_pdf_task(invoice: int):
     with scopes_disabled():
@@ -277,13 +387,25 @@ def invoice_pdf_task(invoice: int):
     with scope(organizer=i.order.event.organizer):
         if i.shredded:
             return None
-        if i.file:
-            i.file.delete()
-        with language(i.locale):
-            fname, ftype, fcontent = i.event.invoice_renderer.generate(i)
-            i.file.save(fname, ContentFile(fcontent))
-            i.save()
-            return i.file.name
+        return _render_pdf(i, i.event.invoice_renderer)
+
+
+@app.task(base=TransactionAwareTask)
+def invoice_pdf_batch_task(invoices: List[int]):
+    with scopes_disabled():
+        qs = Invoice.objects.filter(pk__in=invoices, shredded=False).select_related('order', 'event__organizer')
+        invoices = list(qs.order_by('pk'))
+
+    # Share the event and its invoice renderer between all invoices, so settings, fonts and images that the
+    # renderer needs are only loaded once
+    events = {}
+    renderers = {}
+    for i in invoices:
+        i.event = i.order.event = events.setdefault(i.event_id, i.event)
+        with scope(organizer=i.event.organizer):
+            if i.event_id not in renderers:
+                renderers[i.event_id] = i.event.invoice_renderer
+            _render_pdf(i, renderers[i.event_id])
 
 
 def invoice_qualified(order: Order):
@@ -301,6 +423,15 @@ def invoice_pdf(*args, **kwargs):
     invoice_pdf_task.apply_async(args=args, kwargs=kwargs)
 
 
+def invoice_pdfs(invoices: List[int]):
+    """
+    Renders the PDF files of the given invoices in chunks of ``PDF_CHUNK_SIZE`` invoices. Like ``invoice_pdf``, this
+    only happens after the current transaction has been committed.
+    """
+    for i in range(0, len(invoices), PDF_CHUNK_SIZE):
+        invoice_pdf_batch_task.apply_async(args=(invoices[i:i + PDF_CHUNK_SIZE],))
+
+
 class DummyRollbackException(Exception):
     pass
 
@@ -1,16 +1,21 @@
 import logging
 import time
 import uuid
+import zlib
 from datetime import timedelta
 
 from django.conf import settings
 from django.db import transaction
 from django.utils.timezone import now
 
+from pretix.base.metrics import (
+    pretix_lock_hold_seconds, pretix_lock_wait_seconds,
+)
 from pretix.base.models import EventLock
 
 logger = logging.getLogger('pretix.base.locking')
 LOCK_TIMEOUT = 120
+MAX_RETRY_INTERVAL = 0.05
 
 
 class NoLockManager:
@@ -26,11 +31,14 @@ class NoLockManager:
 
 
 class LockManager:
-    def __init__(self, event):
+    def __init__(self, event, quotas=None, vouchers=None, seats=None):
         self.event = event
+        self.quotas = quotas
+        self.vouchers = vouchers
+        self.seats = seats
 
     def __enter__(self):
-        lock_event(self.event)
+        lock_event(self.event, quotas=self.quotas, vouchers=self.vouchers, seats=self.seats)
         return now()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -47,21 +55,72 @@ class LockReleaseException(Exception):
     pass
 
 
-def lock_event(event):
+def _stripe(kind, obj, stripes):
+    return zlib.crc32('{}:{}'.format(kind, getattr(obj, 'pk', obj)).encode()) % stripes
+
+
+def lock_names(event, quotas=None, vouchers=None, seats=None):
+    """
+    Returns the sorted list of lock names that need to be held to lock the given objects of an
+    event. If ``lock_stripes`` is not configured, this is a single name representing the whole event.
+
+    Otherwise, every quota, voucher and seat is mapped to one of ``lock_stripes`` locks of the event.
+    Locking the whole event means acquiring all of them, which is also done if no objects are given.
+    If a minimal distance between seats is configured, whether a seat is available depends on its
+    neighbours as well, so all seat bookings of the event share one additional lock.
+    Since all locks are always acquired in the same order, two operations can never deadlock each other.
+    """
+    stripes = settings.PRETIX_LOCK_STRIPES
+    if stripes <= 1:
+        return [str(event.id)]
+    selected = (
+        {_stripe('quota', q, stripes) for q in quotas or []} |
+        {_stripe('voucher', v, stripes) for v in vouchers or []} |
+        {_stripe('seat', s, stripes) for s in seats or []}
+    )
+    if seats and event.settings.seating_minimal_distance > 0:
+        selected.add(_stripe('seatingplan', event, stripes))
+    if not selected:
+        # Nothing specific to lock, e.g. because all quotas involved are unlimited. We still lock
+        # the event as a whole, just like without lock striping.
+        selected = set(range(stripes))
+    return ['{}:{}'.format(event.id, s) for s in sorted(selected)]
+
+
+def lock_event(event, quotas=None, vouchers=None, seats=None):
     """
     Issue a lock on this event so nobody can book tickets for this event until
-    you release the lock. Will retry 5 times on failure.
+    you release the lock. Will keep retrying for up to ``lock_wait`` seconds.
+
+    If ``quotas``, ``vouchers`` or ``seats`` are given and ``lock_stripes`` is configured,
+    only these objects are locked, so bookings of unrelated products can happen at the
+    same time.
 
-    :raises LockTimeoutException: if the event is locked every time we try
-                                  to obtain the lock
+    :raises LockTimeoutException: if the event is still locked after the wait time
     """
-    if hasattr(event, '_lock') and event._lock:
-        return True
+    names = lock_names(event, quotas=quotas, vouchers=vouchers, seats=seats)
+    if getattr(event, '_lock', None) is not None:
+        if set(names) <= set(event._lock_names):
+            return True
+        # Acquiring more locks now could violate the lock order and cause deadlocks
+        raise LockTimeoutException()
 
-    if settings.HAS_REDIS:
-        return lock_event_redis(event)
-    else:
-        return lock_event_db(event)
+    scope = 'objects' if quotas or vouchers or seats else 'event'
+    t0 = time.perf_counter()
+    try:
+        if settings.HAS_REDIS:
+            lock_event_redis(event, names)
+        else:
+            lock_event_db(event, names)
+    except LockTimeoutException:
+        if settings.METRICS_ENABLED:
+            pretix_lock_wait_seconds.observe(time.perf_counter() - t0, scope=scope, result='timeout')
+        raise
+    event._lock_acquired = time.perf_counter()
+    event._lock_scope = scope
+    if settings.METRICS_ENABLED:
+        pretix_lock_wait_seconds.observe(event._lock_acquired - t0, scope=scope, result='success')
+    return True
 
 
 def release_event(event):
@@ -72,79 +131,157 @@ def release_event(event):
 
     :raises LockReleaseException: if we do not own the lock
     """
-    if not hasattr(event, '_lock') or not event._lock:
+    if getattr(event, '_lock', None) is None:
         raise LockReleaseException('Lock is not owned by this thread')
+    if settings.METRICS_ENABLED and getattr(event, '_lock_acquired', None):
+        pretix_lock_hold_seconds.observe(time.perf_counter() - event._lock_acquired, scope=event._lock_scope)
     if settings.HAS_REDIS:
         return release_event_redis(event)
     else:
         return release_event_db(event)
 
 
-def lock_event_db(event):
-    retries = 5
-    for i in range(retries):
-        with transaction.atomic():
-            dt = now()
-            l, created = EventLock.objects.get_or_create(event=event.id)
-            if created:
-                event._lock = l
-                return True
-            elif l.date < now() - timedelta(seconds=LOCK_TIMEOUT):
-                newtoken = str(uuid.uuid4())
-                updated = EventLock.objects.filter(event=event.id, token=l.token).update(date=dt, token=newtoken)
-                if updated:
-                    l.token = newtoken
-                    event._lock = l
-                    return True
-        time.sleep(2 ** i / 100)
-    raise LockTimeoutException()
+def _attempts(deadline):
+    """
+    Yields once for every attempt to acquire a lock and sleeps with an increasing
+    interval between attempts, until ``deadline`` is reached.
+    """
+    i = 0
+    while True:
+        yield i
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(2 ** i / 100, MAX_RETRY_INTERVAL, remaining))
+        i += 1
+
+
+def _acquire_db(name):
+    with transaction.atomic():
+        dt = now()
+        lock, created = EventLock.objects.get_or_create(event=name)
+        if created:
+            return lock
+        elif lock.date < now() - timedelta(seconds=LOCK_TIMEOUT):
+            newtoken = str(uuid.uuid4())
+            updated = EventLock.objects.filter(event=name, token=lock.token).update(date=dt, token=newtoken)
+            if updated:
+                lock.token = newtoken
+                return lock
+
+
+def lock_event_db(event, names=None):
+    names = names or [str(event.id)]
+    deadline = time.monotonic() + settings.PRETIX_LOCK_WAIT
+    locks = []
+    for name in names:
+        for i in _attempts(deadline):
+            lock = _acquire_db(name)
+            if lock:
+                locks.append(lock)
+                break
+        else:
+            for lock in locks:
+                EventLock.objects.filter(event=lock.event, token=lock.token).delete()
+            raise LockTimeoutException()
+    event._lock = locks
+    event._lock_names = names
+    return True
 
 
 @transaction.atomic
 def release_event_db(event):
-    if not hasattr(event, '_lock') or not event._lock:
+    if getattr(event, '_lock', None) is None:
         raise LockReleaseException('Lock is not owned by this thread')
-    try:
-        lock = EventLock.objects.get(event=event.id, token=event._lock.token)
-        lock.delete()
-        event._lock = None
-    except EventLock.DoesNotExist:
+    locks = event._lock
+    event._lock = None
+    released = [
+        EventLock.objects.filter(event=lock.event, token=lock.token).delete()[0]
+        for lock in locks
+    ]
+    if not all(released):
         raise LockReleaseException('Lock is no longer owned by this thread')
 
 
-def redis_lock_from_event(event):
+def redis_lock(name):
     from django_redis import get_redis_connection
     from redis.lock import Lock
 
-    if not hasattr(event, '_lock') or not event._lock:
-        rc = get_redis_connection("redis")
-        event._lock = Lock(redis=rc, name='pretix_event_%s' % event.id, timeout=LOCK_TIMEOUT)
-    return event._lock
+    rc = get_redis_connection("redis")
+    return Lock(redis=rc, name='pretix_event_%s' % name, timeout=LOCK_TIMEOUT)
 
 
-def lock_event_redis(event):
+def _acquire_redis(name, deadline):
+    """
+    Waiting clients enter a queue, implemented as a sorted set ordered by the time they started
+    waiting. Only the client at the front of the queue tries to acquire the lock, which gives us
+    roughly first-come-first-served behaviour. Entries of clients that crashed while waiting are
+    removed once they are older than the longest possible wait time.
+    """
+    from django_redis import get_redis_connection
+
+    rc = get_redis_connection("redis")
+    lock = redis_lock(name)
+    queue = 'pretix_event_%s_queue' % name
+    token = uuid.uuid4().hex
+    rc.zadd(queue, {token: time.time()})
+    rc.expire(queue, int(settings.PRETIX_LOCK_WAIT) + 10)
+    try:
+        for i in _attempts(deadline):
+            rc.zremrangebyscore(queue, '-inf', time.time() - settings.PRETIX_LOCK_WAIT - 5)
+            if rc.zrank(queue, token) in (0, None) and lock.acquire(False):
+                return lock
+    finally:
+        rc.zrem(queue, token)
+
+
+def _release_redis_locks(locks):
+    """
+    Releases the given locks after acquiring further locks failed. Errors are ignored, since the
+    locks time out eventually anyway.
+    """
     from redis.exceptions import RedisError
 
-    lock = redis_lock_from_event(event)
-    retries = 5
-    for i in range(retries):
+    for lock in locks:
         try:
-            if lock.acquire(False):
-                return True
+            lock.release()
         except RedisError:
-            logger.exception('Error locking an event')
-            raise LockTimeoutException()
-        time.sleep(2 ** i / 100)
-    raise LockTimeoutException()
+            logger.exception('Error releasing an event lock')
 
 
-def release_event_redis(event):
-    from redis import RedisError
+def lock_event_redis(event, names=None):
+    from redis.exceptions import RedisError
 
-    lock = redis_lock_from_event(event)
+    names = names or [str(event.id)]
+    deadline = time.monotonic() + settings.PRETIX_LOCK_WAIT
+    locks = []
     try:
-        lock.release()
+        for name in names:
+            lock = _acquire_redis(name, deadline)
+            if not lock:
+                _release_redis_locks(locks)
+                raise LockTimeoutException()
+            locks.append(lock)
     except RedisError:
-        logger.exception('Error releasing an event lock')
+        logger.exception('Error locking an event')
+        _release_redis_locks(locks)
         raise LockTimeoutException()
+    event._lock = locks
+    event._lock_names = names
+    return True
+
+
+def release_event_redis(event):
+    from redis import RedisError
+
+    locks = event._lock
     event._lock = None
+    failed = False
+    for lock in locks:
+        try:
+            lock.release()
+        except RedisError:
+            logger.exception('Error releasing an event lock')
+            failed = True
+    if failed:
+        raise LockTimeoutException()
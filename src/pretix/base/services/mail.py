@@ -4,6 +4,7 @@ import os
 import re
 import smtplib
 import ssl
+import time
 import warnings
 from email.mime.image import MIMEImage
 from email.utils import formataddr
@@ -19,18 +20,23 @@ from django.core.mail import (
     EmailMultiAlternatives, SafeMIMEMultipart, get_connection,
 )
 from django.core.mail.message import SafeMIMEText
+from django.db import transaction
 from django.template.loader import get_template
+from django.utils.functional import cached_property
 from django.utils.translation import gettext as _, pgettext
 from django_scopes import scope, scopes_disabled
 from i18nfield.strings import LazyI18nString
 
 from pretix.base.email import ClassicMailRenderer
 from pretix.base.i18n import language
+from pretix.base.metrics import (
+    pretix_mail_batch_duration_seconds, pretix_mail_sent_total,
+)
 from pretix.base.models import (
     Event, Invoice, InvoiceAddress, Order, OrderPosition, User,
 )
 from pretix.base.services.invoices import invoice_pdf_task
-from pretix.base.services.tasks import TransactionAwareTask
+from pretix.base.services.tasks import ProfiledTask, TransactionAwareTask
 from pretix.base.services.tickets import get_tickets_for_order
 from pretix.base.signals import email_filter, global_email_filter
 from pretix.celery_app import app
@@ -39,6 +45,7 @@ from pretix.presale.ical import get_ical
 
 logger = logging.getLogger('pretix.base.mail')
 INVALID_ADDRESS = 'invalid-pretix-mail-address'
+MAIL_BATCH_SIZE = 100
 cssutils.log.setLevel(logging.CRITICAL)
 
 
@@ -55,7 +62,8 @@ class SendMailException(Exception):
 def mail(email: str, subject: str, template: Union[str, LazyI18nString],
          context: Dict[str, Any]=None, event: Event=None, locale: str=None,
          order: Order=None, position: OrderPosition=None, headers: dict=None, sender: str=None,
-         invoices: list=None, attach_tickets=False, auto_email=True, user=None, attach_ical=False):
+         invoices: list=None, attach_tickets=False, auto_email=True, user=None, attach_ical=False,
+         batch: 'MailBatch'=None):
     """
     Sends out an email to a user. The mail will be sent synchronously or asynchronously depending on the installation.
 
@@ -96,6 +104,9 @@ def mail(email: str, subject: str, template: Union[str, LazyI18nString],
 
     :param user: The user this email is sent to
 
+    :param batch: A :py:class:`MailBatch` for ``event`` to add this email to instead of sending it on its own. Emails
+        with invoices are always sent on their own.
+
     :raises MailOrderException: on obvious, immediate failures. Not raising an exception does not necessarily mean
         that the email has been sent, just that it has been queued by the email backend.
     """
@@ -109,7 +120,7 @@ def mail(email: str, subject: str, template: Union[str, LazyI18nString],
 
     with language(locale):
         if isinstance(context, dict) and event:
-            for k, v in event.meta_data.items():
+            for k, v in (batch.meta_data if batch else event.meta_data).items():
                 context['meta_' + k] = v
 
         if isinstance(context, dict) and order:
@@ -138,7 +149,7 @@ def mail(email: str, subject: str, template: Union[str, LazyI18nString],
 
         bcc = []
         if event:
-            renderer = event.get_html_mail_renderer()
+            renderer = batch.renderer if batch else event.get_html_mail_renderer()
             if event.settings.mail_bcc:
                 for bcc_mail in event.settings.mail_bcc.split(','):
                     bcc.append(bcc_mail.strip())
@@ -210,7 +221,7 @@ def mail(email: str, subject: str, template: Union[str, LazyI18nString],
             logger.exception('Could not render HTML body')
             body_html = None
 
-        send_task = mail_send_task.si(
+        send_kwargs = dict(
             to=[email],
             bcc=bcc,
             subject=subject,
@@ -226,7 +237,11 @@ def mail(email: str, subject: str, template: Union[str, LazyI18nString],
             attach_ical=attach_ical,
             user=user.pk if user else None
         )
+        if batch and not invoices:
+            batch.add(send_kwargs)
+            return
 
+        send_task = mail_send_task.si(**send_kwargs)
         if invoices:
             task_chain = [invoice_pdf_task.si(i.pk).on_error(send_task) for i in invoices if not i.file]
         else:
@@ -250,22 +265,134 @@ class CustomEmail(EmailMultiAlternatives):
         return super()._create_mime_attachment(content, mimetype)
 
 
-@app.task(base=TransactionAwareTask, bind=True, acks_late=True)
-def mail_send_task(self, *args, to: List[str], subject: str, body: str, html: str, sender: str,
-                   event: int=None, position: int=None, headers: dict=None, bcc: List[str]=None,
-                   invoices: List[int]=None, order: int=None, attach_tickets=False, user=None,
-                   attach_ical=False) -> bool:
+def _build_mail(event: Event, to: List[str], subject: str, body: str, html: str, sender: str, position: int=None,
+                headers: dict=None, bcc: List[str]=None, invoices: List[int]=None, order: int=None,
+                attach_tickets=False, user=None, attach_ical=False, image_cache: dict=None):
+    """
+    Creates the message for the parameters of ``mail_send_task`` and returns it together with the order it belongs
+    to. Needs to be called with the scope of the event's organizer active. Images embedded into the HTML part are
+    only downloaded once per ``image_cache``.
+    """
     email = CustomEmail(subject, body, sender, to=to, bcc=bcc, headers=headers)
     if html is not None:
         html_message = SafeMIMEMultipart(_subtype='related', encoding=settings.DEFAULT_CHARSET)
         html_with_cid, cid_images = replace_images_with_cid_paths(html)
         html_message.attach(SafeMIMEText(html_with_cid, 'html', settings.DEFAULT_CHARSET))
-        attach_cid_images(html_message, cid_images, verify_ssl=True)
+        attach_cid_images(html_message, cid_images, verify_ssl=True, cache=image_cache)
         email.attach_alternative(html_message, "multipart/related")
 
     if user:
         user = User.objects.get(pk=user)
 
+    if event:
+        if order:
+            try:
+                order = event.orders.get(pk=order)
+            except Order.DoesNotExist:
+                order = None
+            else:
+                if position:
+                    try:
+                        position = order.positions.get(pk=position)
+                    except OrderPosition.DoesNotExist:
+                        attach_tickets = False
+                if attach_tickets:
+                    args = []
+                    attach_size = 0
+                    for name, ct in get_tickets_for_order(order, base_position=position):
+                        content = ct.file.read()
+                        args.append((name, content, ct.type))
+                        attach_size += len(content)
+
+                    if attach_size < 4 * 1024 * 1024:
+                        # Do not attach more than 4MB, it will bounce way to often.
+                        for a in args:
+                            try:
+                                email.attach(*a)
+                            except:
+                                pass
+                    else:
+                        order.log_action(
+                            'pretix.event.order.email.attachments.skipped',
+                            data={
+                                'subject': 'Attachments skipped',
+                                'message': 'Attachment have not been send because {} bytes are likely too large to arrive.'.format(attach_size),
+                                'recipient': '',
+                                'invoices': [],
+                            }
+                        )
+                if attach_ical:
+                    ical_events = set()
+                    if event.has_subevents:
+                        if position:
+                            ical_events.add(position.subevent)
+                        else:
+                            for p in order.positions.all():
+                                ical_events.add(p.subevent)
+                    else:
+                        ical_events.add(order.event)
+
+                    for i, e in enumerate(ical_events):
+                        cal = get_ical([e])
+                        email.attach('event-{}.ics'.format(i), cal.serialize(), 'text/calendar')
+
+        email = email_filter.send_chained(event, 'message', message=email, order=order, user=user)
+
+    if invoices:
+        invoices = Invoice.objects.filter(pk__in=invoices)
+        for inv in invoices:
+            if inv.file:
+                try:
+                    with language(inv.order.locale):
+                        email.attach(
+                            pgettext('invoice', 'Invoice {num}').format(num=inv.number).replace(' ', '_') + '.pdf',
+                            inv.file.file.read(),
+                            'application/pdf'
+                        )
+                except:
+                    logger.exception('Could not attach invoice to email')
+                    pass
+
+    email = global_email_filter.send_chained(event, 'message', message=email, user=user, order=order)
+    return email, order
+
+
+def _is_temporary_failure(e: Exception):
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code in (101, 111, 421, 422, 431, 442, 447, 452)
+    return isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ssl.SSLError, OSError))
+
+
+def _log_failure(e: Exception, order: Order):
+    logger.exception('Error sending email')
+    if order:
+        if isinstance(e, smtplib.SMTPResponseException):
+            subject = 'SMTP code {}'.format(e.smtp_code)
+            message = e.smtp_error.decode() if isinstance(e.smtp_error, bytes) else str(e.smtp_error)
+        else:
+            subject = 'Internal error'
+            message = str(e)
+        order.log_action(
+            'pretix.event.order.email.error',
+            data={
+                'subject': subject,
+                'message': message,
+                'recipient': '',
+                'invoices': [],
+            }
+        )
+
+
+def _count_mail(mode: str, status: str):
+    if settings.METRICS_ENABLED:
+        pretix_mail_sent_total.inc(1, mode=mode, status=status)
+
+
+@app.task(base=TransactionAwareTask, bind=True, acks_late=True)
+def mail_send_task(self, *args, to: List[str], subject: str, body: str, html: str, sender: str,
+                   event: int=None, position: int=None, headers: dict=None, bcc: List[str]=None,
+                   invoices: List[int]=None, order: int=None, attach_tickets=False, user=None,
+                   attach_ical=False) -> bool:
     if event:
         with scopes_disabled():
             event = Event.objects.get(id=event)
@@ -276,111 +403,166 @@ def mail_send_task(self, *args, to: List[str], subject: str, body: str, html: st
         cm = lambda: scopes_disabled()  # noqa
 
     with cm():
-        if event:
-            if order:
-                try:
-                    order = event.orders.get(pk=order)
-                except Order.DoesNotExist:
-                    order = None
-                else:
-                    if position:
-                        try:
-                            position = order.positions.get(pk=position)
-                        except OrderPosition.DoesNotExist:
-                            attach_tickets = False
-                    if attach_tickets:
-                        args = []
-                        attach_size = 0
-                        for name, ct in get_tickets_for_order(order, base_position=position):
-                            content = ct.file.read()
-                            args.append((name, content, ct.type))
-                            attach_size += len(content)
-
-                        if attach_size < 4 * 1024 * 1024:
-                            # Do not attach more than 4MB, it will bounce way to often.
-                            for a in args:
-                                try:
-                                    email.attach(*a)
-                                except:
-                                    pass
-                        else:
-                            order.log_action(
-                                'pretix.event.order.email.attachments.skipped',
-                                data={
-                                    'subject': 'Attachments skipped',
-                                    'message': 'Attachment have not been send because {} bytes are likely too large to arrive.'.format(attach_size),
-                                    'recipient': '',
-                                    'invoices': [],
-                                }
-                            )
-                    if attach_ical:
-                        ical_events = set()
-                        if event.has_subevents:
-                            if position:
-                                ical_events.add(position.subevent)
-                            else:
-                                for p in order.positions.all():
-                                    ical_events.add(p.subevent)
-                        else:
-                            ical_events.add(order.event)
-
-                        for i, e in enumerate(ical_events):
-                            cal = get_ical([e])
-                            email.attach('event-{}.ics'.format(i), cal.serialize(), 'text/calendar')
-
-            email = email_filter.send_chained(event, 'message', message=email, order=order, user=user)
-
-        if invoices:
-            invoices = Invoice.objects.filter(pk__in=invoices)
-            for inv in invoices:
-                if inv.file:
-                    try:
-                        with language(inv.order.locale):
-                            email.attach(
-                                pgettext('invoice', 'Invoice {num}').format(num=inv.number).replace(' ', '_') + '.pdf',
-                                inv.file.file.read(),
-                                'application/pdf'
-                            )
-                    except:
-                        logger.exception('Could not attach invoice to email')
-                        pass
-
-        email = global_email_filter.send_chained(event, 'message', message=email, user=user, order=order)
+        email, order = _build_mail(
+            event, to=to, subject=subject, body=body, html=html, sender=sender, position=position,
+            headers=headers, bcc=bcc, invoices=invoices, order=order, attach_tickets=attach_tickets, user=user,
+            attach_ical=attach_ical
+        )
 
         try:
             backend.send_messages([email])
-        except smtplib.SMTPResponseException as e:
-            if e.smtp_code in (101, 111, 421, 422, 431, 442, 447, 452):
-                self.retry(max_retries=5, countdown=2 ** (self.request.retries * 2))
-            logger.exception('Error sending email')
-
-            if order:
-                order.log_action(
-                    'pretix.event.order.email.error',
-                    data={
-                        'subject': 'SMTP code {}'.format(e.smtp_code),
-                        'message': e.smtp_error.decode() if isinstance(e.smtp_error, bytes) else str(e.smtp_error),
-                        'recipient': '',
-                        'invoices': [],
-                    }
-                )
-
-            raise SendMailException('Failed to send an email to {}.'.format(to))
         except Exception as e:
-            if isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ssl.SSLError, OSError)):
+            if _is_temporary_failure(e):
+                _count_mail('single', 'retry')
                 self.retry(max_retries=5, countdown=2 ** (self.request.retries * 2))
-            if order:
-                order.log_action(
-                    'pretix.event.order.email.error',
-                    data={
-                        'subject': 'Internal error',
-                        'message': str(e),
-                        'recipient': '',
-                        'invoices': [],
-                    }
-                )
-            logger.exception('Error sending email')
+            _count_mail('single', 'error')
+            _log_failure(e, order)
             raise SendMailException('Failed to send an email to {}.'.format(to))
+        _count_mail('single', 'sent')
+
+
+class MailBatch:
+    """
+    Collects emails to many recipients, e.g. from the ``sendmail`` plugin, and sends them in chunks of
+    ``MAIL_BATCH_SIZE``. Every chunk is sent by a single task over one connection to the email server, and data that
+    only depends on the event, like the HTML renderer and the meta data, is only computed once. Pass the batch to
+    :py:func:`mail` and use it as a context manager, the remaining emails are sent when the block is left without an
+    exception. Unlike single emails, chunks are not tied to the current database transaction. Within a transaction,
+    emails are therefore kept until :py:meth:`flush` is called, which should happen after the transaction has been
+    committed::
+
+        with MailBatch(event) as batch:
+            for order in orders:
+                mail(order.email, subject, template, context, event, order=order, batch=batch)
+    """
+
+    def __init__(self, event: Event):
+        self.event = event
+        self.mails = []
+
+    @cached_property
+    def renderer(self):
+        return self.event.get_html_mail_renderer()
+
+    @cached_property
+    def meta_data(self):
+        return self.event.meta_data
+
+    def add(self, send_kwargs: dict):
+        send_kwargs.pop('event')
+        self.mails.append(send_kwargs)
+        if len(self.mails) >= MAIL_BATCH_SIZE and not transaction.get_connection().in_atomic_block:
+            self.flush()
+
+    def flush(self):
+        for i in range(0, len(self.mails), MAIL_BATCH_SIZE):
+            mail_send_batch_task.apply_async(kwargs={'event': self.event.pk, 'mails': self.mails[i:i + MAIL_BATCH_SIZE]})
+        self.mails = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+
+
+class RateLimiter:
+    """
+    Allows at most ``rate`` calls to :py:meth:`wait` per second for the given key and blocks otherwise. If redis is
+    available, the limit is shared between all processes. A rate of ``0`` disables the limit.
+    """
+
+    def __init__(self, key: str, rate: int):
+        self.key = key
+        self.rate = rate
+        self.window = None
+        self.count = 0
+
+    def _count(self, window):
+        if settings.HAS_REDIS:
+            from django_redis import get_redis_connection
+
+            key = 'pretix_ratelimit_{}_{}'.format(self.key, window)
+            pipe = get_redis_connection("redis").pipeline()
+            pipe.incr(key)
+            pipe.expire(key, 2)
+            return pipe.execute()[0]
+
+        if window != self.window:
+            self.window = window
+            self.count = 0
+        self.count += 1
+        return self.count
+
+    def wait(self):
+        if not self.rate:
+            return
+        while True:
+            t = time.time()
+            if self._count(int(t)) <= self.rate:
+                return
+            time.sleep(int(t) + 1 - t)
+
+
+def _backend_key(event: Event):
+    if event.settings.smtp_use_custom:
+        return 'smtp_{}_{}'.format(event.settings.smtp_host, event.settings.smtp_port)
+    return 'smtp_default'
+
+
+@app.task(base=ProfiledTask)
+def mail_send_batch_task(*args, event: int, mails: List[dict]) -> int:
+    """
+    Sends a chunk of a :py:class:`MailBatch` over a single connection to the email server. Emails that fail
+    temporarily are handed to ``mail_send_task`` to be retried on their own. Returns the number of emails sent.
+
+    Unlike ``mail_send_task``, this task is acknowledged when it starts, since running it again after a crash would
+    send the emails of the chunk that were already delivered a second time.
+    """
+    with scopes_disabled():
+        event = Event.objects.select_related('organizer').get(id=event)
+    backend = event.get_mail_backend()
+    limiter = RateLimiter(_backend_key(event), settings.MAIL_RATE_LIMIT)
+    image_cache = {}
+    sent = 0
+    t0 = time.perf_counter()
+
+    with scope(organizer=event.organizer):
+        try:
+            for send_kwargs in mails:
+                try:
+                    email, order = _build_mail(event, image_cache=image_cache, **send_kwargs)
+                except Exception:
+                    logger.exception('Could not build email')
+                    _count_mail('batch', 'error')
+                    continue
+
+                limiter.wait()
+                try:
+                    # Opens a connection that is kept for the following emails, unless one is already open
+                    backend.open()
+                    backend.send_messages([email])
+                except Exception as e:
+                    if _is_temporary_failure(e):
+                        _count_mail('batch', 'retry')
+                        try:
+                            backend.close()
+                        except Exception:
+                            logger.exception('Could not close email connection')
+                        mail_send_task.apply_async(kwargs=dict(send_kwargs, event=event.pk), countdown=1)
+                    else:
+                        _count_mail('batch', 'error')
+                        _log_failure(e, order)
+                else:
+                    sent += 1
+                    _count_mail('batch', 'sent')
+        finally:
+            backend.close()
+
+    if settings.METRICS_ENABLED:
+        pretix_mail_batch_duration_seconds.observe(time.perf_counter() - t0)
+    return sent
 
 
 def mail_send(*args, **kwargs):
@@ -418,7 +600,7 @@ def replace_images_with_cid_paths(body_html):
         return body_html, []
 
 
-def attach_cid_images(msg, cid_images, verify_ssl=True):
+def attach_cid_images(msg, cid_images, verify_ssl=True, cache=None):
     if cid_images and len(cid_images) > 0:
 
         msg.mixed_subtype = 'mixed'
@@ -426,7 +608,7 @@ def attach_cid_images(msg, cid_images, verify_ssl=True):
             cid = 'image_%s' % key
             try:
                 mime_image = convert_image_to_cid(
-                    image, cid, verify_ssl)
+                    image, cid, verify_ssl, cache)
                 if mime_image:
                     msg.attach(mime_image)
             except:
@@ -448,7 +630,7 @@ def encoder_linelength(msg):
     msg.set_payload(b"\r\n".join(pieces))
 
 
-def convert_image_to_cid(image_src, cid_id, verify_ssl=True):
+def convert_image_to_cid(image_src, cid_id, verify_ssl=True, cache=None):
     try:
         if image_src.startswith('data:image/'):
             image_type, image_content = image_src.split(',', 1)
@@ -464,9 +646,14 @@ def convert_image_to_cid(image_src, cid_id, verify_ssl=True):
             path = urlparse(image_src).path
             guess_subtype = os.path.splitext(path)[1][1:]
 
-            response = requests.get(image_src, verify=verify_ssl)
+            if cache is not None and image_src in cache:
+                content = cache[image_src]
+            else:
+                content = requests.get(image_src, verify=verify_ssl).content
+                if cache is not None:
+                    cache[image_src] = content
             mime_image = MIMEImage(
-                response.content, _subtype=guess_subtype)
+                content, _subtype=guess_subtype)
 
         mime_image.add_header('Content-ID', '<%s>' % cid_id)
 
@@ -17,9 +17,27 @@ from pretix.helpers.urls import build_absolute_uri
 @scopes_disabled()
 def notify(logentry_id: int):
     logentry = LogEntry.all.select_related('event', 'event__organizer').get(id=logentry_id)
+    _notify(logentry, {})
+
+
+@app.task(base=TransactionAwareTask, acks_late=True)
+@scopes_disabled()
+def notify_batch(logentry_ids: list):
+    """
+    Like ``notify``, but for many log entries at once, e.g. all entries written by a ``log_batch``.
+    """
+    types_cache = {}
+    logentries = LogEntry.all.select_related('event', 'event__organizer').filter(id__in=logentry_ids).order_by('pk')
+    for logentry in logentries:
+        _notify(logentry, types_cache)
+
+
+def _notify(logentry, types_cache):
     if not logentry.event:
         return  # Ignore, we only have event-related notifications right now
-    types = get_all_notification_types(logentry.event)
+    if logentry.event_id not in types_cache:
+        types_cache[logentry.event_id] = get_all_notification_types(logentry.event)
+    types = types_cache[logentry.event_id]
 
     notification_type = None
     typepath = logentry.action_type
@@ -58,12 +76,12 @@ def notify(logentry_id: int):
     for um, enabled in notify_specific.items():
         user, method = um
         if enabled:
-            send_notification.apply_async(args=(logentry_id, notification_type.action_type, user.pk, method))
+            send_notification.apply_async(args=(logentry.pk, notification_type.action_type, user.pk, method))
 
     for um, enabled in notify_global.items():
         user, method = um
         if enabled and um not in notify_specific:
-            send_notification.apply_async(args=(logentry_id, notification_type.action_type, user.pk, method))
+            send_notification.apply_async(args=(logentry.pk, notification_type.action_type, user.pk, method))
 
 
 @app.task(base=ProfiledTask, acks_late=True)
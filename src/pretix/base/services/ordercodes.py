@@ -0,0 +1,110 @@
+"""
+Pool of pre-generated order codes.
+
+Every new order needs a code that is unique within its organizer. Finding one requires a database
+query per attempt, and with a growing number of orders more attempts are necessary. Since codes
+are assigned while the event is locked during checkout, this directly limits the checkout
+throughput. If ``order_code_pool`` is set in the configuration file and redis is available, we keep
+a set of random codes per organizer in redis that have already been checked against all existing
+orders. Assigning a code then removes one from this set without any database query. Whenever the
+set runs low, a background task adds new codes. If the set is empty, codes are generated the old way.
+
+To make sure a code can never be handed out both from the pool and the old way, every code needs to
+be claimed in a second set in redis before it is used. Adding a code to a set is atomic, so only one
+of the two can succeed. The background task only checks codes against the database after it has
+claimed them, so no order can take them in the meantime.
+"""
+from django.conf import settings
+from django_scopes import scopes_disabled
+
+from pretix.base.models import Order, Organizer
+from pretix.base.services.tasks import ProfiledTask
+from pretix.celery_app import app
+
+POOL_EXPIRY = 7 * 24 * 3600
+REFILL_TIMEOUT = 300
+
+
+def pool_enabled():
+    return settings.HAS_REDIS and settings.PRETIX_ORDER_CODE_POOL > 0
+
+
+def _redis():
+    from django_redis import get_redis_connection
+
+    return get_redis_connection("redis")
+
+
+def _pool_key(organizer_id):
+    return 'pretix_order_codes_{}'.format(organizer_id)
+
+
+def _claims_key(organizer_id):
+    return 'pretix_order_codes_{}_claimed'.format(organizer_id)
+
+
+def pop_code(organizer: Organizer):
+    """
+    Removes a code from the pool of the given organizer and returns it, or returns ``None`` if the pool is empty or
+    disabled. Schedules a refill if the pool runs low.
+    """
+    if not pool_enabled():
+        return None
+
+    rc = _redis()
+    key = _pool_key(organizer.pk)
+    pipe = rc.pipeline()
+    pipe.spop(key)
+    pipe.scard(key)
+    code, remaining = pipe.execute()
+
+    if remaining < settings.PRETIX_ORDER_CODE_POOL // 4:
+        # Only one refill should be running per organizer at a time
+        if rc.set(key + '_refill', '1', nx=True, ex=REFILL_TIMEOUT):
+            refill_order_code_pool.apply_async(args=(organizer.pk,))
+    return code.decode() if code else None
+
+
+def claim_code(organizer: Organizer, code: str):
+    """
+    Claims a code that has been checked against the database the old way. Returns ``False`` if the code has
+    already been claimed for the pool of the given organizer and may therefore not be used for a new order.
+    """
+    if not pool_enabled():
+        return True
+    pipe = _redis().pipeline()
+    pipe.sadd(_claims_key(organizer.pk), code)
+    pipe.expire(_claims_key(organizer.pk), POOL_EXPIRY)
+    added, _ = pipe.execute()
+    return bool(added)
+
+
+@app.task(base=ProfiledTask)
+@scopes_disabled()
+def refill_order_code_pool(organizer: int):
+    rc = _redis()
+    key = _pool_key(organizer)
+    try:
+        missing = settings.PRETIX_ORDER_CODE_POOL - rc.scard(key)
+        length = settings.ENTROPY['order_code']
+        while missing > 0:
+            candidates = list({Order.generate_code(length) for i in range(missing)})
+            pipe = rc.pipeline()
+            for code in candidates:
+                pipe.sadd(_claims_key(organizer), code)
+            pipe.expire(_claims_key(organizer), POOL_EXPIRY)
+            claimed = {code for code, added in zip(candidates, pipe.execute()) if added}
+            taken = set(Order.objects.filter(event__organizer_id=organizer, code__in=claimed).values_list(
+                'code', flat=True
+            ))
+            fresh = claimed - taken
+            if (len(candidates) - len(fresh)) * 2 > len(candidates):
+                # Same safeguard as in Order.assign_code: If most codes are taken, we use longer ones
+                length += 1
+            if fresh:
+                missing -= rc.sadd(key, *fresh)
+        rc.expire(key, POOL_EXPIRY)
+        # The claims must not expire before the codes in the pool
+        rc.expire(_claims_key(organizer), POOL_EXPIRY)
+    finally:
+        rc.delete(key + '_refill')
@@ -1,7 +1,10 @@
 import csv
 import io
+import logging
 from decimal import Decimal
+from itertools import chain
 
+from django.conf import settings as django_settings
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.utils.timezone import now
@@ -10,14 +13,21 @@ from django.utils.translation import gettext as _
 from pretix.base.i18n import LazyLocaleException, language
 from pretix.base.models import (
     CachedFile, Event, InvoiceAddress, Order, OrderPayment, OrderPosition,
-    User,
+    User, generate_position_secret, log_batch,
 )
 from pretix.base.orderimport import get_all_columns
-from pretix.base.services.invoices import generate_invoice, invoice_qualified
+from pretix.base.services import quotacounters, rollups
+from pretix.base.services.invoices import generate_invoices, invoice_qualified
+from pretix.base.services.search import schedule_reindex, search_index_enabled
 from pretix.base.services.tasks import ProfiledEventTask
 from pretix.base.signals import order_paid, order_placed
 from pretix.celery_app import app
 
+logger = logging.getLogger(__name__)
+
+CHARSET_DETECTION_CHUNK_SIZE = 64 * 1024
+IMPORT_CHUNK_SIZE = 500
+
 
 class DataImportError(LazyLocaleException):
     def __init__(self, *args):
@@ -31,27 +41,89 @@ class DataImportError(LazyLocaleException):
         super().__init__(msg)
 
 
-def parse_csv(file, length=None):
-    data = file.read(length)
+class _FileReader(io.RawIOBase):
+    """
+    Exposes a binary file object to ``io`` wrappers without handing over ownership, so the file is not closed when the
+    wrapper is closed or garbage collected.
+    """
+
+    def __init__(self, file):
+        self._file = file
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._file.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._file.seek(offset, whence)
+        return self._file.tell()
+
+    def tell(self):
+        return self._file.tell()
+
+
+def _detect_charset(file, length=None):
     try:
-        import chardet
-        charset = chardet.detect(data)['encoding']
+        from chardet.universaldetector import UniversalDetector
     except ImportError:
-        charset = file.charset
-    data = data.decode(charset or 'utf-8')
-    # If the file was modified on a Mac, it only contains \r as line breaks
-    if '\r' in data and '\n' not in data:
-        data = data.replace('\r', '\n')
+        return file.charset
+
+    file.seek(0)
+    detector = UniversalDetector()
+    remaining = length
+    while not detector.done and (remaining is None or remaining > 0):
+        chunk = file.read(CHARSET_DETECTION_CHUNK_SIZE if remaining is None else min(remaining, CHARSET_DETECTION_CHUNK_SIZE))
+        if not chunk:
+            break
+        detector.feed(chunk)
+        if remaining is not None:
+            remaining -= len(chunk)
+    detector.close()
+    return detector.result['encoding']
+
+
+def parse_csv(file, length=None):
+    """
+    Returns a ``csv.DictReader`` for the given binary file or ``None`` if the file can't be read as a CSV file. If
+    ``length`` is given, only the first ``length`` bytes are read. Otherwise, the file is decoded while it is being
+    read, so the file never needs to fit into memory at once.
+    """
+    if length is not None:
+        data = file.read(length)
+        try:
+            import chardet
+            charset = chardet.detect(data)['encoding']
+        except ImportError:
+            charset = file.charset
+        data = data.decode(charset or 'utf-8')
+        # If the file was modified on a Mac, it only contains \r as line breaks
+        if '\r' in data and '\n' not in data:
+            data = data.replace('\r', '\n')
+        text = io.StringIO(data)
+    else:
+        charset = _detect_charset(file)
+        file.seek(0)
+        # With newline='', lines are split at \r, \n and \r\n without translating them, which is what the csv
+        # module expects and also covers files that only contain \r as line breaks
+        text = io.TextIOWrapper(io.BufferedReader(_FileReader(file)), encoding=charset or 'utf-8', newline='')
 
     try:
-        dialect = csv.Sniffer().sniff(data.split("\n")[0], delimiters=";,.#:")
+        dialect = csv.Sniffer().sniff(text.readline().rstrip('\r\n'), delimiters=";,.#:")
     except csv.Error:
         return None
 
     if dialect is None:
         return None
 
-    reader = csv.DictReader(io.StringIO(data), dialect=dialect)
+    text.seek(0)
+    reader = csv.DictReader(text, dialect=dialect)
     return reader
 
 
@@ -60,118 +132,232 @@ def setif(record, obj, attr, setting):
         setattr(obj, attr, record[setting[4:]] or '')
 
 
-@app.task(base=ProfiledEventTask, throws=(DataImportError,))
-def import_orders(event: Event, fileid: str, settings: dict, locale: str, user) -> None:
+def _report_progress(task, percentage):
+    if django_settings.HAS_CELERY and not task.request.called_directly:
+        task.update_state(state='PROGRESS', meta={'value': round(percentage)})
+
+
+def _clean_record(cols, settings, record, i):
+    values = {}
+    for c in cols:
+        val = c.resolve(settings, record)
+        try:
+            values[c.identifier] = c.clean(val, values)
+        except ValidationError as e:
+            raise DataImportError(
+                _(
+                    'Error while importing value "{value}" for column "{column}" in line "{line}": {message}').format(
+                    value=val if val is not None else '', column=c.verbose_name, line=i + 1, message=e.message
+                )
+            )
+    return values
+
+
+def _read_orders(event, settings, cols, parsed):
+    """
+    Validates the records of the file once more and yields one unsaved order at a time, with its positions and
+    invoice address attached.
+    """
+    order = None
+    for i, record in enumerate(parsed):
+        values = _clean_record(cols, settings, record, i)
+        try:
+            if order is None or settings['orders'] == 'many':
+                if order is not None:
+                    yield order
+                order = Order(
+                    event=event,
+                    testmode=settings['testmode'],
+                )
+                order.meta_info = {}
+                order._positions = []
+                order._address = InvoiceAddress()
+                order._address.name_parts = {'_scheme': event.settings.name_scheme}
+
+            position = OrderPosition()
+            position.attendee_name_parts = {'_scheme': event.settings.name_scheme}
+            position.meta_info = {}
+            order._positions.append(position)
+            position.assign_pseudonymization_id()
+
+            for c in cols:
+                c.assign(values.get(c.identifier), order, position, order._address)
+
+        except ImportError as e:
+            raise ImportError(
+                _('Invalid data in row {row}: {message}').format(row=i, message=str(e))
+            )
+    if order is not None:
+        yield order
+
+
+def _ensure_unique_secrets(event, positions):
+    while True:
+        taken = set(OrderPosition.all.filter(
+            order__event__organizer_id=event.organizer_id, secret__in=[p.secret for p in positions]
+        ).values_list('secret', flat=True))
+        seen = set()
+        changed = False
+        for p in positions:
+            if p.secret in taken or p.secret in seen:
+                p.secret = generate_position_secret()
+                changed = True
+            seen.add(p.secret)
+        if not changed:
+            return
+
+
+def _save_orders(event, orders, cols, settings, user):
+    codes = set()
+    for o in orders:
+        o.total = sum([c.price for c in o._positions])  # currently no support for fees
+        if o.total == Decimal('0.00') or settings['status'] == 'paid':
+            o.status = Order.STATUS_PAID
+        else:
+            o.status = Order.STATUS_PENDING
+        if not o.datetime:
+            o.datetime = now()
+        if not o.expires:
+            o.set_expires()
+        while not o.code or o.code in codes:
+            o.assign_code()
+        codes.add(o.code)
+    Order.objects.bulk_create(orders)
+    if any(o.pk is None for o in orders):
+        pks = dict(event.orders.filter(code__in=codes).values_list('code', 'pk'))
+        for o in orders:
+            o.pk = pks[o.code]
+
+    payments = []
+    positions = []
+    addresses = []
+    for o in orders:
+        if o.status == Order.STATUS_PAID:
+            payments.append(OrderPayment(
+                local_id=1,
+                order=o,
+                amount=o.total,
+                provider='free' if o.total == Decimal('0.00') else 'manual',
+                info='{}',
+                payment_date=now(),
+                state=OrderPayment.PAYMENT_STATE_CONFIRMED
+            ))
+        for p in o._positions:
+            p.order = o
+            if p.tax_rate is None:
+                p._calculate_tax()
+            if p.attendee_name_parts is None:
+                p.attendee_name_parts = {}
+            p.attendee_name_cached = p.attendee_name
+            positions.append(p)
+        a = o._address
+        a.order = o
+        if a.name_parts:
+            a.name_cached = a.name
+        else:
+            a.name_cached = ""
+            a.name_parts = {}
+        addresses.append(a)
+
+    _ensure_unique_secrets(event, positions)
+    OrderPayment.objects.bulk_create(payments)
+    OrderPosition.objects.bulk_create(positions)
+    if any(p.pk is None for p in positions):
+        pks = dict(OrderPosition.all.filter(
+            order_id__in=[o.pk for o in orders]
+        ).values_list('secret', 'pk'))
+        for p in positions:
+            p.pk = pks[p.secret]
+    InvoiceAddress.objects.bulk_create(addresses)
+
+    for c in cols:
+        c.save_many(orders)
+
+    # bulk_create() does not send the signals the quota counters, statistics rollups and the search index are
+    # usually kept up to date by
+    quotacounters.bulk_created_positions(positions)
+    rollups.bulk_created_orders(orders, payments)
+    rollups.bulk_created_positions(positions)
+    if search_index_enabled():
+        for o in orders:
+            schedule_reindex(o.pk)
+
+    with log_batch():
+        for o in orders:
+            o.log_action('pretix.event.order.placed', user=user, data={'source': 'import'})
+
+
+def _finish_orders(event, orders):
+    invoice_orders = []
+    for o in orders:
+        with language(o.locale):
+            order_placed.send(event, order=o)
+            if o.status == Order.STATUS_PAID:
+                order_paid.send(event, order=o)
+
+            gen_invoice = invoice_qualified(o) and (
+                (event.settings.get('invoice_generate') == 'True') or
+                (event.settings.get('invoice_generate') == 'paid' and o.status == Order.STATUS_PAID)
+            ) and not o.invoices.last()
+            if gen_invoice:
+                invoice_orders.append(o)
+
+    if invoice_orders:
+        generate_invoices(event, invoice_orders, trigger_pdf=True)
+
+
+@app.task(base=ProfiledEventTask, bind=True, throws=(DataImportError,))
+def import_orders(self, event: Event, fileid: str, settings: dict, locale: str, user) -> None:
+    """
+    Imports orders from a CSV file. The file is read twice: The first pass validates all rows without keeping them in
+    memory, so that nothing is imported from an invalid file. The second pass saves the orders in chunks of roughly
+    ``IMPORT_CHUNK_SIZE`` positions, each in its own database transaction, and only holds the event lock while a chunk
+    is being saved. If saving a chunk fails, the chunks saved before stay in the database and the error tells the user
+    how many rows have been imported.
+    """
     # TODO: quotacheck?
     cf = CachedFile.objects.get(id=fileid)
     user = User.objects.get(pk=user)
     with language(locale):
+        # Run validation
+        rows = 0
         cols = get_all_columns(event)
-        parsed = parse_csv(cf.file)
-        orders = []
-        order = None
-        data = []
+        for i, record in enumerate(parse_csv(cf.file)):
+            _clean_record(cols, settings, record, i)
+            rows += 1
 
-        # Run validation
-        for i, record in enumerate(parsed):
-            values = {}
-            for c in cols:
-                val = c.resolve(settings, record)
-                try:
-                    values[c.identifier] = c.clean(val, values)
-                except ValidationError as e:
-                    raise DataImportError(
-                        _(
-                            'Error while importing value "{value}" for column "{column}" in line "{line}": {message}').format(
-                            value=val if val is not None else '', column=c.verbose_name, line=i + 1, message=e.message
-                        )
-                    )
-            data.append(values)
-
-        # Prepare model objects. Yes, this might consume lots of RAM, but allows us to make the actual SQL transaction
-        # shorter. We'll see what works better in reality…
-        for i, record in enumerate(data):
+        # Columns keep track of e.g. seats and secrets they have seen, so we need fresh ones for the actual import
+        cols = get_all_columns(event)
+        chunk = []
+        chunk_positions = 0
+        done = 0
+        orders = _read_orders(event, settings, cols, parse_csv(cf.file))
+        for order in chain(orders, [None]):
+            if order is not None:
+                chunk.append(order)
+                chunk_positions += len(order._positions)
+                if chunk_positions < IMPORT_CHUNK_SIZE:
+                    continue
+            if not chunk:
+                break
+
+            # quota check?
             try:
-                if order is None or settings['orders'] == 'many':
-                    order = Order(
-                        event=event,
-                        testmode=settings['testmode'],
-                    )
-                    order.meta_info = {}
-                    order._positions = []
-                    order._address = InvoiceAddress()
-                    order._address.name_parts = {'_scheme': event.settings.name_scheme}
-                    orders.append(order)
-
-                position = OrderPosition()
-                position.attendee_name_parts = {'_scheme': event.settings.name_scheme}
-                position.meta_info = {}
-                order._positions.append(position)
-                position.assign_pseudonymization_id()
-
-                for c in cols:
-                    c.assign(record.get(c.identifier), order, position, order._address)
-
-            except ImportError as e:
-                raise ImportError(
-                    _('Invalid data in row {row}: {message}').format(row=i, message=str(e))
+                with event.lock():
+                    with transaction.atomic():
+                        _save_orders(event, chunk, cols, settings, user)
+            except Exception:
+                if not done:
+                    raise
+                logger.exception('Order import failed after %d rows', done)
+                raise DataImportError(
+                    _('The import failed after {done} of {total} rows. The first {done} rows have been imported, '
+                      'please remove them from the file before you import it again.').format(done=done, total=rows)
                 )
+            _finish_orders(event, chunk)
 
-        # quota check?
-        with event.lock():
-            with transaction.atomic():
-                for o in orders:
-                    o.total = sum([c.price for c in o._positions])  # currently no support for fees
-                    if o.total == Decimal('0.00'):
-                        o.status = Order.STATUS_PAID
-                        o.save()
-                        OrderPayment.objects.create(
-                            local_id=1,
-                            order=o,
-                            amount=Decimal('0.00'),
-                            provider='free',
-                            info='{}',
-                            payment_date=now(),
-                            state=OrderPayment.PAYMENT_STATE_CONFIRMED
-                        )
-                    elif settings['status'] == 'paid':
-                        o.status = Order.STATUS_PAID
-                        o.save()
-                        OrderPayment.objects.create(
-                            local_id=1,
-                            order=o,
-                            amount=o.total,
-                            provider='manual',
-                            info='{}',
-                            payment_date=now(),
-                            state=OrderPayment.PAYMENT_STATE_CONFIRMED
-                        )
-                    else:
-                        o.status = Order.STATUS_PENDING
-                        o.save()
-                    for p in o._positions:
-                        p.order = o
-                        p.save()
-                    o._address.order = o
-                    o._address.save()
-                    for c in cols:
-                        c.save(o)
-                    o.log_action(
-                        'pretix.event.order.placed',
-                        user=user,
-                        data={'source': 'import'}
-                    )
-
-            for o in orders:
-                with language(o.locale):
-                    order_placed.send(event, order=o)
-                    if o.status == Order.STATUS_PAID:
-                        order_paid.send(event, order=o)
-
-                    gen_invoice = invoice_qualified(o) and (
-                        (event.settings.get('invoice_generate') == 'True') or
-                        (event.settings.get('invoice_generate') == 'paid' and o.status == Order.STATUS_PAID)
-                    ) and not o.invoices.last()
-                    if gen_invoice:
-                        generate_invoice(o, trigger_pdf=True)
+            done += chunk_positions
+            _report_progress(self, done / max(rows, 1) * 100)
+            chunk = []
+            chunk_positions = 0
     cf.delete()
@@ -3,6 +3,7 @@ import logging
 from collections import Counter, namedtuple
 from datetime import datetime, time, timedelta
 from decimal import Decimal
+from functools import partial
 from typing import List, Optional
 
 from celery.exceptions import MaxRetriesExceededError
@@ -43,7 +44,7 @@ from pretix.base.services.invoices import (
 )
 from pretix.base.services.locking import LockTimeoutException, NoLockManager
 from pretix.base.services.mail import SendMailException
-from pretix.base.services.pricing import get_price
+from pretix.base.services.pricing import PriceSpec, PricingContext
 from pretix.base.services.quotas import QuotaAvailability
 from pretix.base.services.tasks import ProfiledEventTask, ProfiledTask
 from pretix.base.signals import (
@@ -505,6 +506,11 @@ def _check_positions(event: Event, now_dt: datetime, positions: List[CartPositio
             deleted_positions.add(cp.pk)
             cp.delete()
 
+    pricing = PricingContext(event, address)
+    pricing.load([
+        PriceSpec(cp.item, cp.variation, cp.voucher, subevent=cp.subevent, addon_to=cp.addon_to) for cp in positions
+    ])
+
     for i, cp in enumerate(sorted(positions, key=lambda s: -int(s.is_bundled))):
         if cp.pk in deleted_positions:
             continue
@@ -614,10 +620,10 @@ def _check_positions(event: Event, now_dt: datetime, positions: List[CartPositio
                 bprice = cp.price
             except ItemBundle.MultipleObjectsReturned:
                 raise OrderError("Invalid product configuration (duplicate bundle)")
-            price = get_price(cp.item, cp.variation, cp.voucher, bprice, cp.subevent, custom_price_is_net=False,
-                              invoice_address=address, force_custom_price=True, max_discount=max_discount)
-            pbv = get_price(cp.item, cp.variation, None, bprice, cp.subevent, custom_price_is_net=False,
-                            invoice_address=address, force_custom_price=True, max_discount=max_discount)
+            price = pricing.price(PriceSpec(cp.item, cp.variation, cp.voucher, bprice, cp.subevent, custom_price_is_net=False,
+                                            force_custom_price=True, max_discount=max_discount))
+            pbv = pricing.price(PriceSpec(cp.item, cp.variation, None, bprice, cp.subevent, custom_price_is_net=False,
+                                          force_custom_price=True, max_discount=max_discount))
             changed_prices[cp.pk] = bprice
         else:
             bundled_sum = 0
@@ -626,12 +632,10 @@ def _check_positions(event: Event, now_dt: datetime, positions: List[CartPositio
                     if bundledp.is_bundled:
                         bundled_sum += changed_prices.get(bundledp.pk, bundledp.price)
 
-            price = get_price(cp.item, cp.variation, cp.voucher, cp.price, cp.subevent, custom_price_is_net=False,
-                              addon_to=cp.addon_to, invoice_address=address, bundled_sum=bundled_sum,
-                              max_discount=max_discount)
-            pbv = get_price(cp.item, cp.variation, None, cp.price, cp.subevent, custom_price_is_net=False,
-                            addon_to=cp.addon_to, invoice_address=address, bundled_sum=bundled_sum,
-                            max_discount=max_discount)
+            price = pricing.price(PriceSpec(cp.item, cp.variation, cp.voucher, cp.price, cp.subevent, custom_price_is_net=False,
+                                            addon_to=cp.addon_to, bundled_sum=bundled_sum, max_discount=max_discount))
+            pbv = pricing.price(PriceSpec(cp.item, cp.variation, None, cp.price, cp.subevent, custom_price_is_net=False,
+                                          addon_to=cp.addon_to, bundled_sum=bundled_sum, max_discount=max_discount))
 
         if max_discount is not None:
             v_budget[cp.voucher] = v_budget[cp.voucher] + current_discount - (pbv.gross - price.gross)
@@ -909,7 +913,24 @@ def _perform_order(event: Event, payment_provider: str, position_ids: List[str],
         # Performance optimization: If no voucher is used and no cart position is dangerously close to its expiry date,
         # creating this order shouldn't be prone to any race conditions and we don't need to lock the event.
         locked = True
-        lockfn = event.lock
+        if settings.PRETIX_LOCK_STRIPES > 1:
+            lock_positions = list(positions.values('item_id', 'variation_id', 'subevent_id', 'voucher_id', 'seat_id'))
+            lock_quotas = Quota.objects.filter(
+                Q(items__in={p['item_id'] for p in lock_positions if not p['variation_id']})
+                | Q(variations__in={p['variation_id'] for p in lock_positions if p['variation_id']}),
+                event=event, size__isnull=False,
+            )
+            if event.has_subevents:
+                lock_quotas = lock_quotas.filter(subevent_id__in={p['subevent_id'] for p in lock_positions})
+            lockfn = partial(
+                event.lock,
+                quotas=set(lock_quotas.values_list('pk', flat=True)),
+                vouchers={p['voucher_id'] for p in lock_positions if p['voucher_id']},
+                seats={p['seat_id'] for p in lock_positions if p['seat_id']},
+            )
+        else:
+            # Without lock striping, the whole event is locked anyway
+            lockfn = event.lock
 
     with lockfn() as now_dt:
         positions = list(
@@ -1221,8 +1242,8 @@ class OrderChangeManager:
         self._operations.append(self.SeatOperation(position, seat))
 
     def change_subevent(self, position: OrderPosition, subevent: SubEvent):
-        price = get_price(position.item, position.variation, voucher=position.voucher, subevent=subevent,
-                          invoice_address=self._invoice_address)
+        price = self._pricing.price(PriceSpec(position.item, position.variation, voucher=position.voucher,
+                                              subevent=subevent))
 
         if price is None:  # NOQA
             raise OrderError(self.error_messages['product_invalid'])
@@ -1241,8 +1262,7 @@ class OrderChangeManager:
         if (not variation and item.has_variations) or (variation and variation.item_id != item.pk):
             raise OrderError(self.error_messages['product_without_variation'])
 
-        price = get_price(item, variation, voucher=position.voucher, subevent=subevent,
-                          invoice_address=self._invoice_address)
+        price = self._pricing.price(PriceSpec(item, variation, voucher=position.voucher, subevent=subevent))
 
         if price is None:  # NOQA
             raise OrderError(self.error_messages['product_invalid'])
@@ -1341,7 +1361,7 @@ class OrderChangeManager:
                     raise OrderError(error_messages['seat_invalid'])
 
         if price is None:
-            price = get_price(item, variation, subevent=subevent, invoice_address=self._invoice_address)
+            price = self._pricing.price(PriceSpec(item, variation, subevent=subevent))
         else:
             if item.tax_rule and item.tax_rule.tax_applicable(self._invoice_address):
                 price = item.tax(price, base_price_is='gross')
@@ -1532,12 +1552,11 @@ class OrderChangeManager:
                 if op.position.price_before_voucher is not None and op.position.voucher and not op.position.addon_to_id:
                     op.position.price_before_voucher = max(
                         op.position.price,
-                        get_price(
+                        self._pricing.price(PriceSpec(
                             op.position.item, op.position.variation,
                             subevent=op.position.subevent,
                             custom_price=op.position.price,
-                            invoice_address=self._invoice_address
-                        ).gross
+                        )).gross
                     )
                 op.position.save()
             elif isinstance(op, self.SeatOperation):
@@ -1565,12 +1584,11 @@ class OrderChangeManager:
                 if op.position.price_before_voucher is not None and op.position.voucher and not op.position.addon_to_id:
                     op.position.price_before_voucher = max(
                         op.position.price,
-                        get_price(
+                        self._pricing.price(PriceSpec(
                             op.position.item, op.position.variation,
                             subevent=op.position.subevent,
                             custom_price=op.position.price,
-                            invoice_address=self._invoice_address
-                        ).gross
+                        )).gross
                     )
             elif isinstance(op, self.AddFeeOperation):
                 self.order.log_action('pretix.event.order.changed.addfee', user=self.user, auth=self.auth, data={
@@ -1876,6 +1894,10 @@ class OrderChangeManager:
         except InvoiceAddress.DoesNotExist:
             return None
 
+    @cached_property
+    def _pricing(self):
+        return PricingContext(self.event, self._invoice_address)
+
     def commit(self, check_quotas=True):
         if self._committed:
             # an order change can only be committed once
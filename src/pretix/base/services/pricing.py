@@ -1,81 +1,224 @@
+from collections import namedtuple
 from decimal import Decimal
+from typing import List
 
 from pretix.base.decimal import round_decimal
 from pretix.base.models import (
-    AbstractPosition, InvoiceAddress, Item, ItemAddOn, ItemVariation, Voucher,
+    AbstractPosition, Event, InvoiceAddress, Item, ItemAddOn, ItemVariation,
+    SubEventItem, SubEventItemVariation, Voucher,
 )
 from pretix.base.models.event import SubEvent
 from pretix.base.models.tax import TAXED_ZERO, TaxedPrice, TaxRule
 
+PriceSpec = namedtuple('PriceSpec', ('item', 'variation', 'voucher', 'custom_price', 'subevent', 'custom_price_is_net',
+                                     'addon_to', 'force_custom_price', 'bundled_sum', 'max_discount', 'tax_rule'))
+PriceSpec.__new__.__defaults__ = (None, None, None, None, False, None, False, Decimal('0.00'), None, None)
+PriceSpec.__doc__ = """
+The input of a single price calculation with ``get_prices``. The fields have the same meaning as the arguments of
+``get_price``, the invoice address is part of the ``PricingContext``.
+"""
 
-def get_price(item: Item, variation: ItemVariation = None,
-              voucher: Voucher = None, custom_price: Decimal = None,
-              subevent: SubEvent = None, custom_price_is_net: bool = False,
-              addon_to: AbstractPosition = None, invoice_address: InvoiceAddress = None,
-              force_custom_price: bool = False, bundled_sum: Decimal = Decimal('0.00'),
-              max_discount: Decimal = None, tax_rule=None) -> TaxedPrice:
-    if addon_to:
-        try:
-            iao = addon_to.item.addons.get(addon_category_id=item.category_id)
-            if iao.price_included:
-                return TAXED_ZERO
-        except ItemAddOn.DoesNotExist:
-            pass
 
+def _default_tax_rule():
+    return TaxRule(
+        name='',
+        rate=Decimal('0.00'),
+        price_includes_tax=True,
+        eu_reverse_charge=False,
+    )
+
+
+def _tax_rule_key(tax_rule):
+    # Tax rules passed in explicitly might not be saved
+    return tax_rule.pk or id(tax_rule)
+
+
+def _base_price(item, variation, item_price_overrides, var_price_overrides):
     price = item.default_price
-    if subevent and item.pk in subevent.item_price_overrides:
-        price = subevent.item_price_overrides[item.pk]
+    if item.pk in item_price_overrides:
+        price = item_price_overrides[item.pk]
 
     if variation is not None:
         if variation.default_price is not None:
             price = variation.default_price
-        if subevent and variation.pk in subevent.var_price_overrides:
-            price = subevent.var_price_overrides[variation.pk]
+        if variation.pk in var_price_overrides:
+            price = var_price_overrides[variation.pk]
+    return price
 
+
+def _taxed_price(item, price, voucher, custom_price, custom_price_is_net, force_custom_price, bundled_sum,
+                 max_discount, tax_rule, tax_applicable, currency):
     if voucher:
         price = voucher.calculate_price(price, max_discount=max_discount)
 
-    if tax_rule is not None:
-        tax_rule = tax_rule
-    elif item.tax_rule:
-        tax_rule = item.tax_rule
-    else:
-        tax_rule = TaxRule(
-            name='',
-            rate=Decimal('0.00'),
-            price_includes_tax=True,
-            eu_reverse_charge=False,
-        )
-    price = tax_rule.tax(price)
+    price = tax_rule.tax(price, currency=currency)
 
     if force_custom_price and custom_price is not None and custom_price != "":
         if custom_price_is_net:
-            price = tax_rule.tax(custom_price, base_price_is='net')
+            price = tax_rule.tax(custom_price, base_price_is='net', currency=currency)
         else:
-            price = tax_rule.tax(custom_price, base_price_is='gross')
+            price = tax_rule.tax(custom_price, base_price_is='gross', currency=currency)
     if item.free_price and custom_price is not None and custom_price != "":
         if not isinstance(custom_price, Decimal):
             custom_price = Decimal(str(custom_price).replace(",", "."))
         if custom_price > 100000000:
             raise ValueError('price_too_high')
         if custom_price_is_net:
-            price = tax_rule.tax(max(custom_price, price.net), base_price_is='net')
+            price = tax_rule.tax(max(custom_price, price.net), base_price_is='net', currency=currency)
         else:
-            price = tax_rule.tax(max(custom_price, price.gross), base_price_is='gross')
+            price = tax_rule.tax(max(custom_price, price.gross), base_price_is='gross', currency=currency)
 
     if bundled_sum:
         price = price - TaxedPrice(net=bundled_sum, gross=bundled_sum, rate=0, tax=0, name='')
         if price.gross < Decimal('0.00'):
             return TAXED_ZERO
 
-    if invoice_address and not tax_rule.tax_applicable(invoice_address):
+    if not tax_applicable():
         price.tax = Decimal('0.00')
         price.rate = Decimal('0.00')
         price.gross = price.net
         price.name = ''
 
-    price.gross = round_decimal(price.gross, item.event.currency)
-    price.net = round_decimal(price.net, item.event.currency)
+    price.gross = round_decimal(price.gross, currency)
+    price.net = round_decimal(price.net, currency)
     price.tax = price.gross - price.net
 
     return price
+
+
+def get_price(item: Item, variation: ItemVariation = None,
+              voucher: Voucher = None, custom_price: Decimal = None,
+              subevent: SubEvent = None, custom_price_is_net: bool = False,
+              addon_to: AbstractPosition = None, invoice_address: InvoiceAddress = None,
+              force_custom_price: bool = False, bundled_sum: Decimal = Decimal('0.00'),
+              max_discount: Decimal = None, tax_rule=None) -> TaxedPrice:
+    if addon_to:
+        try:
+            iao = addon_to.item.addons.get(addon_category_id=item.category_id)
+            if iao.price_included:
+                return TAXED_ZERO
+        except ItemAddOn.DoesNotExist:
+            pass
+
+    price = _base_price(
+        item, variation,
+        subevent.item_price_overrides if subevent else {},
+        subevent.var_price_overrides if subevent else {},
+    )
+
+    if tax_rule is None:
+        tax_rule = item.tax_rule or _default_tax_rule()
+
+    return _taxed_price(
+        item, price, voucher, custom_price, custom_price_is_net, force_custom_price, bundled_sum, max_discount,
+        tax_rule, lambda: not invoice_address or tax_rule.tax_applicable(invoice_address), item.event.currency
+    )
+
+
+class PricingContext:
+    """
+    Everything ``get_price`` looks up in the database to price the positions of a cart or an order: price overrides
+    of dates, add-on configurations of the products positions are attached to, and tax rules. Missing data is loaded
+    for all positions passed to ``load`` or ``get_prices`` at once and kept for the lifetime of the context. Equal
+    positions, e.g. in a group booking, are only calculated once.
+
+    A context belongs to a single event and invoice address and should not outlive the operation it is created for,
+    since it does not notice changes to the data it has loaded.
+    """
+
+    def __init__(self, event: Event, invoice_address: InvoiceAddress = None):
+        self.event = event
+        self.invoice_address = invoice_address
+        self.currency = event.currency
+        self._item_price_overrides = {}
+        self._var_price_overrides = {}
+        self._price_included = {}
+        self._addon_base_items = set()
+        self._tax_rules = {None: _default_tax_rule()}
+        self._tax_applicable = {}
+        self._results = {}
+
+    def load(self, specs: List[PriceSpec]):
+        """
+        Loads the data needed to price the given positions that has not been loaded before.
+        """
+        subevents = {s.subevent.pk for s in specs if s.subevent} - set(self._item_price_overrides)
+        if subevents:
+            for se in subevents:
+                self._item_price_overrides[se] = {}
+                self._var_price_overrides[se] = {}
+            for si in SubEventItem.objects.filter(subevent_id__in=subevents, price__isnull=False):
+                self._item_price_overrides[si.subevent_id][si.item_id] = si.price
+            for si in SubEventItemVariation.objects.filter(subevent_id__in=subevents, price__isnull=False):
+                self._var_price_overrides[si.subevent_id][si.variation_id] = si.price
+
+        base_items = {s.addon_to.item_id for s in specs if s.addon_to} - self._addon_base_items
+        if base_items:
+            self._addon_base_items |= base_items
+            for iao in ItemAddOn.objects.filter(base_item_id__in=base_items):
+                self._price_included[iao.base_item_id, iao.addon_category_id] = iao.price_included
+
+        for s in specs:
+            if s.voucher and s.voucher.event_id == self.event.pk and not Voucher.event.is_cached(s.voucher):
+                s.voucher.event = self.event
+            if s.tax_rule is None and s.item.tax_rule_id not in self._tax_rules and Item.tax_rule.is_cached(s.item):
+                self._tax_rules[s.item.tax_rule_id] = s.item.tax_rule
+        tax_rules = {s.item.tax_rule_id for s in specs if s.tax_rule is None} - set(self._tax_rules)
+        if tax_rules:
+            for tr in TaxRule.objects.filter(pk__in=tax_rules):
+                tr.event = self.event
+                self._tax_rules[tr.pk] = tr
+
+    def _applicable(self, tax_rule):
+        if not self.invoice_address:
+            return True
+        key = _tax_rule_key(tax_rule)
+        if key not in self._tax_applicable:
+            self._tax_applicable[key] = tax_rule.tax_applicable(self.invoice_address)
+        return self._tax_applicable[key]
+
+    def price(self, spec: PriceSpec) -> TaxedPrice:
+        """
+        Returns the same result as ``get_price`` would for the given position.
+        """
+        self.load([spec])
+
+        if spec.addon_to and self._price_included.get((spec.addon_to.item_id, spec.item.category_id)):
+            return TAXED_ZERO
+
+        key = (
+            spec.item.pk, spec.variation.pk if spec.variation else None, spec.voucher.pk if spec.voucher else None,
+            spec.custom_price, spec.subevent.pk if spec.subevent else None, spec.custom_price_is_net,
+            spec.force_custom_price, spec.bundled_sum, spec.max_discount,
+            _tax_rule_key(spec.tax_rule) if spec.tax_rule is not None else None,
+        )
+        if key not in self._results:
+            price = _base_price(
+                spec.item, spec.variation,
+                self._item_price_overrides[spec.subevent.pk] if spec.subevent else {},
+                self._var_price_overrides[spec.subevent.pk] if spec.subevent else {},
+            )
+            if spec.tax_rule is not None:
+                tax_rule = spec.tax_rule
+            else:
+                tax_rule = self._tax_rules[spec.item.tax_rule_id]
+            self._results[key] = _taxed_price(
+                spec.item, price, spec.voucher, spec.custom_price, spec.custom_price_is_net,
+                spec.force_custom_price, spec.bundled_sum, spec.max_discount, tax_rule,
+                lambda: self._applicable(tax_rule), self.currency
+            )
+
+        # Callers may modify the returned object
+        result = self._results[key]
+        if result is TAXED_ZERO:
+            return result
+        return TaxedPrice(gross=result.gross, net=result.net, tax=result.tax, rate=result.rate, name=result.name)
+
+
+def get_prices(specs: List[PriceSpec], context: PricingContext) -> List[TaxedPrice]:
+    """
+    Calculates the prices of many positions of the same event in one pass, loading everything that is needed with a
+    fixed number of queries. The results are the same as calling ``get_price`` for every position.
+    """
+    context.load(specs)
+    return [context.price(s) for s in specs]
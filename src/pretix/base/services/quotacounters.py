@@ -0,0 +1,346 @@
+"""
+Counter-based quota availability.
+
+Computing the availability of a quota usually requires aggregating over all order positions and
+waiting list entries of the products in that quota. If ``quota_counters`` is enabled in the
+configuration file, we additionally keep :py:class:`pretix.base.models.QuotaCounter` rows up to date
+whenever an order, an order position or a waiting list entry changes, so
+:py:class:`pretix.base.services.quotas.QuotaAvailability` can read the number of paid orders,
+pending orders and waiting list entries from a handful of counter rows instead.
+
+Vouchers and cart positions are still counted on every computation, since whether they count
+towards a quota depends on the current time. Those tables only contain few relevant rows at any
+point in time, so this is cheap compared to scanning all order positions.
+
+Counters are updated in the same database transaction as the change they reflect. Changes that
+bypass model signals (e.g. ``QuerySet.update()``) are not reflected, which is why the counters of
+recently active events are verified periodically. Only counters that turn out to be wrong are
+written, without locking the event. Counters of an event are only used once they have been
+reconciled at least once. With ``quota_counters=verify``, both ways of counting are performed and
+any difference is logged and triggers a reconciliation of the affected events.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix.base.models import (
+    Event, LogEntry, Order, OrderPosition, QuotaCounter, WaitingListEntry,
+)
+from pretix.base.signals import periodic_task
+from pretix.celery_app import app
+from pretix.helpers.database import repair_aggregates
+
+logger = logging.getLogger(__name__)
+
+COUNTED_ORDER_STATUSES = (Order.STATUS_PAID, Order.STATUS_PENDING)
+POSITION_FIELDS = {'order', 'order_id', 'item', 'item_id', 'variation', 'variation_id', 'subevent',
+                   'subevent_id', 'canceled'}
+WAITINGLIST_FIELDS = {'event', 'event_id', 'item', 'item_id', 'variation', 'variation_id', 'subevent',
+                      'subevent_id', 'voucher', 'voucher_id'}
+
+
+def counters_enabled():
+    return settings.PRETIX_QUOTA_COUNTERS in ('on', 'verify')
+
+
+def counters_verified():
+    return settings.PRETIX_QUOTA_COUNTERS == 'verify'
+
+
+def _apply_deltas(deltas):
+    for (event_id, subevent_id, item_id, variation_id, kind), delta in deltas.items():
+        if not delta:
+            continue
+        key = {
+            'event_id': event_id,
+            'subevent_id': subevent_id or 0,
+            'item_id': item_id,
+            'variation_id': variation_id or 0,
+            'kind': kind,
+        }
+        if QuotaCounter.objects.filter(**key).update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                QuotaCounter.objects.create(count=delta, **key)
+        except IntegrityError:
+            # Somebody else created the row in the meantime
+            QuotaCounter.objects.filter(**key).update(count=F('count') + delta)
+
+
+def _is_relevant_update(update_fields, fields):
+    return update_fields is None or bool(set(update_fields) & fields)
+
+
+def _position_key(state):
+    if not state or state['canceled'] or state['order__status'] not in COUNTED_ORDER_STATUSES:
+        return None
+    return state['order__event_id'], state['subevent_id'], state['item_id'], state['variation_id'], state['order__status']
+
+
+def _fetch_position_state(pk):
+    return OrderPosition.all.filter(pk=pk).values(
+        'item_id', 'variation_id', 'subevent_id', 'canceled', 'order_id', 'order__status', 'order__event_id'
+    ).first()
+
+
+@receiver(pre_save, sender=Order, dispatch_uid="quotacounters_order_pre_save")
+def order_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance._quota_counter_status = None
+    if not counters_enabled() or not instance.pk or not _is_relevant_update(update_fields, {'status'}):
+        return
+    with scopes_disabled():
+        instance._quota_counter_status = Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Order, dispatch_uid="quotacounters_order_post_save")
+def order_post_save(sender, instance, **kwargs):
+    old_status = getattr(instance, '_quota_counter_status', None)
+    if old_status is None or old_status == instance.status:
+        return
+    if old_status not in COUNTED_ORDER_STATUSES and instance.status not in COUNTED_ORDER_STATUSES:
+        return
+
+    deltas = Counter()
+    with scopes_disabled():
+        lines = OrderPosition.objects.filter(order_id=instance.pk).order_by().values(
+            'item_id', 'variation_id', 'subevent_id'
+        ).annotate(c=Count('*'))
+        for line in lines:
+            key = (instance.event_id, line['subevent_id'], line['item_id'], line['variation_id'])
+            if old_status in COUNTED_ORDER_STATUSES:
+                deltas[key + (old_status,)] -= line['c']
+            if instance.status in COUNTED_ORDER_STATUSES:
+                deltas[key + (instance.status,)] += line['c']
+        _apply_deltas(deltas)
+
+
+@receiver(pre_save, sender=OrderPosition, dispatch_uid="quotacounters_position_pre_save")
+def position_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance._quota_counter_state = None
+    if not counters_enabled() or not _is_relevant_update(update_fields, POSITION_FIELDS):
+        return
+    with scopes_disabled():
+        if instance.pk:
+            state = _fetch_position_state(instance.pk)
+        else:
+            state = None
+        if state and state['order_id'] == instance.order_id:
+            order_state = (state['order__status'], state['order__event_id'])
+        else:
+            order_state = Order.objects.filter(pk=instance.order_id).values_list('status', 'event_id').first()
+    instance._quota_counter_state = (state, order_state)
+
+
+@receiver(post_save, sender=OrderPosition, dispatch_uid="quotacounters_position_post_save")
+def position_post_save(sender, instance, **kwargs):
+    if not getattr(instance, '_quota_counter_state', None):
+        return
+    old_state, (order_status, event_id) = instance._quota_counter_state
+    instance._quota_counter_state = None
+
+    deltas = Counter()
+    old_key = _position_key(old_state)
+    new_key = _position_key({
+        'item_id': instance.item_id,
+        'variation_id': instance.variation_id,
+        'subevent_id': instance.subevent_id,
+        'canceled': instance.canceled,
+        'order__status': order_status,
+        'order__event_id': event_id,
+    })
+    if old_key:
+        deltas[old_key] -= 1
+    if new_key:
+        deltas[new_key] += 1
+    _apply_deltas(deltas)
+
+
+@receiver(pre_delete, sender=OrderPosition, dispatch_uid="quotacounters_position_pre_delete")
+def position_pre_delete(sender, instance, **kwargs):
+    if not counters_enabled():
+        return
+    with scopes_disabled():
+        key = _position_key(_fetch_position_state(instance.pk))
+    if key:
+        _apply_deltas({key: -1})
+
+
+def bulk_created_positions(positions):
+    """
+    Counts order positions that have been created with ``bulk_create()``, which does not send the
+    signals the counters are usually kept up to date by. The orders of the positions need to be
+    saved already.
+    """
+    if not counters_enabled():
+        return
+    deltas = Counter()
+    for p in positions:
+        key = _position_key({
+            'item_id': p.item_id,
+            'variation_id': p.variation_id,
+            'subevent_id': p.subevent_id,
+            'canceled': p.canceled,
+            'order__status': p.order.status,
+            'order__event_id': p.order.event_id,
+        })
+        if key:
+            deltas[key] += 1
+    _apply_deltas(deltas)
+
+
+def _waitinglist_key(state):
+    if not state or state['voucher_id'] is not None:
+        return None
+    return state['event_id'], state['subevent_id'], state['item_id'], state['variation_id'], QuotaCounter.KIND_WAITINGLIST
+
+
+def _fetch_waitinglist_state(pk):
+    return WaitingListEntry.objects.filter(pk=pk).values(
+        'event_id', 'item_id', 'variation_id', 'subevent_id', 'voucher_id'
+    ).first()
+
+
+@receiver(pre_save, sender=WaitingListEntry, dispatch_uid="quotacounters_waitinglist_pre_save")
+def waitinglist_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance._quota_counter_state = None
+    if not counters_enabled() or not _is_relevant_update(update_fields, WAITINGLIST_FIELDS):
+        return
+    with scopes_disabled():
+        instance._quota_counter_state = (_fetch_waitinglist_state(instance.pk) if instance.pk else None,)
+
+
+@receiver(post_save, sender=WaitingListEntry, dispatch_uid="quotacounters_waitinglist_post_save")
+def waitinglist_post_save(sender, instance, **kwargs):
+    if not getattr(instance, '_quota_counter_state', None):
+        return
+    old_state, = instance._quota_counter_state
+    instance._quota_counter_state = None
+
+    deltas = Counter()
+    old_key = _waitinglist_key(old_state)
+    new_key = _waitinglist_key({
+        'event_id': instance.event_id,
+        'item_id': instance.item_id,
+        'variation_id': instance.variation_id,
+        'subevent_id': instance.subevent_id,
+        'voucher_id': instance.voucher_id,
+    })
+    if old_key:
+        deltas[old_key] -= 1
+    if new_key:
+        deltas[new_key] += 1
+    _apply_deltas(deltas)
+
+
+@receiver(pre_delete, sender=WaitingListEntry, dispatch_uid="quotacounters_waitinglist_pre_delete")
+def waitinglist_pre_delete(sender, instance, **kwargs):
+    if not counters_enabled():
+        return
+    with scopes_disabled():
+        key = _waitinglist_key(_fetch_waitinglist_state(instance.pk))
+    if key:
+        _apply_deltas({key: -1})
+
+
+def get_counted_lines(quotas, item_ids, variation_ids, kinds):
+    """
+    Returns the counters relevant for the given quotas in the same format as the aggregate queries
+    in ``QuotaAvailability``, i.e. a list of dictionaries with the keys ``kind``, ``item_id``,
+    ``variation_id``, ``subevent_id`` and ``c``. Returns ``None`` if the counters of any of the
+    involved events have not been reconciled yet and can therefore not be used.
+    """
+    events = {q.event_id for q in quotas}
+    rows = QuotaCounter.objects.filter(event_id__in=events).filter(
+        Q(kind=QuotaCounter.KIND_RECONCILED) | Q(
+            Q(kind__in=kinds) &
+            Q(subevent_id__in={q.subevent_id or 0 for q in quotas}) &
+            Q(Q(variation_id=0, item_id__in=item_ids) | Q(variation_id__in=variation_ids))
+        )
+    ).values_list('event_id', 'subevent_id', 'item_id', 'variation_id', 'kind', 'count')
+
+    reconciled = set()
+    lines = []
+    for event_id, subevent_id, item_id, variation_id, kind, count in rows:
+        if kind == QuotaCounter.KIND_RECONCILED:
+            reconciled.add(event_id)
+        elif count:
+            lines.append({
+                'kind': kind,
+                'item_id': item_id,
+                'variation_id': variation_id or None,
+                'subevent_id': subevent_id or None,
+                'c': count,
+            })
+    if events - reconciled:
+        return None
+    return lines
+
+
+def _counter_key(line, kind):
+    return line['subevent_id'] or 0, line['item_id'], line['variation_id'] or 0, kind
+
+
+def _expected_counts(event):
+    expected = Counter()
+    for line in OrderPosition.objects.filter(
+        order__event=event, order__status__in=COUNTED_ORDER_STATUSES
+    ).order_by().values('order__status', 'item_id', 'variation_id', 'subevent_id').annotate(c=Count('*')):
+        expected[_counter_key(line, line['order__status'])] = line['c']
+    for line in WaitingListEntry.objects.filter(
+        event=event, voucher__isnull=True
+    ).order_by().values('item_id', 'variation_id', 'subevent_id').annotate(c=Count('*')):
+        expected[_counter_key(line, QuotaCounter.KIND_WAITINGLIST)] = line['c']
+    return expected
+
+
+def _reconcile(event):
+    """
+    Compares all counters of an event with the database and repairs the ones that differ, see
+    :py:func:`pretix.helpers.database.repair_aggregates`. Counters are repaired without locking the
+    event, since that would block checkouts for the duration of the aggregate queries.
+
+    Returns the number of counters that were repaired.
+    """
+    return repair_aggregates(
+        QuotaCounter, {'event': event}, {'kind': QuotaCounter.KIND_RECONCILED},
+        ('subevent_id', 'item_id', 'variation_id', 'kind'), ('count',),
+        lambda: {key: (count,) for key, count in _expected_counts(event).items()},
+    )
+
+
+@app.task
+@scopes_disabled()
+def reconcile_quota_counters(event: int):
+    """
+    Verifies all counters of an event against the database, repairs the ones that differ and marks
+    them as reliable.
+    """
+    try:
+        event = Event.objects.get(pk=event)
+    except Event.DoesNotExist:
+        return
+    repaired = _reconcile(event)
+    if repaired:
+        logger.warning('Repaired %d quota counters of event %s.', repaired, event.pk)
+
+
+@receiver(signal=periodic_task)
+@scopes_disabled()
+def reconcile_active_quota_counters(sender, **kwargs):
+    if not counters_enabled():
+        return
+
+    active = LogEntry.objects.using(settings.DATABASE_REPLICA).filter(
+        datetime__gt=now() - timedelta(hours=1), event__isnull=False,
+    ).order_by().values_list('event', flat=True).distinct()
+    for event_id in active:
+        reconcile_quota_counters.apply_async(args=(event_id,))
@@ -1,3 +1,4 @@
+import logging
 import sys
 from collections import Counter, defaultdict
 from datetime import timedelta
@@ -13,12 +14,18 @@ from django_scopes import scopes_disabled
 
 from pretix.base.models import (
     CartPosition, Checkin, Event, LogEntry, Order, OrderPosition, Quota,
-    Voucher, WaitingListEntry,
+    QuotaCounter, Voucher, WaitingListEntry,
+)
+from pretix.base.services.quotacounters import (
+    COUNTED_ORDER_STATUSES, counters_enabled, counters_verified,
+    get_counted_lines, reconcile_quota_counters,
 )
 from pretix.celery_app import app
 
 from ..signals import periodic_task, quota_availability
 
+logger = logging.getLogger(__name__)
+
 
 class QuotaAvailability:
     """
@@ -204,6 +211,35 @@ class QuotaAvailability:
                     raise ValueError("inconclusive quota")
 
     def _compute_orders(self, quotas, q_items, q_vars, size_left):
+        op_lookup = None
+        if counters_enabled() and not any(q.release_after_exit for q in quotas):
+            op_lookup = self._order_lines_from_counters(quotas, q_items, q_vars)
+        if op_lookup is None:
+            op_lookup = self._order_lines_from_db(quotas, q_items, q_vars)
+
+        for line in sorted(op_lookup, key=lambda li: (int(li['is_exited']), li['order__status']), reverse=True):  # p before n, exited before non-exited
+            if line['variation_id']:
+                qs = self._var_to_quotas[line['variation_id']]
+            else:
+                qs = self._item_to_quotas[line['item_id']]
+            for q in qs:
+                if q.subevent_id == line['subevent_id']:
+                    if q.release_after_exit and line['is_exited']:
+                        self.count_exited_orders[q] += line['c']
+                    else:
+                        size_left[q] -= line['c']
+                        if line['order__status'] == Order.STATUS_PAID:
+                            self.count_paid_orders[q] += line['c']
+                            q.cached_availability_paid_orders = self.count_paid_orders[q]
+                        elif line['order__status'] == Order.STATUS_PENDING:
+                            self.count_pending_orders[q] += line['c']
+                        if size_left[q] <= 0 and q not in self.results:
+                            if line['order__status'] == Order.STATUS_PAID:
+                                self.results[q] = Quota.AVAILABILITY_GONE, 0
+                            else:
+                                self.results[q] = Quota.AVAILABILITY_ORDERED, 0
+
+    def _order_lines_from_db(self, quotas, q_items, q_vars):
         events = {q.event_id for q in quotas}
         subevents = {q.subevent_id for q in quotas}
         seq = Q(subevent_id__in=subevents)
@@ -253,28 +289,39 @@ class QuotaAvailability:
             op_lookup = op_lookup.annotate(
                 is_exited=Value(0, output_field=models.IntegerField())
             )
-        op_lookup = op_lookup.values('order__status', 'item_id', 'subevent_id', 'variation_id', 'is_exited').annotate(c=Count('*'))
-        for line in sorted(op_lookup, key=lambda li: (int(li['is_exited']), li['order__status']), reverse=True):  # p before n, exited before non-exited
-            if line['variation_id']:
-                qs = self._var_to_quotas[line['variation_id']]
-            else:
-                qs = self._item_to_quotas[line['item_id']]
-            for q in qs:
-                if q.subevent_id == line['subevent_id']:
-                    if q.release_after_exit and line['is_exited']:
-                        self.count_exited_orders[q] += line['c']
-                    else:
-                        size_left[q] -= line['c']
-                        if line['order__status'] == Order.STATUS_PAID:
-                            self.count_paid_orders[q] += line['c']
-                            q.cached_availability_paid_orders = self.count_paid_orders[q]
-                        elif line['order__status'] == Order.STATUS_PENDING:
-                            self.count_pending_orders[q] += line['c']
-                        if size_left[q] <= 0 and q not in self.results:
-                            if line['order__status'] == Order.STATUS_PAID:
-                                self.results[q] = Quota.AVAILABILITY_GONE, 0
-                            else:
-                                self.results[q] = Quota.AVAILABILITY_ORDERED, 0
+        return list(op_lookup.values('order__status', 'item_id', 'subevent_id', 'variation_id', 'is_exited').annotate(c=Count('*')))
+
+    def _order_lines_from_counters(self, quotas, q_items, q_vars):
+        counted = self._counted_lines(quotas, q_items, q_vars, COUNTED_ORDER_STATUSES)
+        if counted is None:
+            return None
+        lines = [
+            {'order__status': li['kind'], 'item_id': li['item_id'], 'subevent_id': li['subevent_id'],
+             'variation_id': li['variation_id'], 'is_exited': 0, 'c': li['c']}
+            for li in counted
+        ]
+        if counters_verified() and not self._verify_lines(
+                quotas, lines, self._order_lines_from_db(quotas, q_items, q_vars),
+                ('order__status', 'item_id', 'subevent_id', 'variation_id', 'c')):
+            return None
+        return lines
+
+    def _counted_lines(self, quotas, q_items, q_vars, kinds):
+        return get_counted_lines(
+            quotas,
+            item_ids={i['item_id'] for i in q_items if self._quota_objects[i['quota_id']] in quotas},
+            variation_ids={i['itemvariation_id'] for i in q_vars if self._quota_objects[i['quota_id']] in quotas},
+            kinds=kinds,
+        )
+
+    def _verify_lines(self, quotas, counted_lines, db_lines, keys):
+        if Counter(tuple(li[k] for k in keys) for li in counted_lines) == Counter(tuple(li[k] for k in keys) for li in db_lines):
+            return True
+        events = sorted({q.event_id for q in quotas})
+        logger.error('Quota counters of events %s do not match the database.', ', '.join(str(e) for e in events))
+        for event_id in events:
+            reconcile_quota_counters.apply_async(args=(event_id,))
+        return False
 
     def _compute_vouchers(self, quotas, q_items, q_vars, size_left, now_dt):
         events = {q.event_id for q in quotas}
@@ -357,6 +404,25 @@ class QuotaAvailability:
                         self.results[q] = Quota.AVAILABILITY_RESERVED, 0
 
     def _compute_waitinglist(self, quotas, q_items, q_vars, size_left):
+        w_lookup = None
+        if counters_enabled():
+            w_lookup = self._waitinglist_lines_from_counters(quotas, q_items, q_vars)
+        if w_lookup is None:
+            w_lookup = self._waitinglist_lines_from_db(quotas, q_items, q_vars)
+
+        for line in w_lookup:
+            if line['variation_id']:
+                qs = self._var_to_quotas[line['variation_id']]
+            else:
+                qs = self._item_to_quotas[line['item_id']]
+            for q in qs:
+                if q.subevent_id == line['subevent_id']:
+                    size_left[q] -= line['c']
+                    self.count_waitinglist[q] += line['c']
+                    if q not in self.results and size_left[q] <= 0:
+                        self.results[q] = Quota.AVAILABILITY_ORDERED, 0
+
+    def _waitinglist_lines_from_db(self, quotas, q_items, q_vars):
         events = {q.event_id for q in quotas}
         subevents = {q.subevent_id for q in quotas}
         seq = Q(subevent_id__in=subevents)
@@ -374,17 +440,17 @@ class QuotaAvailability:
                                         self._quota_objects[i['quota_id']] in quotas})
             )
         ).order_by().values('item_id', 'subevent_id', 'variation_id').annotate(c=Count('*'))
-        for line in w_lookup:
-            if line['variation_id']:
-                qs = self._var_to_quotas[line['variation_id']]
-            else:
-                qs = self._item_to_quotas[line['item_id']]
-            for q in qs:
-                if q.subevent_id == line['subevent_id']:
-                    size_left[q] -= line['c']
-                    self.count_waitinglist[q] += line['c']
-                    if q not in self.results and size_left[q] <= 0:
-                        self.results[q] = Quota.AVAILABILITY_ORDERED, 0
+        return list(w_lookup)
+
+    def _waitinglist_lines_from_counters(self, quotas, q_items, q_vars):
+        lines = self._counted_lines(quotas, q_items, q_vars, (QuotaCounter.KIND_WAITINGLIST,))
+        if lines is None:
+            return None
+        if counters_verified() and not self._verify_lines(
+                quotas, lines, self._waitinglist_lines_from_db(quotas, q_items, q_vars),
+                ('item_id', 'subevent_id', 'variation_id', 'c')):
+            return None
+        return lines
 
     def _compute_early_outs(self, quotas):
         for q in quotas:
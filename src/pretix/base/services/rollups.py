@@ -0,0 +1,486 @@
+"""
+Pre-aggregated order statistics.
+
+The order overview, the reports built on top of it and the statistics plugin all need the number,
+revenue and tax of the order positions of an event grouped by product and order status. If
+``statistics_rollups`` is enabled in the configuration file, we keep
+:py:class:`pretix.base.models.StatisticsRollup` rows per subevent, order day, product, variation,
+order status and cancellation state up to date whenever an order or an order position changes, so
+these views can read a handful of rollup rows instead of aggregating over all order positions.
+For the orders by day shown by the statistics plugin, we additionally keep
+:py:class:`pretix.base.models.StatisticsOrderRollup` rows with the number of orders per order day
+and payment day.
+
+Rollups are updated in the same database transaction as the change they reflect. Changes that
+bypass model signals (e.g. ``QuerySet.update()`` or ``bulk_create()``) are not reflected, which is
+why the rollups of events with recent order activity are verified periodically. Only rollups that
+turn out to be wrong are written, without locking the event. They can also be rebuilt with the
+``rebuild_statistics_rollups`` management command. If the timezone of an event changes, the order
+days of all of its rollups change as well, so they are no longer used and rebuilt in the background.
+Rollups of an event are only used once they have been rebuilt at least once.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Count, DateTimeField, F, Max, OuterRef, Subquery, Sum,
+)
+from django.db.models.functions import TruncDate
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+from django.utils.timezone import now, override
+from django_scopes import scopes_disabled
+
+from pretix.base.models import (
+    Event, Event_SettingsStore, LogEntry, Order, OrderPayment, OrderPosition,
+    StatisticsOrderRollup, StatisticsRollup,
+)
+from pretix.base.signals import periodic_task
+from pretix.celery_app import app
+from pretix.helpers.database import repair_aggregates
+
+logger = logging.getLogger(__name__)
+
+ORDER_FIELDS = {'status', 'datetime'}
+PAYMENT_FIELDS = {'order', 'order_id', 'state', 'payment_date'}
+PAID_PAYMENT_STATES = (OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED)
+POSITION_FIELDS = {'order', 'order_id', 'item', 'item_id', 'variation', 'variation_id', 'subevent',
+                   'subevent_id', 'canceled', 'price', 'tax_value'}
+
+
+def rollups_enabled():
+    return settings.PRETIX_STATISTICS_ROLLUPS
+
+
+def _increment(model, key, **values):
+    update = {field: F(field) + value for field, value in values.items()}
+    if model.objects.filter(**key).update(**update):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **values)
+    except IntegrityError:
+        # Somebody else created the row in the meantime
+        model.objects.filter(**key).update(**update)
+
+
+def _apply_deltas(deltas):
+    for (event_id, subevent_id, day, item_id, variation_id, status, canceled), (count, price, tax_value) in deltas.items():
+        if not count and not price and not tax_value:
+            continue
+        _increment(StatisticsRollup, {
+            'event_id': event_id,
+            'subevent_id': subevent_id or 0,
+            'day': day,
+            'item_id': item_id,
+            'variation_id': variation_id or 0,
+            'status': status,
+            'canceled': canceled,
+        }, count=count, price=price, tax_value=tax_value)
+
+
+def _move_order(event_id, old_key, new_key):
+    if old_key == new_key:
+        return
+    if old_key:
+        _increment(StatisticsOrderRollup, {'event_id': event_id, 'day': old_key[0], 'paid_day': old_key[1]}, count=-1)
+    if new_key:
+        _increment(StatisticsOrderRollup, {'event_id': event_id, 'day': new_key[0], 'paid_day': new_key[1]}, count=1)
+
+
+def _add_delta(deltas, key, sign, count, price, tax_value):
+    current = deltas.get(key, (0, Decimal('0.00'), Decimal('0.00')))
+    deltas[key] = (
+        current[0] + sign * count,
+        current[1] + sign * (price or Decimal('0.00')),
+        current[2] + sign * (tax_value or Decimal('0.00')),
+    )
+
+
+def _is_relevant_update(update_fields, fields):
+    return update_fields is None or bool(set(update_fields) & fields)
+
+
+def _day(dt, tz):
+    return dt.astimezone(tz).date()
+
+
+def _paid_day(order_id, tz):
+    paid = OrderPayment.objects.filter(
+        order_id=order_id, state__in=PAID_PAYMENT_STATES, payment_date__isnull=False,
+    ).aggregate(m=Max('payment_date'))['m']
+    return _day(paid, tz) if paid else StatisticsRollup.NO_DAY
+
+
+def _fetch_order_state(pk):
+    return Order.objects.filter(pk=pk).values('status', 'datetime', 'event_id').first()
+
+
+def _fetch_position_state(pk):
+    return OrderPosition.all.filter(pk=pk).values(
+        'item_id', 'variation_id', 'subevent_id', 'canceled', 'price', 'tax_value', 'order_id',
+        'order__status', 'order__datetime', 'order__event_id',
+    ).first()
+
+
+def _position_key(state, tz):
+    return (
+        state['order__event_id'], state['subevent_id'], _day(state['order__datetime'], tz), state['item_id'],
+        state['variation_id'], state['order__status'], state['canceled']
+    )
+
+
+@receiver(pre_save, sender=Order, dispatch_uid="rollups_order_pre_save")
+def order_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance._rollup_state = None
+    if not rollups_enabled() or not instance.pk or not _is_relevant_update(update_fields, ORDER_FIELDS):
+        return
+    with scopes_disabled():
+        instance._rollup_state = _fetch_order_state(instance.pk)
+
+
+@receiver(post_save, sender=Order, dispatch_uid="rollups_order_post_save")
+def order_post_save(sender, instance, created=False, **kwargs):
+    old_state = getattr(instance, '_rollup_state', None)
+    instance._rollup_state = None
+    if created and rollups_enabled():
+        # New orders do not have any payments yet
+        _move_order(instance.event_id, None, (_day(instance.datetime, instance.event.timezone), StatisticsRollup.NO_DAY))
+    if old_state is None:
+        return
+    tz = instance.event.timezone
+    old_day = _day(old_state['datetime'], tz)
+    new_day = _day(instance.datetime, tz)
+    if old_state['status'] == instance.status and old_day == new_day:
+        return
+
+    deltas = {}
+    with scopes_disabled():
+        if old_day != new_day:
+            paid_day = _paid_day(instance.pk, tz)
+            _move_order(instance.event_id, (old_day, paid_day), (new_day, paid_day))
+        lines = OrderPosition.all.filter(order_id=instance.pk).order_by().values(
+            'item_id', 'variation_id', 'subevent_id', 'canceled'
+        ).annotate(c=Count('*'), p=Sum('price'), t=Sum('tax_value'))
+        for line in lines:
+            _add_delta(
+                deltas,
+                (instance.event_id, line['subevent_id'], old_day, line['item_id'], line['variation_id'],
+                 old_state['status'], line['canceled']),
+                -1, line['c'], line['p'], line['t']
+            )
+            _add_delta(
+                deltas,
+                (instance.event_id, line['subevent_id'], new_day, line['item_id'], line['variation_id'],
+                 instance.status, line['canceled']),
+                1, line['c'], line['p'], line['t']
+            )
+        _apply_deltas(deltas)
+
+
+@receiver(pre_delete, sender=Order, dispatch_uid="rollups_order_pre_delete")
+def order_pre_delete(sender, instance, **kwargs):
+    if not rollups_enabled():
+        return
+    tz = instance.event.timezone
+    with scopes_disabled():
+        _move_order(instance.event_id, (_day(instance.datetime, tz), _paid_day(instance.pk, tz)), None)
+
+
+@receiver(pre_save, sender=OrderPayment, dispatch_uid="rollups_payment_pre_save")
+@receiver(pre_delete, sender=OrderPayment, dispatch_uid="rollups_payment_pre_delete")
+def payment_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance._rollup_paid_day = None
+    if not rollups_enabled() or not _is_relevant_update(update_fields, PAYMENT_FIELDS):
+        return
+    with scopes_disabled():
+        instance._rollup_paid_day = _paid_day(instance.order_id, instance.order.event.timezone)
+
+
+@receiver(post_save, sender=OrderPayment, dispatch_uid="rollups_payment_post_save")
+@receiver(post_delete, sender=OrderPayment, dispatch_uid="rollups_payment_post_delete")
+def payment_post_save(sender, instance, **kwargs):
+    old_paid_day = getattr(instance, '_rollup_paid_day', None)
+    instance._rollup_paid_day = None
+    if old_paid_day is None:
+        return
+    order = instance.order
+    tz = order.event.timezone
+    with scopes_disabled():
+        new_paid_day = _paid_day(order.pk, tz)
+    day = _day(order.datetime, tz)
+    _move_order(order.event_id, (day, old_paid_day), (day, new_paid_day))
+
+
+@receiver(pre_save, sender=OrderPosition, dispatch_uid="rollups_position_pre_save")
+def position_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance._rollup_state = None
+    if not rollups_enabled() or not _is_relevant_update(update_fields, POSITION_FIELDS):
+        return
+    with scopes_disabled():
+        state = _fetch_position_state(instance.pk) if instance.pk else None
+        if state and state['order_id'] == instance.order_id:
+            order_state = {
+                'status': state['order__status'],
+                'datetime': state['order__datetime'],
+                'event_id': state['order__event_id'],
+            }
+        else:
+            order_state = _fetch_order_state(instance.order_id)
+    instance._rollup_state = (state, order_state)
+
+
+@receiver(post_save, sender=OrderPosition, dispatch_uid="rollups_position_post_save")
+def position_post_save(sender, instance, **kwargs):
+    if not getattr(instance, '_rollup_state', None):
+        return
+    old_state, order_state = instance._rollup_state
+    instance._rollup_state = None
+    tz = instance.order.event.timezone
+
+    deltas = {}
+    if old_state:
+        _add_delta(deltas, _position_key(old_state, tz), -1, 1, old_state['price'], old_state['tax_value'])
+    if order_state:
+        _add_delta(deltas, _position_key({
+            'item_id': instance.item_id,
+            'variation_id': instance.variation_id,
+            'subevent_id': instance.subevent_id,
+            'canceled': instance.canceled,
+            'order__status': order_state['status'],
+            'order__datetime': order_state['datetime'],
+            'order__event_id': order_state['event_id'],
+        }, tz), 1, 1, instance.price, instance.tax_value)
+    _apply_deltas(deltas)
+
+
+@receiver(pre_delete, sender=OrderPosition, dispatch_uid="rollups_position_pre_delete")
+def position_pre_delete(sender, instance, **kwargs):
+    if not rollups_enabled():
+        return
+    with scopes_disabled():
+        state = _fetch_position_state(instance.pk)
+    if state:
+        deltas = {}
+        _add_delta(deltas, _position_key(state, instance.order.event.timezone), -1, 1, state['price'], state['tax_value'])
+        _apply_deltas(deltas)
+
+
+def bulk_created_orders(orders, payments):
+    """
+    Adds orders and their payments that have been created with ``bulk_create()``, which does not
+    send the signals the rollups are usually kept up to date by.
+    """
+    if not rollups_enabled():
+        return
+    paid = {}
+    for p in payments:
+        if p.state in PAID_PAYMENT_STATES and p.payment_date:
+            paid[p.order_id] = max(p.payment_date, paid.get(p.order_id, p.payment_date))
+    for o in orders:
+        tz = o.event.timezone
+        _move_order(o.event_id, None, (_day(o.datetime, tz), _day(paid[o.pk], tz) if o.pk in paid else StatisticsRollup.NO_DAY))
+
+
+def bulk_created_positions(positions):
+    """
+    Adds order positions that have been created with ``bulk_create()``, which does not send the
+    signals the rollups are usually kept up to date by. The orders of the positions need to be
+    saved already.
+    """
+    if not rollups_enabled():
+        return
+    deltas = {}
+    for p in positions:
+        _add_delta(deltas, _position_key({
+            'item_id': p.item_id,
+            'variation_id': p.variation_id,
+            'subevent_id': p.subevent_id,
+            'canceled': p.canceled,
+            'order__status': p.order.status,
+            'order__datetime': p.order.datetime,
+            'order__event_id': p.order.event_id,
+        }, p.order.event.timezone), 1, 1, p.price, p.tax_value)
+    _apply_deltas(deltas)
+
+
+def _current_timezone_setting(event_id):
+    return Event_SettingsStore.objects.filter(object_id=event_id, key='timezone').values_list('value', flat=True).first()
+
+
+def _timezone_changed(event_id):
+    # The rollups are bucketed by the old order days. Until they are rebuilt, the statistics are
+    # computed from the order positions again.
+    StatisticsRollup.objects.filter(event_id=event_id, status=StatisticsRollup.STATUS_REBUILT).delete()
+    transaction.on_commit(lambda: rebuild_statistics_rollups.apply_async(args=(event_id,)))
+
+
+@receiver(pre_save, sender=Event_SettingsStore, dispatch_uid="rollups_settings_pre_save")
+def settings_pre_save(sender, instance, **kwargs):
+    if instance.key == 'timezone' and rollups_enabled():
+        instance._rollup_timezone = _current_timezone_setting(instance.object_id)
+
+
+@receiver(post_save, sender=Event_SettingsStore, dispatch_uid="rollups_settings_post_save")
+def settings_post_save(sender, instance, **kwargs):
+    if instance.key == 'timezone' and rollups_enabled() and getattr(instance, '_rollup_timezone', None) != instance.value:
+        _timezone_changed(instance.object_id)
+
+
+@receiver(post_delete, sender=Event_SettingsStore, dispatch_uid="rollups_settings_post_delete")
+def settings_post_delete(sender, instance, **kwargs):
+    if instance.key == 'timezone' and rollups_enabled():
+        _timezone_changed(instance.object_id)
+
+
+def get_rollup_lines(event, subevent=None, day_from=None, day_until=None, item_ids=None):
+    """
+    Returns the rollups of an event summed up by product, variation, order status and cancellation
+    state as a list of dictionaries with the keys ``item``, ``variation``, ``status``, ``canceled``,
+    ``cnt``, ``price`` and ``tax_value``. ``day_from`` and ``day_until`` are inclusive dates in the
+    timezone of the event. Returns ``None`` if rollups are disabled or the rollups of the event have
+    not been rebuilt yet and can therefore not be used.
+    """
+    if not rollups_enabled():
+        return None
+    qs = StatisticsRollup.objects.filter(event=event)
+    if not qs.filter(status=StatisticsRollup.STATUS_REBUILT).exists():
+        return None
+
+    qs = qs.exclude(status=StatisticsRollup.STATUS_REBUILT)
+    if subevent:
+        qs = qs.filter(subevent_id=subevent.pk)
+    if day_from:
+        qs = qs.filter(day__gte=day_from)
+    if day_until:
+        qs = qs.filter(day__lte=day_until)
+    if item_ids is not None:
+        qs = qs.filter(item_id__in=item_ids)
+
+    lines = qs.order_by().values('item_id', 'variation_id', 'status', 'canceled').annotate(
+        c=Sum('count'), p=Sum('price'), t=Sum('tax_value')
+    )
+    return [
+        {
+            'item': line['item_id'],
+            'variation': line['variation_id'] or None,
+            'status': line['status'],
+            'canceled': line['canceled'],
+            'cnt': line['c'],
+            'price': line['p'],
+            'tax_value': line['t'],
+        }
+        for line in lines if line['c']
+    ]
+
+
+def get_rollup_order_days(event):
+    """
+    Returns the number of orders of an event by the day they have been placed and by the day of
+    their latest confirmed or refunded payment, as two dictionaries mapping dates in the timezone
+    of the event to numbers of orders. Returns ``None`` if rollups are disabled or the rollups of
+    the event have not been rebuilt yet and can therefore not be used.
+    """
+    if not rollups_enabled():
+        return None
+    if not StatisticsRollup.objects.filter(event=event, status=StatisticsRollup.STATUS_REBUILT).exists():
+        return None
+
+    ordered_by_day = {}
+    paid_by_day = {}
+    for day, paid_day, count in StatisticsOrderRollup.objects.filter(event=event, count__gt=0).values_list(
+        'day', 'paid_day', 'count'
+    ):
+        ordered_by_day[day] = ordered_by_day.get(day, 0) + count
+        if paid_day != StatisticsRollup.NO_DAY:
+            paid_by_day[paid_day] = paid_by_day.get(paid_day, 0) + count
+    return ordered_by_day, paid_by_day
+
+
+def _expected_order_counts(event):
+    payment_date = OrderPayment.objects.filter(
+        order=OuterRef('pk'), state__in=PAID_PAYMENT_STATES, payment_date__isnull=False
+    ).order_by().values('order').annotate(m=Max('payment_date')).values('m')
+    # TruncDate converts to the current timezone, so the query needs to be evaluated within the override
+    with override(event.timezone):
+        lines = list(Order.objects.filter(event=event).annotate(
+            payment_date=Subquery(payment_date, output_field=DateTimeField())
+        ).order_by().values(
+            order_day=TruncDate('datetime'), paid_day=TruncDate('payment_date')
+        ).annotate(c=Count('*')))
+    return {
+        (line['order_day'], line['paid_day'] or StatisticsRollup.NO_DAY): (line['c'],)
+        for line in lines
+    }
+
+
+def _expected_sums(event):
+    # TruncDate converts to the current timezone, so the query needs to be evaluated within the override
+    with override(event.timezone):
+        lines = list(OrderPosition.all.filter(order__event=event).order_by().values(
+            'order__status', 'subevent_id', 'item_id', 'variation_id', 'canceled', order_day=TruncDate('order__datetime'),
+        ).annotate(c=Count('*'), p=Sum('price'), t=Sum('tax_value')))
+    return {
+        (line['subevent_id'] or 0, line['order_day'], line['item_id'], line['variation_id'] or 0,
+         line['order__status'], line['canceled']): (line['c'], line['p'], line['t'])
+        for line in lines
+    }
+
+
+def _rebuild(event):
+    """
+    Compares all rollups of an event with the orders and order positions and repairs the ones that
+    differ, see :py:func:`pretix.helpers.database.repair_aggregates`. Rollups without any matching
+    orders or positions are removed.
+
+    Returns the number of rollups that were repaired.
+    """
+    repaired = repair_aggregates(
+        StatisticsOrderRollup, {'event': event}, None, ('day', 'paid_day'), ('count',),
+        lambda: _expected_order_counts(event),
+    )
+    # The marker is only created once both kinds of rollups have been rebuilt
+    return repaired + repair_aggregates(
+        StatisticsRollup, {'event': event}, {'status': StatisticsRollup.STATUS_REBUILT},
+        ('subevent_id', 'day', 'item_id', 'variation_id', 'status', 'canceled'), ('count', 'price', 'tax_value'),
+        lambda: _expected_sums(event),
+    )
+
+
+def rebuild_rollups(event):
+    """
+    Verifies all rollups of an event against the order positions, repairs the ones that differ and
+    marks them as reliable. Returns the number of rollups that were repaired.
+    """
+    return _rebuild(event)
+
+
+@app.task
+@scopes_disabled()
+def rebuild_statistics_rollups(event: int):
+    try:
+        event = Event.objects.get(pk=event)
+    except Event.DoesNotExist:
+        return
+    repaired = rebuild_rollups(event)
+    if repaired:
+        logger.warning('Repaired %d statistics rollups of event %s.', repaired, event.pk)
+
+
+@receiver(signal=periodic_task)
+@scopes_disabled()
+def rebuild_active_statistics_rollups(sender, **kwargs):
+    if not rollups_enabled():
+        return
+
+    # Rollups only depend on orders, so only events with recent order activity need to be verified
+    active = LogEntry.objects.using(settings.DATABASE_REPLICA).filter(
+        datetime__gt=now() - timedelta(hours=1), event__isnull=False, action_type__startswith='pretix.event.order.',
+    ).order_by().values_list('event', flat=True).distinct()
+    for event_id in active:
+        rebuild_statistics_rollups.apply_async(args=(event_id,))
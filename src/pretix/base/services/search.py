@@ -0,0 +1,191 @@
+"""
+Search index for orders and attendees.
+
+Searching for orders in the backend or through the API used to match the query against a dozen
+columns spread over orders, order positions, invoice addresses and vouchers with ``LIKE '%…%'``
+lookups, which requires a scan over all of these tables on every search. If ``search_index`` is
+enabled in the configuration file, we keep one :py:class:`pretix.base.models.OrderSearchDocument`
+per order and per order position with a lowercased copy of all searchable values instead, so a
+search only needs to look at a single table. On PostgreSQL, the documents are covered by trigram
+indexes that make these substring searches fast even for very large events.
+
+Documents are rebuilt after the transaction that changed the order has been committed. Changes that
+bypass model signals (e.g. ``QuerySet.update()``) are picked up by the periodic tasks for all orders
+that have been modified since the previous run. After enabling the index, the documents of existing orders need
+to be created with the ``rebuild_search_index`` management command.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix.base.models import (
+    InvoiceAddress, Order, OrderPosition, OrderSearchDocument,
+)
+from pretix.base.signals import periodic_task
+
+REINDEX_CHUNK_SIZE = 500
+# Orders are saved a moment before their transaction is committed, so the periodic task looks back a little
+# further than its previous run
+REINDEX_OVERLAP = timedelta(minutes=1)
+
+
+def search_index_enabled():
+    return settings.PRETIX_SEARCH_INDEX
+
+
+def _document(order, position=None):
+    values = [order.email]
+    prefixes = []
+    try:
+        ia = order.invoice_address
+    except InvoiceAddress.DoesNotExist:
+        ia = None
+    if ia:
+        values += [ia.name_cached, ia.company]
+    if position is None:
+        values.append(order.comment)
+    else:
+        values += [position.attendee_name_cached, position.attendee_email]
+        prefixes += [position.secret, order.code]
+        if position.voucher_id:
+            values.append(position.voucher.code)
+            prefixes.append(position.voucher.code)
+    return OrderSearchDocument(
+        order=order,
+        position=position,
+        text='\n'.join(v.lower() for v in values if v),
+        prefixes=''.join('\n' + v.lower() for v in prefixes if v),
+    )
+
+
+@scopes_disabled()
+def reindex_orders(order_ids):
+    """
+    Replaces the search documents of the given orders with up-to-date ones.
+    """
+    order_ids = list(order_ids)
+    for i in range(0, len(order_ids), REINDEX_CHUNK_SIZE):
+        chunk = order_ids[i:i + REINDEX_CHUNK_SIZE]
+        orders = {
+            o.pk: o for o in Order.objects.filter(pk__in=chunk).select_related('invoice_address')
+        }
+        documents = [_document(o) for o in orders.values()]
+        for p in OrderPosition.all.filter(order_id__in=orders.keys()).select_related('voucher'):
+            documents.append(_document(orders[p.order_id], p))
+        with transaction.atomic():
+            OrderSearchDocument.objects.filter(order_id__in=chunk).delete()
+            OrderSearchDocument.objects.bulk_create(documents, batch_size=REINDEX_CHUNK_SIZE)
+
+
+def reindex_event(event):
+    reindex_orders(Order.objects.filter(event=event).order_by('pk').values_list('pk', flat=True))
+
+
+class _PendingReindex:
+    def __init__(self):
+        self.order_ids = set()
+
+    def __call__(self):
+        reindex_orders(self.order_ids)
+
+
+def schedule_reindex(order_id):
+    """
+    Makes sure the search documents of an order are rebuilt once the current transaction has been
+    committed. An order that is changed multiple times within the same transaction is only reindexed
+    once.
+    """
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        savepoint_ids = set(connection.savepoint_ids)
+        for sids, func in connection.run_on_commit:
+            # Only reuse a callback registered at the same savepoint level, so it is discarded together
+            # with the changes if this savepoint is rolled back.
+            if isinstance(func, _PendingReindex) and sids == savepoint_ids:
+                func.order_ids.add(order_id)
+                return
+    pending = _PendingReindex()
+    pending.order_ids.add(order_id)
+    transaction.on_commit(pending)
+
+
+@receiver(post_save, sender=Order, dispatch_uid="search_order_post_save")
+def order_post_save(sender, instance, **kwargs):
+    if search_index_enabled():
+        schedule_reindex(instance.pk)
+
+
+@receiver(post_save, sender=OrderPosition, dispatch_uid="search_position_post_save")
+def position_post_save(sender, instance, **kwargs):
+    if search_index_enabled():
+        schedule_reindex(instance.order_id)
+
+
+@receiver(post_save, sender=InvoiceAddress, dispatch_uid="search_invoiceaddress_post_save")
+def invoiceaddress_post_save(sender, instance, **kwargs):
+    if search_index_enabled() and instance.order_id:
+        schedule_reindex(instance.order_id)
+
+
+def _matching_documents(query):
+    query = query.lower()
+    return OrderSearchDocument.objects.filter(
+        Q(text__contains=query) | Q(prefixes__contains='\n' + query)
+    )
+
+
+def search_orders_q(query):
+    """
+    Returns a ``Q`` object for a queryset of orders that matches all orders with contact data, invoice
+    address, comment or non-canceled positions matching the query. Returns ``None`` if the search
+    index is disabled.
+    """
+    if not search_index_enabled():
+        return None
+    documents = _matching_documents(query).filter(
+        Q(position__isnull=True) | Q(position__canceled=False)
+    )
+    return Q(pk__in=documents.values('order_id'))
+
+
+def search_positions_q(query, include_addon_to=False):
+    """
+    Returns a ``Q`` object for a queryset of order positions that matches all positions whose own data
+    or whose order's contact data or invoice address match the query. If ``include_addon_to`` is set,
+    add-on positions also match if their parent position matches. Returns ``None`` if the search index
+    is disabled.
+    """
+    if not search_index_enabled():
+        return None
+    q = Q(pk__in=_matching_documents(query).filter(position__isnull=False).values('position_id'))
+    if include_addon_to:
+        # Only the attendee data of the parent position is relevant for add-ons, not its secret
+        q |= Q(addon_to_id__in=OrderSearchDocument.objects.filter(
+            position__isnull=False, text__contains=query.lower()
+        ).values('position_id'))
+    return q
+
+
+@receiver(signal=periodic_task)
+@scopes_disabled()
+def reindex_modified_orders(sender, **kwargs):
+    if not search_index_enabled():
+        return
+
+    # If the time of the previous run is not known, e.g. because no persistent cache is configured, we fall back
+    # to all orders modified within the last hour
+    until = now()
+    since = cache.get('pretix_search_index_reindexed_until') or until - timedelta(hours=1)
+    reindex_orders(
+        Order.objects.using(settings.DATABASE_REPLICA).filter(
+            last_modified__gt=since - REINDEX_OVERLAP, last_modified__lte=until,
+        ).order_by('pk').values_list('pk', flat=True)
+    )
+    cache.set('pretix_search_index_reindexed_until', until, timeout=3600)
@@ -1,6 +1,6 @@
 from datetime import date, datetime, time, timedelta
 from decimal import Decimal
-from typing import Any, Dict, Iterable, List, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from django.db.models import (
     Case, Count, DateTimeField, F, Max, OuterRef, Subquery, Sum, Value, When,
@@ -11,6 +11,7 @@ from django.utils.translation import gettext_lazy as _
 from pretix.base.models import Event, Item, ItemCategory, Order, OrderPosition
 from pretix.base.models.event import SubEvent
 from pretix.base.models.orders import OrderFee, OrderPayment
+from pretix.base.services.rollups import get_rollup_lines
 from pretix.base.signals import order_fee_type_name
 
 
@@ -75,6 +76,24 @@ def dictsum(*dicts) -> dict:
     return res
 
 
+def _rollup_counters(event, subevent, day_from, day_until, item_ids) -> Optional[List[dict]]:
+    lines = get_rollup_lines(event, subevent=subevent, day_from=day_from, day_until=day_until, item_ids=item_ids)
+    if lines is None:
+        return None
+
+    counters = {}
+    for line in lines:
+        status = Order.STATUS_CANCELED if line['canceled'] else line['status']
+        c = counters.setdefault((line['item'], line['variation'], status), {
+            'item': line['item'], 'variation': line['variation'], 'status': status,
+            'cnt': 0, 'price': Decimal('0.00'), 'tax_value': Decimal('0.00'),
+        })
+        c['cnt'] += line['cnt']
+        c['price'] += line['price']
+        c['tax_value'] += line['tax_value']
+    return list(counters.values())
+
+
 def order_overview(
         event: Event, subevent: SubEvent=None, date_filter='', date_from=None, date_until=None, fees=False,
         admission_only=False
@@ -92,6 +111,17 @@ def order_overview(
         qs = qs.filter(item__admission=True)
         items = items.filter(admission=True)
 
+    counters = None
+    if not date_filter or (date_filter == 'order_date' and not isinstance(date_from, datetime)
+                           and not isinstance(date_until, datetime)):
+        # Order dates are stored by day in the rollups, so we can only use them to filter by whole days
+        counters = _rollup_counters(
+            event, subevent,
+            day_from=date_from if date_filter else None,
+            day_until=date_until if date_filter else None,
+            item_ids=items.values_list('pk', flat=True) if admission_only else None,
+        )
+
     if date_from and isinstance(date_from, date):
         date_from = make_aware(datetime.combine(
             date_from,
@@ -123,16 +153,17 @@ def order_overview(
         if date_until:
             qs = qs.filter(payment_date__lt=date_until)
 
-    counters = qs.filter(
-        order__event=event
-    ).annotate(
-        status=Case(
-            When(canceled=True, then=Value('c')),
-            default=F('order__status')
-        )
-    ).values(
-        'item', 'variation', 'status'
-    ).annotate(cnt=Count('id'), price=Sum('price'), tax_value=Sum('tax_value')).order_by()
+    if counters is None:
+        counters = qs.filter(
+            order__event=event
+        ).annotate(
+            status=Case(
+                When(canceled=True, then=Value('c')),
+                default=F('order__status')
+            )
+        ).values(
+            'item', 'variation', 'status'
+        ).annotate(cnt=Count('id'), price=Sum('price'), tax_value=Sum('tax_value')).order_by()
 
     states = {
         'canceled': Order.STATUS_CANCELED,
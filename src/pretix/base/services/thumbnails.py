@@ -0,0 +1,43 @@
+"""
+Pre-generation of thumbnails.
+
+The presale templates show product pictures, logos and favicons through the ``thumb`` template filter,
+which creates missing thumbnails while rendering the page. Whenever one of these images is uploaded in
+the backend, we create the thumbnails in all sizes the templates use in the background instead, so the
+first customers visiting the shop do not have to wait for them.
+"""
+import logging
+
+from pretix.base.services.tasks import TransactionAwareTask
+from pretix.celery_app import app
+from pretix.helpers.thumb import get_thumbnail
+
+logger = logging.getLogger(__name__)
+
+ITEM_PICTURE_SIZES = ('60x60^',)
+SETTINGS_THUMBNAIL_SIZES = {
+    'logo_image': ('1170x5000', '5000x120'),
+    'organizer_logo_image': ('1170x5000', '5000x120'),
+    'favicon': ('16x16^', '32x32^', '194x194^'),
+}
+
+
+@app.task(base=TransactionAwareTask)
+def pregenerate_thumbnails(source: str, sizes: list):
+    for size in sizes:
+        try:
+            get_thumbnail(source, size)
+        except:
+            logger.exception('Failed to create thumbnail')
+
+
+def pregenerate_settings_thumbnails(obj, keys):
+    """
+    Schedules the creation of thumbnails for all images among the given settings keys of an event
+    or organizer.
+    """
+    for k in keys:
+        if k in SETTINGS_THUMBNAIL_SIZES:
+            fname = obj.settings.get(k, as_type=str, default='')
+            if fname and fname.startswith('file://'):
+                pregenerate_thumbnails.apply_async(args=(fname[7:], SETTINGS_THUMBNAIL_SIZES[k]))
@@ -1,7 +1,9 @@
 import logging
 import os
 
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.dispatch import receiver
 from django.utils.timezone import now
 from django.utils.translation import gettext as _
 from django_scopes import scopes_disabled
@@ -11,52 +13,70 @@ from pretix.base.models import (
     CachedCombinedTicket, CachedTicket, Event, InvoiceAddress, Order,
     OrderPosition,
 )
-from pretix.base.services.tasks import EventTask, ProfiledTask
+from pretix.base.services.tasks import (
+    EventTask, ProfiledEventTask, ProfiledTask,
+    TransactionAwareProfiledEventTask,
+)
 from pretix.base.settings import PERSON_NAME_SCHEMES
-from pretix.base.signals import allow_ticket_download, register_ticket_outputs
+from pretix.base.signals import (
+    allow_ticket_download, order_paid, register_ticket_outputs,
+)
 from pretix.celery_app import app
 from pretix.helpers.database import rolledback_transaction
 
 logger = logging.getLogger(__name__)
+PRERENDER_BATCH_SIZE = 50
+
+
+def _get_provider(event: Event, provider: str):
+    responses = register_ticket_outputs.send(event)
+    for recv, response in responses:
+        prov = response(event)
+        if prov.identifier == provider:
+            return prov
+
+
+def _generate_orderposition(order_position: OrderPosition, prov):
+    filename, ttype, data = prov.generate(order_position)
+    path, ext = os.path.splitext(filename)
+    for ct in CachedTicket.objects.filter(order_position=order_position, provider=prov.identifier):
+        ct.delete()
+    ct = CachedTicket.objects.create(order_position=order_position, provider=prov.identifier,
+                                     extension=ext, type=ttype, file=None)
+    ct.file.save(filename, ContentFile(data))
+    return ct.pk
+
+
+def _generate_order(order: Order, prov):
+    filename, ttype, data = prov.generate_order(order)
+    if ttype == 'text/uri-list':
+        return
+
+    path, ext = os.path.splitext(filename)
+    for ct in CachedCombinedTicket.objects.filter(order=order, provider=prov.identifier):
+        ct.delete()
+    ct = CachedCombinedTicket.objects.create(order=order, provider=prov.identifier, extension=ext,
+                                             type=ttype, file=None)
+    ct.file.save(filename, ContentFile(data))
+    return ct.pk
 
 
 def generate_orderposition(order_position: int, provider: str):
     order_position = OrderPosition.objects.select_related('order', 'order__event').get(id=order_position)
 
     with language(order_position.order.locale):
-        responses = register_ticket_outputs.send(order_position.order.event)
-        for receiver, response in responses:
-            prov = response(order_position.order.event)
-            if prov.identifier == provider:
-                filename, ttype, data = prov.generate(order_position)
-                path, ext = os.path.splitext(filename)
-                for ct in CachedTicket.objects.filter(order_position=order_position, provider=provider):
-                    ct.delete()
-                ct = CachedTicket.objects.create(order_position=order_position, provider=provider,
-                                                 extension=ext, type=ttype, file=None)
-                ct.file.save(filename, ContentFile(data))
-                return ct.pk
+        prov = _get_provider(order_position.order.event, provider)
+        if prov:
+            return _generate_orderposition(order_position, prov)
 
 
 def generate_order(order: int, provider: str):
     order = Order.objects.select_related('event').get(id=order)
 
     with language(order.locale):
-        responses = register_ticket_outputs.send(order.event)
-        for receiver, response in responses:
-            prov = response(order.event)
-            if prov.identifier == provider:
-                filename, ttype, data = prov.generate_order(order)
-                if ttype == 'text/uri-list':
-                    continue
-
-                path, ext = os.path.splitext(filename)
-                for ct in CachedCombinedTicket.objects.filter(order=order, provider=provider):
-                    ct.delete()
-                ct = CachedCombinedTicket.objects.create(order=order, provider=provider, extension=ext,
-                                                         type=ttype, file=None)
-                ct.file.save(filename, ContentFile(data))
-                return ct.pk
+        prov = _get_provider(order.event, provider)
+        if prov:
+            return _generate_order(order, prov)
 
 
 @app.task(base=ProfiledTask)
@@ -68,6 +88,76 @@ def generate(model: str, pk: int, provider: str):
             return generate_orderposition(pk, provider)
 
 
+@app.task(base=ProfiledEventTask, acks_late=True)
+def generate_batch(event: Event, provider: str, positions: list=None, orders: list=None):
+    """
+    Generates the tickets of many order positions and the combined tickets of many orders
+    with one instance of the output provider, so any state the provider keeps, like parsed
+    layouts and backgrounds, is shared between them.
+    """
+    prov = _get_provider(event, provider)
+    if not prov:
+        return
+
+    for op in OrderPosition.objects.filter(order__event=event, pk__in=positions or []).select_related('order'):
+        try:
+            with language(op.order.locale):
+                _generate_orderposition(op, prov)
+        except:
+            logger.exception('Failed to generate ticket.')
+
+    for order in event.orders.filter(pk__in=orders or []):
+        try:
+            with language(order.locale):
+                _generate_order(order, prov)
+        except:
+            logger.exception('Failed to generate ticket.')
+
+
+@app.task(base=TransactionAwareProfiledEventTask, acks_late=True)
+def prerender(event: Event, orders: list):
+    """
+    Generates all tickets of the given orders that are not cached yet, e.g. right after the orders
+    have been paid, so customers do not need to wait for them on their first download. The work is
+    split up in batches that can run on different workers in parallel.
+    """
+    orders = [
+        o for o in event.orders.filter(pk__in=orders).prefetch_related('positions')
+        if o.ticket_download_available and all(r for rr, r in allow_ticket_download.send(event, order=o))
+    ]
+    if not orders:
+        return
+
+    for prov in [response(event) for recv, response in register_ticket_outputs.send(event)]:
+        if not prov.is_enabled:
+            continue
+
+        cached = set(CachedTicket.objects.filter(
+            order_position__order__in=orders, provider=prov.identifier, file__isnull=False
+        ).values_list('order_position_id', flat=True))
+        positions = [p.pk for o in orders for p in o.positions_with_tickets if p.pk not in cached]
+        for i in range(0, len(positions), PRERENDER_BATCH_SIZE):
+            generate_batch.apply_async(args=(event.pk, prov.identifier), kwargs={
+                'positions': positions[i:i + PRERENDER_BATCH_SIZE]
+            })
+
+        if prov.multi_download_enabled:
+            cached = set(CachedCombinedTicket.objects.filter(
+                order__in=orders, provider=prov.identifier, file__isnull=False
+            ).values_list('order_id', flat=True))
+            combined = [o.pk for o in orders if o.pk not in cached and any(o.positions_with_tickets)]
+            for i in range(0, len(combined), PRERENDER_BATCH_SIZE):
+                generate_batch.apply_async(args=(event.pk, prov.identifier), kwargs={
+                    'orders': combined[i:i + PRERENDER_BATCH_SIZE]
+                })
+
+
+@receiver(order_paid, dispatch_uid="pretixbase_order_paid_prerender_tickets")
+def prerender_paid_order(sender: Event, order: Order, **kwargs):
+    if settings.PRETIX_TICKET_PRERENDER and settings.HAS_CELERY:
+        prerender.apply_async(args=(sender.pk, [order.pk]))
+
+
 class DummyRollbackException(Exception):
     pass
 
@@ -96,7 +186,7 @@ def preview(event: int, provider: str):
         InvoiceAddress.objects.create(order=order, name_parts=sample, company=_("Sample company"))
 
         responses = register_ticket_outputs.send(event)
-        for receiver, response in responses:
+        for recv, response in responses:
             prov = response(event)
             if prov.identifier == provider:
                 return prov.generate(p)
@@ -111,7 +201,7 @@ def get_tickets_for_order(order, base_position=None):
 
     providers = [
         response(order.event)
-        for receiver, response
+        for recv, response
         in register_ticket_outputs.send(order.event)
     ]
 
@@ -1,10 +1,11 @@
 import warnings
+import weakref
 from typing import Any, Callable, List, Tuple
 
 import django.dispatch
 from django.apps import apps
 from django.conf import settings
-from django.dispatch.dispatcher import NO_RECEIVERS
+from django.dispatch.dispatcher import NO_RECEIVERS, NONE_ID
 
 from .models import Event
 
@@ -18,13 +19,42 @@ def _populate_app_cache():
         app_cache[ac.name] = ac
 
 
+def _weak_ref(receiver):
+    if hasattr(receiver, '__self__') and hasattr(receiver, '__func__'):
+        return weakref.WeakMethod(receiver)
+    try:
+        return weakref.ref(receiver)
+    except TypeError:
+        # Objects that can't be weakly referenced can only have been connected with weak=False,
+        # so the signal keeps them alive anyway.
+        return lambda: receiver
+
+
 class EventPluginSignal(django.dispatch.Signal):
     """
     This is an extension to Django's built-in signals which differs in a way that it sends
     out it's events only to receivers which belong to plugins that are enabled for the given
     Event.
+
+    The ordered list of receivers to call only depends on the set of plugins enabled for the
+    event, so it is computed once per set of plugins and kept until a receiver is connected,
+    disconnected or garbage collected. The cached plans only hold weak references, so they do not
+    keep receivers connected with ``weak=True`` alive.
     """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._plans = {}
+
+    def connect(self, *args, **kwargs):
+        super().connect(*args, **kwargs)
+        self._plans.clear()
+
+    def disconnect(self, *args, **kwargs):
+        disconnected = super().disconnect(*args, **kwargs)
+        self._plans.clear()
+        return disconnected
+
     def _is_active(self, sender, receiver):
         if sender is None:
             # Send to all events!
@@ -65,10 +95,9 @@ class EventPluginSignal(django.dispatch.Signal):
         if not app_cache:
             _populate_app_cache()
 
-        for receiver in self._sorted_receivers(sender):
-            if self._is_active(sender, receiver):
-                response = receiver(signal=self, sender=sender, **named)
-                responses.append((receiver, response))
+        for receiver in self._active_receivers(sender):
+            response = receiver(signal=self, sender=sender, **named)
+            responses.append((receiver, response))
         return responses
 
     def send_chained(self, sender: Event, chain_kwarg_name, **named) -> List[Tuple[Callable, Any]]:
@@ -89,10 +118,9 @@ class EventPluginSignal(django.dispatch.Signal):
         if not app_cache:
             _populate_app_cache()
 
-        for receiver in self._sorted_receivers(sender):
-            if self._is_active(sender, receiver):
-                named[chain_kwarg_name] = response
-                response = receiver(signal=self, sender=sender, **named)
+        for receiver in self._active_receivers(sender):
+            named[chain_kwarg_name] = response
+            response = receiver(signal=self, sender=sender, **named)
         return response
 
     def send_robust(self, sender: Event, **named) -> List[Tuple[Callable, Any]]:
@@ -116,16 +144,32 @@ class EventPluginSignal(django.dispatch.Signal):
         if not app_cache:
             _populate_app_cache()
 
-        for receiver in self._sorted_receivers(sender):
-            if self._is_active(sender, receiver):
-                try:
-                    response = receiver(signal=self, sender=sender, **named)
-                except Exception as err:
-                    responses.append((receiver, err))
-                else:
-                    responses.append((receiver, response))
+        for receiver in self._active_receivers(sender):
+            try:
+                response = receiver(signal=self, sender=sender, **named)
+            except Exception as err:
+                responses.append((receiver, err))
+            else:
+                responses.append((receiver, response))
         return responses
 
+    def _active_receivers(self, sender):
+        if self._dead_receivers:
+            self._plans.clear()
+        if any(senderkey != NONE_ID for (receiverkey, senderkey), receiver in self.receivers):
+            # Receivers connected for a specific sender can't be shared between events
+            return [r for r in self._sorted_receivers(sender) if self._is_active(sender, r)]
+
+        key = None if sender is None else frozenset(sender.get_plugins())
+        plan = self._plans.get(key)
+        if plan is not None:
+            receivers = [ref() for ref in plan]
+            if all(r is not None for r in receivers):
+                return receivers
+        receivers = [r for r in self._sorted_receivers(sender) if self._is_active(sender, r)]
+        self._plans[key] = [_weak_ref(r) for r in receivers]
+        return receivers
+
     def _sorted_receivers(self, sender):
         orig_list = self._live_receivers(sender)
         sorted_list = sorted(
@@ -16,6 +16,9 @@ from pretix.base.models import (
     OrderPayment, OrderPosition, OrderRefund, Organizer, Question,
     QuestionAnswer, SubEvent,
 )
+from pretix.base.services.search import (
+    search_orders_q, search_positions_q,
+)
 from pretix.base.signals import register_payment_providers
 from pretix.control.forms.widgets import Select2
 from pretix.control.signals import order_search_filter_q
@@ -140,27 +143,30 @@ class OrderFilterForm(FilterForm):
                 | Q(full_invoice_no__iexact=u)
             ).values_list('order_id', flat=True)
 
-            matching_positions = OrderPosition.objects.filter(
-                Q(order=OuterRef('pk')) & Q(
-                    Q(attendee_name_cached__icontains=u) | Q(attendee_email__icontains=u)
-                    | Q(secret__istartswith=u) | Q(voucher__code__icontains=u)
+            search_q = search_orders_q(u)
+            if search_q is not None:
+                mainq = code | Q(pk__in=matching_invoices) | search_q
+            else:
+                matching_positions = OrderPosition.objects.filter(
+                    Q(order=OuterRef('pk')) & Q(
+                        Q(attendee_name_cached__icontains=u) | Q(attendee_email__icontains=u)
+                        | Q(secret__istartswith=u) | Q(voucher__code__icontains=u)
+                    )
+                ).values('id')
+                qs = qs.annotate(has_pos=Exists(matching_positions))
+
+                mainq = (
+                    code
+                    | Q(email__icontains=u)
+                    | Q(invoice_address__name_cached__icontains=u)
+                    | Q(invoice_address__company__icontains=u)
+                    | Q(pk__in=matching_invoices)
+                    | Q(comment__icontains=u)
+                    | Q(has_pos=True)
                 )
-            ).values('id')
-
-            mainq = (
-                code
-                | Q(email__icontains=u)
-                | Q(invoice_address__name_cached__icontains=u)
-                | Q(invoice_address__company__icontains=u)
-                | Q(pk__in=matching_invoices)
-                | Q(comment__icontains=u)
-                | Q(has_pos=True)
-            )
             for recv, q in order_search_filter_q.send(sender=getattr(self, 'event', None), query=u):
                 mainq = mainq | q
-            qs = qs.annotate(has_pos=Exists(matching_positions)).filter(
-                mainq
-            )
+            qs = qs.filter(mainq)
 
         if fdata.get('status'):
             s = fdata.get('status')
@@ -862,16 +868,20 @@ class CheckInFilterForm(FilterForm):
 
         if fdata.get('user'):
             u = fdata.get('user')
-            qs = qs.filter(
-                Q(order__code__istartswith=u)
-                | Q(secret__istartswith=u)
-                | Q(order__email__icontains=u)
-                | Q(attendee_name_cached__icontains=u)
-                | Q(attendee_email__icontains=u)
-                | Q(voucher__code__istartswith=u)
-                | Q(order__invoice_address__name_cached__icontains=u)
-                | Q(order__invoice_address__company__icontains=u)
-            )
+            search_q = search_positions_q(u)
+            if search_q is not None:
+                qs = qs.filter(search_q)
+            else:
+                qs = qs.filter(
+                    Q(order__code__istartswith=u)
+                    | Q(secret__istartswith=u)
+                    | Q(order__email__icontains=u)
+                    | Q(attendee_name_cached__icontains=u)
+                    | Q(attendee_email__icontains=u)
+                    | Q(voucher__code__istartswith=u)
+                    | Q(order__invoice_address__name_cached__icontains=u)
+                    | Q(order__invoice_address__company__icontains=u)
+                )
 
         if fdata.get('status'):
             s = fdata.get('status')
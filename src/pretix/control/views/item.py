@@ -32,6 +32,9 @@ from pretix.base.models import (
 from pretix.base.models.event import SubEvent
 from pretix.base.models.items import ItemAddOn, ItemBundle, ItemMetaValue
 from pretix.base.services.quotas import QuotaAvailability
+from pretix.base.services.thumbnails import (
+    ITEM_PICTURE_SIZES, pregenerate_thumbnails,
+)
 from pretix.base.services.tickets import invalidate_cache
 from pretix.base.signals import quota_availability
 from pretix.control.forms.item import (
@@ -1219,6 +1222,8 @@ class ItemUpdateGeneral(ItemDetailMixin, EventPermissionRequiredMixin, MetaDataE
                 'pretix.event.item.changed', user=self.request.user, data=data
             )
             invalidate_cache.apply_async(kwargs={'event': self.request.event.pk, 'item': self.object.pk})
+            if 'picture' in form.changed_data and self.object.picture:
+                pregenerate_thumbnails.apply_async(args=(self.object.picture.name, ITEM_PICTURE_SIZES))
         for f in self.plugin_forms:
             f.save()
 
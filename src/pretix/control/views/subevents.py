@@ -17,7 +17,7 @@ from django.utils.translation import gettext_lazy as _, pgettext_lazy
 from django.views import View
 from django.views.generic import CreateView, DeleteView, ListView, UpdateView
 
-from pretix.base.models import CartPosition, LogEntry
+from pretix.base.models import CartPosition, LogEntry, log_batch
 from pretix.base.models.checkin import CheckinList
 from pretix.base.models.event import SubEvent, SubEventMetaValue
 from pretix.base.models.items import (
@@ -538,24 +538,26 @@ class SubEventBulkAction(EventPermissionRequiredMixin, View):
     @transaction.atomic
     def post(self, request, *args, **kwargs):
         if request.POST.get('action') == 'disable':
-            for obj in self.objects:
-                obj.log_action(
-                    'pretix.subevent.changed', user=self.request.user, data={
-                        'active': False
-                    }
-                )
-                obj.active = False
-                obj.save(update_fields=['active'])
+            with log_batch():
+                for obj in self.objects:
+                    obj.log_action(
+                        'pretix.subevent.changed', user=self.request.user, data={
+                            'active': False
+                        }
+                    )
+                    obj.active = False
+                    obj.save(update_fields=['active'])
             messages.success(request, pgettext_lazy('subevent', 'The selected dates have been disabled.'))
         elif request.POST.get('action') == 'enable':
-            for obj in self.objects:
-                obj.log_action(
-                    'pretix.subevent.changed', user=self.request.user, data={
-                        'active': True
-                    }
-                )
-                obj.active = True
-                obj.save(update_fields=['active'])
+            with log_batch():
+                for obj in self.objects:
+                    obj.log_action(
+                        'pretix.subevent.changed', user=self.request.user, data={
+                            'active': True
+                        }
+                    )
+                    obj.active = True
+                    obj.save(update_fields=['active'])
             messages.success(request, pgettext_lazy('subevent', 'The selected dates have been enabled.'))
         elif request.POST.get('action') == 'delete':
             return render(request, 'pretixcontrol/subevents/delete_bulk.html', {
@@ -563,20 +565,21 @@ class SubEventBulkAction(EventPermissionRequiredMixin, View):
                 'forbidden': self.objects.filter(orderposition__isnull=False),
             })
         elif request.POST.get('action') == 'delete_confirm':
-            for obj in self.objects:
-                if obj.allow_delete():
-                    CartPosition.objects.filter(addon_to__subevent=obj).delete()
-                    obj.cartposition_set.all().delete()
-                    obj.log_action('pretix.subevent.deleted', user=self.request.user)
-                    obj.delete()
-                else:
-                    obj.log_action(
-                        'pretix.subevent.changed', user=self.request.user, data={
-                            'active': False
-                        }
-                    )
-                    obj.active = False
-                    obj.save(update_fields=['active'])
+            with log_batch():
+                for obj in self.objects:
+                    if obj.allow_delete():
+                        CartPosition.objects.filter(addon_to__subevent=obj).delete()
+                        obj.cartposition_set.all().delete()
+                        obj.log_action('pretix.subevent.deleted', user=self.request.user)
+                        obj.delete()
+                    else:
+                        obj.log_action(
+                            'pretix.subevent.changed', user=self.request.user, data={
+                                'active': False
+                            }
+                        )
+                        obj.active = False
+                        obj.save(update_fields=['active'])
             messages.success(request, pgettext_lazy('subevent', 'The selected dates have been deleted or disabled.'))
         return redirect(self.get_success_url())
 
@@ -19,7 +19,7 @@ from django.views.generic import (
     CreateView, DeleteView, ListView, TemplateView, UpdateView, View,
 )
 
-from pretix.base.models import CartPosition, LogEntry, OrderPosition, Voucher
+from pretix.base.models import CartPosition, OrderPosition, Voucher, log_batch
 from pretix.base.models.vouchers import _generate_random_code
 from pretix.base.services.vouchers import vouchers_send
 from pretix.control.forms.filter import VoucherFilterForm, VoucherTagFilterForm
@@ -319,15 +319,12 @@ class VoucherBulkCreate(EventPermissionRequiredMixin, CreateView):
 
     @transaction.atomic
     def form_valid(self, form):
-        log_entries = []
         objs = form.save(self.request.event)
         voucherids = []
-        for v in objs:
-            log_entries.append(
-                v.log_action('pretix.voucher.added', data=form.cleaned_data, user=self.request.user, save=False)
-            )
-            voucherids.append(v.pk)
-        LogEntry.objects.bulk_create(log_entries)
+        with log_batch():
+            for v in objs:
+                v.log_action('pretix.voucher.added', data=form.cleaned_data, user=self.request.user)
+                voucherids.append(v.pk)
 
         if form.cleaned_data['send']:
             vouchers_send.apply_async(kwargs={
@@ -407,19 +404,20 @@ class VoucherBulkAction(EventPermissionRequiredMixin, View):
                 'forbidden': self.objects.exclude(redeemed=0),
             })
         elif request.POST.get('action') == 'delete_confirm':
-            for obj in self.objects:
-                if obj.allow_delete():
-                    obj.log_action('pretix.voucher.deleted', user=self.request.user)
-                    OrderPosition.objects.filter(addon_to__voucher=obj).delete()
-                    obj.cartposition_set.all().delete()
-                    obj.delete()
-                else:
-                    obj.log_action('pretix.voucher.changed', user=self.request.user, data={
-                        'max_usages': min(obj.redeemed, obj.max_usages),
-                        'bulk': True
-                    })
-                    obj.max_usages = min(obj.redeemed, obj.max_usages)
-                    obj.save(update_fields=['max_usages'])
+            with log_batch():
+                for obj in self.objects:
+                    if obj.allow_delete():
+                        obj.log_action('pretix.voucher.deleted', user=self.request.user)
+                        OrderPosition.objects.filter(addon_to__voucher=obj).delete()
+                        obj.cartposition_set.all().delete()
+                        obj.delete()
+                    else:
+                        obj.log_action('pretix.voucher.changed', user=self.request.user, data={
+                            'max_usages': min(obj.redeemed, obj.max_usages),
+                            'bulk': True
+                        })
+                        obj.max_usages = min(obj.redeemed, obj.max_usages)
+                        obj.save(update_fields=['max_usages'])
             messages.success(request, _('The selected vouchers have been deleted or disabled.'))
         return redirect(self.get_success_url())
 
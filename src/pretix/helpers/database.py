@@ -1,6 +1,6 @@
 import contextlib
 
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.db.models import Aggregate, Field, Lookup
 from django.db.models.expressions import OrderBy
 
@@ -38,6 +38,82 @@ def casual_reads():
     yield
 
 
+def iterate_in_chunks(qs, chunk_size=1000):
+    """
+    Iterates over the objects of a queryset while only keeping ``chunk_size`` of them in memory
+    at a time. In contrast to ``QuerySet.iterator()``, this keeps ``prefetch_related`` working,
+    since every chunk is fetched by its own query. The ordering of the queryset is preserved.
+    """
+    pks = list(qs.values_list('pk', flat=True))
+    for i in range(0, len(pks), chunk_size):
+        chunk = pks[i:i + chunk_size]
+        objects = {o.pk: o for o in qs.filter(pk__in=chunk)}
+        for pk in chunk:
+            if pk in objects:
+                yield objects[pk]
+
+
+def repair_aggregates(model, fixed, marker, key_fields, value_fields, aggregate):
+    """
+    Compares rows that hold incrementally maintained aggregates with freshly computed values and
+    repairs the ones that differ. ``fixed`` contains the field values shared by all rows to compare
+    (e.g. the event), ``key_fields`` and ``value_fields`` are the names of the fields that identify
+    a row and that hold its values. ``aggregate`` is called to compute the expected values as a
+    dictionary mapping tuples of key values to tuples of values.
+
+    This does not lock anything, since that would block all changes for the duration of the
+    aggregation. Instead, the rows are read before and after aggregating and rows that changed in
+    between are skipped, as they have been touched by a concurrent change and the result of the
+    aggregation cannot be trusted. All other rows are only written if they still have the values
+    we read (compare-and-set), so concurrent updates are never lost. Rows without an expected value
+    are removed. Skipped rows are repaired by the next run. Finally, unless ``marker`` is ``None``,
+    a row with the field values in ``marker`` is created to mark the rows as reliable, if it does
+    not exist yet.
+
+    Returns the number of rows that were repaired.
+    """
+    rows = model.objects.filter(**fixed)
+
+    def current():
+        qs = rows.exclude(**marker) if marker is not None else rows
+        return {
+            values[:len(key_fields)]: values[len(key_fields):]
+            for values in qs.values_list(*key_fields, *value_fields)
+        }
+
+    before = current()
+    expected = aggregate()
+    after = current()
+
+    repaired = 0
+    for key in set(expected) | set(after):
+        if expected.get(key) == after.get(key) or before.get(key) != after.get(key):
+            continue
+        lookup = dict(zip(key_fields, key))
+        if key in after:
+            qs = rows.filter(**lookup, **dict(zip(value_fields, after[key])))
+            if key in expected:
+                repaired += qs.update(**dict(zip(value_fields, expected[key])))
+            else:
+                repaired += qs.delete()[0]
+        else:
+            try:
+                with transaction.atomic():
+                    model.objects.create(**fixed, **lookup, **dict(zip(value_fields, expected[key])))
+                repaired += 1
+            except IntegrityError:
+                # Somebody else created the row in the meantime
+                pass
+
+    if marker is not None and not rows.filter(**marker).exists():
+        try:
+            with transaction.atomic():
+                model.objects.create(**fixed, **marker)
+        except IntegrityError:
+            pass
+    return repaired
+
+
 class FixedOrderBy(OrderBy):
     # Workaround for https://code.djangoproject.com/ticket/28848
     template = '%(expression)s %(ordering)s'
@@ -242,3 +242,91 @@ class Logic():
             return self._operations[operator](*values)
         else:
             raise ValueError("Unrecognized operation %s" % operator)
+
+    def compile(self, tests):
+        """
+        Turns the json-logic into a callable that can be applied to many data sets
+        without walking the rule structure again. ``self.compile(tests)(data)`` returns
+        the same as ``self.apply(tests, data)``, except that ``and``, ``or``, ``if``
+        and ``?:`` only evaluate the arguments they need.
+        """
+        if tests is None or not isinstance(tests, dict):
+            return lambda data: tests
+
+        operator = list(tests.keys())[0]
+        values = tests[operator]
+        if not isinstance(values, list) and not isinstance(values, tuple):
+            values = [values]
+
+        if operator in ('none', 'all', 'some', 'map', 'filter'):
+            source, inner = self.compile(values[0]), self.compile(values[1])
+            if operator == 'none':
+                return lambda data: not any(inner(i) for i in source(data or {}))
+            if operator == 'all':
+                def _all(data):
+                    elements = source(data or {})
+                    if not elements:
+                        return False
+                    return all(inner(i) for i in elements)
+                return _all
+            if operator == 'some':
+                return lambda data: any(inner(i) for i in source(data or {}))
+            if operator == 'map':
+                return lambda data: [inner(i) for i in (source(data or {}) or [])]
+            return lambda data: [i for i in source(data or {}) if inner(i)]
+        if operator == 'reduce':
+            source, inner, initial = (self.compile(v) for v in values[:3])
+            return lambda data: reduce(
+                lambda acc, el: inner({'current': el, 'accumulator': acc}),
+                source(data or {}) or [],
+                initial(data or {})
+            )
+
+        args = [self.compile(val) for val in values]
+
+        if operator == 'var':
+            if len(values) == 1 and not isinstance(values[0], dict):
+                # Fast path for the most common case of a constant variable name
+                name = values[0]
+                return lambda data: get_var(data or {}, name)
+            return lambda data: get_var(data or {}, *[a(data or {}) for a in args])
+        if operator == 'missing':
+            return lambda data: missing(data or {}, *[a(data or {}) for a in args])
+        if operator == 'missing_some':
+            return lambda data: missing_some(data or {}, *[a(data or {}) for a in args])
+
+        if operator == 'and':
+            def _and(data):
+                total = True
+                for a in args:
+                    total = a(data)
+                    if not total:
+                        return total
+                return total
+            return _and
+        if operator == 'or':
+            def _or(data):
+                total = False
+                for a in args:
+                    total = a(data)
+                    if total:
+                        return total
+                return total
+            return _or
+        if operator in ('if', '?:'):
+            def _if(data):
+                for i in range(0, len(args) - 1, 2):
+                    if args[i](data):
+                        return args[i + 1](data)
+                if len(args) % 2:
+                    return args[-1](data)
+                return None
+            return _if
+
+        if operator in operations:
+            func = operations[operator]
+        elif operator in self._operations:
+            func = self._operations[operator]
+        else:
+            raise ValueError("Unrecognized operation %s" % operator)
+        return lambda data: func(*[a(data) for a in args])
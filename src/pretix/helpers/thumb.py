@@ -1,13 +1,20 @@
 import hashlib
+import threading
+from collections import OrderedDict
 from io import BytesIO
 
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
 from PIL import Image
 from PIL.Image import LANCZOS
 
 from pretix.helpers.models import Thumbnail
 
+THUMBNAIL_CACHE_SIZE = 5000
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
 
 class ThumbnailError(Exception):
     pass
@@ -49,34 +56,56 @@ def get_sizes(size, imgsize):
 
 
 def create_thumbnail(sourcename, size):
-    source = default_storage.open(sourcename)
-    image = Image.open(BytesIO(source.read()))
-    try:
-        image.load()
-    except:
-        raise ThumbnailError('Could not load image')
+    with default_storage.open(sourcename) as source:
+        try:
+            image = Image.open(source)
+            scale, crop = get_sizes(size, image.size)
+            # Lets the JPEG decoder scale down large images while decoding, which is a lot faster and needs a
+            # lot less memory than decoding the full image first. Does nothing for other formats.
+            image.draft(image.mode, (max(scale[0], 1), max(scale[1], 1)))
+            image.load()
+        except:
+            raise ThumbnailError('Could not load image')
 
-    scale, crop = get_sizes(size, image.size)
-    image = image.resize(scale, resample=LANCZOS)
+    image = image.resize(scale, resample=LANCZOS, reducing_gap=3.0)
     if crop:
         image = image.crop(crop)
 
-    checksum = hashlib.md5(image.tobytes()).hexdigest()
-    name = checksum + '.' + size.replace('^', 'c') + '.png'
     buffer = BytesIO()
     if image.mode not in ("1", "L", "RGB", "RGBA"):
         image = image.convert('RGB')
     image.save(fp=buffer, format='PNG')
-    imgfile = ContentFile(buffer.getvalue())
+    checksum = hashlib.md5(buffer.getvalue()).hexdigest()
+    name = checksum + '.' + size.replace('^', 'c') + '.png'
 
-    t = Thumbnail.objects.create(source=sourcename, size=size)
-    t.thumb.save(name, imgfile)
+    t = Thumbnail(source=sourcename, size=size)
+    t.thumb.save(name, ContentFile(buffer.getvalue()), save=False)
+    try:
+        with transaction.atomic():
+            t.save()
+    except IntegrityError:
+        # Somebody else created the same thumbnail in the meantime
+        t.thumb.delete(save=False)
+        return Thumbnail.objects.get(source=sourcename, size=size)
     return t
 
 
 def get_thumbnail(source, size):
-    # Assumes files are immutable
+    # Assumes files are immutable, which also allows us to keep the result in memory
+    key = (source, size)
+    with _cache_lock:
+        t = _cache.get(key)
+        if t is not None:
+            _cache.move_to_end(key)
+            return t
+
     try:
-        return Thumbnail.objects.get(source=source, size=size)
+        t = Thumbnail.objects.get(source=source, size=size)
     except Thumbnail.DoesNotExist:
-        return create_thumbnail(source, size)
+        t = create_thumbnail(source, size)
+
+    with _cache_lock:
+        _cache[key] = t
+        while len(_cache) > THUMBNAIL_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return t
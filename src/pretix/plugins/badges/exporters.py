@@ -122,6 +122,7 @@ OPTIONS = OrderedDict([
 
 def render_pdf(event, positions, opt):
     from PyPDF2 import PdfFileWriter, PdfFileReader
+    from PyPDF2.pdf import PageObject
     Renderer._register_fonts()
 
     renderermap = {
@@ -134,12 +135,15 @@ def render_pdf(event, positions, opt):
         default_renderer = None
     output_pdf_writer = PdfFileWriter()
 
-    any = False
     npp = opt['cols'] * opt['rows']
 
+    # All badges are drawn onto one canvas, so the static parts of every layout only need to be included
+    # in the document once and the result only needs to be parsed once.
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=pagesizes.A4)
+    pages = []
+
     def render_page(positions):
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer, pagesize=pagesizes.A4)
         for i, (op, r) in enumerate(positions):
             offsetx = opt['margins'][3] + (i % opt['cols']) * opt['offsets'][0]
             offsety = opt['margins'][2] + (opt['rows'] - 1 - i // opt['cols']) * opt['offsets'][1]
@@ -151,31 +155,13 @@ def render_pdf(event, positions, opt):
         if opt['pagesize']:
             p.setPageSize(opt['pagesize'])
         p.showPage()
-        p.save()
-        buffer.seek(0)
-        canvas_pdf_reader = PdfFileReader(buffer)
-        empty_pdf_page = output_pdf_writer.addBlankPage(
-            width=opt['pagesize'][0] if opt['pagesize'] else positions[0][1].bg_pdf.getPage(0).mediaBox[2],
-            height=opt['pagesize'][1] if opt['pagesize'] else positions[0][1].bg_pdf.getPage(0).mediaBox[3],
-        )
-        for i, (op, r) in enumerate(positions):
-            bg_page = copy.copy(r.bg_pdf.getPage(0))
-            offsetx = opt['margins'][3] + (i % opt['cols']) * opt['offsets'][0]
-            offsety = opt['margins'][2] + (opt['rows'] - 1 - i // opt['cols']) * opt['offsets'][1]
-            empty_pdf_page.mergeTranslatedPage(
-                bg_page,
-                tx=offsetx,
-                ty=offsety
-            )
-        empty_pdf_page.mergePage(canvas_pdf_reader.getPage(0))
+        pages.append(tuple(r for op, r in positions))
 
     pagebuffer = []
-    outbuffer = BytesIO()
     for op in positions:
         r = renderermap.get(op.item_id, default_renderer)
         if not r:
             continue
-        any = True
         pagebuffer.append((op, r))
         if len(pagebuffer) == npp:
             render_page(pagebuffer)
@@ -184,14 +170,44 @@ def render_pdf(event, positions, opt):
     if pagebuffer:
         render_page(pagebuffer)
 
+    if not pages:
+        raise OrderError(_("None of the selected products is configured to print badges."))
+
+    p.save()
+    buffer.seek(0)
+    canvas_pdf_reader = PdfFileReader(buffer)
+
+    # Pages with the same layouts in the same slots share the same background, which we only compose once
+    backgrounds = {}
+    for pageno, renderers in enumerate(pages):
+        key = tuple(id(r) for r in renderers)
+        if key not in backgrounds:
+            background = PageObject.createBlankPage(
+                None,
+                width=opt['pagesize'][0] if opt['pagesize'] else renderers[0].bg_pdf.getPage(0).mediaBox[2],
+                height=opt['pagesize'][1] if opt['pagesize'] else renderers[0].bg_pdf.getPage(0).mediaBox[3],
+            )
+            for i, r in enumerate(renderers):
+                bg_page = copy.copy(r.bg_pdf.getPage(0))
+                offsetx = opt['margins'][3] + (i % opt['cols']) * opt['offsets'][0]
+                offsety = opt['margins'][2] + (opt['rows'] - 1 - i // opt['cols']) * opt['offsets'][1]
+                background.mergeTranslatedPage(
+                    bg_page,
+                    tx=offsetx,
+                    ty=offsety
+                )
+            backgrounds[key] = background
+        page = copy.copy(backgrounds[key])
+        page.mergePage(canvas_pdf_reader.getPage(pageno))
+        output_pdf_writer.addPage(page)
+
+    outbuffer = BytesIO()
     output_pdf_writer.addMetadata({
         '/Title': 'Badges',
         '/Creator': 'pretix',
     })
     output_pdf_writer.write(outbuffer)
     outbuffer.seek(0)
-    if not any:
-        raise OrderError(_("None of the selected products is configured to print badges."))
     return outbuffer
 
 
@@ -4,7 +4,7 @@ from decimal import Decimal
 
 from celery.exceptions import MaxRetriesExceededError
 from django.conf import settings
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models import Q
 from django.utils.translation import gettext, gettext_noop
 from django_scopes import scope, scopes_disabled
@@ -22,6 +22,7 @@ from pretix.celery_app import app
 from .models import BankImportJob, BankTransaction
 
 logger = logging.getLogger(__name__)
+MATCH_CHUNK_SIZE = 200
 
 
 def notify_incomplete_payment(o: Order):
@@ -64,34 +65,7 @@ def cancel_old_payments(order):
 
 
 @transaction.atomic
-def _handle_transaction(trans: BankTransaction, code: str, event: Event=None, organizer: Organizer=None,
-                        slug: str=None):
-    if event:
-        try:
-            trans.order = event.orders.get(code=code)
-        except Order.DoesNotExist:
-            normalized_code = Order.normalize_code(code)
-            try:
-                trans.order = event.orders.get(code=normalized_code)
-            except Order.DoesNotExist:
-                trans.state = BankTransaction.STATE_NOMATCH
-                trans.save()
-                return
-    else:
-        qs = Order.objects.filter(event__organizer=organizer)
-        if slug:
-            qs = qs.filter(event__slug__iexact=slug)
-        try:
-            trans.order = qs.get(code=code)
-        except Order.DoesNotExist:
-            normalized_code = Order.normalize_code(code)
-            try:
-                trans.order = qs.get(code=normalized_code)
-            except Order.DoesNotExist:
-                trans.state = BankTransaction.STATE_NOMATCH
-                trans.save()
-                return
-
+def _handle_transaction(trans: BankTransaction):
     if trans.order.status == Order.STATUS_PAID and trans.order.pending_sum <= Decimal('0.00'):
         trans.state = BankTransaction.STATE_DUPLICATE
     elif trans.order.status == Order.STATUS_CANCELED:
@@ -147,7 +121,57 @@ def _handle_transaction(trans: BankTransaction, code: str, event: Event=None, or
             if o.pending_sum > Decimal('0.00') and o.status == Order.STATUS_PENDING:
                 notify_incomplete_payment(o)
 
-    trans.save()
+
+def _find_orders(codes: set, event: Event=None, organizer: Organizer=None) -> dict:
+    """
+    Looks up all orders matching any of the given codes or their normalized variants with a single query.
+    Orders are keyed by their code if ``event`` is given and by the lowercased slug of their event and their
+    code otherwise.
+    """
+    codes = codes | {Order.normalize_code(c) for c in codes}
+    if event:
+        return {o.code: o for o in event.orders.filter(code__in=codes)}
+    return {
+        (o.event.slug.lower(), o.code): o
+        for o in Order.objects.filter(event__organizer=organizer, code__in=codes).select_related('event')
+    }
+
+
+def _handle_transactions(candidates: list, event: Event=None, organizer: Organizer=None):
+    """
+    Matches and processes a list of ``(transaction, code, slug)`` tuples, in which ``code`` is ``None`` if no
+    order code could be found in the reference. Orders are resolved one chunk at a time and transactions without a
+    matching order are saved in bulk. Every matched transaction is processed and saved in its own database
+    transaction, so a failure or a lock only affects a single payment.
+    """
+    for i in range(0, len(candidates), MATCH_CHUNK_SIZE):
+        chunk = candidates[i:i + MATCH_CHUNK_SIZE]
+        orders = _find_orders({code for trans, code, slug in chunk if code}, event=event, organizer=organizer)
+        handled = set()
+        nomatch = []
+
+        for trans, code, slug in chunk:
+            order = None
+            if code:
+                for c in (code, Order.normalize_code(code)):
+                    order = orders.get(c if event else (slug.lower(), c))
+                    if order:
+                        break
+            if not order:
+                trans.state = BankTransaction.STATE_NOMATCH
+                nomatch.append(trans)
+                continue
+
+            if order.pk in handled:
+                # An earlier transaction of this chunk might have changed the order
+                order.refresh_from_db()
+            handled.add(order.pk)
+            trans.order = order
+            with transaction.atomic():
+                _handle_transaction(trans)
+                trans.save(update_fields=['state', 'message', 'order'])
+
+        BankTransaction.objects.bulk_update(nomatch, ['state'])
 
 
 def _get_unknown_transactions(job: BankImportJob, data: list, event: Event=None, organizer: Organizer=None):
@@ -181,10 +205,21 @@ def _get_unknown_transactions(job: BankImportJob, data: list, event: Event=None,
         trans.checksum = trans.calculate_checksum()
         if trans.checksum not in known_checksums:
             trans.state = BankTransaction.STATE_UNCHECKED
-            trans.save()
             transactions.append(trans)
             known_checksums.add(trans.checksum)
 
+    BankTransaction.objects.bulk_create(transactions, batch_size=MATCH_CHUNK_SIZE)
+    if transactions and not connection.features.can_return_rows_from_bulk_insert:
+        # The primary keys are referenced from the payments, so we need to look them up if the database does not
+        # return them. Checksums are unique within an import job.
+        pks = {}
+        for i in range(0, len(transactions), MATCH_CHUNK_SIZE):
+            pks.update(BankTransaction.objects.filter(
+                import_job=job, checksum__in=[t.checksum for t in transactions[i:i + MATCH_CHUNK_SIZE]]
+            ).values_list('checksum', 'pk'))
+        for trans in transactions:
+            trans.pk = pks[trans.checksum]
+
     return transactions
 
 
@@ -213,20 +248,19 @@ def process_banktransfers(self, job: int, data: list) -> None:
                                     for e in job.organizer.events.all()]
                     pattern = re.compile("(%s)[ \\-_]*([A-Z0-9]{%s})" % ("|".join(prefixes), code_len))
 
+                candidates = []
                 for trans in transactions:
                     match = pattern.search(trans.reference.replace(" ", "").replace("\n", "").upper())
 
                     if match:
                         if job.event:
-                            code = match.group(1)
-                            _handle_transaction(trans, code, event=job.event)
+                            candidates.append((trans, match.group(1), None))
                         else:
-                            slug = match.group(1)
-                            code = match.group(2)
-                            _handle_transaction(trans, code, organizer=job.organizer, slug=slug)
+                            candidates.append((trans, match.group(2), match.group(1)))
                     else:
-                        trans.state = BankTransaction.STATE_NOMATCH
-                        trans.save()
+                        candidates.append((trans, None, None))
+
+                _handle_transactions(candidates, **job.owner_kwargs)
             except LockTimeoutException:
                 try:
                     self.retry()
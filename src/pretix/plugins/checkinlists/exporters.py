@@ -24,6 +24,7 @@ from pretix.base.models import (
 from pretix.base.settings import PERSON_NAME_SCHEMES
 from pretix.base.templatetags.money import money_filter
 from pretix.control.forms.widgets import Select2
+from pretix.helpers.database import iterate_in_chunks
 from pretix.plugins.reports.exporters import ReportlabExportMixin
 
 
@@ -421,7 +422,7 @@ class CSVCheckinList(CheckInListMixin, ListExporter):
         headers.append(_('Comment'))
         yield headers
 
-        for op in qs:
+        for op in iterate_in_chunks(qs):
             try:
                 ia = op.order.invoice_address
             except InvoiceAddress.DoesNotExist:
@@ -1,5 +1,6 @@
 import datetime
 import json
+from collections import Counter
 from decimal import Decimal
 
 import dateutil.parser
@@ -11,6 +12,9 @@ from django.views.generic import TemplateView
 from pretix.base.models import (
     Item, Order, OrderPayment, OrderPosition, SubEvent,
 )
+from pretix.base.services.rollups import (
+    get_rollup_lines, get_rollup_order_days,
+)
 from pretix.control.permissions import EventPermissionRequiredMixin
 from pretix.control.views import ChartContainingView
 from pretix.plugins.statistics.signals import clear_cache
@@ -60,18 +64,23 @@ class IndexView(EventPermissionRequiredMixin, ChartContainingView, TemplateView)
         # Orders by day
         ctx['obd_data'] = cache.get('statistics_obd_data' + ckey)
         if not ctx['obd_data']:
-            oqs = Order.objects.annotate(payment_date=Subquery(p_date, output_field=DateTimeField()))
-            if subevent:
-                oqs = oqs.filter(all_positions__subevent_id=subevent, all_positions__canceled=False).distinct()
+            # Orders can contain positions for several dates, so the rollups only count them for the event as a whole
+            rollups = None if subevent else get_rollup_order_days(self.request.event)
+            if rollups is not None:
+                ordered_by_day, paid_by_day = rollups
+            else:
+                oqs = Order.objects.annotate(payment_date=Subquery(p_date, output_field=DateTimeField()))
+                if subevent:
+                    oqs = oqs.filter(all_positions__subevent_id=subevent, all_positions__canceled=False).distinct()
 
-            ordered_by_day = {}
-            for o in oqs.filter(event=self.request.event).values('datetime'):
-                day = o['datetime'].astimezone(tz).date()
-                ordered_by_day[day] = ordered_by_day.get(day, 0) + 1
-            paid_by_day = {}
-            for o in oqs.filter(event=self.request.event, payment_date__isnull=False).values('payment_date'):
-                day = o['payment_date'].astimezone(tz).date()
-                paid_by_day[day] = paid_by_day.get(day, 0) + 1
+                ordered_by_day = {}
+                for o in oqs.filter(event=self.request.event).values('datetime'):
+                    day = o['datetime'].astimezone(tz).date()
+                    ordered_by_day[day] = ordered_by_day.get(day, 0) + 1
+                paid_by_day = {}
+                for o in oqs.filter(event=self.request.event, payment_date__isnull=False).values('payment_date'):
+                    day = o['payment_date'].astimezone(tz).date()
+                    paid_by_day[day] = paid_by_day.get(day, 0) + 1
 
             data = []
             for d in dateutil.rrule.rrule(
@@ -94,23 +103,34 @@ class IndexView(EventPermissionRequiredMixin, ChartContainingView, TemplateView)
         # Orders by product
         ctx['obp_data'] = cache.get('statistics_obp_data' + ckey)
         if not ctx['obp_data']:
-            opqs = OrderPosition.objects
-            if subevent:
-                opqs = opqs.filter(subevent=subevent)
-            num_ordered = {
-                p['item']: p['cnt']
-                for p in (opqs
-                          .filter(order__event=self.request.event)
-                          .values('item')
-                          .annotate(cnt=Count('id')).order_by())
-            }
-            num_paid = {
-                p['item']: p['cnt']
-                for p in (opqs
-                          .filter(order__event=self.request.event, order__status=Order.STATUS_PAID)
-                          .values('item')
-                          .annotate(cnt=Count('id')).order_by())
-            }
+            rollups = get_rollup_lines(self.request.event, subevent=subevent)
+            if rollups is not None:
+                num_ordered = {}
+                num_paid = {}
+                for p in rollups:
+                    if p['canceled']:
+                        continue
+                    num_ordered[p['item']] = num_ordered.get(p['item'], 0) + p['cnt']
+                    if p['status'] == Order.STATUS_PAID:
+                        num_paid[p['item']] = num_paid.get(p['item'], 0) + p['cnt']
+            else:
+                opqs = OrderPosition.objects
+                if subevent:
+                    opqs = opqs.filter(subevent=subevent)
+                num_ordered = {
+                    p['item']: p['cnt']
+                    for p in (opqs
+                              .filter(order__event=self.request.event)
+                              .values('item')
+                              .annotate(cnt=Count('id')).order_by())
+                }
+                num_paid = {
+                    p['item']: p['cnt']
+                    for p in (opqs
+                              .filter(order__event=self.request.event, order__status=Order.STATUS_PAID)
+                              .values('item')
+                              .annotate(cnt=Count('id')).order_by())
+                }
             item_names = {
                 i.id: str(i)
                 for i in Item.objects.filter(event=self.request.event)
@@ -168,24 +188,40 @@ class IndexView(EventPermissionRequiredMixin, ChartContainingView, TemplateView)
         if not self.request.event.has_subevents or (ckey != "all" and subevent):
             ev = subevent or self.request.event
             if ev.seating_plan_id is not None:
-                seats_qs = ev.free_seats(sales_channel=None, include_blocked=True)
-                ctx['seats']['blocked_seats'] = seats_qs.filter(blocked=True).count()
-                ctx['seats']['free_seats'] = seats_qs.filter(blocked=False).count()
+                free_seats = ev.free_seats(sales_channel=None, include_blocked=True)
+                ctx['seats']['blocked_seats'] = len([s for s in free_seats if s.blocked])
+                ctx['seats']['free_seats'] = len(free_seats) - ctx['seats']['blocked_seats']
                 ctx['seats']['purchased_seats'] = \
                     ev.seats.count() - ctx['seats']['blocked_seats'] - ctx['seats']['free_seats']
 
-                seats_qs = seats_qs.values('product', 'blocked').annotate(count=Count('id'))\
-                    .order_by('product__category__position', 'product__position', 'product', 'blocked')
+                seat_counts = Counter((s.product_id, s.blocked) for s in free_seats)
 
                 ctx['seats']['products'] = {}
                 ctx['seats']['stats'] = {}
                 item_cache = {i.pk: i for i in
-                              self.request.event.items.annotate(has_variations=Count('variations')).filter(
-                                  pk__in={p['product'] for p in seats_qs if p['product']}
+                              self.request.event.items.select_related('category').annotate(
+                                  has_variations=Count('variations')
+                              ).filter(
+                                  pk__in={p for p, blocked in seat_counts if p}
                               )}
                 item_cache[None] = None
 
-                for item in seats_qs:
+                def sort_key(key):
+                    product = item_cache[key[0]]
+                    return (
+                        product is None or product.category is None,
+                        product.category.position if product and product.category else 0,
+                        product.position if product else 0,
+                        key[0] or 0,
+                        key[1],
+                    )
+
+                seat_groups = [
+                    {'product': product, 'blocked': blocked, 'count': seat_counts[product, blocked]}
+                    for product, blocked in sorted(seat_counts, key=sort_key)
+                ]
+
+                for item in seat_groups:
                     product = item_cache[item['product']]
                     if item_cache[item['product']] not in ctx['seats']['products']:
                         price = None
@@ -1,5 +1,7 @@
 import json
 import logging
+import threading
+from collections import OrderedDict
 from io import BytesIO
 
 from django.contrib.staticfiles import finders
@@ -23,6 +25,17 @@ from pretix.plugins.ticketoutputpdf.signals import override_layout
 
 logger = logging.getLogger('pretix.plugins.ticketoutputpdf')
 
+# Renderers are kept per worker thread, since setting one up requires reading and parsing the background PDF. A
+# renderer keeps its background open and must not be used by two threads at the same time.
+_renderer_cache = threading.local()
+RENDERER_CACHE_SIZE = 16
+
+
+def _get_renderer_cache():
+    if not hasattr(_renderer_cache, 'renderers'):
+        _renderer_cache.renderers = OrderedDict()
+    return _renderer_cache.renderers
+
 
 class PdfTicketOutput(BaseTicketOutput):
     identifier = 'pdf'
@@ -59,8 +72,18 @@ class PdfTicketOutput(BaseTicketOutput):
     def _register_fonts(self):
         Renderer._register_fonts()
 
-    def _draw_page(self, layout: TicketLayout, op: OrderPosition, order: Order):
-        buffer = BytesIO()
+    @cached_property
+    def _variables_version(self):
+        # The text variables of a renderer depend on the event's questions, name scheme and anything plugins add
+        # to them. The prefix of the event cache changes whenever the event or one of its related objects change,
+        # but questions are not among them when they are added or changed.
+        return (
+            self.event.cache.current_prefix(),
+            self.event.settings.name_scheme,
+            tuple(self.event.questions.order_by('pk').values_list('pk', flat=True)),
+        )
+
+    def _create_renderer(self, layout: TicketLayout):
         objs = self.override_layout or json.loads(layout.layout) or self._legacy_layout()
         bg_file = layout.background
 
@@ -71,8 +94,32 @@ class PdfTicketOutput(BaseTicketOutput):
         else:
             bgf = self._get_default_background()
 
+        with bgf:
+            return Renderer(self.event, objs, bgf)
+
+    def _get_renderer(self, layout: TicketLayout):
+        if self.override_layout or self.override_background or not json.loads(layout.layout):
+            return self._create_renderer(layout)
+
+        key = (
+            self.event.pk, self.event.plugins, self._variables_version, layout.layout,
+            layout.background.name if isinstance(layout.background, File) else None,
+        )
+        renderers = _get_renderer_cache()
+        renderer = renderers.get(key)
+        if renderer is None:
+            renderer = self._create_renderer(layout)
+            renderers[key] = renderer
+            while len(renderers) > RENDERER_CACHE_SIZE:
+                renderers.popitem(last=False)
+        else:
+            renderers.move_to_end(key)
+        return renderer
+
+    def _draw_page(self, layout: TicketLayout, op: OrderPosition, order: Order):
+        buffer = BytesIO()
         p = self._create_canvas(buffer)
-        renderer = Renderer(self.event, objs, bgf)
+        renderer = self._get_renderer(layout)
         renderer.draw_page(p, order, op)
         p.save()
         return renderer.render_background(buffer, _('Ticket'))
@@ -5,7 +5,6 @@ from django.core.cache import cache
 from django.core.files.base import ContentFile, File
 from django.core.files.storage import default_storage
 from django.core.management.base import BaseCommand
-from django.utils.timezone import now
 from django_scopes import scopes_disabled
 
 from pretix.base.models import Event_SettingsStore, Organizer_SettingsStore
@@ -24,14 +23,11 @@ class Command(BaseCommand):
 
     @scopes_disabled()
     def handle(self, *args, **options):
-        # Reset compile cache
-        cache.set('sass_compile_prefix', now().isoformat())
-
         ostore = Organizer_SettingsStore.objects.filter(key="presale_css_file")
         if options.get('organizer'):
             ostore = ostore.filter(object__slug=options['organizer'])
         for es in ostore:
-            regenerate_organizer_css.apply_async(args=(es.object_id,))
+            regenerate_organizer_css.apply_async(args=(es.object_id,), kwargs={'force': True})
 
         estore = Event_SettingsStore.objects.filter(key="presale_css_file").order_by('-object__date_from')
         if options.get('event'):
@@ -39,7 +35,7 @@ class Command(BaseCommand):
         if options.get('organizer'):
             estore = estore.filter(object__organizer__slug=options['event'])
         for es in estore:
-            regenerate_css.apply_async(args=(es.object_id,))
+            regenerate_css.apply_async(args=(es.object_id,), kwargs={'force': True})
 
         gs = GlobalSettingsObject()
         for lc, ll in settings.LANGUAGES:
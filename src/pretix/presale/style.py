@@ -1,6 +1,7 @@
 import hashlib
 import logging
 import os
+from functools import lru_cache
 from urllib.parse import urljoin, urlsplit
 
 import django_libsass
@@ -12,9 +13,9 @@ from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.dispatch import Signal
 from django.templatetags.static import static as _static
-from django.utils.timezone import now
 from django_scopes import scope
 
+from pretix import __version__
 from pretix.base.models import Event, Event_SettingsStore, Organizer
 from pretix.base.services.tasks import (
     TransactionAwareProfiledEventTask, TransactionAwareTask,
@@ -29,25 +30,35 @@ logger = logging.getLogger('pretix.presale.style')
 affected_keys = ['primary_font', 'primary_color', 'theme_color_success', 'theme_color_danger']
 
 
-def compile_scss(object, file="main.scss", fonts=True):
-    sassdir = os.path.join(settings.STATIC_ROOT, 'pretixpresale/scss')
-
+def _static_base(object):
+    """
+    Returns the URL that static file paths in stylesheets need to be resolved against, or ``None`` if they can
+    be used as they are.
+    """
+    if settings.MEDIA_URL.startswith("/"):
+        return None
+    if isinstance(object, Event):
+        domain = get_event_domain(object, fallback=True)
+    else:
+        domain = get_organizer_domain(object)
+    if domain:
+        siteurlsplit = urlsplit(settings.SITE_URL)
+        if siteurlsplit.port and siteurlsplit.port not in (80, 443):
+            domain = '%s:%d' % (domain, siteurlsplit.port)
+        return '%s://%s' % (siteurlsplit.scheme, domain)
+    return settings.SITE_URL
+
+
+def _static_function(base):
     def static(path):
         sp = _static(path)
-        if not settings.MEDIA_URL.startswith("/") and sp.startswith("/"):
-            if isinstance(object, Event):
-                domain = get_event_domain(object, fallback=True)
-            else:
-                domain = get_organizer_domain(object)
-            if domain:
-                siteurlsplit = urlsplit(settings.SITE_URL)
-                if siteurlsplit.port and siteurlsplit.port not in (80, 443):
-                    domain = '%s:%d' % (domain, siteurlsplit.port)
-                sp = urljoin('%s://%s' % (siteurlsplit.scheme, domain), sp)
-            else:
-                sp = urljoin(settings.SITE_URL, sp)
+        if base and sp.startswith("/"):
+            sp = urljoin(base, sp)
         return '"{}"'.format(sp)
+    return static
+
 
+def _scss_source(object, file, fonts):
     sassrules = []
     if object.settings.get('primary_color'):
         sassrules.append('$brand-primary: {};'.format(object.settings.get('primary_color')))
@@ -81,75 +92,116 @@ def compile_scss(object, file="main.scss", fonts=True):
         for recv, resp in sass_postamble.send(object, filename=file):
             sassrules.append(resp)
 
-    sasssrc = "\n".join(sassrules)
-    srcchecksum = hashlib.sha1(sasssrc.encode('utf-8')).hexdigest()
-
-    cp = cache.get_or_set('sass_compile_prefix', now().isoformat())
-    css = cache.get('sass_compile_{}_{}'.format(cp, srcchecksum))
-    if not css:
-        cf = dict(django_libsass.CUSTOM_FUNCTIONS)
-        cf['static'] = static
-        css = sass.compile(
-            string=sasssrc,
-            include_paths=[sassdir], output_style='nested',
-            custom_functions=cf
-        )
-        cssf = CSSCompressorFilter(css)
-        css = cssf.output()
-        cache.set('sass_compile_{}_{}'.format(cp, srcchecksum), css, 600)
-
-    checksum = hashlib.sha1(css.encode('utf-8')).hexdigest()
+    return "\n".join(sassrules)
+
+
+@lru_cache(maxsize=None)
+def _scss_version():
+    """
+    Returns a checksum of all SCSS files that can be imported, which changes whenever pretix is upgraded
+    to a version with different styles.
+    """
+    sassdir = os.path.join(settings.STATIC_ROOT, 'pretixpresale/scss')
+    h = hashlib.sha1()
+    for root, dirs, files in sorted(os.walk(sassdir)):
+        for f in sorted(files):
+            with open(os.path.join(root, f), 'rb') as fp:
+                h.update(os.path.relpath(os.path.join(root, f), sassdir).encode())
+                h.update(fp.read())
+    return h.hexdigest()
+
+
+def _compile(sasssrc, static):
+    sassdir = os.path.join(settings.STATIC_ROOT, 'pretixpresale/scss')
+    cf = dict(django_libsass.CUSTOM_FUNCTIONS)
+    cf['static'] = static
+    css = sass.compile(
+        string=sasssrc,
+        include_paths=[sassdir], output_style='nested',
+        custom_functions=cf
+    )
+    cssf = CSSCompressorFilter(css)
+    return cssf.output()
+
+
+def get_stylesheet(object, file="main.scss", fonts=True, force=False, recompiled=None):
+    """
+    Returns the name of the compiled stylesheet for the given event or organizer in the default file storage
+    together with a checksum that changes whenever the stylesheet does.
+
+    Compiled stylesheets are stored under a checksum of everything the result depends on: the SASS source,
+    the URLs of static files and the version of pretix and its SCSS files. Events and organizers with the same
+    settings therefore share a single file, and every distinct stylesheet is only compiled once, even after
+    a restart.
+
+    Files provided by plugins or registered fonts are not part of the checksum. Pass ``force=True`` to compile
+    the stylesheet again and replace the stored file anyway. If ``recompiled`` is a set, checksums in it are
+    not compiled again even if ``force`` is set, and newly compiled checksums are added to it.
+    """
+    sasssrc = _scss_source(object, file, fonts)
+    base = _static_base(object)
+    checksum = hashlib.sha1('\n'.join([
+        sasssrc, str(base), settings.STATIC_URL, __version__, _scss_version()
+    ]).encode('utf-8')).hexdigest()
+    fname = 'pub/css/{}.css'.format(checksum)
+
+    if force and (recompiled is None or checksum not in recompiled):
+        css = _compile(sasssrc, _static_function(base))
+        if default_storage.exists(fname):
+            default_storage.delete(fname)
+        fname = default_storage.save(fname, ContentFile(css.encode('utf-8')))
+        cache.set('sass_compiled_{}'.format(checksum), True, 600)
+        if recompiled is not None:
+            recompiled.add(checksum)
+    elif not cache.get('sass_compiled_{}'.format(checksum)):
+        if not default_storage.exists(fname):
+            css = _compile(sasssrc, _static_function(base))
+            fname = default_storage.save(fname, ContentFile(css.encode('utf-8')))
+        cache.set('sass_compiled_{}'.format(checksum), True, 600)
+    return fname, checksum
+
+
+def compile_scss(object, file="main.scss", fonts=True):
+    fname, checksum = get_stylesheet(object, file, fonts)
+    with default_storage.open(fname, 'rb') as f:
+        css = f.read().decode('utf-8')
     return css, checksum
 
 
-@app.task(base=TransactionAwareProfiledEventTask)
-def regenerate_css(event):
+def _update_stylesheets(object, force=False, recompiled=None):
     # main.scss
-    css, checksum = compile_scss(event)
-    fname = 'pub/{}/{}/presale.{}.css'.format(event.organizer.slug, event.slug, checksum[:16])
-
-    if event.settings.get('presale_css_checksum', '') != checksum:
-        newname = default_storage.save(fname, ContentFile(css.encode('utf-8')))
-        event.settings.set('presale_css_file', newname)
-        event.settings.set('presale_css_checksum', checksum)
+    fname, checksum = get_stylesheet(object, force=force, recompiled=recompiled)
+    if object.settings.get('presale_css_checksum', '') != checksum:
+        object.settings.set('presale_css_file', fname)
+        object.settings.set('presale_css_checksum', checksum)
 
     # widget.scss
-    css, checksum = compile_scss(event, file='widget.scss', fonts=False)
-    fname = 'pub/{}/{}/widget.{}.css'.format(event.organizer.slug, event.slug, checksum[:16])
+    fname, checksum = get_stylesheet(object, file='widget.scss', fonts=False, force=force, recompiled=recompiled)
+    if object.settings.get('presale_widget_css_checksum', '') != checksum:
+        object.settings.set('presale_widget_css_file', fname)
+        object.settings.set('presale_widget_css_checksum', checksum)
 
-    if event.settings.get('presale_widget_css_checksum', '') != checksum:
-        newname = default_storage.save(fname, ContentFile(css.encode('utf-8')))
-        event.settings.set('presale_widget_css_file', newname)
-        event.settings.set('presale_widget_css_checksum', checksum)
+
+@app.task(base=TransactionAwareProfiledEventTask)
+def regenerate_css(event, force=False):
+    _update_stylesheets(event, force=force)
 
 
 @app.task(base=TransactionAwareTask)
-def regenerate_organizer_css(organizer_id: int):
+def regenerate_organizer_css(organizer_id: int, force=False):
     organizer = Organizer.objects.get(pk=organizer_id)
+    recompiled = set()
 
     with scope(organizer=organizer):
-        # main.scss
-        css, checksum = compile_scss(organizer)
-        fname = 'pub/{}/presale.{}.css'.format(organizer.slug, checksum[:16])
-        if organizer.settings.get('presale_css_checksum', '') != checksum:
-            newname = default_storage.save(fname, ContentFile(css.encode('utf-8')))
-            organizer.settings.set('presale_css_file', newname)
-            organizer.settings.set('presale_css_checksum', checksum)
-
-        # widget.scss
-        css, checksum = compile_scss(organizer, file='widget.scss', fonts=False)
-        fname = 'pub/{}/widget.{}.css'.format(organizer.slug, checksum[:16])
-        if organizer.settings.get('presale_widget_css_checksum', '') != checksum:
-            newname = default_storage.save(fname, ContentFile(css.encode('utf-8')))
-            organizer.settings.set('presale_widget_css_file', newname)
-            organizer.settings.set('presale_widget_css_checksum', checksum)
+        _update_stylesheets(organizer, force=force, recompiled=recompiled)
 
+        # All events that inherit the organizer's style are updated right here instead of in separate tasks, so
+        # every distinct stylesheet is compiled once and then shared by all events using it.
         non_inherited_events = set(Event_SettingsStore.objects.filter(
             object__organizer=organizer, key__in=affected_keys
         ).values_list('object_id', flat=True))
-        for event in organizer.events.all():
-            if event.pk not in non_inherited_events:
-                regenerate_css.apply_async(args=(event.pk,))
+        for event in organizer.events.exclude(pk__in=non_inherited_events).select_related('organizer'):
+            _update_stylesheets(event, force=force, recompiled=recompiled)
 
 
 register_fonts = Signal()
@@ -1,8 +1,10 @@
+import time
 import warnings
 from importlib import import_module
 from urllib.parse import urljoin
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.http import Http404
 from django.shortcuts import redirect
@@ -21,6 +23,109 @@ from pretix.presale.signals import process_request, process_response
 
 SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
 
+# Events and organizers resolved by recent requests in this process, keyed by the slugs in the URL. An entry is only
+# used as long as the version stamps of the object-related caches of the event and organizer have not changed, which
+# happens whenever the event, the organizer or one of their domains is saved.
+_snapshots = {}
+SNAPSHOT_CACHE_SIZE = 2000
+SNAPSHOT_MAX_AGE = 60
+
+
+def _get_versions(keys, initialize=False):
+    versions = cache.get_many(keys)
+    if initialize and len(versions) < len(keys):
+        for k in keys:
+            if k not in versions:
+                # Same initial value as NamespacedCache would use
+                cache.add(k, int(time.time()))
+        versions = cache.get_many(keys)
+    if len(versions) < len(keys):
+        # No shared cache is configured or the stamp has been evicted, so we can't tell if the snapshot is recent
+        return None
+    return tuple(versions[k] for k in keys)
+
+
+class _Snapshot:
+    """
+    The field values and domains of an organizer and optionally one of its events, from which new model instances can
+    be created without a database query.
+    """
+
+    def __init__(self, organizer, event, keys, versions):
+        self.organizer_values = [getattr(organizer, f.attname) for f in Organizer._meta.concrete_fields]
+        self.organizer_domain = get_organizer_domain(organizer)
+        if event:
+            self.event_values = [getattr(event, f.attname) for f in Event._meta.concrete_fields]
+            self.event_domain = get_event_domain(event)
+        else:
+            self.event_values = self.event_domain = None
+        self.keys = keys
+        self.versions = versions
+        self.created = time.time()
+
+    def is_recent(self):
+        return time.time() - self.created < SNAPSHOT_MAX_AGE and _get_versions(self.keys) == self.versions
+
+    def restore(self, db):
+        organizer = Organizer.from_db(db, [f.attname for f in Organizer._meta.concrete_fields], self.organizer_values)
+        organizer._cached_domain = self.organizer_domain or 'none'
+        if not self.event_values:
+            return organizer, None
+        event = Event.from_db(db, [f.attname for f in Event._meta.concrete_fields], self.event_values)
+        event._cached_domain = self.event_domain or 'none'
+        event.organizer = organizer
+        return organizer, event
+
+
+def _remember(key, organizer, event=None):
+    keys = [o.cache.prefixkey for o in ([organizer, event] if event else [organizer])]
+    versions = _get_versions(keys, initialize=True)
+    if versions is None:
+        return
+    if len(_snapshots) >= SNAPSHOT_CACHE_SIZE:
+        _snapshots.clear()
+    _snapshots[key] = _Snapshot(organizer, event, keys, versions)
+
+
+def _recall(key, db):
+    snapshot = _snapshots.get(key)
+    if snapshot and snapshot.is_recent():
+        return snapshot.restore(db)
+    return None, None
+
+
+def _get_event(db, organizer_slug, event_slug, organizer=None):
+    """
+    Returns the event with the given slugs, reusing a snapshot from an earlier request if possible. If ``organizer``
+    is given, the event is looked up within this organizer and the returned event refers to it.
+    """
+    key = (organizer_slug, event_slug)
+    _, event = _recall(key, db)
+    if event is None:
+        if organizer:
+            event = organizer.events.using(db).get(slug=event_slug, organizer=organizer)
+        else:
+            event = Event.objects.select_related('organizer').using(db).get(
+                slug=event_slug,
+                organizer__slug=organizer_slug
+            )
+        _remember(key, organizer or event.organizer, event)
+    if organizer:
+        event.organizer = organizer
+    return event
+
+
+def _get_organizer(db, organizer_slug):
+    """
+    Returns the organizer with the given slug, reusing a snapshot from an earlier request if possible.
+    """
+    key = (organizer_slug, None)
+    organizer, _ = _recall(key, db)
+    if organizer is None:
+        organizer = Organizer.objects.using(db).get(slug=organizer_slug)
+        _remember(key, organizer)
+    return organizer
+
 
 @scope(organizer=None)
 def _detect_event(request, require_live=True, require_plugin=None):
@@ -44,11 +149,7 @@ def _detect_event(request, require_live=True, require_plugin=None):
                 path = "/" + request.get_full_path().split("/", 2)[-1]
                 return redirect(path)
 
-            request.event = request.organizer.events.using(db).get(
-                slug=url.kwargs['event'],
-                organizer=request.organizer,
-            )
-            request.organizer = request.organizer
+            request.event = _get_event(db, request.organizer.slug, url.kwargs['event'], organizer=request.organizer)
 
             # If this event has a custom domain, send the user there
             domain = get_event_domain(request.event)
@@ -62,13 +163,7 @@ def _detect_event(request, require_live=True, require_plugin=None):
         else:
             # We are on our main domain
             if 'event' in url.kwargs and 'organizer' in url.kwargs:
-                request.event = Event.objects\
-                    .select_related('organizer')\
-                    .using(db)\
-                    .get(
-                        slug=url.kwargs['event'],
-                        organizer__slug=url.kwargs['organizer']
-                    )
+                request.event = _get_event(db, url.kwargs['organizer'], url.kwargs['event'])
                 request.organizer = request.event.organizer
 
                 # If this event has a custom domain, send the user there
@@ -81,9 +176,7 @@ def _detect_event(request, require_live=True, require_plugin=None):
                     r['Access-Control-Allow-Origin'] = '*'
                     return r
             elif 'organizer' in url.kwargs:
-                request.organizer = Organizer.objects.using(db).get(
-                    slug=url.kwargs['organizer']
-                )
+                request.organizer = _get_organizer(db, url.kwargs['organizer'])
             else:
                 raise Http404()
 
@@ -124,6 +124,15 @@ PRETIX_PASSWORD_RESET = config.getboolean('pretix', 'password_reset', fallback=T
 PRETIX_LONG_SESSIONS = config.getboolean('pretix', 'long_sessions', fallback=True)
 PRETIX_ADMIN_AUDIT_COMMENTS = config.getboolean('pretix', 'audit_comments', fallback=False)
 PRETIX_OBLIGATORY_2FA = config.getboolean('pretix', 'obligatory_2fa', fallback=False)
+PRETIX_QUOTA_COUNTERS = config.get('pretix', 'quota_counters', fallback='off')
+PRETIX_STATISTICS_ROLLUPS = config.getboolean('pretix', 'statistics_rollups', fallback=False)
+PRETIX_SEARCH_INDEX = config.getboolean('pretix', 'search_index', fallback=False)
+PRETIX_ORDER_CODE_POOL = config.getint('pretix', 'order_code_pool', fallback=0)
+PRETIX_LOCK_STRIPES = config.getint('pretix', 'lock_stripes', fallback=1)
+PRETIX_LOCK_WAIT = config.getfloat('pretix', 'lock_wait', fallback=0.3)
+PRETIX_EXPORT_WORKERS = config.getint('pretix', 'export_workers', fallback=1)
+PRETIX_WEBHOOK_BATCH_WINDOW = config.getint('pretix', 'webhook_batch_window', fallback=10)
+PRETIX_TICKET_PRERENDER = config.getboolean('pretix', 'ticket_prerender', fallback=False)
 PRETIX_SESSION_TIMEOUT_RELATIVE = 3600 * 3
 PRETIX_SESSION_TIMEOUT_ABSOLUTE = 3600 * 12
 
@@ -178,6 +187,7 @@ EMAIL_HOST_USER = config.get('mail', 'user', fallback='')
 EMAIL_HOST_PASSWORD = config.get('mail', 'password', fallback='')
 EMAIL_USE_TLS = config.getboolean('mail', 'tls', fallback=False)
 EMAIL_USE_SSL = config.getboolean('mail', 'ssl', fallback=False)
+MAIL_RATE_LIMIT = config.getint('mail', 'rate_limit', fallback=0)
 EMAIL_SUBJECT_PREFIX = '[pretix] '
 
 ADMINS = [('Admin', n) for n in config.get('mail', 'admins', fallback='').split(",") if n]
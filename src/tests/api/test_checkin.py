@@ -1,4 +1,6 @@
 import datetime
+import gzip
+import json
 import time
 from decimal import Decimal
 from unittest import mock
@@ -613,6 +615,111 @@ def test_by_secret(token_client, organizer, clist, event, order):
     assert resp.data['status'] == 'ok'
 
 
+@pytest.mark.django_db
+def test_changes(token_client, organizer, clist, event, order):
+    url = '/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/changes/'.format(
+        organizer.slug, event.slug, clist.pk
+    )
+    resp = token_client.get(url)
+    assert resp.status_code == 200
+    assert [p['secret'] for p in resp.data['results']] == ['z3fsn8jyufm5kpk768q69gkbyr5f4h6w']
+    assert resp.data['removed'] == []
+    cursor = resp.data['cursor']
+
+    resp = token_client.get(url, {'cursor': cursor})
+    assert resp.status_code == 200
+    assert resp.data['results'] == []
+
+    with scopes_disabled():
+        p = order.positions.first()
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/{}/redeem/'.format(
+        organizer.slug, event.slug, clist.pk, p.secret
+    ), {}, format='json')
+    assert resp.status_code == 201
+    resp = token_client.get(url, {'cursor': cursor})
+    assert [p['secret'] for p in resp.data['results']] == ['z3fsn8jyufm5kpk768q69gkbyr5f4h6w']
+    assert len(resp.data['results'][0]['checkins']) == 1
+    cursor = resp.data['cursor']
+
+    order.status = Order.STATUS_CANCELED
+    order.save()
+    resp = token_client.get(url, {'cursor': cursor})
+    assert resp.data['results'] == []
+    assert resp.data['removed'] == ['z3fsn8jyufm5kpk768q69gkbyr5f4h6w']
+
+    resp = token_client.get(url, {'cursor': 'foo'})
+    assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+def test_changes_product_changed(token_client, organizer, clist, event, order, item, other_item):
+    url = '/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/changes/'.format(
+        organizer.slug, event.slug, clist.pk
+    )
+    resp = token_client.get(url)
+    cursor = resp.data['cursor']
+
+    with scopes_disabled():
+        p1 = order.positions.get(item=item)
+        p2 = order.positions.get(item=other_item)
+        for p, old_item, new_item in ((p1, item, other_item), (p2, other_item, item)):
+            p.item = new_item
+            p.save()
+            order.log_action('pretix.event.order.changed.item', data={
+                'position': p.pk, 'positionid': p.positionid, 'old_item': old_item.pk, 'new_item': new_item.pk,
+            })
+    resp = token_client.get(url, {'cursor': cursor})
+    assert [p['secret'] for p in resp.data['results']] == ['sf4HZG73fU6kwddgjg2QOusFbYZwVKpK']
+    assert resp.data['removed'] == ['z3fsn8jyufm5kpk768q69gkbyr5f4h6w']
+
+
+@pytest.mark.django_db
+def test_changes_ndjson(token_client, organizer, clist, event, order):
+    resp = token_client.get(
+        '/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/changes/?ndjson=true'.format(
+            organizer.slug, event.slug, clist.pk
+        ),
+        HTTP_ACCEPT_ENCODING='gzip'
+    )
+    assert resp.status_code == 200
+    assert resp['Content-Encoding'] == 'gzip'
+    lines = [json.loads(line) for line in gzip.decompress(b''.join(resp.streaming_content)).decode().splitlines()]
+    assert 'cursor' in lines[0]
+    assert [line['position']['secret'] for line in lines[1:]] == ['z3fsn8jyufm5kpk768q69gkbyr5f4h6w']
+
+
+@pytest.mark.django_db
+def test_bulk_redeem(token_client, organizer, clist, event, order):
+    clist.allow_entry_after_exit = False
+    clist.save()
+    with scopes_disabled():
+        p = order.positions.first()
+    url = '/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/bulk_redeem/'.format(
+        organizer.slug, event.slug, clist.pk
+    )
+    resp = token_client.post(url, [
+        {'secret': p.secret, 'nonce': 'foo', 'datetime': '2020-02-01T10:00:00Z'},
+        {'secret': p.secret, 'nonce': 'foo', 'datetime': '2020-02-01T10:00:00Z'},
+        {'secret': p.secret, 'type': 'exit', 'datetime': '2020-02-01T11:00:00Z'},
+        {'secret': p.secret, 'datetime': '2020-02-01T12:00:00Z'},
+        {'secret': 'unknown'},
+    ], format='json')
+    assert resp.status_code == 200
+    assert [(r['status'], r.get('reason')) for r in resp.data['results']] == [
+        ('ok', None), ('ok', None), ('ok', None), ('error', 'already_redeemed'), ('error', 'invalid'),
+    ]
+    assert resp.data['results'][0]['position'] == p.pk
+    assert resp.data['results'][4]['position'] is None
+    with scopes_disabled():
+        assert list(p.checkins.order_by('datetime').values_list('type', flat=True)) == ['entry', 'exit']
+        assert p.checkins.first().datetime == datetime.datetime(2020, 2, 1, 10, 0, 0, tzinfo=UTC)
+
+    resp = token_client.post(url, [{'secret': p.secret, 'type': 'foo'}], format='json')
+    assert resp.status_code == 400
+    resp = token_client.post(url, {'secret': p.secret}, format='json')
+    assert resp.status_code == 400
+
+
 @pytest.mark.django_db
 def test_only_once(token_client, organizer, clist, event, order):
     with scopes_disabled():
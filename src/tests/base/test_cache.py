@@ -46,6 +46,12 @@ class CacheTest(TestCase):
         self.cache.clear()
         self.assertIsNone(self.cache.get(self.testkey))
 
+    def test_current_prefix(self):
+        prefix = self.cache.current_prefix()
+        self.assertEqual(self.cache.current_prefix(), prefix)
+        self.cache.clear()
+        self.assertNotEqual(self.cache.current_prefix(), prefix)
+
     def test_many(self):
         inp = {
             'a': 'foo',
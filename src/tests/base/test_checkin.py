@@ -4,13 +4,16 @@ from decimal import Decimal
 
 import pytest
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 from django_scopes import scope
 from freezegun import freeze_time
 
 from pretix.base.models import Checkin, Event, Order, OrderPosition, Organizer
 from pretix.base.services.checkin import (
-    CheckInError, RequiredQuestionsError, perform_checkin,
+    CheckInError, LazyRuleVars, RequiredQuestionsError, _compile_rules,
+    get_compiled_rules, perform_checkin,
 )
 
 
@@ -600,3 +603,64 @@ def test_position_queries(django_assert_num_queries, position, clist):
         perform_checkin(position, clist, {})
     if 'sqlite' not in settings.DATABASES['default']['ENGINE']:
         assert any('FOR UPDATE' in s['sql'] for s in captured)
+
+
+@pytest.mark.django_db
+def test_rules_entry_counters_single_query(django_assert_num_queries, event, position, clist):
+    clist.allow_multiple_entries = True
+    clist.rules = {"and": [
+        {"<": [{"var": "entries_number"}, 10]},
+        {"<": [{"var": "entries_today"}, 10]},
+        {"<": [{"var": "entries_days"}, 10]},
+    ]}
+    clist.save()
+    perform_checkin(position, clist, {})
+    perform_checkin(position, clist, {})
+
+    rule_data = LazyRuleVars(position, clist, now())
+    with django_assert_num_queries(1):
+        assert get_compiled_rules(clist, event)(rule_data)
+    assert rule_data['entries_number'] == 2
+    assert rule_data['entries_today'] == 2
+    assert rule_data['entries_days'] == 1
+
+
+@pytest.mark.django_db
+def test_rules_compiled_cache_invalidation(event, position, clist):
+    clist.rules = {"isAfter": [{"var": "now"}, {"buildTime": ["date_from"]}]}
+    clist.save()
+    event.date_from = now() - timedelta(hours=1)
+    event.save()
+    rules = get_compiled_rules(clist, event)
+    assert rules is get_compiled_rules(clist, event)
+    assert rules(LazyRuleVars(position, clist, now()))
+
+    event.date_from = now() + timedelta(hours=1)
+    event.save()
+    assert not get_compiled_rules(clist, event)(LazyRuleVars(position, clist, now()))
+
+    clist.rules = {"isBefore": [{"var": "now"}, {"buildTime": ["date_from"]}]}
+    clist.save()
+    assert get_compiled_rules(clist, event)(LazyRuleVars(position, clist, now()))
+
+
+@pytest.mark.django_db
+def test_rules_scan_compiled_once(django_assert_num_queries, position, clist):
+    clist.allow_multiple_entries = True
+    clist.rules = {"and": [
+        {"<": [{"var": "entries_number"}, 1000]},
+        {"<": [{"var": "entries_today"}, 1000]},
+        {"<": [{"var": "entries_days"}, 1000]},
+        {"isAfter": [{"var": "now"}, {"buildTime": ["date_from"]}, 10]},
+    ]}
+    clist.save()
+    _compile_rules.cache_clear()
+    perform_checkin(position, clist, {})
+    with CaptureQueriesContext(connection) as ctx:
+        perform_checkin(position, clist, {})
+    for i in range(10):
+        # The number of queries does not grow with the number of entries
+        with django_assert_num_queries(len(ctx.captured_queries)):
+            perform_checkin(position, clist, {})
+    assert position.checkins.count() == 12
+    assert _compile_rules.cache_info().misses == 1
@@ -0,0 +1,173 @@
+import datetime
+import io
+from decimal import Decimal
+
+import pytest
+import pytz
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix.base.exporters.orderlist import OrderListExporter
+from pretix.base.i18n import language
+from pretix.base.models import (
+    CachedFile, Event, Order, OrderFee, OrderPayment, OrderPosition, Organizer,
+    Question, User,
+)
+from pretix.base.services.export import multiexport
+
+
+@pytest.fixture
+def organizer():
+    return Organizer.objects.create(name='Dummy', slug='dummy')
+
+
+@pytest.fixture
+def user(organizer):
+    user = User.objects.create_user('dummy@dummy.dummy', 'dummy')
+    t = organizer.teams.create(all_events=True, can_view_orders=True)
+    t.members.add(user)
+    return user
+
+
+def _create_payment(organizer, slug, code, created):
+    with scopes_disabled():
+        event = Event.objects.create(
+            organizer=organizer, name='Dummy', slug=slug,
+            date_from=now(),
+        )
+        order = Order.objects.create(
+            code=code, event=event, email='dummy@dummy.test',
+            status=Order.STATUS_PAID, datetime=created,
+            expires=now() + datetime.timedelta(days=10),
+            total=Decimal('23.00'), locale='en'
+        )
+        p = order.payments.create(
+            amount=Decimal('23.00'), provider='manual', state=OrderPayment.PAYMENT_STATE_CONFIRMED,
+        )
+        OrderPayment.objects.filter(pk=p.pk).update(created=created)
+        return event
+
+
+@pytest.mark.django_db
+def test_multiexport_sharded(organizer, user):
+    e1 = _create_payment(organizer, 'one', 'FOO', datetime.datetime(2020, 1, 3, 12, 0, 0, tzinfo=pytz.UTC))
+    e2 = _create_payment(organizer, 'two', 'BAR', datetime.datetime(2020, 1, 2, 12, 0, 0, tzinfo=pytz.UTC))
+    e3 = _create_payment(organizer, 'three', 'BAZ', datetime.datetime(2020, 1, 4, 12, 0, 0, tzinfo=pytz.UTC))
+    cf = CachedFile.objects.create()
+
+    multiexport.apply(kwargs={
+        'organizer': organizer.pk,
+        'user': user.pk,
+        'fileid': str(cf.pk),
+        'provider': 'paymentlist',
+        'form_data': {
+            'events': [e1.pk, e2.pk, e3.pk],
+            '_format': 'csv-excel',
+            'payment_states': [OrderPayment.PAYMENT_STATE_CONFIRMED],
+            'refund_states': [],
+        }
+    })
+
+    cf.refresh_from_db()
+    assert cf.filename == 'dummy_payments.csv'
+    lines = cf.file.read().decode().strip().split('\r\n')
+    assert len(lines) == 4
+    assert lines[0].startswith('Event slug,Order,')
+    assert [line.split(',')[0] for line in lines[1:]] == ['two', 'one', 'three']
+    assert lines[1].split(',')[3] == '2020-01-02'
+    assert lines[1].split(',')[7] == '23.00'
+    assert len(lines[1].split(',')) == 9
+
+
+@pytest.mark.django_db
+def test_multiexport_sharded_sorted_across_timezones(organizer, user):
+    # Both payments are created on January 2nd in their event's timezone, the one in Tokyo first
+    e1 = _create_payment(organizer, 'one', 'FOO', datetime.datetime(2020, 1, 2, 10, 0, 0, tzinfo=pytz.UTC))
+    e2 = _create_payment(organizer, 'two', 'BAR', datetime.datetime(2020, 1, 1, 20, 0, 0, tzinfo=pytz.UTC))
+    e2.settings.timezone = 'Asia/Tokyo'
+    cf = CachedFile.objects.create()
+
+    multiexport.apply(kwargs={
+        'organizer': organizer.pk,
+        'user': user.pk,
+        'fileid': str(cf.pk),
+        'provider': 'paymentlist',
+        'form_data': {
+            'events': [e1.pk, e2.pk],
+            '_format': 'csv-excel',
+            'payment_states': [OrderPayment.PAYMENT_STATE_CONFIRMED],
+            'refund_states': [],
+        }
+    })
+
+    cf.refresh_from_db()
+    lines = cf.file.read().decode().strip().split('\r\n')
+    assert [line.split(',')[0] for line in lines[1:]] == ['two', 'one']
+    assert [line.split(',')[3] for line in lines[1:]] == ['2020-01-02', '2020-01-02']
+
+
+def _create_orders(organizer, slug, tax_rate, created):
+    with scopes_disabled():
+        event = Event.objects.create(
+            organizer=organizer, name='Dummy', slug=slug,
+            date_from=now(),
+        )
+        item = event.items.create(name='Ticket', default_price=Decimal('23.00'))
+        q = event.questions.create(question='Question of {}'.format(slug), type=Question.TYPE_STRING)
+        for i, dt in enumerate(created):
+            order = Order.objects.create(
+                code='{}{}'.format(slug.upper(), i), event=event, email='dummy@dummy.test',
+                status=Order.STATUS_PAID, datetime=dt,
+                expires=now() + datetime.timedelta(days=10),
+                total=Decimal('25.00'), locale='en'
+            )
+            p = OrderPosition.objects.create(
+                order=order, item=item, price=Decimal('23.00'), tax_rate=tax_rate, positionid=1,
+            )
+            p.answers.create(question=q, answer='Answer {}'.format(i))
+            OrderPosition.objects.create(order=order, item=item, price=Decimal('23.00'), positionid=2)
+            order.fees.create(fee_type=OrderFee.FEE_TYPE_PAYMENT, value=Decimal('2.00'), tax_rate=tax_rate,
+                              tax_value=Decimal('0.00'))
+        return event
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('fmt', ['orders:default', 'positions:default', 'fees:default', 'xlsx'])
+def test_multiexport_orderlist_sharded_equals_serial(organizer, user, fmt):
+    day = datetime.datetime(2020, 1, 1, 12, 0, 0, tzinfo=pytz.UTC)
+    e1 = _create_orders(organizer, 'one', Decimal('19.00'), [day, day + datetime.timedelta(days=3)])
+    e2 = _create_orders(organizer, 'two', Decimal('7.00'), [day + datetime.timedelta(days=1)])
+    e3 = _create_orders(organizer, 'three', Decimal('0.00'), [day + datetime.timedelta(days=2)])
+    e3.settings.timezone = 'Asia/Tokyo'
+    form_data = {
+        'events': [e1.pk, e2.pk, e3.pk],
+        '_format': fmt,
+        'paid_only': True,
+    }
+    cf = CachedFile.objects.create()
+
+    multiexport.apply(kwargs={
+        'organizer': organizer.pk,
+        'user': user.pk,
+        'fileid': str(cf.pk),
+        'provider': 'orderlist',
+        'form_data': form_data,
+    })
+
+    cf.refresh_from_db()
+    with scopes_disabled(), language(user.locale):
+        ex = OrderListExporter(Event.objects.filter(pk__in=[e1.pk, e2.pk, e3.pk]))
+        filename, filetype, serial = ex.render(form_data)
+    assert cf.filename == filename
+    if fmt == 'xlsx':
+        from openpyxl import load_workbook
+
+        sharded_wb = load_workbook(io.BytesIO(cf.file.read()))
+        serial_wb = load_workbook(io.BytesIO(serial))
+        assert [list(ws.values) for ws in sharded_wb.worksheets] == [list(ws.values) for ws in serial_wb.worksheets]
+    else:
+        sharded = cf.file.read()
+        assert sharded == serial
+        lines = sharded.decode().strip().split('\r\n')
+        assert len(lines) == (9 if fmt.startswith('positions') else 5)
+        assert [line.split(',')[0] for line in lines[1:3]] == ['"one"', '"one"' if fmt.startswith('positions') else '"two"']
@@ -1,22 +1,25 @@
 import json
 from datetime import date, timedelta
 from decimal import Decimal
+from unittest import mock
 
 import pytest
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import DatabaseError, transaction
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 from django_countries.fields import Country
 from django_scopes import scope, scopes_disabled
 
 from pretix.base.models import (
-    Event, Invoice, InvoiceAddress, Item, ItemVariation, Order, OrderPosition,
-    Organizer,
+    Event, Invoice, InvoiceAddress, InvoiceNumberSequence, Item, ItemVariation,
+    Order, OrderPosition, Organizer,
 )
 from pretix.base.models.orders import OrderFee
 from pretix.base.services.invoices import (
     build_preview_invoice_pdf, generate_cancellation, generate_invoice,
-    invoice_pdf_task, invoice_qualified, regenerate_invoice,
+    generate_invoices, invoice_pdf_batch_task, invoice_pdf_task,
+    invoice_qualified, regenerate_invoice,
 )
 from pretix.base.services.orders import OrderChangeManager
 from pretix.base.settings import GlobalSettingsObject
@@ -436,6 +439,111 @@ def test_invoice_number_prefixes(env):
             )
 
 
+def _create_orders(event, count, **kwargs):
+    ticket = event.items.get(name='Early-bird ticket')
+    kwargs.setdefault('status', Order.STATUS_PENDING)
+    orders = []
+    for i in range(count):
+        o = Order.objects.create(
+            event=event, email='dummy@dummy.test',
+            datetime=now(), expires=now() + timedelta(days=10), total=Decimal('23.00'), locale='en', **kwargs
+        )
+        OrderPosition.objects.create(order=o, item=ticket, price=Decimal('23.00'), positionid=1)
+        orders.append(o)
+    return orders
+
+
+@pytest.mark.django_db
+def test_generate_invoices(env):
+    event, order = env
+    assert generate_invoice(order).invoice_no == '00001'
+    orders = _create_orders(event, 3)
+    testorders = _create_orders(event, 2, testmode=True)
+    canceled = _create_orders(event, 1, status=Order.STATUS_CANCELED)
+
+    invoices = generate_invoices(event, orders + testorders + canceled, trigger_pdf=False)
+    assert [i.number for i in invoices] == [
+        'DUMMY-00002', 'DUMMY-00003', 'DUMMY-00004', 'DUMMY-TEST-00001', 'DUMMY-TEST-00002', 'DUMMY-00005'
+    ]
+    assert [i.full_invoice_no for i in invoices] == [i.number for i in invoices]
+    assert all(i.lines.count() == 1 for i in invoices)
+    # canceled is cached on the invoice object from before the cancellation was created
+    assert Invoice.objects.get(pk=invoices[-1].pk).canceled
+    assert Invoice.objects.get(refers=invoices[-1]).number == 'DUMMY-00006'
+    assert generate_invoice(order).invoice_no == '00007'
+
+    event.settings.set('invoice_numbers_consecutive', False)
+    invoices = generate_invoices(event, orders, trigger_pdf=False)
+    assert [i.invoice_no for i in invoices] == ['{}-2'.format(o.code) for o in orders]
+
+
+@pytest.mark.django_db
+def test_invoice_number_sequence_resync(env):
+    event, order = env
+    generate_invoice(order)
+    generate_invoice(order)
+    InvoiceNumberSequence.objects.update(last=0)
+    assert generate_invoice(order).invoice_no == '00003'
+    assert InvoiceNumberSequence.objects.get().last == 3
+
+    # Without a sequence, numbering continues after the existing invoices
+    InvoiceNumberSequence.objects.all().delete()
+    assert generate_invoice(order).invoice_no == '00004'
+
+    assert InvoiceNumberSequence.allocate(event.organizer, 'DUMMY-', 3) == ['00005', '00006', '00007']
+    assert InvoiceNumberSequence.allocate(event.organizer, 'OTHER-', 2) == ['00001', '00002']
+
+
+@pytest.mark.django_db
+def test_pdf_batch_generation(env):
+    event, order = env
+    invoices = generate_invoices(event, [order] + _create_orders(event, 2), trigger_pdf=False)
+    invoice_pdf_batch_task([i.pk for i in invoices])
+    for i in invoices:
+        i.refresh_from_db()
+        assert i.file.name.endswith('.pdf')
+
+
+def _count_queries(fn, *args, **kwargs):
+    with CaptureQueriesContext(connection) as ctx:
+        fn(*args, **kwargs)
+    return [q['sql'] for q in ctx.captured_queries]
+
+
+@pytest.mark.django_db
+def test_generate_invoices_queries(env):
+    event, order = env
+    orders = _create_orders(event, 20)
+
+    serial = _count_queries(lambda: [generate_invoice(o, trigger_pdf=False) for o in orders[:10]])
+    batch = _count_queries(generate_invoices, event, orders[10:], trigger_pdf=False)
+    assert len(batch) < len(serial)
+
+    # The invoice number sequence is only touched once per batch, regardless of its size
+    small = _count_queries(generate_invoices, event, orders[:2], trigger_pdf=False)
+    large = _count_queries(generate_invoices, event, orders, trigger_pdf=False)
+    assert (
+        len([q for q in small if 'invoicenumbersequence' in q]) ==
+        len([q for q in large if 'invoicenumbersequence' in q])
+    )
+
+
+@pytest.mark.django_db
+def test_pdf_batch_reuses_renderer(env):
+    event, order = env
+    invoices = [i.pk for i in generate_invoices(event, _create_orders(event, 10), trigger_pdf=False)]
+
+    with mock.patch.object(Event, 'get_invoice_renderers', autospec=True,
+                           side_effect=Event.get_invoice_renderers) as renderers:
+        for i in invoices[:5]:
+            invoice_pdf_task(i)
+        assert renderers.call_count == 5
+
+        renderers.reset_mock()
+        invoice_pdf_batch_task(invoices[5:])
+        assert renderers.call_count == 1
+
+
 @pytest.mark.django_db
 def test_sales_channels_qualify(env):
     event, order = env
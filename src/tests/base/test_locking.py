@@ -1,6 +1,7 @@
 import time
 
 import pytest
+from django.test import override_settings
 from django.utils.timezone import now
 from django_scopes import scope, scopes_disabled
 
@@ -54,3 +55,109 @@ def test_lock_timeout_steal(event):
     locking.lock_event(ev)
     with pytest.raises(LockReleaseException):
         locking.release_event(event)
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_LOCK_WAIT=0.5)
+def test_lock_wait(event):
+    with event.lock():
+        with scopes_disabled():
+            ev = Event.objects.get(id=event.id)
+        t0 = time.monotonic()
+        with pytest.raises(LockTimeoutException):
+            with ev.lock():
+                pass
+        assert time.monotonic() - t0 >= 0.5
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_LOCK_STRIPES=16)
+def test_locking_stripes_unrelated_quotas(event):
+    with event.lock(quotas=[1]):
+        with scopes_disabled():
+            ev = Event.objects.get(id=event.id)
+        with ev.lock(quotas=[2], vouchers=[3]):
+            pass
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_LOCK_STRIPES=16)
+def test_locking_stripes_same_quota(event):
+    with event.lock(quotas=[1, 2]):
+        with pytest.raises(LockTimeoutException):
+            with scopes_disabled():
+                ev = Event.objects.get(id=event.id)
+            with ev.lock(quotas=[2]):
+                pass
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_LOCK_STRIPES=16)
+def test_locking_stripes_whole_event(event):
+    with event.lock(quotas=[1]):
+        with pytest.raises(LockTimeoutException):
+            with scopes_disabled():
+                ev = Event.objects.get(id=event.id)
+            with ev.lock():
+                pass
+    with event.lock():
+        with pytest.raises(LockTimeoutException):
+            with scopes_disabled():
+                ev = Event.objects.get(id=event.id)
+            with ev.lock(seats=[5]):
+                pass
+    with event.lock(seats=[5]):
+        pass
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_LOCK_STRIPES=16)
+def test_locking_stripes_no_objects(event):
+    with event.lock(quotas=[], vouchers=[], seats=[]):
+        assert locking.lock_event(event)
+        with pytest.raises(LockTimeoutException):
+            with scopes_disabled():
+                ev = Event.objects.get(id=event.id)
+            with ev.lock(quotas=[1]):
+                pass
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_LOCK_STRIPES=16)
+def test_locking_stripes_adjacent_seats_with_distancing(event):
+    seats = [
+        event.seats.create(name="A{}".format(i), seat_guid="A{}".format(i), row_name="A", seat_number=str(i), x=i, y=0)
+        for i in range(1, 20)
+    ]
+    seat1, seat2 = next(
+        (a, b) for a, b in zip(seats, seats[1:])
+        if locking.lock_names(event, seats=[a]) != locking.lock_names(event, seats=[b])
+    )
+    with event.lock(seats=[seat1]):
+        with scopes_disabled():
+            ev = Event.objects.get(id=event.id)
+        with ev.lock(seats=[seat2]):
+            pass
+
+    event.settings.seating_minimal_distance = 1.5
+    with event.lock(seats=[seat1]):
+        with pytest.raises(LockTimeoutException):
+            with scopes_disabled():
+                ev = Event.objects.get(id=event.id)
+            with ev.lock(seats=[seat2]):
+                pass
+
+
+@pytest.mark.django_db
+def test_lock_redis_error_releases_acquired_locks(event):
+    from unittest import mock
+
+    from redis.exceptions import RedisError
+
+    acquired = mock.Mock()
+    acquired.release.side_effect = RedisError()
+    with mock.patch('pretix.base.services.locking._acquire_redis', side_effect=[acquired, RedisError()]):
+        with pytest.raises(LockTimeoutException):
+            locking.lock_event_redis(event, ['{}:0'.format(event.pk), '{}:1'.format(event.pk)])
+    acquired.release.assert_called_once_with()
+    assert getattr(event, '_lock', None) is None
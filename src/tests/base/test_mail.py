@@ -1,14 +1,17 @@
 import os
+import smtplib
 
 import pytest
 from django.conf import settings
 from django.core import mail as djmail
+from django.core.mail.backends.locmem import EmailBackend
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from django_scopes import scope
 
 from pretix.base.models import Event, Organizer, User
-from pretix.base.services.mail import mail
+from pretix.base.services import mail as mail_service
+from pretix.base.services.mail import MailBatch, RateLimiter, mail
 
 
 @pytest.fixture
@@ -102,3 +105,83 @@ def test_sendmail_placeholder(env):
     assert len(djmail.outbox) == 1
     assert djmail.outbox[0].to == [user.email]
     assert djmail.outbox[0].subject == 'Dummy Test subject'
+
+
+class CountingBackend(EmailBackend):
+    def __init__(self, fail=()):
+        super().__init__()
+        self.fail = set(fail)
+        self.connections = 0
+
+    def close(self):
+        self.connections += 1
+
+    def send_messages(self, messages):
+        for m in messages:
+            if m.to[0] in self.fail:
+                self.fail.remove(m.to[0])
+                raise smtplib.SMTPResponseException(421, b'Try again later')
+        return super().send_messages(messages)
+
+
+@pytest.mark.django_db
+def test_mail_batch_reuses_connection(env, monkeypatch):
+    djmail.outbox = []
+    event, user, organizer = env
+    backend = CountingBackend()
+    monkeypatch.setattr(Event, 'get_mail_backend', lambda self, force_custom=False: backend)
+    monkeypatch.setattr(mail_service, 'MAIL_BATCH_SIZE', 3)
+    event.settings.set('mail_prefix', 'test')
+
+    with MailBatch(event) as batch:
+        for i in range(7):
+            mail('dummy{}@dummy.dummy'.format(i), 'Test subject', 'mailtest.txt', {}, event, batch=batch)
+
+    assert [m.to for m in djmail.outbox] == [['dummy{}@dummy.dummy'.format(i)] for i in range(7)]
+    assert all(m.subject == '[test] Test subject' for m in djmail.outbox)
+    assert backend.connections == 3
+
+
+@pytest.mark.django_db
+def test_mail_batch_not_sent_on_exception(env):
+    djmail.outbox = []
+    event, user, organizer = env
+    with pytest.raises(ValueError):
+        with MailBatch(event) as batch:
+            mail('dummy@dummy.dummy', 'Test subject', 'mailtest.txt', {}, event, batch=batch)
+            raise ValueError()
+    assert len(djmail.outbox) == 0
+
+
+@pytest.mark.django_db
+def test_mail_batch_retries_temporary_failure(env, monkeypatch):
+    djmail.outbox = []
+    event, user, organizer = env
+    backend = CountingBackend(fail=['dummy1@dummy.dummy'])
+    monkeypatch.setattr(Event, 'get_mail_backend', lambda self, force_custom=False: backend)
+    monkeypatch.setattr("django.db.transaction.on_commit", lambda t: t())
+
+    with MailBatch(event) as batch:
+        for i in range(3):
+            mail('dummy{}@dummy.dummy'.format(i), 'Test subject', 'mailtest.txt', {}, event, batch=batch)
+
+    assert sorted(m.to[0] for m in djmail.outbox) == ['dummy{}@dummy.dummy'.format(i) for i in range(3)]
+
+
+def test_rate_limiter(monkeypatch):
+    clock = [1000.5]
+    monkeypatch.setattr(mail_service.time, 'time', lambda: clock[0])
+
+    def sleep(seconds):
+        clock[0] += seconds
+    monkeypatch.setattr(mail_service.time, 'sleep', sleep)
+
+    limiter = RateLimiter('test', 2)
+    for i in range(5):
+        limiter.wait()
+    assert clock[0] == 1002
+
+    limiter = RateLimiter('test', 0)
+    for i in range(5):
+        limiter.wait()
+    assert clock[0] == 1002
@@ -10,7 +10,7 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils.timezone import now
 from django_scopes import scope, scopes_disabled
 
@@ -18,7 +18,8 @@ from pretix.base.i18n import language
 from pretix.base.models import (
     CachedFile, CartPosition, Checkin, CheckinList, Event, Item, ItemCategory,
     ItemVariation, Order, OrderFee, OrderPayment, OrderPosition, OrderRefund,
-    Organizer, Question, Quota, SeatingPlan, User, Voucher, WaitingListEntry,
+    Organizer, Question, Quota, QuotaCounter, Seat, SeatingPlan, User,
+    Voucher, WaitingListEntry,
 )
 from pretix.base.models.event import SubEvent
 from pretix.base.models.items import (
@@ -26,6 +27,7 @@ from pretix.base.models.items import (
 )
 from pretix.base.reldate import RelativeDate, RelativeDateWrapper
 from pretix.base.services.orders import OrderError, cancel_order, perform_order
+from pretix.base.services.quotacounters import reconcile_quota_counters
 from pretix.base.services.quotas import QuotaAvailability
 from pretix.testutils.scope import classscope
 
@@ -524,6 +526,136 @@ class QuotaTestCase(BaseQuotaTestCase):
         assert self.quota.availability() == (Quota.AVAILABILITY_ORDERED, 0)
 
 
+@override_settings(PRETIX_QUOTA_COUNTERS='on')
+class CountedQuotaTestCase(QuotaTestCase):
+    """
+    Runs all quota tests again with availability computed from incrementally maintained counters.
+    """
+
+    def setUp(self):
+        super().setUp()
+        reconcile_quota_counters(self.event.pk)
+
+    def _assert_counters_match(self):
+        quotas = list(self.event.quotas.all())
+        with override_settings(PRETIX_QUOTA_COUNTERS='off'):
+            qa_db = QuotaAvailability(full_results=True)
+            qa_db.queue(*quotas)
+            qa_db.compute()
+        qa_counted = QuotaAvailability(full_results=True)
+        qa_counted.queue(*quotas)
+        qa_counted.compute()
+        assert qa_db.results == qa_counted.results
+        assert qa_db.count_paid_orders == qa_counted.count_paid_orders
+        assert qa_db.count_pending_orders == qa_counted.count_pending_orders
+        assert qa_db.count_waitinglist == qa_counted.count_waitinglist
+
+    @classscope(attr='o')
+    def test_counters_used(self):
+        self.quota.items.add(self.item1)
+        self.quota.size = 5
+        self.quota.save()
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3), total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        # Manipulate the counter to make sure it is actually used
+        QuotaCounter.objects.filter(event=self.event, kind=Order.STATUS_PAID).update(count=3)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 2)
+
+    @classscope(attr='o')
+    def test_counters_ignored_if_not_reconciled(self):
+        self.quota.items.add(self.item1)
+        self.quota.size = 5
+        self.quota.save()
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3), total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        QuotaCounter.objects.filter(event=self.event, kind=QuotaCounter.KIND_RECONCILED).delete()
+        QuotaCounter.objects.filter(event=self.event, kind=Order.STATUS_PAID).update(count=3)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 4)
+
+    @classscope(attr='o')
+    def test_verify_falls_back_to_database(self):
+        self.quota.items.add(self.item1)
+        self.quota.size = 5
+        self.quota.save()
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3), total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        QuotaCounter.objects.filter(event=self.event, kind=Order.STATUS_PAID).update(count=3)
+        with override_settings(PRETIX_QUOTA_COUNTERS='verify'):
+            assert self.quota.availability() == (Quota.AVAILABILITY_OK, 4)
+        # The mismatch triggered a repair
+        assert QuotaCounter.objects.get(event=self.event, kind=Order.STATUS_PAID).count == 1
+
+    @classscope(attr='o')
+    def test_order_lifecycle(self):
+        self.quota.items.add(self.item1, self.item2)
+        self.quota.variations.add(self.var1, self.var2)
+        self.quota.size = 10
+        self.quota.save()
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PENDING,
+                                     expires=now() + timedelta(days=3), total=4)
+        p1 = OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        p2 = OrderPosition.objects.create(order=order, item=self.item2, variation=self.var1, price=2)
+        self._assert_counters_match()
+
+        order.status = Order.STATUS_PAID
+        order.save()
+        self._assert_counters_match()
+
+        p2.variation = self.var2
+        p2.save()
+        self._assert_counters_match()
+
+        p1.canceled = True
+        p1.save(update_fields=['canceled'])
+        self._assert_counters_match()
+
+        order.status = Order.STATUS_CANCELED
+        order.save(update_fields=['status'])
+        self._assert_counters_match()
+
+        order.status = Order.STATUS_PENDING
+        order.save()
+        self._assert_counters_match()
+
+        p2.delete()
+        self._assert_counters_match()
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 10)
+
+    @classscope(attr='o')
+    def test_waitinglist_lifecycle(self):
+        self.quota.items.add(self.item1)
+        self.quota.size = 10
+        self.quota.save()
+        w1 = WaitingListEntry.objects.create(event=self.event, item=self.item1, email='foo@bar.com')
+        WaitingListEntry.objects.create(event=self.event, item=self.item1, email='bar@bar.com')
+        self._assert_counters_match()
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 8)
+
+        w1.voucher = Voucher.objects.create(event=self.event, item=self.item1)
+        w1.save()
+        self._assert_counters_match()
+
+        w1.delete()
+        self._assert_counters_match()
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 9)
+
+    @classscope(attr='o')
+    def test_reconcile_repairs_counters(self):
+        self.quota.items.add(self.item1)
+        self.quota.size = 5
+        self.quota.save()
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3), total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        QuotaCounter.objects.filter(event=self.event, kind=Order.STATUS_PAID).update(count=3)
+        reconcile_quota_counters(self.event.pk)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 4)
+        self._assert_counters_match()
+
+
 class CheckinQuotaTestCase(BaseQuotaTestCase):
 
     @scopes_disabled()
@@ -2321,6 +2453,55 @@ class SeatingTestCase(TestCase):
         assert self.seat_a1.is_available()
 
 
+def _create_stadium(event, ticket, rows, seats_per_row, take_every):
+    Seat.objects.bulk_create([
+        Seat(event=event, name='{}-{}'.format(r, s), row_name=str(r), seat_guid='{}-{}'.format(r, s),
+             product=ticket, x=s * 1.0, y=r * 1.5)
+        for r in range(rows) for s in range(seats_per_row)
+    ])
+    seats = list(event.seats.order_by('pk'))
+    Voucher.objects.bulk_create([
+        Voucher(event=event, code='S{}'.format(seat.pk), item=ticket, seat=seat)
+        for seat in seats[::take_every]
+    ])
+    return seats, set(seats[::take_every])
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("within_row", [False, True])
+def test_free_seats_minimal_distance(within_row):
+    organizer = Organizer.objects.create(name='Dummy', slug='dummy')
+    with scope(organizer=organizer):
+        event = Event.objects.create(organizer=organizer, name='Dummy', slug='dummy', date_from=now())
+        event.settings.seating_minimal_distance = 2.5
+        event.settings.seating_distance_within_row = within_row
+        ticket = event.items.create(name="Ticket", default_price=12)
+        seats, taken = _create_stadium(event, ticket, 20, 30, 7)
+
+        expected = {
+            s for s in seats
+            if s not in taken and not any(
+                (t.x - s.x) ** 2 + (t.y - s.y) ** 2 < 2.5 ** 2 and (not within_row or t.row_name == s.row_name)
+                for t in taken
+            )
+        }
+        assert set(event.free_seats()) == expected
+        assert {s for s in seats if s.is_available()} == expected
+
+
+@pytest.mark.django_db
+def test_free_seats_minimal_distance_stadium():
+    organizer = Organizer.objects.create(name='Dummy', slug='dummy')
+    with scope(organizer=organizer):
+        event = Event.objects.create(organizer=organizer, name='Dummy', slug='dummy', date_from=now())
+        event.settings.seating_minimal_distance = 2.5
+        ticket = event.items.create(name="Ticket", default_price=12)
+        _create_stadium(event, ticket, 100, 200, 11)
+
+        free = len(event.free_seats())
+        assert 0 < free < 20000
+
+
 @pytest.mark.django_db
 @pytest.mark.parametrize("qtype,answer,expected", [
     (Question.TYPE_STRING, "a", "a"),
@@ -0,0 +1,155 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.test import override_settings
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix.base.models import Event, Order, Organizer
+from pretix.base.services import ordercodes
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args):
+            self.commands.append((getattr(self.redis, name), args))
+            return self
+        return queue
+
+    def execute(self):
+        return [command(*args) for command, args in self.commands]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.sets = {}
+        self.keys = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def spop(self, key):
+        s = self.sets.get(key)
+        return s.pop().encode() if s else None
+
+    def scard(self, key):
+        return len(self.sets.get(key, ()))
+
+    def sadd(self, key, *values):
+        s = self.sets.setdefault(key, set())
+        before = len(s)
+        s.update(values)
+        return len(s) - before
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = value
+        return True
+
+    def delete(self, key):
+        self.keys.pop(key, None)
+
+    def expire(self, key, timeout):
+        pass
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    r = FakeRedis()
+    monkeypatch.setattr(ordercodes, '_redis', lambda: r)
+    return r
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    with scopes_disabled():
+        event = Event.objects.create(
+            organizer=o, name='Dummy', slug='dummy',
+            date_from=now(),
+        )
+        yield event
+
+
+def _order(event, **kwargs):
+    return Order(
+        event=event, email='dummy@dummy.test', status=Order.STATUS_PENDING, datetime=now(),
+        expires=now() + timedelta(days=10), total=Decimal('0.00'), **kwargs
+    )
+
+
+@pytest.mark.django_db
+@override_settings(HAS_REDIS=True, PRETIX_ORDER_CODE_POOL=20)
+def test_pool_skips_used_codes(event, fake_redis, monkeypatch):
+    _order(event, code='AAAAA').save()
+    codes = iter(['AAAAA'] + ['B{:04d}'.format(i) for i in range(100)])
+    monkeypatch.setattr(Order, 'generate_code', staticmethod(lambda length: next(codes)))
+
+    ordercodes.refill_order_code_pool(event.organizer.pk)
+    pool = fake_redis.sets[ordercodes._pool_key(event.organizer.pk)]
+    assert len(pool) == 20
+    assert 'AAAAA' not in pool
+
+    o = _order(event)
+    o.assign_code()
+    assert o.code in set('B{:04d}'.format(i) for i in range(100))
+    assert o.code not in pool
+
+
+@pytest.mark.django_db
+@override_settings(HAS_REDIS=True, PRETIX_ORDER_CODE_POOL=20)
+def test_pool_assignment_without_queries(event, fake_redis, django_assert_num_queries):
+    ordercodes.refill_order_code_pool(event.organizer.pk)
+    o = _order(event)
+    with django_assert_num_queries(0):
+        o.assign_code()
+    assert o.code
+
+
+@pytest.mark.django_db
+@override_settings(HAS_REDIS=True, PRETIX_ORDER_CODE_POOL=20)
+def test_pool_skips_codes_claimed_the_old_way(event, fake_redis, monkeypatch):
+    # Claimed for an order that is created the old way, but not saved yet
+    assert ordercodes.claim_code(event.organizer, 'AAAAA')
+    assert not ordercodes.claim_code(event.organizer, 'AAAAA')
+    codes = iter(['AAAAA'] + ['B{:04d}'.format(i) for i in range(100)])
+    monkeypatch.setattr(Order, 'generate_code', staticmethod(lambda length: next(codes)))
+
+    ordercodes.refill_order_code_pool(event.organizer.pk)
+    pool = fake_redis.sets[ordercodes._pool_key(event.organizer.pk)]
+    assert len(pool) == 20
+    assert 'AAAAA' not in pool
+    assert not ordercodes.claim_code(event.organizer, next(iter(pool)))
+
+
+@pytest.mark.django_db
+@override_settings(HAS_REDIS=True, PRETIX_ORDER_CODE_POOL=20)
+def test_pool_refilled_when_low(event, fake_redis):
+    key = ordercodes._pool_key(event.organizer.pk)
+    codes = set()
+    for i in range(30):
+        o = _order(event)
+        o.save()
+        codes.add(o.code)
+    assert len(codes) == 30
+    # The first order used the old way and triggered the initial fill, later refills happen once the pool runs low
+    assert 5 <= len(fake_redis.sets[key]) <= 20
+    assert not fake_redis.keys
+    assert not Order.objects.filter(code__in=fake_redis.sets[key]).exists()
+
+
+@pytest.mark.django_db
+@override_settings(HAS_REDIS=True, PRETIX_ORDER_CODE_POOL=20)
+def test_claimed_codes_not_assigned_in_test_mode(event, fake_redis, monkeypatch):
+    fake_redis.sadd(ordercodes._claims_key(event.organizer.pk), 'A0AAA')
+    codes = iter(['AAAAA', 'BBBBB'])
+    monkeypatch.setattr(Order, 'generate_code', staticmethod(lambda length: next(codes)))
+    o = _order(event, testmode=True)
+    o.assign_code()
+    assert o.code == 'B0BBB'
@@ -4,14 +4,18 @@ from io import StringIO
 
 import pytest
 from django.core.files.base import ContentFile
+from django.db.models import Sum
+from django.test import override_settings
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
 from i18nfield.strings import LazyI18nString
 
 from pretix.base.models import (
-    CachedFile, Event, Item, Order, OrderPayment, OrderPosition, Organizer,
-    Question, QuestionAnswer, User,
+    CachedFile, Event, InvoiceAddress, Item, LogEntry, Order, OrderPayment,
+    OrderPosition, OrderSearchDocument, Organizer, Question, QuestionAnswer,
+    QuotaCounter, StatisticsOrderRollup, StatisticsRollup, User,
 )
+from pretix.base.services import orderimport
 from pretix.base.services.orderimport import DataImportError, import_orders
 
 
@@ -685,4 +689,131 @@ def test_import_question_valid(user, event, item):
     assert a3.question == q
     assert set(a3.options.all()) == {o1, o2}
 
+
+@pytest.mark.django_db
+@scopes_disabled()
+def test_import_in_chunks(user, event, item, monkeypatch):
+    monkeypatch.setattr(orderimport, 'IMPORT_CHUNK_SIZE', 2)
+    settings = dict(DEFAULT_SETTINGS)
+    q1 = event.questions.create(question='Foo', type=Question.TYPE_CHOICE_MULTIPLE)
+    o1 = q1.options.create(answer='Foo', identifier='Foo')
+    o2 = q1.options.create(answer='Bar', identifier='Bar')
+    q2 = event.questions.create(question='Bar', type=Question.TYPE_STRING)
+    settings['item'] = 'static:{}'.format(item.pk)
+    settings['attendee_email'] = 'csv:C'
+    settings['question_{}'.format(q1.pk)] = 'csv:I'
+    settings['question_{}'.format(q2.pk)] = 'csv:E'
+
+    import_orders.apply(
+        args=(event.pk, inputfile_factory().id, settings, 'en', user.pk)
+    ).get()
+    assert event.orders.count() == 3
+    assert len({o.code for o in event.orders.all()}) == 3
+    assert OrderPayment.objects.filter(order__event=event, provider='manual').count() == 3
+    assert InvoiceAddress.objects.filter(order__event=event).count() == 3
+    assert LogEntry.objects.filter(action_type='pretix.event.order.placed').count() == 3
+    assert QuestionAnswer.objects.filter(question=q1).count() == 3
+    assert QuestionAnswer.objects.filter(question=q2).count() == 3
+    p = OrderPosition.objects.get(attendee_email__isnull=True)
+    assert set(p.answers.get(question=q1).options.all()) == {o1, o2}
+    assert p.answers.get(question=q2).answer == 'Baz'
+
+
+@pytest.mark.django_db
+@scopes_disabled()
+def test_import_nothing_if_last_row_invalid(user, event, item, monkeypatch):
+    monkeypatch.setattr(orderimport, 'IMPORT_CHUNK_SIZE', 1)
+    settings = dict(DEFAULT_SETTINGS)
+    settings['item'] = 'static:{}'.format(item.pk)
+    settings['price'] = 'csv:A'
+    c = CachedFile.objects.create(type="text/csv", filename="input.csv")
+    c.file.save("input.csv", ContentFile("A,B\r1.00,x\r2.00,y\rfoo,z\r".encode()))
+
+    with pytest.raises(DataImportError) as excinfo:
+        import_orders.apply(
+            args=(event.pk, c.id, settings, 'en', user.pk)
+        ).get()
+    assert 'in line "3"' in str(excinfo.value)
+    assert not event.orders.exists()
+
+
+@pytest.mark.django_db
+@scopes_disabled()
+def test_import_reports_imported_rows_on_failure(user, event, item, monkeypatch):
+    monkeypatch.setattr(orderimport, 'IMPORT_CHUNK_SIZE', 1)
+    save_orders = orderimport._save_orders
+    calls = []
+
+    def fail_second_chunk(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise ValueError()
+        save_orders(*args, **kwargs)
+
+    monkeypatch.setattr(orderimport, '_save_orders', fail_second_chunk)
+    settings = dict(DEFAULT_SETTINGS)
+    settings['item'] = 'static:{}'.format(item.pk)
+    settings['price'] = 'csv:A'
+    c = CachedFile.objects.create(type="text/csv", filename="input.csv")
+    c.file.save("input.csv", ContentFile("A,B\r1.00,x\r2.00,y\r3.00,z\r".encode()))
+
+    with pytest.raises(DataImportError) as excinfo:
+        import_orders.apply(
+            args=(event.pk, c.id, settings, 'en', user.pk)
+        ).get()
+    assert 'after 1 of 3 rows' in str(excinfo.value)
+    assert event.orders.count() == 1
+
+
+@pytest.mark.django_db
+@scopes_disabled()
+def test_import_mac_line_breaks(user, event, item):
+    settings = dict(DEFAULT_SETTINGS)
+    settings['item'] = 'static:{}'.format(item.pk)
+    settings['price'] = 'csv:A'
+    c = CachedFile.objects.create(type="text/csv", filename="input.csv")
+    c.file.save("input.csv", ContentFile("A,B\r1.00,x\r2.00,y\r".encode()))
+
+    import_orders.apply(
+        args=(event.pk, c.id, settings, 'en', user.pk)
+    ).get()
+    assert sorted(event.orders.values_list('total', flat=True)) == [Decimal('1.00'), Decimal('2.00')]
+
 # TODO: validate question
+
+
+@pytest.mark.django_db
+@scopes_disabled()
+def test_import_non_utf8(user, event, item):
+    settings = dict(DEFAULT_SETTINGS)
+    settings['item'] = 'static:{}'.format(item.pk)
+    settings['attendee_name_full_name'] = 'csv:A'
+    c = CachedFile.objects.create(type="text/csv", filename="input.csv")
+    c.file.save("input.csv", ContentFile("A,B\r\nJürgen Müller,x\r\nGünther Weiß,y\r\n".encode('cp1252')))
+
+    import_orders.apply(
+        args=(event.pk, c.id, settings, 'en', user.pk)
+    ).get()
+    assert sorted(OrderPosition.objects.filter(order__event=event).values_list('attendee_name_cached', flat=True)) == [
+        'Günther Weiß', 'Jürgen Müller'
+    ]
+
+
+@pytest.mark.django_db
+@scopes_disabled()
+@override_settings(PRETIX_QUOTA_COUNTERS='on', PRETIX_STATISTICS_ROLLUPS=True, PRETIX_SEARCH_INDEX=True)
+def test_import_updates_counters_rollups_and_search_index(user, event, item, monkeypatch):
+    monkeypatch.setattr("django.db.transaction.on_commit", lambda t: t())
+    settings = dict(DEFAULT_SETTINGS)
+    settings['item'] = 'static:{}'.format(item.pk)
+    settings['attendee_email'] = 'csv:C'
+
+    import_orders.apply(
+        args=(event.pk, inputfile_factory().id, settings, 'en', user.pk)
+    ).get()
+    assert QuotaCounter.objects.get(event=event, item_id=item.pk, kind=Order.STATUS_PAID).count == 3
+    assert StatisticsRollup.objects.filter(event=event, item_id=item.pk).aggregate(s=Sum('count'))['s'] == 3
+    assert StatisticsOrderRollup.objects.filter(
+        event=event, paid_day__gt=StatisticsRollup.NO_DAY
+    ).aggregate(s=Sum('count'))['s'] == 3
+    assert OrderSearchDocument.objects.filter(position__attendee_email='daniel@example.org').exists()
@@ -1,3 +1,7 @@
+import gc
+import weakref
+from unittest import mock
+
 import pytest
 from django.conf import settings
 from django.test import TestCase
@@ -48,3 +52,56 @@ class PluginSignalTest(TestCase):
         responses = register_ticket_outputs.send(self.event, **payload)
         self.assertEqual(len(responses), 1)
         self.assertIn('tests.testdummy.signals', [r[0].__module__ for r in responses])
+
+    def test_plan_cached_per_plugin_set(self):
+        self.event.plugins = 'tests.testdummy'
+        register_ticket_outputs._active_receivers(self.event)
+        plan = register_ticket_outputs._plans[frozenset(self.event.get_plugins())]
+        register_ticket_outputs._active_receivers(self.event)
+        self.assertIs(plan, register_ticket_outputs._plans[frozenset(self.event.get_plugins())])
+        self.event.plugins = ''
+        self.assertEqual(register_ticket_outputs._active_receivers(self.event), [])
+        self.event.plugins = 'tests.testdummy'
+        register_ticket_outputs._active_receivers(self.event)
+        self.assertIs(plan, register_ticket_outputs._plans[frozenset(self.event.get_plugins())])
+
+    def test_plan_invalidated_on_connect(self):
+        self.event.plugins = ''
+        self.assertEqual(len(register_ticket_outputs.send(self.event)), 0)
+
+        def receiver(sender, **kwargs):
+            return 'core'
+        receiver.__module__ = 'pretix.base.models'
+
+        register_ticket_outputs.connect(receiver, dispatch_uid='test_plan_invalidated_on_connect')
+        try:
+            self.assertEqual([r[1] for r in register_ticket_outputs.send(self.event)], ['core'])
+        finally:
+            register_ticket_outputs.disconnect(dispatch_uid='test_plan_invalidated_on_connect')
+        self.assertEqual(len(register_ticket_outputs.send(self.event)), 0)
+
+    def test_plan_does_not_keep_receivers_alive(self):
+        self.event.plugins = ''
+
+        def receiver(sender, **kwargs):
+            return 'core'
+        receiver.__module__ = 'pretix.base.models'
+
+        register_ticket_outputs.connect(receiver)
+        self.assertEqual([r[1] for r in register_ticket_outputs.send(self.event)], ['core'])
+        ref = weakref.ref(receiver)
+        del receiver
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertEqual(len(register_ticket_outputs.send(self.event)), 0)
+
+    def test_send_resolves_receivers_once(self):
+        self.event.plugins = 'tests.testdummy,pretix.plugins.banktransfer'
+        register_ticket_outputs._plans.clear()
+        with mock.patch.object(register_ticket_outputs, '_is_active', wraps=register_ticket_outputs._is_active) as m:
+            responses = register_ticket_outputs.send(self.event)
+            calls = m.call_count
+            self.assertGreater(calls, 0)
+            for i in range(10):
+                self.assertEqual(register_ticket_outputs.send(self.event), responses)
+            self.assertEqual(m.call_count, calls)
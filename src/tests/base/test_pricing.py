@@ -3,10 +3,13 @@ from decimal import Decimal
 import pytest
 from django.utils.timezone import now
 from django_countries.fields import Country
+from django_scopes import scopes_disabled
 
-from pretix.base.models import Event, InvoiceAddress, Organizer
+from pretix.base.models import CartPosition, Event, InvoiceAddress, Organizer
 from pretix.base.models.items import SubEventItem, SubEventItemVariation
-from pretix.base.services.pricing import get_price
+from pretix.base.services.pricing import (
+    PriceSpec, PricingContext, get_price, get_prices,
+)
 
 
 @pytest.fixture
@@ -325,3 +328,76 @@ def test_tax_reverse_charge_invalid_vat_id(item):
     )
     assert not item.tax_rule.is_reverse_charge(ia)
     assert get_price(item, invoice_address=ia).gross == Decimal('119.00')
+
+
+@pytest.mark.django_db
+@scopes_disabled()
+def test_get_prices_matches_get_price(event, item, variation, subevent):
+    tr = event.tax_rules.create(rate=Decimal('19.00'), eu_reverse_charge=True, home_country=Country('DE'))
+    item.tax_rule = tr
+    item.free_price = True
+    item.save()
+    variation.default_price = Decimal('30.00')
+    variation.save()
+    SubEventItem.objects.create(item=item, subevent=subevent, price=Decimal('24.00'))
+    SubEventItemVariation.objects.create(variation=variation, subevent=subevent, price=Decimal('31.00'))
+    voucher = event.vouchers.create(price_mode='percent', value=Decimal('10.00'))
+
+    category = event.categories.create(name='Add-ons', is_addon=True)
+    addon = event.items.create(name='Add-on', default_price=Decimal('5.00'), category=category, tax_rule=tr)
+    base = event.items.create(name='Base', default_price=Decimal('50.00'))
+    base.addons.create(addon_category=category, price_included=True)
+    other = event.items.create(name='Other base', default_price=Decimal('50.00'))
+    other.addons.create(addon_category=category)
+
+    specs = [
+        PriceSpec(item),
+        PriceSpec(item, variation),
+        PriceSpec(item, subevent=subevent),
+        PriceSpec(item, variation, subevent=subevent),
+        PriceSpec(item, voucher=voucher),
+        PriceSpec(item, voucher=voucher, max_discount=Decimal('1.00')),
+        PriceSpec(item, custom_price=Decimal('40.00')),
+        PriceSpec(item, custom_price='40,00', custom_price_is_net=True),
+        PriceSpec(item, custom_price=Decimal('12.00'), force_custom_price=True),
+        PriceSpec(item, bundled_sum=Decimal('10.00')),
+        PriceSpec(item, bundled_sum=Decimal('100.00')),
+        PriceSpec(item, tax_rule=event.tax_rules.create(rate=Decimal('7.00'))),
+        PriceSpec(addon, addon_to=CartPosition(item=base)),
+        PriceSpec(addon, addon_to=CartPosition(item=other)),
+        PriceSpec(base),
+    ]
+    addresses = [
+        None,
+        InvoiceAddress(is_business=True, vat_id='EU1234', vat_id_validated=True, country=Country('BE')),
+    ]
+    for ia in addresses:
+        prices = get_prices(specs, PricingContext(event, ia))
+        for spec, price in zip(specs, prices):
+            expected = get_price(invoice_address=ia, **spec._asdict())
+            assert (price.gross, price.net, price.tax, price.rate, price.name) == (
+                expected.gross, expected.net, expected.tax, expected.rate, expected.name
+            ), spec
+
+
+@pytest.mark.django_db
+@scopes_disabled()
+def test_get_prices_queries(event, item, subevent, django_assert_max_num_queries):
+    item.tax_rule = event.tax_rules.create(rate=Decimal('19.00'))
+    item.save()
+    category = event.categories.create(name='Add-ons', is_addon=True)
+    addon = event.items.create(name='Add-on', default_price=Decimal('5.00'), category=category)
+    item.addons.create(addon_category=category)
+    specs = []
+    for i in range(50):
+        specs.append(PriceSpec(event.items.get(pk=item.pk), subevent=subevent))
+        specs.append(PriceSpec(addon, subevent=subevent, addon_to=CartPosition(item=item)))
+
+    context = PricingContext(event)
+    with django_assert_max_num_queries(4):
+        prices = get_prices(specs, context)
+    assert [p.gross for p in prices[:2]] == [Decimal('23.00'), Decimal('5.00')]
+
+    # Everything is loaded, so pricing the same positions again does not need the database
+    with django_assert_max_num_queries(0):
+        assert [p.gross for p in get_prices(specs, context)] == [p.gross for p in prices]
@@ -0,0 +1,156 @@
+import datetime
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from freezegun import freeze_time
+
+from pretix.base.models import (
+    Event, InvoiceAddress, Item, Order, OrderPosition, OrderSearchDocument,
+    Organizer,
+)
+from pretix.base.services.search import reindex_modified_orders
+from pretix.control.forms.filter import (
+    CheckInFilterForm, EventOrderFilterForm,
+)
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    with scopes_disabled():
+        event = Event.objects.create(
+            organizer=o, name='Dummy', slug='dummy',
+            date_from=now(),
+        )
+        yield event
+
+
+@pytest.fixture
+def orders(event):
+    ticket = Item.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+    voucher = event.vouchers.create(code='SUMMERSALE')
+    o1 = Order.objects.create(
+        code='FOO12', event=event, email='alice@example.org', status=Order.STATUS_PAID, datetime=now(),
+        expires=now() + datetime.timedelta(days=10), total=Decimal('46.00'), comment='Wheelchair access'
+    )
+    InvoiceAddress.objects.create(order=o1, name_parts={'_scheme': 'full', 'full_name': 'Alice Accounting'}, company='Umbrella Corp')
+    OrderPosition.objects.create(
+        order=o1, item=ticket, price=Decimal('23.00'), attendee_name_parts={'full_name': 'Bob Builder'},
+        secret='abcdefghijk', voucher=voucher
+    )
+    OrderPosition.objects.create(
+        order=o1, item=ticket, price=Decimal('23.00'), attendee_name_parts={'full_name': 'Carla Canceled'},
+        secret='zyxwvutsrqp', canceled=True
+    )
+    o2 = Order.objects.create(
+        code='BAR34', event=event, email='dave@example.com', status=Order.STATUS_PENDING, datetime=now(),
+        expires=now() + datetime.timedelta(days=10), total=Decimal('23.00'),
+    )
+    OrderPosition.objects.create(
+        order=o2, item=ticket, price=Decimal('23.00'), attendee_name_parts={'full_name': 'Erin Example'},
+        attendee_email='erin@example.net', secret='1234567890'
+    )
+    return o1, o2
+
+
+QUERIES = [
+    'alice', 'EXAMPLE.ORG', 'accounting', 'umbrella', 'wheelchair', 'bob', 'carla', 'erin@', 'abcdef', 'cdef',
+    'summer', 'sale', 'foo', 'example', 'nothing',
+]
+
+
+def _order_codes(event, query):
+    form = EventOrderFilterForm(data={'query': query}, event=event)
+    assert form.is_valid()
+    return sorted(form.filter_qs(event.orders.all()).values_list('code', flat=True))
+
+
+def _position_secrets(event, query):
+    form = CheckInFilterForm(data={'user': query}, event=event, list=event.checkin_lists.create(name='Default'))
+    assert form.is_valid()
+    return sorted(form.filter_qs(OrderPosition.objects.filter(order__event=event)).values_list('secret', flat=True))
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_SEARCH_INDEX=True)
+def test_search_index_matches_queries(event, orders):
+    call_command('rebuild_search_index', event=[event.pk])
+    assert OrderSearchDocument.objects.count() == 5
+
+    for query in QUERIES:
+        with override_settings(PRETIX_SEARCH_INDEX=False):
+            expected = _order_codes(event, query)
+        assert _order_codes(event, query) == expected, query
+
+    # Without the index, digits in the query are normalized as if they were mistyped letters, so only the index finds
+    # the order code as it was given
+    assert _order_codes(event, 'bar34') == ['BAR34']
+
+    assert _position_secrets(event, 'abcdef') == ['abcdefghijk']
+    assert _position_secrets(event, 'cdef') == []
+    assert _position_secrets(event, 'example.net') == ['1234567890']
+    assert _position_secrets(event, 'umbrella') == ['abcdefghijk']
+    assert _position_secrets(event, 'bar') == ['1234567890']
+    assert _position_secrets(event, 'wheelchair') == []
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(PRETIX_SEARCH_INDEX=True)
+def test_search_index_follows_changes(event, orders):
+    o1, o2 = orders
+    with scopes_disabled():
+        call_command('rebuild_search_index')
+        assert _order_codes(event, 'erin') == ['BAR34']
+
+        with transaction.atomic():
+            p = o2.positions.get()
+            p.attendee_name_parts = {'full_name': 'Frank Fresh'}
+            p.attendee_email = 'frank@example.net'
+            p.save()
+            o2.email = 'frank@example.com'
+            o2.save()
+            assert _order_codes(event, 'frank') == []
+        assert _order_codes(event, 'frank') == ['BAR34']
+        assert _order_codes(event, 'erin') == []
+        assert OrderSearchDocument.objects.filter(order=o2).count() == 2
+
+        try:
+            with transaction.atomic():
+                o1.invoice_address.company = 'Initech'
+                o1.invoice_address.save()
+                raise ValueError()
+        except ValueError:
+            pass
+        assert _order_codes(event, 'initech') == []
+        assert _order_codes(event, 'umbrella') == ['FOO12']
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_SEARCH_INDEX=True, CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'search-index',
+    }
+})
+def test_periodic_reindex_since_previous_run(event, orders):
+    o1, o2 = orders
+    cache.clear()
+    with scopes_disabled():
+        with freeze_time("2020-01-01 10:00:00+00:00"):
+            Order.objects.filter(pk=o1.pk).update(email='frank@example.org', last_modified=now())
+        with freeze_time("2020-01-01 10:02:00+00:00"):
+            reindex_modified_orders(sender=None)
+        assert _order_codes(event, 'frank') == ['FOO12']
+
+        with freeze_time("2020-01-01 10:05:00+00:00"):
+            Order.objects.filter(pk=o2.pk).update(email='grace@example.org', last_modified=now())
+            with mock.patch('pretix.base.services.search.reindex_orders') as reindex:
+                reindex_modified_orders(sender=None)
+            assert list(reindex.call_args[0][0]) == [o2.pk]
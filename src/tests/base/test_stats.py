@@ -0,0 +1,214 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+import pytz
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix.base.models import (
+    Event, Item, Order, OrderPayment, OrderPosition, Organizer,
+    StatisticsOrderRollup, StatisticsRollup,
+)
+from pretix.base.services.rollups import (
+    get_rollup_order_days, rebuild_rollups,
+)
+from pretix.base.services.stats import order_overview
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    with scopes_disabled():
+        event = Event.objects.create(
+            organizer=o, name='Dummy', slug='dummy',
+            date_from=now(),
+        )
+        event.settings.timezone = 'Europe/Berlin'
+        yield event
+
+
+@pytest.fixture
+def items(event):
+    ticket = Item.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+    shirt = Item.objects.create(event=event, name='T-Shirt', default_price=12)
+    var = shirt.variations.create(value='S')
+    return ticket, shirt, var
+
+
+def _create_order(event, code, status, dt, positions):
+    order = Order.objects.create(
+        code=code, event=event, email='dummy@dummy.test', status=status, datetime=dt,
+        expires=now() + datetime.timedelta(days=10), total=Decimal('0.00'),
+    )
+    for item, variation, price in positions:
+        OrderPosition.objects.create(
+            order=order, item=item, variation=variation, price=price, tax_value=price * Decimal('0.19'),
+            tax_rate=Decimal('19.00'),
+        )
+    return order
+
+
+def _overview(event, **kwargs):
+    items_by_category, total = order_overview(event, **kwargs)
+    return [
+        (item.pk, item.num)
+        for cat, items in items_by_category for item in items
+    ], total['num']
+
+
+def _assert_rollups_match(event, **kwargs):
+    with override_settings(PRETIX_STATISTICS_ROLLUPS=False):
+        expected = _overview(event, **kwargs)
+    assert _overview(event, **kwargs) == expected
+
+
+def _assert_order_days_match(event):
+    tz = event.timezone
+    ordered_by_day = {}
+    paid_by_day = {}
+    for o in Order.objects.filter(event=event):
+        day = o.datetime.astimezone(tz).date()
+        ordered_by_day[day] = ordered_by_day.get(day, 0) + 1
+        payment_dates = [
+            p.payment_date for p in o.payments.filter(
+                state__in=(OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED)
+            ) if p.payment_date
+        ]
+        if payment_dates:
+            day = max(payment_dates).astimezone(tz).date()
+            paid_by_day[day] = paid_by_day.get(day, 0) + 1
+    assert get_rollup_order_days(event) == (ordered_by_day, paid_by_day)
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_STATISTICS_ROLLUPS=True)
+def test_rollups_follow_order_changes(event, items):
+    ticket, shirt, var = items
+    o1 = _create_order(event, 'FOO', Order.STATUS_PENDING, datetime.datetime(2020, 1, 1, 23, 30, tzinfo=pytz.UTC), [
+        (ticket, None, Decimal('23.00')), (ticket, None, Decimal('23.00')), (shirt, var, Decimal('12.00')),
+    ])
+    o2 = _create_order(event, 'BAR', Order.STATUS_PAID, datetime.datetime(2020, 1, 2, 10, 0, tzinfo=pytz.UTC), [
+        (ticket, None, Decimal('20.00')),
+    ])
+    rebuild_rollups(event)
+    assert set(StatisticsRollup.objects.filter(event=event, status=Order.STATUS_PENDING).values_list('day', flat=True)) == {
+        datetime.date(2020, 1, 2)
+    }
+    _assert_rollups_match(event)
+
+    o1.status = Order.STATUS_PAID
+    o1.save()
+    _assert_rollups_match(event)
+
+    p = o1.positions.filter(item=ticket).first()
+    p.canceled = True
+    p.save(update_fields=['canceled'])
+    _assert_rollups_match(event)
+
+    p = o2.positions.first()
+    p.price = Decimal('18.00')
+    p.save()
+    _create_order(event, 'BAZ', Order.STATUS_EXPIRED, datetime.datetime(2020, 1, 3, 10, 0, tzinfo=pytz.UTC), [
+        (shirt, var, Decimal('12.00')),
+    ])
+    o1.positions.filter(item=shirt).first().delete()
+    _assert_rollups_match(event)
+    _assert_rollups_match(event, admission_only=True)
+    _assert_rollups_match(event, date_filter='order_date', date_from=datetime.date(2020, 1, 3))
+    _assert_rollups_match(event, date_filter='order_date', date_until=datetime.date(2020, 1, 2))
+
+    before = list(StatisticsRollup.objects.filter(event=event).order_by('pk').values_list(
+        'subevent_id', 'day', 'item_id', 'variation_id', 'status', 'canceled', 'count', 'price', 'tax_value'
+    ))
+    call_command('rebuild_statistics_rollups', event=[event.pk])
+    after = StatisticsRollup.objects.filter(event=event).order_by('pk').values_list(
+        'subevent_id', 'day', 'item_id', 'variation_id', 'status', 'canceled', 'count', 'price', 'tax_value'
+    )
+    assert {r for r in before if r[6] or r[4] == 'r'} == set(after)
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_STATISTICS_ROLLUPS=True)
+def test_rollups_unused_before_rebuild(event, items):
+    ticket, shirt, var = items
+    _create_order(event, 'FOO', Order.STATUS_PAID, now(), [(ticket, None, Decimal('23.00'))])
+    StatisticsRollup.objects.filter(event=event).update(count=42)
+    _assert_rollups_match(event)
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_STATISTICS_ROLLUPS=True)
+def test_rebuild_repairs_only_wrong_rollups(event, items):
+    ticket, shirt, var = items
+    _create_order(event, 'FOO', Order.STATUS_PAID, now(), [(ticket, None, Decimal('23.00'))])
+    _create_order(event, 'BAR', Order.STATUS_PENDING, now(), [(shirt, var, Decimal('12.00'))])
+    rebuild_rollups(event)
+    assert StatisticsRollup.objects.get(event=event, status=StatisticsRollup.STATUS_REBUILT).day == StatisticsRollup.NO_DAY
+    StatisticsRollup.objects.filter(event=event, status=Order.STATUS_PAID).update(count=42)
+    StatisticsRollup.objects.create(event=event, day=now().date(), item_id=ticket.pk, status=Order.STATUS_EXPIRED,
+                                    count=1, price=Decimal('1.00'))
+    assert rebuild_rollups(event) == 2
+    assert rebuild_rollups(event) == 0
+    _assert_rollups_match(event)
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_STATISTICS_ROLLUPS=True)
+def test_order_rollups_follow_orders_and_payments(event, items):
+    ticket, shirt, var = items
+    o1 = _create_order(event, 'FOO', Order.STATUS_PENDING, datetime.datetime(2020, 1, 1, 23, 30, tzinfo=pytz.UTC), [
+        (ticket, None, Decimal('23.00')),
+    ])
+    o2 = _create_order(event, 'BAR', Order.STATUS_PENDING, datetime.datetime(2020, 1, 2, 10, 0, tzinfo=pytz.UTC), [
+        (shirt, var, Decimal('12.00')),
+    ])
+    assert get_rollup_order_days(event) is None
+    rebuild_rollups(event)
+    assert get_rollup_order_days(event) == ({datetime.date(2020, 1, 2): 2}, {})
+
+    payment = o1.payments.create(amount=Decimal('23.00'), provider='manual', state=OrderPayment.PAYMENT_STATE_CREATED)
+    _assert_order_days_match(event)
+    payment.state = OrderPayment.PAYMENT_STATE_CONFIRMED
+    payment.payment_date = datetime.datetime(2020, 1, 3, 23, 30, tzinfo=pytz.UTC)
+    payment.save()
+    _assert_order_days_match(event)
+
+    o1.payments.create(amount=Decimal('23.00'), provider='manual', state=OrderPayment.PAYMENT_STATE_REFUNDED,
+                       payment_date=datetime.datetime(2020, 1, 5, 10, 0, tzinfo=pytz.UTC))
+    o2.datetime = datetime.datetime(2020, 1, 4, 10, 0, tzinfo=pytz.UTC)
+    o2.save()
+    _create_order(event, 'BAZ', Order.STATUS_EXPIRED, datetime.datetime(2020, 1, 3, 10, 0, tzinfo=pytz.UTC), [])
+    _assert_order_days_match(event)
+
+    o1.payments.filter(state=OrderPayment.PAYMENT_STATE_REFUNDED).first().delete()
+    _assert_order_days_match(event)
+    o1.testmode = True
+    o1.save(update_fields=['testmode'])
+    o1.gracefully_delete()
+    _assert_order_days_match(event)
+
+    StatisticsOrderRollup.objects.filter(event=event).update(count=42)
+    assert rebuild_rollups(event) == 5
+    _assert_order_days_match(event)
+
+
+@pytest.mark.django_db
+@override_settings(PRETIX_STATISTICS_ROLLUPS=True)
+def test_rollups_unused_after_timezone_change(event, items):
+    ticket, shirt, var = items
+    _create_order(event, 'FOO', Order.STATUS_PAID, datetime.datetime(2020, 1, 1, 23, 30, tzinfo=pytz.UTC), [
+        (ticket, None, Decimal('23.00')),
+    ])
+    rebuild_rollups(event)
+    event.settings.timezone = 'Europe/Berlin'
+    assert get_rollup_order_days(event) == ({datetime.date(2020, 1, 2): 1}, {})
+
+    event.settings.timezone = 'UTC'
+    assert get_rollup_order_days(event) is None
+    _assert_rollups_match(event, date_filter='order_date', date_from=datetime.date(2020, 1, 2))
+
+    rebuild_rollups(event)
+    assert get_rollup_order_days(event) == ({datetime.date(2020, 1, 1): 1}, {})
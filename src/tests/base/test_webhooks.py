@@ -8,7 +8,9 @@ from django.db import transaction
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
 
-from pretix.base.models import Event, Item, Order, OrderPosition, Organizer
+from pretix.base.models import (
+    Event, Item, Order, OrderPosition, Organizer, log_batch,
+)
 
 
 @pytest.fixture
@@ -133,6 +135,18 @@ def test_webhook_trigger_global_wildcard(event, order, webhook, monkeypatch_on_c
     }
 
 
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_session_keeps_no_cookies(event, order, webhook, monkeypatch_on_commit):
+    responses.add(responses.POST, 'https://google.com', status=200, headers={'Set-Cookie': 'session=secret'})
+    with transaction.atomic():
+        order.log_action('pretix.event.order.paid', {})
+    with transaction.atomic():
+        order.log_action('pretix.event.order.paid', {})
+    assert len(responses.calls) == 2
+    assert 'Cookie' not in responses.calls[1].request.headers
+
+
 @pytest.mark.django_db
 @responses.activate
 def test_webhook_ignore_wrong_action_type(event, order, webhook, monkeypatch_on_commit):
@@ -200,3 +214,113 @@ def test_webhook_disable_gone(event, order, webhook, monkeypatch_on_commit):
     assert len(responses.calls) == 1
     webhook.refresh_from_db()
     assert not webhook.enabled
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_batched(event, order, webhook, monkeypatch, monkeypatch_on_commit):
+    from pretix.api.webhooks import send_webhook_batch
+
+    webhook.batched = True
+    webhook.save()
+    responses.add(responses.POST, 'https://google.com', status=200)
+    # Simulate the batch window by not sending anything until we trigger the delivery ourselves
+    monkeypatch.setattr(send_webhook_batch, 'apply_async', lambda *args, **kwargs: None)
+    with transaction.atomic():
+        le1 = order.log_action('pretix.event.order.placed', {})
+    with transaction.atomic():
+        le2 = order.log_action('pretix.event.order.paid', {})
+    assert len(responses.calls) == 0
+
+    send_webhook_batch.apply(args=(webhook.pk,))
+    assert len(responses.calls) == 1
+    assert json.loads(force_str(responses.calls[0].request.body)) == [
+        {
+            "notification_id": le1.pk,
+            "organizer": "dummy",
+            "event": "dummy",
+            "code": "FOO",
+            "action": "pretix.event.order.placed"
+        },
+        {
+            "notification_id": le2.pk,
+            "organizer": "dummy",
+            "event": "dummy",
+            "code": "FOO",
+            "action": "pretix.event.order.paid"
+        },
+    ]
+    with scopes_disabled():
+        assert not webhook.batch_entries.exists()
+        call = webhook.calls.get()
+        assert call.action_type == 'pretix.event.order.paid, pretix.event.order.placed'
+        assert call.success
+
+    send_webhook_batch.apply(args=(webhook.pk,))
+    assert len(responses.calls) == 1
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_batched_crash_after_dequeue(event, order, webhook, monkeypatch, monkeypatch_on_commit):
+    from pretix.api import webhooks
+    from pretix.api.webhooks import send_webhook_batch
+
+    webhook.batched = True
+    webhook.save()
+    responses.add(responses.POST, 'https://google.com', status=200)
+    monkeypatch.setattr(send_webhook_batch, 'apply_async', lambda *args, **kwargs: None)
+    with transaction.atomic():
+        order.log_action('pretix.event.order.placed', {})
+
+    class WorkerCrash(Exception):
+        pass
+
+    def crash(*args, **kwargs):
+        raise WorkerCrash()
+
+    with monkeypatch.context() as m:
+        m.setattr(webhooks.get_session(), 'post', crash)
+        with pytest.raises(WorkerCrash):
+            send_webhook_batch.apply(args=(webhook.pk,), throw=True)
+    with scopes_disabled():
+        assert webhook.batch_entries.count() == 1
+
+    send_webhook_batch.apply(args=(webhook.pk,))
+    assert len(responses.calls) == 1
+    with scopes_disabled():
+        assert not webhook.batch_entries.exists()
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_log_batch(event, order, webhook, monkeypatch, monkeypatch_on_commit):
+    from pretix.api import webhooks
+
+    responses.add(responses.POST, 'https://google.com', status=200)
+    scheduled = []
+    monkeypatch.setattr(webhooks.notify_webhooks, 'apply_async', lambda *args, **kwargs: scheduled.append(args))
+    with transaction.atomic(), log_batch():
+        le1 = order.log_action('pretix.event.order.placed', {})
+        order.log_action('pretix.event.order.comment', {})
+        le2 = order.log_action('pretix.event.order.paid', {})
+        assert le1.pk is None
+        assert len(responses.calls) == 0
+    assert not scheduled
+    assert le1.pk and le2.pk
+    with scopes_disabled():
+        assert order.all_logentries().count() == 3
+    assert [json.loads(force_str(c.request.body))['notification_id'] for c in responses.calls] == [le1.pk, le2.pk]
+
+
+@pytest.mark.django_db
+def test_log_batch_discarded_on_error(event, order):
+    with pytest.raises(ValueError):
+        with transaction.atomic(), log_batch():
+            order.log_action('pretix.event.order.paid', {})
+            raise ValueError()
+    with scopes_disabled():
+        assert not order.all_logentries().exists()
+    order.log_action('pretix.event.order.comment', {})
+    with scopes_disabled():
+        assert order.all_logentries().count() == 1
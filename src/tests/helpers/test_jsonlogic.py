@@ -32,3 +32,24 @@ def test_custom_operation():
     logic = Logic()
     logic.add_operation('double', lambda a: a * 2)
     assert logic.apply({'double': [{'var': 'value'}]}, {'value': 3}) == 6
+
+
+@pytest.mark.parametrize("logic,data,expected", params)
+def test_shared_tests_compiled(logic, data, expected):
+    assert Logic().compile(logic)(data) == expected
+
+
+def test_compiled_short_circuit():
+    logic = Logic()
+    calls = []
+    logic.add_operation('track', lambda a: calls.append(a) or a)
+    rule = logic.compile({'or': [{'track': [{'var': 'a'}]}, {'track': [{'var': 'b'}]}]})
+    assert rule({'a': True, 'b': False}) is True
+    assert calls == [True]
+    assert rule({'a': False, 'b': 3}) == 3
+    assert calls == [True, False, 3]
+
+
+def test_compiled_unknown_operator():
+    with pytest.raises(ValueError):
+        Logic().compile({'unknownOp': []})
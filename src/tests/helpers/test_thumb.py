@@ -0,0 +1,71 @@
+from io import BytesIO
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.timezone import now
+from PIL import Image
+
+from pretix.base.models import Event, Organizer
+from pretix.base.services.thumbnails import pregenerate_settings_thumbnails
+from pretix.helpers import thumb
+from pretix.helpers.models import Thumbnail
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    thumb._cache.clear()
+    yield
+    thumb._cache.clear()
+
+
+def _image(fmt, size):
+    buffer = BytesIO()
+    Image.new('RGB', size, (255, 0, 0)).save(buffer, format=fmt)
+    return default_storage.save('pub/test.{}'.format(fmt.lower()), ContentFile(buffer.getvalue()))
+
+
+def _thumb_size(t):
+    with default_storage.open(t.thumb.name) as f:
+        return Image.open(f).size
+
+
+@pytest.mark.django_db
+def test_thumbnail_remembered(django_assert_num_queries):
+    source = _image('PNG', (200, 100))
+    t = thumb.get_thumbnail(source, '60x60^')
+    assert _thumb_size(t) == (60, 60)
+    with django_assert_num_queries(0):
+        assert thumb.get_thumbnail(source, '60x60^').thumb.url == t.thumb.url
+
+    thumb._cache.clear()
+    with django_assert_num_queries(1):
+        assert thumb.get_thumbnail(source, '60x60^').pk == t.pk
+
+
+@pytest.mark.django_db
+def test_thumbnail_large_jpeg():
+    source = _image('JPEG', (4000, 3000))
+    assert _thumb_size(thumb.get_thumbnail(source, '60x60^')) == (60, 60)
+    assert _thumb_size(thumb.get_thumbnail(source, '5000x120')) == (160, 120)
+    assert _thumb_size(thumb.get_thumbnail(source, '1170x5000')) == (1170, 877)
+
+
+@pytest.mark.django_db
+def test_thumbnail_created_concurrently():
+    source = _image('PNG', (200, 100))
+    t = thumb.create_thumbnail(source, '60x60^')
+    assert thumb.create_thumbnail(source, '60x60^').pk == t.pk
+    assert Thumbnail.objects.filter(source=source).count() == 1
+
+
+@pytest.mark.django_db
+def test_pregenerate_logo_thumbnails(monkeypatch):
+    monkeypatch.setattr("django.db.transaction.on_commit", lambda t: t())
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+    source = _image('PNG', (600, 200))
+    event.settings.logo_image = 'file://' + source
+
+    pregenerate_settings_thumbnails(event, ['logo_image', 'primary_color'])
+    assert set(Thumbnail.objects.filter(source=source).values_list('size', flat=True)) == {'1170x5000', '5000x120'}
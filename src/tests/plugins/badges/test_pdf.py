@@ -83,3 +83,36 @@ def test_generate_pdf_multi(env):
     assert ftype == 'application/pdf'
     pdf = PdfFileReader(BytesIO(buf))
     assert pdf.numPages == 1
+
+
+@pytest.mark.django_db
+def test_static_layout_elements_drawn_once(env):
+    from unittest import mock
+
+    from reportlab.pdfgen.canvas import Canvas
+
+    from pretix.base.pdf import Renderer
+
+    event, order, shirt = env
+    text = {
+        "type": "textarea", "left": "10", "bottom": "50", "fontsize": "12.0", "color": [0, 0, 0, 1],
+        "fontfamily": "Open Sans", "bold": False, "italic": False, "width": "80", "align": "left",
+    }
+    layout = [
+        dict(text, content="other", text="Welcome"),
+        dict(text, content="other", text="to our conference", bottom="40"),
+        {"type": "barcodearea", "left": "10", "bottom": "10", "size": "20", "content": "secret"},
+        dict(text, content="attendee_name", bottom="5"),
+    ]
+    Renderer._register_fonts()
+    r = Renderer(event, layout, None)
+    assert [kind for kind, o in r._plan] == ['static', 'dynamic', 'dynamic']
+
+    c = Canvas(BytesIO())
+    with mock.patch.object(Canvas, 'beginForm', autospec=True, side_effect=Canvas.beginForm) as begin, \
+            mock.patch.object(Canvas, 'doForm', autospec=True, side_effect=Canvas.doForm) as do:
+        for op in order.positions.all():
+            r.draw_page(c, order, op)
+    c.save()
+    assert begin.call_count == 1
+    assert do.call_count == 2
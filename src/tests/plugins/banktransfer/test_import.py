@@ -1,3 +1,4 @@
+import os
 from datetime import timedelta
 from decimal import Decimal
 
@@ -12,6 +13,7 @@ from pretix.base.models import (
     Event, Item, Order, OrderFee, OrderPayment, OrderPosition, Organizer,
     Quota, Team, User,
 )
+from pretix.plugins.banktransfer import tasks
 from pretix.plugins.banktransfer.models import BankImportJob, BankTransaction
 from pretix.plugins.banktransfer.tasks import process_banktransfers
 
@@ -443,3 +445,80 @@ def test_pending_paypal_replace_fee_missing(env, job):
         assert env[2].fees.count() == 1
         assert env[2].fees.last().value == Decimal('1.00')
         assert env[2].total == Decimal('24.00')
+
+
+@pytest.mark.django_db
+def test_same_order_twice_in_statement(env, job):
+    process_banktransfers(job, [{
+        'payer': 'Karla Kundin',
+        'reference': 'Bestellung DUMMY1Z3AS',
+        'date': '2016-01-26',
+        'amount': '23.00'
+    }, {
+        'payer': 'Karl Kunde',
+        'reference': 'Bestellung DUMMY1234S',
+        'date': '2016-01-26',
+        'amount': '23.00'
+    }])
+    env[2].refresh_from_db()
+    assert env[2].status == Order.STATUS_PAID
+    with scopes_disabled():
+        assert list(BankTransaction.objects.order_by('pk').values_list('state', flat=True)) == [
+            BankTransaction.STATE_VALID, BankTransaction.STATE_DUPLICATE
+        ]
+
+
+def _large_statement(env, orga_job, matched, rows):
+    with scopes_disabled():
+        orders = [
+            Order.objects.create(
+                code='L{:04d}'.format(i), event=env[0], status=Order.STATUS_PENDING,
+                datetime=now(), expires=now() + timedelta(days=10), total=23
+            )
+            for i in range(matched)
+        ]
+    data = [
+        {
+            'payer': 'Payer {}'.format(i),
+            'reference': 'Bestellung DUMMY-{}'.format(orders[i].code if i < len(orders) else 'X{:04d}'.format(i % 10000)),
+            'date': '2016-01-26',
+            'amount': '23.00'
+        }
+        for i in range(rows)
+    ]
+    return orders, data
+
+
+def _assert_large_statement_matched(orders, rows):
+    with scopes_disabled():
+        assert BankTransaction.objects.filter(state=BankTransaction.STATE_VALID).count() == len(orders)
+        assert BankTransaction.objects.filter(state=BankTransaction.STATE_NOMATCH).count() == rows - len(orders)
+        assert Order.objects.filter(code__startswith='L', status=Order.STATUS_PAID).count() == len(orders)
+        assert all(
+            p.info_data['trans_id'] == BankTransaction.objects.get(order=p.order).pk
+            for p in OrderPayment.objects.filter(order__in=orders)
+        )
+
+
+@pytest.mark.django_db
+def test_large_statement(env, orga_job, django_assert_max_num_queries, monkeypatch):
+    monkeypatch.setattr(tasks, 'MATCH_CHUNK_SIZE', 20)
+    orders, data = _large_statement(env, orga_job, 5, 600)
+
+    # Matching every row on its own would need at least one query per row
+    with django_assert_max_num_queries(300):
+        process_banktransfers(orga_job, data[len(orders):])
+    process_banktransfers(orga_job, data[:len(orders)])
+
+    _assert_large_statement_matched(orders, len(data))
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(not os.environ.get('PRETIX_SLOW_TESTS'), reason="benchmark, set PRETIX_SLOW_TESTS to run")
+def test_large_statement_benchmark(env, orga_job, django_assert_max_num_queries):
+    orders, data = _large_statement(env, orga_job, 50, 50000)
+
+    with django_assert_max_num_queries(5000):
+        process_banktransfers(orga_job, data)
+
+    _assert_large_statement_matched(orders, len(data))
@@ -1,4 +1,5 @@
 import datetime
+import io
 from decimal import Decimal
 
 import pytest
@@ -77,6 +78,25 @@ def test_csv_simple(event):
 """)
 
 
+@pytest.mark.django_db
+def test_csv_output_file(event):
+    c = CSVCheckinList(event)
+    form_data = {
+        'list': event.checkin_lists.first().pk,
+        'secrets': True,
+        'sort': 'name',
+        '_format': 'default',
+        'questions': []
+    }
+    _, _, content = c.render(form_data)
+    f = io.BytesIO()
+    filename, ctype, streamed = c.render(form_data, output_file=f)
+    assert streamed is None
+    assert ctype == 'text/csv'
+    assert not f.closed
+    assert f.getvalue() == content
+
+
 @pytest.mark.django_db
 def test_csv_order_by_name_parts(event):  # noqa
     from django.conf import settings
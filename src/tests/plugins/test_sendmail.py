@@ -6,7 +6,8 @@ from django.utils.timezone import now
 from django_scopes import scopes_disabled
 
 from pretix.base.models import (
-    Checkin, Event, Item, Order, OrderPosition, Organizer, Team, User,
+    Checkin, Event, Item, LogEntry, Order, OrderPosition, Organizer, Team,
+    User,
 )
 
 
@@ -489,3 +490,39 @@ def test_sendmail_attendee_checkin_filter(logged_in_client, sendmail_url, event,
     assert '/order/' not in djmail.outbox[1].body
     to_emails = set(*zip(*[mail.to for mail in djmail.outbox]))
     assert to_emails == {'attendee1@dummy.test', 'attendee2@dummy.test'}
+
+
+@pytest.mark.django_db
+def test_sendmail_many_orders(logged_in_client, sendmail_url, event, item, monkeypatch):
+    from pretix.base.services import mail
+    from pretix.plugins.sendmail import tasks
+
+    monkeypatch.setattr(tasks, 'CHUNK_SIZE', 2)
+    monkeypatch.setattr(mail, 'MAIL_BATCH_SIZE', 3)
+    event.settings.attendee_emails_asked = True
+    with scopes_disabled():
+        for i in range(5):
+            o = Order.objects.create(event=event, status=Order.STATUS_PENDING,
+                                     expires=now() + datetime.timedelta(hours=1),
+                                     total=13, code='DUMMY{}'.format(i), email='dummy{}@dummy.test'.format(i),
+                                     datetime=now(), locale='en')
+            OrderPosition.objects.create(order=o, item=item, price=13, attendee_email='attendee{}@dummy.test'.format(i))
+
+    djmail.outbox = []
+    response = logged_in_client.post(sendmail_url,
+                                     {'sendto': 'n',
+                                      'recipients': 'both',
+                                      'items': item.pk,
+                                      'subject_0': 'Test subject',
+                                      'message_0': 'This is a test file for sending mails.',
+                                      },
+                                     follow=True)
+    assert response.status_code == 200
+    assert 'alert-success' in response.rendered_content
+    assert [m.to[0] for m in djmail.outbox] == [
+        r for i in range(5) for r in ('attendee{}@dummy.test'.format(i), 'dummy{}@dummy.test'.format(i))
+    ]
+    with scopes_disabled():
+        assert LogEntry.objects.filter(
+            event=event, action_type__startswith='pretix.plugins.sendmail.order.email.sent'
+        ).count() == 10
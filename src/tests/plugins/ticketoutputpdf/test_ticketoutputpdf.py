@@ -51,3 +51,49 @@ def test_generate_pdf(env0):
         assert ftype == 'application/pdf'
         pdf = PdfFileReader(BytesIO(buf))
         assert pdf.numPages == 1
+
+
+@pytest.mark.django_db
+def test_prerender(env0):
+    from pretix.base.models import CachedCombinedTicket, CachedTicket
+    from pretix.base.services.tickets import prerender
+
+    event, order = env0
+    event.plugins = 'pretix.plugins.ticketoutputpdf'
+    event.save()
+    with scope(organizer=event.organizer):
+        event.settings.ticket_download = True
+        event.settings.ticket_download_nonadm = True
+        event.settings.ticketoutput_pdf__enabled = True
+        order.status = Order.STATUS_PAID
+        order.save()
+
+        prerender.apply(args=(event.pk, [order.pk]))
+        assert CachedTicket.objects.filter(order_position__order=order, provider='pdf').count() == 2
+        assert CachedCombinedTicket.objects.filter(order=order, provider='pdf').count() == 1
+
+
+@pytest.mark.django_db
+def test_generate_batch_reuses_renderer(env0):
+    from unittest import mock
+
+    from pretix.base import pdf
+    from pretix.base.models import CachedTicket
+    from pretix.base.services.tickets import generate_batch
+    from pretix.plugins.ticketoutputpdf import ticketoutput
+
+    event, order = env0
+    event.plugins = 'pretix.plugins.ticketoutputpdf'
+    event.save()
+    ticketoutput._get_renderer_cache().clear()
+    with scope(organizer=event.organizer):
+        item = order.positions.first().item
+        for i in range(38):
+            OrderPosition.objects.create(order=order, item=item, price=12, attendee_name_parts={})
+        positions = list(order.positions.values_list('pk', flat=True))
+
+        with mock.patch.object(pdf.Renderer, '__init__', autospec=True, side_effect=pdf.Renderer.__init__) as init:
+            generate_batch.apply(args=(event.pk, 'pdf'), kwargs={'positions': positions})
+
+        assert init.call_count == 1
+        assert CachedTicket.objects.filter(order_position__order=order, provider='pdf').count() == len(positions)
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import set_urlconf
+from django.utils.timezone import now
+
+from pretix.base.models import Event, Organizer
+from pretix.multidomain.models import KnownDomain
+from pretix.presale import utils
+from pretix.presale.utils import _detect_event
+
+
+@pytest.fixture
+def env():
+    o = Organizer.objects.create(name='MRMCD e.V.', slug='mrmcd')
+    event = Event.objects.create(
+        organizer=o, name='MRMCD2015', slug='2015',
+        date_from=now() + timedelta(days=10),
+        live=True,
+    )
+    return o, event
+
+
+@pytest.fixture(autouse=True)
+def real_cache():
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+        cache.clear()
+        utils._snapshots.clear()
+        set_urlconf(None)
+        yield
+        utils._snapshots.clear()
+
+
+def _detect(path):
+    request = RequestFactory().get(path)
+    request.user = AnonymousUser()
+    request.session = {}
+    request.port = None
+    return request, _detect_event(request)
+
+
+def _count_queries(path):
+    with CaptureQueriesContext(connection) as ctx:
+        request, response = _detect(path)
+    assert response is None
+    return len(ctx.captured_queries), request
+
+
+@pytest.mark.django_db
+def test_snapshot_reused(env):
+    first, request = _count_queries('/mrmcd/2015/')
+    assert request.event == env[1]
+    second, request = _count_queries('/mrmcd/2015/')
+    assert request.event == env[1]
+    assert request.organizer == env[0]
+    assert request.event.organizer is request.organizer
+    assert second < first
+
+    first, request = _count_queries('/mrmcd/')
+    assert request.organizer == env[0]
+    second, request = _count_queries('/mrmcd/')
+    assert request.organizer == env[0]
+    assert second < first
+
+
+@pytest.mark.django_db
+def test_snapshot_invalidated_on_change(env):
+    _detect('/mrmcd/2015/')
+    env[1].live = False
+    env[1].save()
+    with pytest.raises(PermissionDenied):
+        _detect('/mrmcd/2015/')
+
+    env[1].live = True
+    env[1].save()
+    _detect('/mrmcd/2015/')
+    KnownDomain.objects.create(domainname='tickets.mrmcd.net', event=env[1])
+    request, response = _detect('/mrmcd/2015/')
+    assert response.status_code == 302
+    assert response['Location'].startswith('http://tickets.mrmcd.net')
+
+
+@pytest.mark.django_db
+def test_snapshot_invalidated_on_delete(env):
+    _detect('/mrmcd/2015/')
+    env[1].delete_sub_objects()
+    env[1].delete()
+    with pytest.raises(Http404):
+        _detect('/mrmcd/2015/')
@@ -1,5 +1,6 @@
 import datetime
 import os.path
+from unittest import mock
 
 from django.conf import settings
 from django.test import TestCase, override_settings
@@ -7,6 +8,7 @@ from django_scopes import scopes_disabled
 
 from pretix.base.models import Event, Organizer
 from pretix.multidomain.models import KnownDomain
+from pretix.presale import style
 from pretix.presale.style import regenerate_css, regenerate_organizer_css
 
 
@@ -130,3 +132,52 @@ class StyleTest(TestCase):
         with open(os.path.join(settings.MEDIA_ROOT, self.event.settings.presale_css_file), 'r') as c:
             assert 'https://static.pretix.files/static/' in c.read()
             assert 'https://test.pretix.eu/static/' not in c.read()
+
+    def test_organizer_generate_css_compiles_each_source_once(self):
+        with scopes_disabled():
+            event2 = Event.objects.create(
+                organizer=self.orga, name='31C3', slug='31c3',
+                date_from=datetime.datetime(2014, 12, 26, tzinfo=datetime.timezone.utc),
+            )
+        compiled = []
+        compile = style._compile
+
+        def counting_compile(sasssrc, static):
+            compiled.append(sasssrc)
+            return compile(sasssrc, static)
+
+        self.orga.settings.primary_color = "#1a2b3c"
+        with mock.patch('pretix.presale.style._compile', counting_compile):
+            regenerate_organizer_css.apply(args=(self.orga.pk,))
+            assert len(compiled) == 2
+
+            self.orga.settings.flush()
+            self.event.settings.flush()
+            event2.settings.flush()
+            assert self.event.settings.presale_css_file == self.orga.settings.presale_css_file
+            assert event2.settings.presale_css_file == self.orga.settings.presale_css_file
+            assert event2.settings.presale_widget_css_file == self.orga.settings.presale_widget_css_file
+            with open(os.path.join(settings.MEDIA_ROOT, event2.settings.presale_css_file), 'r') as c:
+                assert '#1a2b3c' in c.read()
+
+            regenerate_css.apply(args=(self.event.pk,))
+            assert len(compiled) == 2
+
+    def test_generate_css_force_recompiles_existing_file(self):
+        regenerate_css.apply(args=(self.event.pk,))
+        self.event.settings.flush()
+        fname = self.event.settings.presale_css_file
+        with open(os.path.join(settings.MEDIA_ROOT, fname), 'w') as c:
+            c.write('stale')
+
+        regenerate_css.apply(args=(self.event.pk,))
+        self.event.settings.flush()
+        assert self.event.settings.presale_css_file == fname
+        with open(os.path.join(settings.MEDIA_ROOT, fname), 'r') as c:
+            assert c.read() == 'stale'
+
+        regenerate_css.apply(args=(self.event.pk,), kwargs={'force': True})
+        self.event.settings.flush()
+        assert self.event.settings.presale_css_file == fname
+        with open(os.path.join(settings.MEDIA_ROOT, fname), 'r') as c:
+            assert 'stale' not in c.read()